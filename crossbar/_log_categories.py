@@ -45,6 +45,7 @@ log_categories = {
     "AR201": "REST bridge webhook event succeeded.",
     "AR202": "REST bridge call succeeded.",
     "AR203": "REST bridge signature valid.",
+    "AR204": "REST bridge bulk publish done. ({count} events, {failed} failed)",
     "AR400": "Malformed request to the REST bridge.",
     "AR401": "Request denied based on failed authentication.",
     "AR405": "Method not accepted by the REST bridge. ({method} not allowed, only {allowed})",
@@ -53,7 +54,7 @@ log_categories = {
     "AR451": "Non-decodable request body, was not UTF-8.",
     "AR452": "Non-accepted content type. (must be one of '{accepted}', not '{given}')",
     "AR453": "Request body was invalid JSON.",
-    "AR454": "Request body was valid JSON, but not well formed (must be a dict).",
+    "AR454": "Request body was valid JSON, but not well formed (must be a dict, or a list for bulk requests).",
     "AR455": "Request body was valid JSON, but not well formed (missing key '{key}').",
     "AR456": "REST bridge publish failed.",
     "AR457": "REST bridge webhook request failed.",
@@ -66,6 +67,7 @@ log_categories = {
     "AR464": "Request expired, too old timestamp.",
     "AR465": "Body length ({bodylen}) is different to Content-Length header ({conlen}).",
     "AR466": "Request denied based on IP address.",
+    "AR467": "Request denied, replayed request (nonce was used before).",
 
     # MQXXX - Adapter, MQTT Bridge
     "MQ100": "Got packet from '{client_id}': {packet!r}",
@@ -76,6 +78,7 @@ log_categories = {
     "MQ203": "Received a QoS 2 Publish from '{client_id}'",
     "MQ204": "Received a Disconnect from '{client_id}', closing connection",
     "MQ303": "Got a non-allowed QoS value in the publish queue, dropping it.",
+    "MQ304": "Send queue for '{client_id}' is full ({queued} messages), applying overflow policy '{policy}'",
     "MQ400": "MQTT client '{client_id}' timed out after recieving no full packets for {seconds}",
     "MQ401": "Protocol violation from '{client_id}', terminating connection: {error}",
     "MQ402": "Got a packet ('{packet_id}') from '{client_id}' that is invalid for a server, terminating connection",
@@ -34,10 +34,10 @@ import warnings
 import attr
 
 from attr.validators import instance_of, optional
-from bitstring import pack
 
 from ._utils import (read_prefixed_data, read_string, build_string,
-                     build_header, ParseFailure, SerialisationFailure)
+                     build_header, pack_uint8, pack_uint16,
+                     ParseFailure, SerialisationFailure)
 
 unicode = type(u"")
 
@@ -115,7 +115,7 @@ class UnsubACK(object):
         b = []
 
         # Session identifier
-        b.append(pack('uint:16', self.packet_identifier).bytes)
+        b.append(pack_uint16(self.packet_identifier))
 
         return b"".join(b)
 
@@ -124,7 +124,7 @@ class UnsubACK(object):
         if flags != (False, False, False, False):
             raise ParseFailure(cls, "Bad flags")
 
-        packet_identifier = data.read('uint:16')
+        packet_identifier = data.read_uint16()
         return cls(packet_identifier=packet_identifier)
 
 
@@ -149,7 +149,7 @@ class Unsubscribe(object):
         b = []
 
         # Session identifier
-        b.append(pack('uint:16', self.packet_identifier).bytes)
+        b.append(pack_uint16(self.packet_identifier))
 
         for topic in self.topics:
             if not isinstance(topic, unicode):
@@ -165,9 +165,9 @@ class Unsubscribe(object):
             raise ParseFailure(cls, "Bad flags")
 
         topics = []
-        packet_identifier = data.read('uint:16')
+        packet_identifier = data.read_uint16()
 
-        while not data.bitpos == len(data):
+        while not data.at_end():
             topics.append(read_string(data))
 
         if len(topics) == 0:
@@ -193,7 +193,7 @@ class PubCOMP(object):
         Build the payload from its constituent parts.
         """
         b = []
-        b.append(pack('uint:16', self.packet_identifier).bytes)
+        b.append(pack_uint16(self.packet_identifier))
         return b"".join(b)
 
     @classmethod
@@ -204,7 +204,7 @@ class PubCOMP(object):
         if flags != (False, False, False, False):
             raise ParseFailure(cls, "Bad flags")
 
-        packet_identifier = data.read('uint:16')
+        packet_identifier = data.read_uint16()
 
         return cls(packet_identifier)
 
@@ -226,7 +226,7 @@ class PubREL(object):
         Build the payload from its constituent parts.
         """
         b = []
-        b.append(pack('uint:16', self.packet_identifier).bytes)
+        b.append(pack_uint16(self.packet_identifier))
         return b"".join(b)
 
     @classmethod
@@ -237,7 +237,7 @@ class PubREL(object):
         if flags != (False, False, True, False):
             raise ParseFailure(cls, "Bad flags")
 
-        packet_identifier = data.read('uint:16')
+        packet_identifier = data.read_uint16()
 
         return cls(packet_identifier)
 
@@ -259,7 +259,7 @@ class PubREC(object):
         Build the payload from its constituent parts.
         """
         b = []
-        b.append(pack('uint:16', self.packet_identifier).bytes)
+        b.append(pack_uint16(self.packet_identifier))
         return b"".join(b)
 
     @classmethod
@@ -270,7 +270,7 @@ class PubREC(object):
         if flags != (False, False, False, False):
             raise ParseFailure(cls, "Bad flags")
 
-        packet_identifier = data.read('uint:16')
+        packet_identifier = data.read_uint16()
 
         return cls(packet_identifier)
 
@@ -292,7 +292,7 @@ class PubACK(object):
         Build the payload from its constituent parts.
         """
         b = []
-        b.append(pack('uint:16', self.packet_identifier).bytes)
+        b.append(pack_uint16(self.packet_identifier))
         return b"".join(b)
 
     @classmethod
@@ -303,7 +303,7 @@ class PubACK(object):
         if flags != (False, False, False, False):
             raise ParseFailure(cls, "Bad flags")
 
-        packet_identifier = data.read('uint:16')
+        packet_identifier = data.read_uint16()
 
         return cls(packet_identifier)
 
@@ -350,7 +350,7 @@ class Publish(object):
         if self.packet_identifier:
             if self.qos_level > 0:
                 # Session identifier
-                b.append(pack('uint:16', self.packet_identifier).bytes)
+                b.append(pack_uint16(self.packet_identifier))
             else:
                 raise SerialisationFailure(self, "Packet Identifier on non-QoS 1/2 packet")
         else:
@@ -365,8 +365,6 @@ class Publish(object):
     @classmethod
     def deserialise(cls, flags, data):
 
-        total_length = len(data)
-
         duplicate = flags[0]
 
         if flags[1:3] == (False, False):
@@ -383,11 +381,11 @@ class Publish(object):
         topic_name = read_string(data)
 
         if qos_level in [1, 2]:
-            packet_identifier = data.read('uint:16')
+            packet_identifier = data.read_uint16()
         else:
             packet_identifier = None
 
-        payload = data.read(total_length - data.bitpos).bytes
+        payload = data.read_rest()
 
         return cls(duplicate=duplicate, qos_level=qos_level, retain=retain,
                    topic_name=topic_name, packet_identifier=packet_identifier,
@@ -415,10 +413,10 @@ class SubACK(object):
         b = []
 
         # Session identifier
-        b.append(pack('uint:16', self.packet_identifier).bytes)
+        b.append(pack_uint16(self.packet_identifier))
 
         for code in self.return_codes:
-            b.append(pack('uint:8', code).bytes)
+            b.append(pack_uint8(code))
 
         return b"".join(b)
 
@@ -428,10 +426,10 @@ class SubACK(object):
             raise ParseFailure(cls, "Bad flags")
 
         return_codes = []
-        packet_identifier = data.read('uint:16')
+        packet_identifier = data.read_uint16()
 
-        while not data.bitpos == len(data):
-            return_code = data.read('uint:8')
+        while not data.at_end():
+            return_code = data.read_uint8()
             return_codes.append(return_code)
 
         return cls(packet_identifier=packet_identifier,
@@ -453,7 +451,7 @@ class SubscriptionTopicRequest(object):
         b.append(build_string(self.topic_filter))
 
         # Reserved section + max QoS
-        b.append(pack('uint:6, uint:2', 0, self.max_qos).bytes)
+        b.append(pack_uint8(self.max_qos & 0x03))
 
         return b"".join(b)
 
@@ -479,7 +477,7 @@ class Subscribe(object):
         b = []
 
         # Session identifier
-        b.append(pack('uint:16', self.packet_identifier).bytes)
+        b.append(pack_uint16(self.packet_identifier))
 
         for request in self.topic_requests:
             b.append(request.serialise())
@@ -492,13 +490,14 @@ class Subscribe(object):
             raise ParseFailure(cls, "Bad flags")
 
         pairs = []
-        packet_identifier = data.read('uint:16')
+        packet_identifier = data.read_uint16()
 
         def parse_pair():
 
             topic_filter = read_string(data)
-            reserved = data.read("uint:6")
-            max_qos = data.read("uint:2")
+            options = data.read_uint8()
+            reserved = options >> 2
+            max_qos = options & 0x03
 
             if reserved:
                 raise ParseFailure(cls, "Data in QoS Reserved area")
@@ -511,7 +510,7 @@ class Subscribe(object):
 
         parse_pair()
 
-        while not data.bitpos == len(data):
+        while not data.at_end():
             parse_pair()
 
         return cls(packet_identifier=packet_identifier, topic_requests=pairs)
@@ -538,10 +537,10 @@ class ConnACK(object):
         b = []
 
         # Flags -- 7 bit reserved + Session Present flag
-        b.append(pack('uint:7, bool', 0, self.session_present).bytes)
+        b.append(pack_uint8(1 if self.session_present else 0))
 
         # Return code
-        b.append(pack('uint:8', self.return_code).bytes)
+        b.append(pack_uint8(self.return_code))
 
         return b"".join(b)
 
@@ -553,22 +552,22 @@ class ConnACK(object):
         if flags != (False, False, False, False):
             raise ParseFailure(cls, "Bad flags")
 
-        reserved = data.read(7).uint
+        ack_flags = data.read_uint8()
 
-        if reserved:
+        if ack_flags >> 1:
             raise ParseFailure(cls, "Reserved flag used.")
 
-        built = cls(session_present=data.read(1).bool,
-                    return_code=data.read(8).uint)
+        built = cls(session_present=bool(ack_flags & 0x01),
+                    return_code=data.read_uint8())
 
         # XXX: Do some more verification, re conn flags
 
-        if not data.bitpos == len(data):
+        if not data.at_end():
             # There's some wacky stuff going on here -- data they included, but
             # didn't put flags for, maybe?
             warnings.warn(("Quirky server CONNACK -- packet length was "
                            "%d bytes but only had %d bytes of useful data") % (
-                               data.bitpos, len(data)))
+                               data.pos * 8, len(data) * 8))
 
         return built
 
@@ -587,21 +586,25 @@ class ConnectFlags(object):
         """
         Assemble this into an on-wire message portion.
         """
-        return pack(
-            'bool, bool, bool, uint:2, bool, bool, bool',
-            self.username, self.password, self.will_retain, self.will_qos,
-            self.will, self.clean_session, self.reserved).bytes
+        return pack_uint8(
+            bool(self.username) << 7 | bool(self.password) << 6 |
+            bool(self.will_retain) << 5 | (self.will_qos & 0x03) << 3 |
+            bool(self.will) << 2 | bool(self.clean_session) << 1 |
+            bool(self.reserved))
 
     @classmethod
-    def deserialise(cls, data):
+    def deserialise(cls, flags):
+        """
+        Disassemble from the CONNECT flags byte.
+        """
         built = cls(
-            username=data.read(1).bool,
-            password=data.read(1).bool,
-            will_retain=data.read(1).bool,
-            will_qos=data.read(2).uint,
-            will=data.read(1).bool,
-            clean_session=data.read(1).bool,
-            reserved=data.read(1).bool
+            username=bool(flags & 0x80),
+            password=bool(flags & 0x40),
+            will_retain=bool(flags & 0x20),
+            will_qos=(flags >> 3) & 0x03,
+            will=bool(flags & 0x04),
+            clean_session=bool(flags & 0x02),
+            reserved=bool(flags & 0x01)
         )
 
         # XXX: Do some more conformance checking here
@@ -648,13 +651,13 @@ class Connect(object):
         b.append(build_string(u"MQTT"))
 
         # Protocol Level (4 == 3.1.1)
-        b.append(pack('uint:8', 4).bytes)
+        b.append(pack_uint8(4))
 
         # CONNECT flags
         b.append(self.flags.serialise())
 
         # Keep Alive time
-        b.append(pack('uint:16', self.keep_alive).bytes)
+        b.append(pack_uint16(self.keep_alive))
 
         # Client ID
         b.append(build_string(self.client_id))
@@ -663,7 +666,7 @@ class Connect(object):
             b.append(build_string(self.will_topic))
 
             # Will message is a uint16 prefixed bytestring
-            b.append(pack('uint:16', len(self.will_message)).bytes)
+            b.append(pack_uint16(len(self.will_message)))
             b.append(self.will_message)
 
         if self.flags.username:
@@ -689,15 +692,15 @@ class Connect(object):
             print(protocol)
             raise ParseFailure(cls, "Bad protocol name")
 
-        protocol_level = data.read('uint:8')
+        protocol_level = data.read_uint8()
 
         if protocol_level != 4:
             raise ParseFailure(cls, "Bad protocol level")
 
-        flags = ConnectFlags.deserialise(data.read(8))
+        flags = ConnectFlags.deserialise(data.read_uint8())
 
         # Keep alive, in seconds
-        keep_alive = data.read('uint:16')
+        keep_alive = data.read_uint16()
 
         # The client ID
         client_id = read_string(data)
@@ -722,12 +725,12 @@ class Connect(object):
         else:
             password = None
 
-        if not data.bitpos == len(data):
+        if not data.at_end():
             # There's some wacky stuff going on here -- data they included, but
             # didn't put flags for, maybe?
             warnings.warn(("Quirky client CONNECT -- packet length was "
                            "%d bytes but only had %d bytes of useful data") % (
-                               data.bitpos, len(data)))
+                               data.pos * 8, len(data) * 8))
 
         # The event
         return cls(flags=flags, keep_alive=keep_alive, client_id=client_id,
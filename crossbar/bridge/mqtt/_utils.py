@@ -30,13 +30,16 @@
 
 from __future__ import absolute_import, division, print_function
 
-from bitstring import pack
+import struct
 
 from autobahn.websocket.utf8validator import Utf8Validator
 
 
 _validator = Utf8Validator()
 
+_uint8 = struct.Struct('!B')
+_uint16 = struct.Struct('!H')
+
 
 class ParseFailure(Exception):
     pass
@@ -46,12 +49,70 @@ class SerialisationFailure(Exception):
     pass
 
 
+class ReadError(Exception):
+    """
+    A read went past the end of the packet.
+    """
+
+
+class ByteReader(object):
+    """
+    Sequential reader over the bytes of a single MQTT control packet.
+
+    The reader wraps a :class:`memoryview`, so slicing the packet out of a
+    larger receive buffer and reading fields from it does not copy data
+    until a field is actually returned as ``bytes``.
+    """
+
+    __slots__ = ('_data', 'pos')
+
+    def __init__(self, data):
+        self._data = memoryview(data)
+        self.pos = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def at_end(self):
+        return self.pos == len(self._data)
+
+    def _need(self, length):
+        available = len(self._data) - self.pos
+        if length > available:
+            # same wording as bitstring, which we used before
+            raise ReadError("Cannot read %d bits, only %d available." % (
+                length * 8, available * 8))
+
+    def read_uint8(self):
+        self._need(1)
+        value = _uint8.unpack_from(self._data, self.pos)[0]
+        self.pos += 1
+        return value
+
+    def read_uint16(self):
+        self._need(2)
+        value = _uint16.unpack_from(self._data, self.pos)[0]
+        self.pos += 2
+        return value
+
+    def read_bytes(self, length):
+        self._need(length)
+        value = self._data[self.pos:self.pos + length].tobytes()
+        self.pos += length
+        return value
+
+    def read_rest(self):
+        value = self._data[self.pos:].tobytes()
+        self.pos = len(self._data)
+        return value
+
+
 def read_prefixed_data(data):
     """
     Reads the next 16-bit-uint prefixed data block from `data`.
     """
-    data_length = data.read('uint:16')
-    return data.read(data_length * 8).bytes
+    data_length = data.read_uint16()
+    return data.read_bytes(data_length)
 
 
 def read_string(data):
@@ -70,30 +131,40 @@ def read_string(data):
         raise ParseFailure("Invalid UTF-8 string (contains surrogates)")
 
 
-def build_string(string):
+def pack_uint8(value):
+    return _uint8.pack(value)
 
-    string = string.encode('utf8')
-    return pack('uint:16', len(string)).bytes + string
 
+def pack_uint16(value):
+    return _uint16.pack(value)
 
-def build_header(packet_id, flags, payload_length):
 
-    header = pack('uint:4, bool, bool, bool, bool', packet_id, *flags)
+def build_string(string):
+
+    string = string.encode('utf8')
+    return _uint16.pack(len(string)) + string
 
-    if payload_length > 0:
-        length_bytes = []
 
-        while payload_length > 0:
-            encoded_byte = payload_length % 128
-            payload_length = payload_length // 128
-            if payload_length > 0:
-                encoded_byte = encoded_byte | 128
-            length_bytes.append(encoded_byte)
-    else:
-        length_bytes = [0]
+def build_header(packet_id, flags, payload_length):
 
-    return header.bytes + pack(','.join(['uint:8'] * len(length_bytes)),
-                               *length_bytes).bytes
+    header = bytearray(5)
+    header[0] = ((packet_id & 0x0f) << 4 |
+                 bool(flags[0]) << 3 | bool(flags[1]) << 2 |
+                 bool(flags[2]) << 1 | bool(flags[3]))
+
+    # remaining length, as a variable length integer of 7 bit groups
+    i = 1
+    while True:
+        encoded_byte = payload_length % 128
+        payload_length = payload_length // 128
+        if payload_length > 0:
+            encoded_byte = encoded_byte | 128
+        header[i] = encoded_byte
+        i += 1
+        if payload_length == 0:
+            break
+
+    return bytes(header[:i])
 
 
 def iterbytes(b):
@@ -0,0 +1,157 @@
+#####################################################################################
+#
+#  Copyright (c) Crossbar.io Technologies GmbH
+#
+#  Unless a separate license agreement exists between you and Crossbar.io GmbH (e.g.
+#  you have purchased a commercial license), the license terms below apply.
+#
+#  Should you enter into a separate license agreement after having received a copy of
+#  this software, then the terms of such license agreement replace the terms below at
+#  the time at which such license agreement becomes effective.
+#
+#  In case a separate license agreement ends, and such agreement ends without being
+#  replaced by another separate license agreement, the license terms below apply
+#  from the time at which said agreement ends.
+#
+#  LICENSE TERMS
+#
+#  This program is free software: you can redistribute it and/or modify it under the
+#  terms of the GNU Affero General Public License, version 3, as published by the
+#  Free Software Foundation. This program is distributed in the hope that it will be
+#  useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#  See the GNU Affero General Public License Version 3 for more details.
+#
+#  You should have received a copy of the GNU Affero General Public license along
+#  with this program. If not, see <http://www.gnu.org/licenses/agpl-3.0.en.html>.
+#
+#####################################################################################
+
+from __future__ import absolute_import, division, print_function
+
+import txaio
+txaio.use_twisted()
+
+from txaio import make_logger
+
+from twisted.internet.defer import Deferred
+from twisted.python.failure import Failure
+
+__all__ = ('CodecBatcher',)
+
+
+class CodecBatcher(object):
+    """
+    Accumulates calls to a dynamic payload codec (an encoder or decoder
+    procedure) for a short time, and sends them to a batch-capable codec
+    procedure in one call.
+
+    The batch procedure is called with a single positional argument, the list
+    of the argument lists of the individual calls, and must return a list of
+    results of the same length. If the batch call fails (or returns something
+    else), every call in the batch is retried individually on the regular
+    codec procedure.
+    """
+
+    log = make_logger()
+
+    def __init__(self, reactor, get_session, procedure, batch_procedure,
+                 max_size=100, max_delay=5):
+        """
+
+        :param reactor: Reactor used to schedule flushing a batch.
+
+        :param get_session: Callable returning the session to call the codec
+            procedures on.
+
+        :param procedure: URI of the regular codec procedure.
+        :type procedure: str
+
+        :param batch_procedure: URI of the batch codec procedure.
+        :type batch_procedure: str
+
+        :param max_size: Maximum number of calls in one batch.
+        :type max_size: int
+
+        :param max_delay: Maximum time in ms a call is held back to be batched.
+        :type max_delay: int
+        """
+        self._reactor = reactor
+        self._get_session = get_session
+        self._procedure = procedure
+        self._batch_procedure = batch_procedure
+        self._max_size = max_size
+        self._max_delay = max_delay
+
+        # list of (args, Deferred) of the calls in the current batch
+        self._pending = []
+        self._flush_call = None
+
+        # number of batches sent, and of batches that failed
+        self.batches = 0
+        self.fallbacks = 0
+
+    def call(self, *args):
+        """
+        Call the codec with the given (positional) arguments.
+
+        :returns: A Deferred that fires with the result of the call.
+        """
+        d = Deferred()
+        self._pending.append((args, d))
+        if len(self._pending) >= self._max_size:
+            self._flush()
+        elif self._flush_call is None:
+            self._flush_call = self._reactor.callLater(self._max_delay / 1000., self._flush)
+        return d
+
+    def _flush(self):
+        if self._flush_call is not None:
+            if self._flush_call.active():
+                self._flush_call.cancel()
+            self._flush_call = None
+
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        self.batches += 1
+        try:
+            d = self._get_session().call(self._batch_procedure, [list(args) for args, _ in batch])
+        except Exception:
+            self._batch_failed(Failure(), batch)
+        else:
+            d.addCallbacks(self._batch_done, self._batch_failed,
+                           callbackArgs=(batch,), errbackArgs=(batch,))
+
+    def _batch_done(self, results, batch):
+        if not isinstance(results, (list, tuple)) or len(results) != len(batch):
+            self.log.warn(
+                "MQTT payload codec: batch procedure '{procedure}' returned {result_type} for a batch of {count} calls - falling back to single calls",
+                procedure=self._batch_procedure,
+                result_type=type(results),
+                count=len(batch),
+            )
+            self._fall_back(batch)
+            return
+
+        for (_, d), result in zip(batch, results):
+            d.callback(result)
+
+    def _batch_failed(self, failure, batch):
+        self.log.warn(
+            "MQTT payload codec: batch procedure '{procedure}' failed ({error}) - falling back to single calls",
+            procedure=self._batch_procedure,
+            error=failure.getErrorMessage(),
+        )
+        self._fall_back(batch)
+
+    def _fall_back(self, batch):
+        self.fallbacks += 1
+        session = self._get_session()
+        for args, d in batch:
+            try:
+                session.call(self._procedure, *args).chainDeferred(d)
+            except Exception as e:
+                d.errback(e)
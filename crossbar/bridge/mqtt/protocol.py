@@ -41,7 +41,9 @@ from ._events import (
     Disconnect,
 )
 
-import bitstring
+from ._utils import ByteReader, ReadError
+
+import struct
 
 __all__ = [
     "MQTTParser",
@@ -100,31 +102,50 @@ client_packet_handlers = {
 }
 
 
-def _parse_header(data):
-    # New packet
-    packet_type = data.read('uint:4')
-    flags = (data.read("bool"),
-             data.read("bool"),
-             data.read("bool"),
-             data.read("bool"))
+_uint8 = struct.Struct('!B')
+
+# the packet flags (lower nibble of the first header byte), as a tuple of bools
+_FLAGS = [
+    (bool(f & 8), bool(f & 4), bool(f & 2), bool(f & 1)) for f in range(16)
+]
+
+
+def _parse_header(data, pos):
+    """
+    Parse a fixed header from `data` starting at `pos`.
+
+    :returns: The tuple ``(packet_type, flags, remaining_length)`` and the
+        number of bytes the header occupied.
+    """
+    end = len(data)
+    if pos >= end:
+        raise _NeedMoreData()
+
+    first = _uint8.unpack_from(data, pos)[0]
+    packet_type = first >> 4
+    flags = _FLAGS[first & 0x0f]
 
+    # remaining length, a variable length integer of 7 bit groups
     multiplier = 1
     value = 0
-    encodedByte = -1
+    i = pos + 1
 
-    while (encodedByte & 128) != 0:
-        try:
-            encodedByte = data.read('uint:8')
-        except bitstring.ReadError:
+    while True:
+        if i >= end:
             # Not enough data yet, raise that up...
             raise _NeedMoreData()
-        value += (encodedByte & 127) * multiplier
+        encoded_byte = _uint8.unpack_from(data, i)[0]
+        i += 1
+        value += (encoded_byte & 127) * multiplier
         multiplier = multiplier * 128
 
         if multiplier > (128 * 128 * 128):
             raise ParseFailure("Too big packet size")
 
-    return (packet_type, flags, value)
+        if not encoded_byte & 128:
+            break
+
+    return (packet_type, flags, value), i - pos
 
 
 class MQTTParser(object):
@@ -134,7 +155,9 @@ class MQTTParser(object):
 
     def __init__(self):
 
-        self._data = bitstring.BitStream()
+        # received, but not yet parsed chunks of data
+        self._chunks = []
+        self._buffered = 0
         self._bytes_expected = 0
         self._state = WAITING_FOR_NEW_PACKET
         self._packet_header = None
@@ -148,89 +171,110 @@ class MQTTParser(object):
             # (e.g. flushed input buffers), just drop the data.
             return []
 
-        events = []
+        self._chunks.append(data)
+        self._buffered += len(data)
+
+        if self._state == COLLECTING_REST_OF_PACKET and self._buffered < self._bytes_expected:
+            # a large packet arriving in many pieces: don't join the pieces
+            # before the packet is complete
+            return []
+
+        if len(self._chunks) == 1:
+            data = self._chunks[0]
+        else:
+            data = b"".join(self._chunks)
+        view = memoryview(data)
+
+        events, pos = self._parse(view)
+
+        # keep the unparsed tail (if any) for the next round
+        if pos < len(view) and self._state is not PROTOCOL_VIOLATION:
+            tail = view[pos:].tobytes()
+            self._chunks = [tail]
+            self._buffered = len(tail)
+        else:
+            self._chunks = []
+            self._buffered = 0
 
-        self._data.append(bitstring.BitArray(bytes=data))
-        self._data = self._data[self._data.bitpos:]
+        return events
+
+    def _parse(self, view):
+        """
+        Parse as many packets as possible from `view`.
+
+        :returns: The parsed events and the number of bytes consumed.
+        """
+        events = []
+        pos = 0
+        end = len(view)
 
         while True:
 
-            if self._state == WAITING_FOR_NEW_PACKET and len(self._data) > 8:
+            if self._state == WAITING_FOR_NEW_PACKET:
+
+                if end - pos < 2:
+                    return events, pos
 
                 try:
-                    self._packet_header = _parse_header(self._data)
+                    self._packet_header, consumed = _parse_header(view, pos)
                 except _NeedMoreData:
-                    # Reset the data stream
-                    self._data.bitpos = 0
                     # Return the events we have
-                    return events
+                    return events, pos
                 except ParseFailure as e:
                     events.append(Failure(e.args[0]))
                     self._state = PROTOCOL_VIOLATION
-                    return events
+                    return events, end
 
+                pos += consumed
                 self._bytes_expected = self._packet_header[2]
-                self._data = self._data[self._data.bitpos:]
                 self._state = COLLECTING_REST_OF_PACKET
 
-            elif self._state == COLLECTING_REST_OF_PACKET:
-
-                self._data = self._data[self._data.bitpos:]
-
-                if len(self._data) < self._bytes_expected * 8:
-                    return events
-
-            else:
-                self._data = self._data[self._data.bitpos:]
-                return events
-
-            if self._bytes_expected * 8 <= len(self._data):
+            if end - pos < self._bytes_expected:
+                return events, pos
 
-                self._state = WAITING_FOR_NEW_PACKET
+            self._state = WAITING_FOR_NEW_PACKET
 
-                packet_type, flags, value = self._packet_header
+            packet_type, flags, value = self._packet_header
 
-                if self._packet_count == 0 and packet_type != self._first_pkt:
-                    self._state = PROTOCOL_VIOLATION
-                    return [Failure("Connect packet was not first")]
-
-                if self._packet_count > 0 and packet_type == self._first_pkt:
-                    events.append(Failure("Multiple Connect packets"))
-                    self._state = PROTOCOL_VIOLATION
-                    return events
+            if self._packet_count == 0 and packet_type != self._first_pkt:
+                self._state = PROTOCOL_VIOLATION
+                return [Failure("Connect packet was not first")], end
 
-                try:
-                    dataToGive = self._data.read(value * 8)
+            if self._packet_count > 0 and packet_type == self._first_pkt:
+                events.append(Failure("Multiple Connect packets"))
+                self._state = PROTOCOL_VIOLATION
+                return events, end
 
-                    if packet_type not in self._packet_handlers:
-                        self._state = PROTOCOL_VIOLATION
-                        events.append(Failure("Unimplemented packet type %d" % (
-                            packet_type,)))
-                        return events
+            try:
+                dataToGive = ByteReader(view[pos:pos + value])
 
-                    packet_handler = self._packet_handlers[packet_type]
-                    deser = packet_handler.deserialise(flags, dataToGive)
-                    events.append(deser)
-                except ParseFailure as e:
-                    if len(e.args) == 1:
-                        events.append(Failure(e.args[0]))
-                    else:
-                        events.append(Failure(
-                            e.args[1] + " in " + e.args[0].__name__))
-                    self._state = PROTOCOL_VIOLATION
-                    return events
-                except bitstring.ReadError as e:
-                    # whoops the parsing fell off the amount of data
-                    events.append(Failure("Corrupt data, fell off the end: " +
-                                          str(e)))
+                if packet_type not in self._packet_handlers:
                     self._state = PROTOCOL_VIOLATION
-                    return events
-
-                self._packet_header = None
-                self._data = self._data[self._data.bitpos:]
-                self._packet_count += 1
-            else:
-                return events
+                    events.append(Failure("Unimplemented packet type %d" % (
+                        packet_type,)))
+                    return events, end
+
+                packet_handler = self._packet_handlers[packet_type]
+                deser = packet_handler.deserialise(flags, dataToGive)
+                events.append(deser)
+            except ParseFailure as e:
+                if len(e.args) == 1:
+                    events.append(Failure(e.args[0]))
+                else:
+                    events.append(Failure(
+                        e.args[1] + " in " + e.args[0].__name__))
+                self._state = PROTOCOL_VIOLATION
+                return events, end
+            except ReadError as e:
+                # whoops the parsing fell off the amount of data
+                events.append(Failure("Corrupt data, fell off the end: " +
+                                      str(e)))
+                self._state = PROTOCOL_VIOLATION
+                return events, end
+
+            pos += value
+            self._packet_header = None
+            self._packet_count += 1
 
 
 class MQTTClientParser(MQTTParser):
@@ -0,0 +1,298 @@
+#####################################################################################
+#
+#  Copyright (c) Crossbar.io Technologies GmbH
+#
+#  Unless a separate license agreement exists between you and Crossbar.io GmbH (e.g.
+#  you have purchased a commercial license), the license terms below apply.
+#
+#  Should you enter into a separate license agreement after having received a copy of
+#  this software, then the terms of such license agreement replace the terms below at
+#  the time at which such license agreement becomes effective.
+#
+#  In case a separate license agreement ends, and such agreement ends without being
+#  replaced by another separate license agreement, the license terms below apply
+#  from the time at which said agreement ends.
+#
+#  LICENSE TERMS
+#
+#  This program is free software: you can redistribute it and/or modify it under the
+#  terms of the GNU Affero General Public License, version 3, as published by the
+#  Free Software Foundation. This program is distributed in the hope that it will be
+#  useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#  See the GNU Affero General Public License Version 3 for more details.
+#
+#  You should have received a copy of the GNU Affero General Public license along
+#  with this program. If not, see <http://www.gnu.org/licenses/agpl-3.0.en.html>.
+#
+#####################################################################################
+
+from __future__ import absolute_import, division, print_function
+
+import hashlib
+import os
+import struct
+
+from collections import OrderedDict
+
+from txaio import make_logger
+
+from crossbar.bridge.mqtt.tx import Message
+
+__all__ = (
+    'SpillLog',
+    'PersistentSession',
+    'SessionStore',
+)
+
+
+class SpillLog(object):
+    """
+    Append-only file of MQTT messages, used to queue messages for an offline
+    client beyond what is kept in memory.
+
+    Each record is a fixed header (QoS, retain flag, topic length, payload
+    length) followed by the UTF-8 encoded topic and the payload.
+
+    Records are buffered in memory and written to the file in one go when
+    ``flush_size`` bytes have been buffered, so the reactor thread does one
+    write per many records. Writes and reads block the reactor thread (see
+    the ``spill_dir`` option in the docs). The log only serves to bound memory: it is not
+    synced to disk, and neither it nor the sessions survive a restart.
+    """
+
+    _header = struct.Struct('!BBHI')
+
+    def __init__(self, path, flush_size=65536):
+        self.path = path
+        self.count = 0
+        self._file = None
+        self._flush_size = flush_size
+        self._buffer = []
+        self._buffered = 0
+
+    def append(self, message):
+        topic = message.topic.encode('utf8')
+        self._buffer.append(self._header.pack(message.qos, message.retained, len(topic), len(message.body)))
+        self._buffer.append(topic)
+        self._buffer.append(message.body)
+        self._buffered += self._header.size + len(topic) + len(message.body)
+        self.count += 1
+        if self._buffered >= self._flush_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the buffered records to the file.
+        """
+        if not self._buffer:
+            return
+        if self._file is None:
+            # unbuffered: the records are written with one system call
+            self._file = open(self.path, 'wb', 0)
+        self._file.write(b''.join(self._buffer))
+        self._buffer = []
+        self._buffered = 0
+
+    def read(self):
+        """
+        Read back all messages in the log (in order), and remove the log.
+
+        :returns: list of :class:`crossbar.bridge.mqtt.tx.Message`
+        """
+        messages = []
+        if not self.count:
+            return messages
+
+        data = b''
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        data += b''.join(self._buffer)
+
+        pos = 0
+        while pos < len(data):
+            qos, retained, topic_len, body_len = self._header.unpack_from(data, pos)
+            pos += self._header.size
+            topic = data[pos:pos + topic_len].decode('utf8')
+            pos += topic_len
+            body = data[pos:pos + body_len]
+            pos += body_len
+            messages.append(Message(topic=topic, body=body, qos=qos, retained=bool(retained)))
+
+        self.remove()
+        return messages
+
+    def remove(self):
+        self._buffer = []
+        self._buffered = 0
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.count = 0
+
+
+class PersistentSession(object):
+    """
+    The state of a MQTT session with ``clean_session=false``.
+
+    The WAMP session of the MQTT client (and hence its subscriptions) is kept
+    while the client is offline, and QoS 1/2 events are queued for delivery
+    when it comes back.
+    """
+
+    def __init__(self, client_id, protocol, max_queued, spill_log=None, max_spilled=0):
+        self.client_id = client_id
+        self.protocol = protocol
+        self.online = True
+
+        # the call discarding the session when it has been offline too long
+        self.expiry_call = None
+        self._max_queued = max_queued
+        self._spill_log = spill_log
+        self._max_spilled = max_spilled
+
+    def queue(self, topic, qos, body, retained):
+        """
+        Queue an event for an offline client.
+        """
+        mqtt_session = self.protocol._mqtt.session
+        message = Message(topic=topic, body=body, qos=qos, retained=retained)
+
+        if self._spill_log is not None and self._spill_log.count:
+            # once we spilled, everything goes to the log to keep the order
+            if self._spill_log.count < self._max_spilled:
+                self._spill_log.append(message)
+                return
+        elif not self._max_queued or len(mqtt_session.queued_messages) < self._max_queued:
+            mqtt_session.queued_messages.append(message)
+            return
+        elif self._spill_log is not None and self._max_spilled:
+            self._spill_log.append(message)
+            return
+
+        mqtt_session.dropped_messages += 1
+
+    def restore(self):
+        """
+        Move spilled messages back to the send queue, when the client is back.
+        """
+        if self._spill_log is not None:
+            self.protocol._mqtt.session.queued_messages.extend(self._spill_log.read())
+
+    def discard(self):
+        if self._spill_log is not None:
+            self._spill_log.remove()
+
+
+class SessionStore(object):
+    """
+    Persistent MQTT sessions, keyed by MQTT client ID.
+
+    At most ``max_sessions`` offline sessions are kept: when more clients go
+    offline, the sessions that have been offline the longest are discarded.
+    Sessions offline for more than ``session_expiry`` seconds are discarded
+    as well.
+    """
+
+    log = make_logger()
+
+    def __init__(self, max_sessions=10000, max_queued=1000, spill_dir=None, max_spilled=100000,
+                 session_expiry=3600, timers=None):
+        self._max_sessions = max_sessions
+        self._max_queued = max_queued
+        self._spill_dir = spill_dir
+        self._max_spilled = max_spilled
+        self._session_expiry = session_expiry
+
+        if timers is None:
+            from twisted.internet import reactor
+            timers = reactor
+        self._timers = timers
+
+        # client ID -> PersistentSession
+        self._sessions = {}
+
+        # offline sessions, in the order they went offline
+        self._offline = OrderedDict()
+
+        if spill_dir and not os.path.isdir(spill_dir):
+            os.makedirs(spill_dir)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, client_id):
+        return self._sessions.get(client_id, None)
+
+    def attach(self, client_id, protocol):
+        """
+        Attach a (new) client connection to the persistent session for the
+        client ID, creating the session if it does not exist yet.
+        """
+        session = self._sessions.get(client_id, None)
+        if session is None:
+            spill_log = None
+            if self._spill_dir:
+                name = hashlib.sha1(client_id.encode('utf8')).hexdigest()
+                spill_log = SpillLog(os.path.join(self._spill_dir, '{}.log'.format(name)))
+            session = PersistentSession(client_id, protocol, self._max_queued,
+                                        spill_log=spill_log, max_spilled=self._max_spilled)
+            self._sessions[client_id] = session
+        else:
+            self._offline.pop(client_id, None)
+            self._cancel_expiry(session)
+            session.protocol = protocol
+
+        session.online = True
+        return session
+
+    def detach(self, client_id):
+        """
+        The client of a persistent session went offline.
+        """
+        session = self._sessions[client_id]
+        session.online = False
+        self._offline[client_id] = session
+
+        if self._session_expiry:
+            session.expiry_call = self._timers.callLater(self._session_expiry, self._expire, client_id)
+
+        while len(self._offline) > self._max_sessions:
+            oldest = next(iter(self._offline))
+            self.log.info('discarding offline MQTT session "{client_id}" (too many offline sessions)',
+                          client_id=oldest)
+            self.discard(oldest)
+
+    def discard(self, client_id):
+        """
+        Discard the persistent session for the client ID.
+
+        :returns: The discarded session, or ``None``.
+        """
+        session = self._sessions.pop(client_id, None)
+        if session is not None:
+            self._offline.pop(client_id, None)
+            self._cancel_expiry(session)
+            session.discard()
+            if not session.online:
+                session.protocol._close_wamp_session()
+        return session
+
+    def _expire(self, client_id):
+        session = self._sessions.get(client_id, None)
+        if session is not None and not session.online:
+            session.expiry_call = None
+            self.log.info('discarding offline MQTT session "{client_id}" (expired)', client_id=client_id)
+            self.discard(client_id)
+
+    def _cancel_expiry(self, session):
+        if session.expiry_call is not None:
+            if session.expiry_call.active():
+                session.expiry_call.cancel()
+            session.expiry_call = None
@@ -0,0 +1,139 @@
+#####################################################################################
+#
+#  Copyright (c) Crossbar.io Technologies GmbH
+#
+#  Unless a separate license agreement exists between you and Crossbar.io GmbH (e.g.
+#  you have purchased a commercial license), the license terms below apply.
+#
+#  Should you enter into a separate license agreement after having received a copy of
+#  this software, then the terms of such license agreement replace the terms below at
+#  the time at which such license agreement becomes effective.
+#
+#  In case a separate license agreement ends, and such agreement ends without being
+#  replaced by another separate license agreement, the license terms below apply
+#  from the time at which said agreement ends.
+#
+#  LICENSE TERMS
+#
+#  This program is free software: you can redistribute it and/or modify it under the
+#  terms of the GNU Affero General Public License, version 3, as published by the
+#  Free Software Foundation. This program is distributed in the hope that it will be
+#  useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#  See the GNU Affero General Public License Version 3 for more details.
+#
+#  You should have received a copy of the GNU Affero General Public license along
+#  with this program. If not, see <http://www.gnu.org/licenses/agpl-3.0.en.html>.
+#
+#####################################################################################
+
+from __future__ import absolute_import, division
+
+from twisted.trial.unittest import TestCase
+from twisted.internet.defer import succeed, fail
+from twisted.internet.task import Clock
+
+from autobahn.wamp.exception import ApplicationError
+
+from crossbar.bridge.mqtt.batch import CodecBatcher
+
+
+class FakeCodecSession(object):
+    """
+    A codec session with a decoder upper-casing the payload, and a batch
+    decoder doing the same for a list of calls.
+    """
+
+    def __init__(self, batch_result=None):
+        self.calls = []
+        self._batch_result = batch_result
+
+    def call(self, procedure, *args):
+        self.calls.append((procedure, args))
+        if procedure == u'com.example.decode':
+            return succeed(args[2].upper())
+        elif procedure == u'com.example.decode_batch':
+            if self._batch_result is not None:
+                return self._batch_result
+            return succeed([call[2].upper() for call in args[0]])
+        return fail(ApplicationError(u'wamp.error.no_such_procedure'))
+
+
+class CodecBatcherTests(TestCase):
+
+    def _make_batcher(self, session, **kw):
+        clock = Clock()
+        batcher = CodecBatcher(clock, lambda: session,
+                               u'com.example.decode',
+                               u'com.example.decode_batch', **kw)
+        return clock, batcher
+
+    def test_batch_flushed_after_delay(self):
+        """
+        Calls are held back until ``max_delay`` elapsed, and then sent to the
+        batch procedure in one call.
+        """
+        session = FakeCodecSession()
+        clock, batcher = self._make_batcher(session, max_delay=5)
+
+        d1 = batcher.call(u'a.b', u'a/b', u'foo')
+        d2 = batcher.call(u'a.c', u'a/c', u'bar')
+        self.assertEqual(session.calls, [])
+
+        clock.advance(0.005)
+        self.assertEqual(session.calls, [
+            (u'com.example.decode_batch', ([[u'a.b', u'a/b', u'foo'], [u'a.c', u'a/c', u'bar']],))
+        ])
+        self.assertEqual(self.successResultOf(d1), u'FOO')
+        self.assertEqual(self.successResultOf(d2), u'BAR')
+        self.assertEqual(batcher.batches, 1)
+
+    def test_batch_flushed_when_full(self):
+        """
+        A batch is sent right away once ``max_size`` calls are pending.
+        """
+        session = FakeCodecSession()
+        clock, batcher = self._make_batcher(session, max_size=2)
+
+        batcher.call(u'a.b', u'a/b', u'foo')
+        batcher.call(u'a.b', u'a/b', u'bar')
+        self.assertEqual(len(session.calls), 1)
+
+        # the timer for the flushed batch was cancelled
+        self.assertEqual(clock.getDelayedCalls(), [])
+
+    def test_fallback_on_failure(self):
+        """
+        When the batch procedure fails, every call is retried on the regular
+        codec procedure.
+        """
+        session = FakeCodecSession(batch_result=fail(ApplicationError(u'com.example.error')))
+        clock, batcher = self._make_batcher(session)
+
+        d1 = batcher.call(u'a.b', u'a/b', u'foo')
+        d2 = batcher.call(u'a.c', u'a/c', u'bar')
+        clock.advance(1)
+
+        self.assertEqual(self.successResultOf(d1), u'FOO')
+        self.assertEqual(self.successResultOf(d2), u'BAR')
+        self.assertEqual([procedure for procedure, _ in session.calls], [
+            u'com.example.decode_batch', u'com.example.decode', u'com.example.decode'
+        ])
+        self.assertEqual(batcher.fallbacks, 1)
+
+    def test_fallback_on_invalid_result(self):
+        """
+        When the batch procedure returns a result not matching the batch, every
+        call is retried on the regular codec procedure.
+        """
+        session = FakeCodecSession(batch_result=succeed([u'FOO']))
+        clock, batcher = self._make_batcher(session)
+
+        d1 = batcher.call(u'a.b', u'a/b', u'foo')
+        d2 = batcher.call(u'a.c', u'a/c', u'bar')
+        clock.advance(1)
+
+        self.assertEqual(self.successResultOf(d1), u'FOO')
+        self.assertEqual(self.successResultOf(d2), u'BAR')
+        self.assertEqual(batcher.fallbacks, 1)
@@ -30,7 +30,7 @@
 
 from __future__ import absolute_import, division
 
-from bitstring import BitStream
+from crossbar.bridge.mqtt._utils import ByteReader
 
 from crossbar.bridge.mqtt.protocol import (
     Connect, ConnACK,
@@ -57,7 +57,7 @@ class ConnectTests(TestCase):
         good = b"\x00\x04MQTT\x04\x02\x00\x00\x00\x07test123"
 
         event = Connect.deserialise((False, False, False, False),
-                                    BitStream(bytes=good))
+                                    ByteReader(good))
         self.assertEqual(event.serialise(), header + good)
 
 
@@ -73,7 +73,7 @@ class ConnectAckTests(TestCase):
         header = b"\x20\x02"
         good = b"\x00\x00"
         event = ConnACK.deserialise((False, False, False, False),
-                                    BitStream(bytes=good))
+                                    ByteReader(good))
         self.assertEqual(event.serialise(), header + good)
 
 
@@ -90,7 +90,7 @@ class SubscribeTests(TestCase):
         good = (b"\x00\x01\x00\x0b\x66\x6f\x6f\x2f\x62\x61\x72\x2f\x62\x61"
                 b"\x7a\x00")
         event = Subscribe.deserialise((False, False, True, False),
-                                      BitStream(bytes=good))
+                                      ByteReader(good))
         self.assertEqual(event.serialise(), header + good)
 
 
@@ -106,7 +106,7 @@ class SubACKTests(TestCase):
         header = b"\x90\x03"
         good = b"\x00\x01\x00"
         event = SubACK.deserialise((False, False, False, False),
-                                   BitStream(bytes=good))
+                                   ByteReader(good))
         self.assertEqual(event.serialise(), header + good)
 
 
@@ -125,7 +125,7 @@ class PublishTests(TestCase):
                 b"\x6c\x6c\x6f\x20\x66\x72\x69\x65\x6e\x64\x73")
 
         event = Publish.deserialise((False, False, False, False),
-                                    BitStream(bytes=good))
+                                    ByteReader(good))
         self.assertEqual(event.serialise(), header + good)
 
     def test_round_trip_qos1(self):
@@ -139,7 +139,7 @@ class PublishTests(TestCase):
                 b"\x68\x65\x6c\x6c\x6f\x20\x66\x72\x69\x65\x6e\x64\x73")
 
         event = Publish.deserialise((False, False, True, False),
-                                    BitStream(bytes=good))
+                                    ByteReader(good))
         self.assertEqual(event.serialise(), header + good)
 
 
@@ -156,7 +156,7 @@ class PubACKTests(TestCase):
         good = b"\x00\x02"
 
         event = PubACK.deserialise((False, False, False, False),
-                                   BitStream(bytes=good))
+                                   ByteReader(good))
         self.assertEqual(event.serialise(), header + good)
 
 
@@ -174,7 +174,7 @@ class UnsubscribeTests(TestCase):
                 b"\x2e\x6f\x6e\x63\x6f\x75\x6e\x74\x65\x72")
 
         event = Unsubscribe.deserialise((False, False, True, False),
-                                        BitStream(bytes=good))
+                                        ByteReader(good))
         self.assertEqual(event.serialise(), header + good)
 
 
@@ -191,5 +191,5 @@ class UnsubACKTests(TestCase):
         good = b"\x00\x03"
 
         event = UnsubACK.deserialise((False, False, False, False),
-                                     BitStream(bytes=good))
+                                     ByteReader(good))
         self.assertEqual(event.serialise(), header + good)
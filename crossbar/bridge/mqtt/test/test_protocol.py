@@ -39,6 +39,7 @@ from crossbar.bridge.mqtt.protocol import (
     Failure, PROTOCOL_VIOLATION,
     Connect,
     Subscribe, Unsubscribe,
+    Publish,
     PingREQ,
 )
 from crossbar.bridge.mqtt._utils import iterbytes
@@ -540,3 +541,29 @@ class MQTTConformanceTests(TestCase, MQTTEventTestBase):
         # We want to have consumed all the events
         self.assertEqual(len(events), 0)
         self.assertEqual(p._state, PROTOCOL_VIOLATION)
+
+    def test_large_packet_in_chunks(self):
+        """
+        A packet with a multi-byte remaining length, received in chunks of
+        arbitrary size and followed by further packets in the same chunk, is
+        parsed correctly.
+        """
+        events = []
+        p = MQTTParser()
+
+        publish = Publish(duplicate=False, qos_level=1, retain=False,
+                          topic_name=u"foo/bar", packet_identifier=1234,
+                          payload=b"x" * 20000)
+        data = (
+            unhexlify(b"101300044d51545404020002000774657374313233") +
+            publish.serialise() + PingREQ().serialise()
+        )
+
+        for i in range(0, len(data), 1000):
+            events.extend(p.data_received(data[i:i + 1000]))
+
+        self.assertEqual(len(events), 3)
+        self.assertIsInstance(events[0], Connect)
+        self.assertEqual(events[1], publish)
+        self.assertIsInstance(events[2], PingREQ)
+        self.assertEqual(p._chunks, [])
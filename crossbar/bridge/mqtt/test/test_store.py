@@ -0,0 +1,191 @@
+#####################################################################################
+#
+#  Copyright (c) Crossbar.io Technologies GmbH
+#
+#  Unless a separate license agreement exists between you and Crossbar.io GmbH (e.g.
+#  you have purchased a commercial license), the license terms below apply.
+#
+#  Should you enter into a separate license agreement after having received a copy of
+#  this software, then the terms of such license agreement replace the terms below at
+#  the time at which such license agreement becomes effective.
+#
+#  In case a separate license agreement ends, and such agreement ends without being
+#  replaced by another separate license agreement, the license terms below apply
+#  from the time at which said agreement ends.
+#
+#  LICENSE TERMS
+#
+#  This program is free software: you can redistribute it and/or modify it under the
+#  terms of the GNU Affero General Public License, version 3, as published by the
+#  Free Software Foundation. This program is distributed in the hope that it will be
+#  useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#  See the GNU Affero General Public License Version 3 for more details.
+#
+#  You should have received a copy of the GNU Affero General Public license along
+#  with this program. If not, see <http://www.gnu.org/licenses/agpl-3.0.en.html>.
+#
+#####################################################################################
+
+from __future__ import absolute_import, division
+
+import os
+import tempfile
+import shutil
+
+import mock
+
+from twisted.internet.task import Clock
+from twisted.trial.unittest import TestCase
+
+from crossbar.bridge.mqtt.tx import Session, Message
+from crossbar.bridge.mqtt.store import SpillLog, SessionStore
+
+
+class FakeProtocol(object):
+
+    def __init__(self, client_id):
+        self._mqtt = mock.Mock()
+        self._mqtt.session = Session(client_id=client_id)
+        self._close_wamp_session = mock.Mock()
+
+
+class SpillLogTests(TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+
+    def test_roundtrip(self):
+        """
+        Messages appended to the log are read back in order, and the log file
+        is removed afterwards.
+        """
+        path = os.path.join(self.tempdir, 'test.log')
+        log = SpillLog(path)
+        messages = [
+            Message(topic=u'a/b', body=b'hello', qos=1, retained=False),
+            Message(topic=u'\u00fc/c', body=b'', qos=2, retained=True),
+        ]
+        for message in messages:
+            log.append(message)
+        self.assertEqual(log.count, 2)
+
+        self.assertEqual(log.read(), messages)
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(log.count, 0)
+        self.assertEqual(log.read(), [])
+
+    def test_buffered(self):
+        """
+        Records are written to the file in chunks, and records not written
+        yet are read back as well.
+        """
+        path = os.path.join(self.tempdir, 'test.log')
+        log = SpillLog(path, flush_size=20)
+        messages = [Message(topic=u't', body=str(i).encode('ascii') * 5, qos=1, retained=False) for i in range(3)]
+
+        log.append(messages[0])
+        self.assertFalse(os.path.exists(path))
+        log.append(messages[1])
+        self.assertEqual(os.path.getsize(path), 28)
+        log.append(messages[2])
+
+        self.assertEqual(log.read(), messages)
+        self.assertFalse(os.path.exists(path))
+
+
+class SessionStoreTests(TestCase):
+
+    def test_queue_bound(self):
+        """
+        Messages for an offline client are queued up to the limit, further
+        messages are dropped.
+        """
+        store = SessionStore(max_queued=2, timers=Clock())
+        protocol = FakeProtocol(u'client1')
+        session = store.attach(u'client1', protocol)
+        store.detach(u'client1')
+
+        for i in range(3):
+            session.queue(u'topic', 1, b'x', False)
+
+        self.assertEqual(len(protocol._mqtt.session.queued_messages), 2)
+        self.assertEqual(protocol._mqtt.session.dropped_messages, 1)
+
+    def test_spill(self):
+        """
+        With a spill directory, messages beyond the in-memory limit go to the
+        spill log, and are queued again in order when the client is back.
+        """
+        tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tempdir)
+
+        store = SessionStore(max_queued=2, spill_dir=tempdir, max_spilled=2, timers=Clock())
+        protocol = FakeProtocol(u'client1')
+        session = store.attach(u'client1', protocol)
+        store.detach(u'client1')
+
+        for i in range(5):
+            session.queue(u'topic', 1, str(i).encode('ascii'), False)
+
+        queue = protocol._mqtt.session.queued_messages
+        self.assertEqual([m.body for m in queue], [b'0', b'1'])
+        self.assertEqual(session._spill_log.count, 2)
+        self.assertEqual(protocol._mqtt.session.dropped_messages, 1)
+
+        store.attach(u'client1', protocol)
+        session.restore()
+        self.assertEqual([m.body for m in queue], [b'0', b'1', b'2', b'3'])
+        self.assertEqual(os.listdir(tempdir), [])
+
+    def test_evict_oldest_offline(self):
+        """
+        When there are too many offline sessions, the one that has been offline
+        the longest is discarded.
+        """
+        store = SessionStore(max_sessions=2, timers=Clock())
+        protocols = {}
+        for client_id in [u'client1', u'client2', u'client3']:
+            protocols[client_id] = FakeProtocol(client_id)
+            store.attach(client_id, protocols[client_id])
+
+        store.detach(u'client2')
+        store.detach(u'client1')
+        self.assertEqual(len(store), 3)
+
+        store.detach(u'client3')
+        self.assertEqual(len(store), 2)
+        self.assertIsNone(store.get(u'client2'))
+        protocols[u'client2']._close_wamp_session.assert_called_once_with()
+
+        # a client coming back is not offline anymore
+        store.attach(u'client1', protocols[u'client1'])
+        self.assertTrue(store.get(u'client1').online)
+
+    def test_expiry(self):
+        """
+        Sessions offline for longer than the session expiry are discarded.
+        """
+        clock = Clock()
+        store = SessionStore(session_expiry=60, timers=clock)
+        protocols = {}
+        for client_id in [u'client1', u'client2']:
+            protocols[client_id] = FakeProtocol(client_id)
+            store.attach(client_id, protocols[client_id])
+            store.detach(client_id)
+
+        # a client coming back in time keeps its session
+        clock.advance(30)
+        store.attach(u'client1', protocols[u'client1'])
+
+        clock.advance(30)
+        self.assertIsNone(store.get(u'client2'))
+        protocols[u'client2']._close_wamp_session.assert_called_once_with()
+        self.assertTrue(store.get(u'client1').online)
+
+        store.detach(u'client1')
+        clock.advance(60)
+        self.assertEqual(len(store), 0)
+        self.assertEqual(clock.getDelayedCalls(), [])
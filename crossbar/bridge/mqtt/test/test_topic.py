@@ -31,7 +31,7 @@
 
 from twisted.trial.unittest import TestCase
 
-from crossbar.bridge.mqtt.wamp import _mqtt_topicfilter_to_wamp, _mqtt_topicname_to_wamp
+from crossbar.bridge.mqtt.wamp import _mqtt_topicfilter_to_wamp, _mqtt_topicname_to_wamp, _mqtt_shared_topicfilter
 
 
 class MQTTTopicTests(TestCase):
@@ -165,3 +165,25 @@ class MQTTTopicTests(TestCase):
         ]:
             with self.assertRaises(TypeError):
                 _mqtt_topicname_to_wamp(topic)
+
+    def test_shared_topic_filters(self):
+        """
+        Test splitting of topic filters of shared subscriptions.
+        """
+        for topic, group, topic_filter in [
+            (u'$share/g1/com/example/topic1', u'g1', u'com/example/topic1'),
+            (u'$share/consumers/sport/+/player1', u'consumers', u'sport/+/player1'),
+            (u'$share/g1/#', u'g1', u'#'),
+            (u'com/example/topic1', None, u'com/example/topic1'),
+        ]:
+            self.assertEqual(_mqtt_shared_topicfilter(topic), (group, topic_filter))
+
+        for topic in [
+            u'$share/g1',
+            u'$share//com/example/topic1',
+            u'$share/g1/',
+            u'$share/+/com/example/topic1',
+            u'$share/#/com/example/topic1',
+        ]:
+            with self.assertRaises(TypeError):
+                _mqtt_shared_topicfilter(topic)
@@ -42,9 +42,11 @@ from crossbar.bridge.mqtt._events import (
     SubACK, Subscribe,
     Publish, PubACK, PubREC, PubREL, PubCOMP,
     Unsubscribe, UnsubACK,
+    PingREQ, PingRESP,
     SubscriptionTopicRequest
 )
 from crossbar.bridge.mqtt._utils import iterbytes
+from crossbar.router.timerwheel import TimerWheel
 from crossbar._logging import LogCapturer, LogLevel
 
 from twisted.test.proto_helpers import Clock, StringTransport
@@ -180,6 +182,40 @@ class TwistedProtocolTests(TestCase):
         r.advance(0.1)
         self.assertTrue(t.disconnecting)
 
+    def test_keepalive_timer_wheel(self):
+        """
+        Keepalive timeouts can be scheduled on a timer wheel, which resets the
+        timeout when data arrives, and disconnects after keep_alive * 1.5.
+        """
+        h = BasicHandler()
+        r = Clock()
+        t = StringTransport()
+        timers = TimerWheel(r)
+        p = MQTTServerTwistedProtocol(h, r, timers=timers)
+        p.makeConnection(t)
+
+        data = (
+            # CONNECT, with keepalive of 2
+            b"101300044d51545404020002000774657374313233"
+        )
+
+        for x in iterbytes(unhexlify(data)):
+            p.dataReceived(x)
+
+        self.assertEqual(len(timers), 1)
+        self.assertEqual(len(r.calls), 1)
+
+        r.pump([0.1] * 20)
+        self.assertFalse(t.disconnecting)
+
+        # PINGREQ resets the timeout
+        p.dataReceived(b"\xc0\x00")
+        r.pump([0.1] * 29)
+        self.assertFalse(t.disconnecting)
+
+        r.advance(0.1)
+        self.assertTrue(t.disconnecting)
+
     def test_keepalive_canceled_on_lost_connection(self):
         """
         If a client connects with a timeout, and disconnects themselves, we
@@ -293,19 +329,25 @@ class TwistedProtocolTests(TestCase):
         r.advance(0.1)
         self.assertFalse(t.disconnecting)
 
-    def test_transport_paused_while_processing(self):
+    def test_transport_not_paused_while_processing(self):
         """
-        The transport is paused whilst the MQTT protocol is parsing/handling
-        existing items.
+        The transport is not paused whilst the MQTT protocol is handling
+        existing items. Packets received meanwhile are processed in order,
+        after the pending ones.
         """
         d = Deferred()
         h = BasicHandler()
         h.process_connect = lambda x: d
+        published = []
+        h.process_publish_qos_0 = published.append
         r, t, p, cp = make_test_items(h)
 
         data = (
             Connect(client_id=u"test123",
-                    flags=ConnectFlags(clean_session=False)).serialise()
+                    flags=ConnectFlags(clean_session=False)).serialise() +
+            Publish(duplicate=False, qos_level=0, retain=False,
+                    topic_name=u"foo", payload=b"bar").serialise() +
+            PingREQ().serialise()
         )
 
         self.assertEqual(t.producerState, 'producing')
@@ -313,10 +355,46 @@ class TwistedProtocolTests(TestCase):
         for x in iterbytes(data):
             p.dataReceived(x)
 
+        self.assertEqual(t.producerState, 'producing')
+        self.assertEqual(t.value(), b'')
+        self.assertEqual(published, [])
+
+        d.callback((0, False))
+
+        events = cp.data_received(t.value())
+        self.assertEqual(len(events), 2)
+        self.assertIsInstance(events[0], ConnACK)
+        self.assertIsInstance(events[1], PingRESP)
+        self.assertEqual(len(published), 1)
+        self.assertEqual(t.producerState, 'producing')
+
+    def test_transport_paused_when_work_piles_up(self):
+        """
+        When too many received packets wait to be processed, the transport
+        is paused until they are processed.
+        """
+        d = Deferred()
+        h = BasicHandler()
+        h.process_connect = lambda x: d
+        r, t, p, cp = make_test_items(h)
+        p.max_pending = 3
+
+        data = Connect(client_id=u"test123",
+                       flags=ConnectFlags(clean_session=False)).serialise()
+        p.dataReceived(data)
+        # the CONNECT waiting for the handler counts as pending, too
+        p.dataReceived(PingREQ().serialise())
+        self.assertEqual(t.producerState, 'producing')
+
+        p.dataReceived(PingREQ().serialise())
         self.assertEqual(t.producerState, 'paused')
+
         d.callback((0, False))
         self.assertEqual(t.producerState, 'producing')
 
+        events = cp.data_received(t.value())
+        self.assertEqual(len(events), 3)
+
     def test_unknown_connect_code_must_lose_connection(self):
         """
         A non-zero, and non-1-to-5 connect code from the handler must result in
@@ -1397,3 +1475,163 @@ class SendPublishTests(TestCase):
               test_qos_2_resent_on_disconnect_pubrel]:
         x.todo = ("Needs WAMP-level implementation first, and the WAMP router "
                   "to resend ACKs/messages")
+
+
+class ResumingHandler(BasicHandler):
+    """
+    A handler which keeps the sessions of disconnected clients, and resumes
+    them when the client connects again.
+    """
+    def __init__(self):
+        self.sessions = {}
+        self.protocol = None
+
+    def process_connect(self, event):
+        session = self.sessions.get(event.client_id)
+        if session is not None:
+            self.protocol.session = session
+        self.sessions[event.client_id] = self.protocol.session
+        return succeed((0, session is not None))
+
+
+class OutboundFlowControlTests(TestCase):
+    """
+    Tests for the in-flight window and send queue of outgoing Publishes.
+    """
+
+    def _connect(self, p, client_id=u"test123"):
+        data = Connect(client_id=client_id,
+                       flags=ConnectFlags(clean_session=False)).serialise()
+        for x in iterbytes(data):
+            p.dataReceived(x)
+
+    def _make(self, handler=None, **kwargs):
+        r = Clock()
+        t = StringTransport()
+        p = MQTTServerTwistedProtocol(handler or BasicHandler(), r, **kwargs)
+        cp = MQTTClientParser()
+        p.makeConnection(t)
+        self._connect(p)
+        events = cp.data_received(t.value())
+        t.clear()
+        self.assertIsInstance(events[0], ConnACK)
+        return r, t, p, cp
+
+    def test_inflight_window(self):
+        """
+        No more than ``max_inflight`` QoS 1 messages are sent before the client
+        acknowledges some of them. Messages behind are sent in order after the
+        PubACK arrived.
+        """
+        r, t, p, cp = self._make(max_inflight=2)
+
+        p.send_publish(u"hello", 1, b'1', False)
+        p.send_publish(u"hello", 1, b'2', False)
+        p.send_publish(u"hello", 1, b'3', False)
+        p.send_publish(u"hello", 0, b'4', False)
+        r.advance(0.1)
+
+        events = cp.data_received(t.value())
+        t.clear()
+        self.assertEqual([e.payload for e in events], [b'1', b'2'])
+        self.assertEqual(list(p.session.inflight.keys()), [1, 2])
+
+        for x in iterbytes(PubACK(packet_identifier=1).serialise()):
+            p.dataReceived(x)
+
+        events = cp.data_received(t.value())
+        t.clear()
+        self.assertEqual([e.payload for e in events], [b'3', b'4'])
+        self.assertEqual(events[0].packet_identifier, 3)
+        self.assertEqual(events[1].qos_level, 0)
+        self.assertEqual(list(p.session.inflight.keys()), [2, 3])
+
+    def test_queue_drop_oldest(self):
+        """
+        With the "drop_oldest" policy, the oldest queued message is dropped when
+        the queue is full.
+        """
+        r, t, p, cp = self._make(max_queued=2, queue_overflow_policy=u'drop_oldest')
+
+        for i in range(3):
+            p.send_publish(u"hello", 0, str(i).encode('ascii'), False)
+        r.advance(0.1)
+
+        events = cp.data_received(t.value())
+        self.assertEqual([e.payload for e in events], [b'1', b'2'])
+        self.assertEqual(p.session.dropped_messages, 1)
+
+    def test_queue_drop_newest(self):
+        """
+        With the "drop_newest" policy, new messages are dropped when the queue
+        is full.
+        """
+        r, t, p, cp = self._make(max_queued=2, queue_overflow_policy=u'drop_newest')
+
+        for i in range(3):
+            p.send_publish(u"hello", 0, str(i).encode('ascii'), False)
+        r.advance(0.1)
+
+        events = cp.data_received(t.value())
+        self.assertEqual([e.payload for e in events], [b'0', b'1'])
+        self.assertEqual(p.session.dropped_messages, 1)
+
+    def test_queue_disconnect(self):
+        """
+        With the "disconnect" policy, the client is disconnected when the queue
+        is full.
+        """
+        r, t, p, cp = self._make(max_queued=2, queue_overflow_policy=u'disconnect')
+
+        for i in range(3):
+            p.send_publish(u"hello", 0, b'x', False)
+
+        self.assertTrue(t.disconnecting)
+
+    def test_resend_inflight_on_resume(self):
+        """
+        If the handler resumes a session, the QoS 1 messages that were not
+        acknowledged are resent with DUP set, before the messages queued while
+        the client was away.
+
+        Compliance statements: MQTT-4.4.0-1, MQTT-3.3.1-1
+        """
+        h = ResumingHandler()
+        r = Clock()
+        p = MQTTServerTwistedProtocol(h, r, max_inflight=1)
+        h.protocol = p
+        t = StringTransport()
+        p.makeConnection(t)
+        self._connect(p)
+
+        p.send_publish(u"hello", 1, b'1', False)
+        p.send_publish(u"hello", 1, b'2', False)
+        r.advance(0.1)
+        t.clear()
+
+        # the client goes away without acknowledging
+        t.connected = False
+        p.connectionLost(None)
+
+        p2 = MQTTServerTwistedProtocol(h, r, max_inflight=1)
+        h.protocol = p2
+        t2 = StringTransport()
+        p2.makeConnection(t2)
+        self._connect(p2)
+
+        cp = MQTTClientParser()
+        events = cp.data_received(t2.value())
+        t2.clear()
+        self.assertEqual(len(events), 2)
+        self.assertEqual(events[0], ConnACK(session_present=True, return_code=0))
+        self.assertEqual(events[1], Publish(duplicate=True, qos_level=1, retain=False,
+                                            packet_identifier=1, topic_name=u"hello",
+                                            payload=b"1"))
+
+        for x in iterbytes(PubACK(packet_identifier=1).serialise()):
+            p2.dataReceived(x)
+
+        events = cp.data_received(t2.value())
+        self.assertEqual(events, [Publish(duplicate=False, qos_level=1, retain=False,
+                                          packet_identifier=2, topic_name=u"hello",
+                                          payload=b"2")])
@@ -81,7 +81,7 @@ class ObservingSession(ApplicationSession):
         self.s = yield self.subscribe(on_event, self._topic)
 
 
-def build_mqtt_server():
+def build_mqtt_server(**extra_options):
 
     reactor = Clock()
     router_factory, server_factory, session_factory = make_router()
@@ -180,6 +180,8 @@ def build_mqtt_server():
         }
     }
 
+    options[u"options"].update(extra_options)
+
     mqtt_factory = WampMQTTServerFactory(session_factory, options, reactor)
 
     server_factory._mqtt_factory = mqtt_factory
@@ -476,6 +478,255 @@ class MQTTAdapterTests(TestCase):
                     payload=b'{"args":["bar"]}').serialise()
         )
 
+    def test_subscribe_qos_1(self):
+        """
+        A MQTT client subscribing with QoS 1 is granted QoS 1, and gets the
+        events with QoS 1.
+        """
+        reactor, router, server_factory, session_factory = build_mqtt_server()
+        client_transport, client_protocol, mqtt_pump = connect_mqtt_server(server_factory)
+
+        session, pump = connect_application_session(
+            server_factory, ApplicationSession, component_config=ComponentConfig(realm=u"mqtt"))
+
+        client_transport.write(
+            Connect(client_id=u"testclient", username=u"test123", password=u"password",
+                    flags=ConnectFlags(clean_session=True, username=True, password=True)).serialise())
+        client_transport.write(
+            Subscribe(packet_identifier=1, topic_requests=[
+                SubscriptionTopicRequest(topic_filter=u"com/test/wamp", max_qos=1)
+            ]).serialise())
+
+        mqtt_pump.flush()
+
+        self.assertEqual(
+            client_protocol.data,
+            (
+                ConnACK(session_present=False, return_code=0).serialise() +
+                SubACK(packet_identifier=1, return_codes=[1]).serialise()
+            ))
+        client_protocol.data = b""
+
+        session.publish(u"com.test.wamp", u"bar")
+        pump.flush()
+
+        reactor.advance(0.1)
+        mqtt_pump.flush()
+
+        self.assertEqual(
+            client_protocol.data,
+            Publish(duplicate=False, qos_level=1, retain=False,
+                    topic_name=u"com/test/wamp", packet_identifier=1,
+                    payload=b'{"args":["bar"]}').serialise()
+        )
+
+    def test_retained_wildcard(self):
+        """
+        A MQTT client subscribing with a wildcard topic filter gets the
+        retained messages of all matching topics. A retained message with an
+        empty payload clears the retained message on the topic.
+        """
+        reactor, router, server_factory, session_factory = build_mqtt_server()
+
+        client_transport, client_protocol, mqtt_pump = connect_mqtt_server(server_factory)
+        client_transport.write(
+            Connect(client_id=u"publisher", username=u"test123", password=u"password",
+                    flags=ConnectFlags(clean_session=True, username=True, password=True)).serialise())
+        for topic, payload in [(u"sensors/1/temp", b'{"args":[20]}'),
+                               (u"sensors/2/temp", b'{"args":[21]}'),
+                               (u"sensors/2/humidity", b'{"args":[50]}'),
+                               (u"sensors/1/temp", b'')]:
+            client_transport.write(
+                Publish(duplicate=False, qos_level=0, retain=True,
+                        topic_name=topic, payload=payload).serialise())
+        mqtt_pump.flush()
+
+        client_transport, client_protocol, mqtt_pump = connect_mqtt_server(server_factory)
+        client_transport.write(
+            Connect(client_id=u"subscriber", username=u"test123", password=u"password",
+                    flags=ConnectFlags(clean_session=True, username=True, password=True)).serialise())
+        client_transport.write(
+            Subscribe(packet_identifier=1, topic_requests=[
+                SubscriptionTopicRequest(topic_filter=u"sensors/+/temp", max_qos=0)
+            ]).serialise())
+        mqtt_pump.flush()
+        reactor.advance(0.1)
+        mqtt_pump.flush()
+
+        self.assertEqual(
+            client_protocol.data,
+            (
+                ConnACK(session_present=False, return_code=0).serialise() +
+                SubACK(packet_identifier=1, return_codes=[0]).serialise() +
+                Publish(duplicate=False, qos_level=0, retain=True,
+                        topic_name=u"sensors/2/temp",
+                        payload=b'{"args":[21]}').serialise()
+            ))
+
+    def test_shared_subscription(self):
+        """
+        MQTT clients subscribing to a shared subscription of the same group
+        take turns in receiving the events.
+        """
+        reactor, router, server_factory, session_factory = build_mqtt_server()
+
+        session, pump = connect_application_session(
+            server_factory, ApplicationSession, component_config=ComponentConfig(realm=u"mqtt"))
+
+        clients = []
+        for client_id in [u"client1", u"client2"]:
+            client_transport, client_protocol, mqtt_pump = connect_mqtt_server(server_factory)
+            client_transport.write(
+                Connect(client_id=client_id, username=u"test123", password=u"password",
+                        flags=ConnectFlags(clean_session=True, username=True, password=True)).serialise())
+            client_transport.write(
+                Subscribe(packet_identifier=1, topic_requests=[
+                    SubscriptionTopicRequest(topic_filter=u"$share/g1/com/test/wamp", max_qos=0)
+                ]).serialise())
+            mqtt_pump.flush()
+
+            self.assertEqual(
+                client_protocol.data,
+                (
+                    ConnACK(session_present=False, return_code=0).serialise() +
+                    SubACK(packet_identifier=1, return_codes=[0]).serialise()
+                ))
+            client_protocol.data = b""
+            clients.append((client_protocol, mqtt_pump))
+
+        for i in range(4):
+            session.publish(u"com.test.wamp", i)
+            pump.flush()
+
+        reactor.advance(0.1)
+
+        received = []
+        for client_protocol, mqtt_pump in clients:
+            mqtt_pump.flush()
+            received.append(client_protocol.data)
+
+        expected = [
+            Publish(duplicate=False, qos_level=0, retain=False,
+                    topic_name=u"com/test/wamp",
+                    payload=u'{{"args":[{}]}}'.format(i).encode('utf8')).serialise()
+            for i in range(4)
+        ]
+        self.assertEqual(sorted(received), sorted([
+            expected[0] + expected[2],
+            expected[1] + expected[3],
+        ]))
+
+    def test_shared_subscription_and_plain(self):
+        """
+        A MQTT client subscribing to both a topic filter and a shared
+        subscription on it receives every event, while the other members of
+        the group still take turns.
+        """
+        reactor, router, server_factory, session_factory = build_mqtt_server()
+
+        session, pump = connect_application_session(
+            server_factory, ApplicationSession, component_config=ComponentConfig(realm=u"mqtt"))
+
+        clients = []
+        for client_id, topic_filters in [(u"client1", [u"com/test/wamp", u"$share/g1/com/test/wamp"]),
+                                         (u"client2", [u"$share/g1/com/test/wamp"])]:
+            client_transport, client_protocol, mqtt_pump = connect_mqtt_server(server_factory)
+            client_transport.write(
+                Connect(client_id=client_id, username=u"test123", password=u"password",
+                        flags=ConnectFlags(clean_session=True, username=True, password=True)).serialise())
+            for n, topic_filter in enumerate(topic_filters):
+                client_transport.write(
+                    Subscribe(packet_identifier=n + 1, topic_requests=[
+                        SubscriptionTopicRequest(topic_filter=topic_filter, max_qos=0)
+                    ]).serialise())
+            mqtt_pump.flush()
+            client_protocol.data = b""
+            clients.append((client_protocol, mqtt_pump))
+
+        for i in range(4):
+            session.publish(u"com.test.wamp", i)
+            pump.flush()
+
+        reactor.advance(0.1)
+
+        received = []
+        for client_protocol, mqtt_pump in clients:
+            mqtt_pump.flush()
+            received.append(client_protocol.data)
+
+        expected = [
+            Publish(duplicate=False, qos_level=0, retain=False,
+                    topic_name=u"com/test/wamp",
+                    payload=u'{{"args":[{}]}}'.format(i).encode('utf8')).serialise()
+            for i in range(4)
+        ]
+        self.assertEqual(received[0], b"".join(expected))
+        self.assertIn(received[1], [expected[0] + expected[2], expected[1] + expected[3]])
+
+    def test_persistent_session(self):
+        """
+        A MQTT client connecting with clean_session=false keeps its
+        subscriptions while offline, gets QoS 1 events queued meanwhile
+        delivered when it reconnects, and does not need to subscribe again.
+        """
+        reactor, router, server_factory, session_factory = build_mqtt_server(persistent_sessions={u'max_sessions': 10})
+        client_transport, client_protocol, mqtt_pump = connect_mqtt_server(server_factory)
+
+        session, pump = connect_application_session(
+            server_factory, ApplicationSession, component_config=ComponentConfig(realm=u"mqtt"))
+
+        connect = Connect(client_id=u"testclient", username=u"test123", password=u"password",
+                          flags=ConnectFlags(clean_session=False, username=True, password=True))
+
+        client_transport.write(connect.serialise())
+        client_transport.write(
+            Subscribe(packet_identifier=1, topic_requests=[
+                SubscriptionTopicRequest(topic_filter=u"com/test/wamp", max_qos=1)
+            ]).serialise())
+        mqtt_pump.flush()
+
+        self.assertEqual(
+            client_protocol.data,
+            (
+                ConnACK(session_present=False, return_code=0).serialise() +
+                SubACK(packet_identifier=1, return_codes=[1]).serialise()
+            ))
+
+        # the client goes away
+        client_transport.loseConnection()
+        mqtt_pump.flush()
+        reactor.advance(0.1)
+
+        store = server_factory._mqtt_factory._session_store
+        self.assertEqual(len(store), 1)
+        self.assertFalse(store.get(u"testclient").online)
+
+        session.publish(u"com.test.wamp", u"bar")
+        pump.flush()
+        reactor.advance(0.1)
+
+        # .. and comes back
+        client_transport, client_protocol, mqtt_pump = connect_mqtt_server(server_factory)
+        client_transport.write(connect.serialise())
+        mqtt_pump.flush()
+        reactor.advance(0.1)
+        mqtt_pump.flush()
+
+        self.assertEqual(
+            client_protocol.data,
+            (
+                ConnACK(session_present=True, return_code=0).serialise() +
+                Publish(duplicate=False, qos_level=1, retain=False,
+                        topic_name=u"com/test/wamp", packet_identifier=1,
+                        payload=b'{"args":["bar"]}').serialise()
+            ))
+        self.assertTrue(store.get(u"testclient").online)
+
+        # the WAMP session used to authenticate the new connection is gone, the
+        # previous one lives on
+        sessions = [x for x in router._session_id_to_session.values() if x._authid == u"test123"]
+        self.assertEqual(len(sessions), 1)
+
     def _test_retained(self):
         """
         The MQTT client can set and receive retained messages.
@@ -565,3 +816,95 @@ class MQTTAdapterTests(TestCase):
         self.assertEqual(
             session.events,
             [{"args": [u"foobar"]}])
+
+
+class TopicCacheTests(TestCase):
+    """
+    Tests for the topic translation cache of the MQTT server factory.
+    """
+
+    def _make_factory(self, **options):
+        router_factory, server_factory, session_factory = make_router()
+        options[u'realm'] = u'mqtt'
+        options[u'payload_mapping'] = {
+            u'': {u'type': u'passthrough'},
+            u'com.example': {u'type': u'native', u'serializer': u'json'},
+        }
+        return WampMQTTServerFactory(session_factory, {u'options': options}, Clock())
+
+    def test_translations_cached(self):
+        """
+        Topics are translated together with their payload format, and the
+        least recently used translations are evicted when the cache is full.
+        """
+        factory = self._make_factory(topic_cache_size=2)
+
+        self.assertEqual(factory._translate_mqtt_topic(u'com/example/a'),
+                         (u'com.example.a', {u'type': u'native', u'serializer': u'json'}))
+        self.assertEqual(factory._translate_mqtt_topic(u'foo/b'),
+                         (u'foo.b', {u'type': u'passthrough'}))
+        self.assertEqual(factory._translate_wamp_topic(u'foo.b'),
+                         (u'foo/b', {u'type': u'passthrough'}))
+        self.assertEqual(factory._translate_topicfilter(u'foo/+/c'),
+                         (u'foo..c', u'wildcard'))
+
+        # touch "com/example/a", so "foo/b" is evicted instead
+        factory._translate_mqtt_topic(u'com/example/a')
+        factory._translate_mqtt_topic(u'foo/c')
+        self.assertEqual(list(factory._mqtt_topic_cache.keys()),
+                         [u'com/example/a', u'foo/c'])
+
+        # invalid topics are not cached
+        with self.assertRaises(TypeError):
+            factory._translate_mqtt_topic(u'foo/#')
+        self.assertNotIn(u'foo/#', factory._mqtt_topic_cache)
+
+    def test_cache_invalidated_by_payload_mapping(self):
+        """
+        Changing the payload mapping invalidates the cached translations.
+        """
+        factory = self._make_factory()
+
+        self.assertEqual(factory._translate_mqtt_topic(u'foo/b'),
+                         (u'foo.b', {u'type': u'passthrough'}))
+
+        factory._set_payload_format(u'foo', {u'type': u'native', u'serializer': u'cbor'})
+        self.assertEqual(factory._translate_mqtt_topic(u'foo/b'),
+                         (u'foo.b', {u'type': u'native', u'serializer': u'cbor'}))
+        self.assertEqual(factory._translate_wamp_topic(u'foo.b'),
+                         (u'foo/b', {u'type': u'native', u'serializer': u'cbor'}))
+
+        factory._set_payload_format(u'foo')
+        self.assertEqual(factory._translate_wamp_topic(u'foo.b'),
+                         (u'foo/b', {u'type': u'passthrough'}))
+
+    def test_cache_disabled(self):
+        """
+        A cache size of 0 disables caching.
+        """
+        factory = self._make_factory(topic_cache_size=0)
+
+        self.assertEqual(factory._translate_mqtt_topic(u'foo/b'),
+                         (u'foo.b', {u'type': u'passthrough'}))
+        self.assertEqual(len(factory._mqtt_topic_cache), 0)
+
+
+class CodecBatcherCacheTests(TestCase):
+    """
+    Tests for sharing batchers of dynamic payload codec calls.
+    """
+
+    def test_batcher_per_procedure(self):
+        """
+        Mappings sharing a batch procedure, but with different procedures to
+        fall back to, get different batchers.
+        """
+        router_factory, server_factory, session_factory = make_router()
+        factory = WampMQTTServerFactory(session_factory, {u'options': {u'realm': u'mqtt'}}, Clock())
+        batch = {u'encoder': u'com.example.encode_batch'}
+
+        first = factory._get_codec_batcher(u'codec', u'com.example.encode1', u'com.example.encode_batch', batch)
+        second = factory._get_codec_batcher(u'codec', u'com.example.encode2', u'com.example.encode_batch', batch)
+
+        self.assertIsNot(first, second)
+        self.assertIs(factory._get_codec_batcher(u'codec', u'com.example.encode1', u'com.example.encode_batch', batch), first)
@@ -53,26 +53,34 @@ from ._events import (
 )
 
 from twisted.internet.protocol import Protocol
-from twisted.internet.defer import inlineCallbacks, returnValue
+from twisted.internet.defer import Deferred, inlineCallbacks, returnValue
 
 _ids = count()
 _SIXTEEN_BIT_MAX = 65535
 
+QUEUE_OVERFLOW_POLICIES = (u'drop_oldest', u'drop_newest', u'disconnect')
+
 
 @attr.s
 class Session(object):
 
     client_id = attr.ib()
     queued_messages = attr.ib(default=attr.Factory(collections.deque))
+    # QoS 1/2 messages sent to the client, but not yet acknowledged by it
+    inflight = attr.ib(default=attr.Factory(collections.OrderedDict))
+    dropped_messages = attr.ib(default=0)
     _count = attr.ib(default=attr.Factory(count))
 
     def get_packet_id(self):
 
-        x = next(self._count)
-        if x == _SIXTEEN_BIT_MAX or x == 0:
-            self._count = count(start=1)
+        while True:
             x = next(self._count)
-        return x
+            if x == _SIXTEEN_BIT_MAX or x == 0:
+                self._count = count(start=1)
+                x = next(self._count)
+            # a packet id must not be reused while a message is in flight with it
+            if x not in self.inflight:
+                return x
 
 
 @attr.s
@@ -82,22 +90,51 @@ class Message(object):
     body = attr.ib()
     qos = attr.ib()
     retained = attr.ib()
+    packet_id = attr.ib(default=None)
+    # QoS 2 only: we got the PubREC and sent the PubREL
+    released = attr.ib(default=False)
 
 
 class MQTTServerTwistedProtocol(Protocol):
 
     log = make_logger()
 
-    def __init__(self, handler, reactor, _id_maker=_ids):
+    # stop reading from the transport when this many received packets are
+    # waiting to be processed
+    max_pending = 1000
+
+    def __init__(self, handler, reactor, _id_maker=_ids, timers=None,
+                 max_inflight=20, max_queued=1000,
+                 queue_overflow_policy=u'drop_oldest'):
         self._reactor = reactor
+        # keepalive timeouts go to the (shared) timer wheel, if any
+        self._timers = timers if timers is not None else reactor
         self._mqtt = MQTTParser()
         self._handler = handler
         self._timeout = None
         self._timeout_time = 0
         self._flush_publishes = None
+        # received packets waiting to be processed, in order
+        self._work = collections.deque()
+        self._processing = False
+        self._in_progress = 0
+        self._paused = False
         self._connection_id = next(_id_maker)
         self.session = Session(client_id=u"<still connecting>")
 
+        # maximum number of QoS 1/2 messages sent, but not yet acknowledged
+        # (0 means no limit)
+        self._max_inflight = max_inflight
+
+        # maximum number of messages queued for sending to the client (0 means
+        # no limit), and what to do when the queue is full: "drop_oldest",
+        # "drop_newest" or "disconnect"
+        self._max_queued = max_queued
+        if queue_overflow_policy not in QUEUE_OVERFLOW_POLICIES:
+            raise ValueError("Invalid queue overflow policy {}".format(queue_overflow_policy))
+        self._queue_overflow_policy = queue_overflow_policy
+        self._queue_full = False
+
     @property
     def _connected(self):
 
@@ -127,17 +164,95 @@ class MQTTServerTwistedProtocol(Protocol):
             self._timeout.reset(self._timeout_time)
 
     def dataReceived(self, data):
-        # Pause the producer as we need to process some of these things
-        # serially -- for example, subscribes in Autobahn are a Deferred op,
-        # so we don't want any more data yet
-        self.transport.pauseProducing()
-        d = self._handle(data)
-        d.addErrback(print)
-        d.addBoth(lambda _: self._resume_producing())
-
-    def _resume_producing(self):
+        events = self._mqtt.data_received(data)
+
+        if events:
+            # We've got at least one full control packet -- the client is
+            # alive, reset the timeout.
+            self._reset_timeout()
+
+        work = self._work
+        for event in events:
+            if not work and not self._processing and \
+                    type(event) is Publish and event.qos_level == 0:
+                # Nothing is pending that must be processed first, so QoS 0
+                # publishes are processed right away, without waiting for the
+                # outcome
+                if not self._publish_qos_0(event):
+                    return
+            else:
+                # Everything else is processed in order -- for example,
+                # subscribes in Autobahn are a Deferred op, and a publish
+                # following a subscribe must not overtake it
+                work.append(event)
+
+        if work and not self._processing:
+            self._process_work()
+
+        # Only when the pending work piles up, we stop reading
+        pending = len(work) + self._in_progress
+        if pending >= self.max_pending and not self._paused and self._connected:
+            self._paused = True
+            self.transport.pauseProducing()
+
+    def _publish_qos_0(self, event):
+        try:
+            d = self._handler.process_publish_qos_0(event)
+        except:
+            # MQTT-4.8.0-2 - If we get a transient error (like
+            # publishing raising an exception), we must close the
+            # connection.
+            self.log.failure(log_category="MQ503",
+                             client_id=self.session.client_id)
+            self.transport.loseConnection()
+            return False
+
+        if isinstance(d, Deferred):
+            d.addErrback(self._publish_qos_0_failed)
+
+        self.log.debug(log_category="MQ201", publish=event,
+                       client_id=self.session.client_id)
+        return True
+
+    def _publish_qos_0_failed(self, failure):
+        self.log.failure(log_category="MQ503", failure=failure,
+                         client_id=self.session.client_id)
         if self._connected:
-            self.transport.resumeProducing()
+            self.transport.loseConnection()
+
+    def _process_work(self):
+        """
+        Process the pending packets in order, handing everything received so
+        far to the handler in one go.
+        """
+        self._processing = True
+        work = self._work
+
+        while work:
+            if not self._connected:
+                work.clear()
+                break
+
+            events = list(work)
+            work.clear()
+            self._in_progress = len(events)
+
+            d = self._handle_events(events)
+            d.addErrback(lambda failure: self.log.failure(failure=failure))
+
+            if not d.called:
+                # some packet is waiting for a Deferred, continue with the
+                # packets received meanwhile once it is done
+                d.addBoth(lambda _: self._process_work())
+                return
+
+        self._processing = False
+        self._in_progress = 0
+
+        if self._paused:
+            self._paused = False
+            if self._connected:
+                self.transport.resumeProducing()
 
     def connectionLost(self, reason):
         if self._timeout:
@@ -159,31 +274,47 @@ class MQTTServerTwistedProtocol(Protocol):
         if qos not in [0, 1, 2]:
             raise ValueError("QoS must be [0, 1, 2]")
 
-        self.session.queued_messages.append(
-            Message(topic=topic, qos=qos, body=body, retained=retained))
+        queue = self.session.queued_messages
+        message = Message(topic=topic, qos=qos, body=body, retained=retained)
+
+        if self._max_queued and len(queue) >= self._max_queued:
+            self.session.dropped_messages += 1
+            if not self._queue_full:
+                # only log once, until the queue has drained again
+                self._queue_full = True
+                self.log.warn(log_category="MQ304", client_id=self.session.client_id,
+                              queued=len(queue), policy=self._queue_overflow_policy)
+
+            if self._queue_overflow_policy == u'drop_oldest':
+                queue.popleft()
+            elif self._queue_overflow_policy == u'drop_newest':
+                return
+            else:
+                if self._connected:
+                    self.transport.loseConnection()
+                return
+
+        queue.append(message)
 
         if not self._flush_publishes and self._connected:
             self._flush_publishes = self._reactor.callLater(0, self._flush_saved_messages)
 
-    def _send_publish(self, topic, qos, body, retained):
-
-        if qos == 0:
-            publish = Publish(duplicate=False, qos_level=qos, retain=retained,
-                              packet_identifier=None, topic_name=topic,
-                              payload=body)
+    def _send_publish(self, message, duplicate=False):
 
-        elif qos == 1:
-            packet_id = self.session.get_packet_id()
-            publish = Publish(duplicate=False, qos_level=qos, retain=retained,
-                              packet_identifier=packet_id, topic_name=topic,
-                              payload=body)
+        if message.qos == 0:
+            publish = Publish(duplicate=False, qos_level=0,
+                              retain=message.retained, packet_identifier=None,
+                              topic_name=message.topic, payload=message.body)
 
-        elif qos == 2:
+        elif message.qos in [1, 2]:
+            if message.packet_id is None:
+                message.packet_id = self.session.get_packet_id()
+                self.session.inflight[message.packet_id] = message
 
-            packet_id = self.session.get_packet_id()
-            publish = Publish(duplicate=False, qos_level=qos, retain=retained,
-                              packet_identifier=packet_id, topic_name=topic,
-                              payload=body)
+            publish = Publish(duplicate=duplicate, qos_level=message.qos,
+                              retain=message.retained,
+                              packet_identifier=message.packet_id,
+                              topic_name=message.topic, payload=message.body)
 
         else:
             self.log.warn(log_category="MQ303")
@@ -191,6 +322,27 @@ class MQTTServerTwistedProtocol(Protocol):
 
         self._send_packet(publish)
 
+    def _resend_inflight(self):
+        """
+        Resend all messages in flight, after the session was resumed.
+
+        Compliance statements: MQTT-4.4.0-1, MQTT-3.3.1-1
+        """
+        for message in list(self.session.inflight.values()):
+            if message.released:
+                self._send_packet(PubREL(packet_identifier=message.packet_id))
+            else:
+                self._send_publish(message, duplicate=True)
+
+    def _acknowledge(self, packet_id):
+        """
+        A message in flight was acknowledged by the client, which frees up
+        space in the in-flight window.
+        """
+        if self.session.inflight.pop(packet_id, None) is not None:
+            if self.session.queued_messages:
+                self._flush_saved_messages()
+
     def _lose_connection(self):
         self.log.debug(log_category="MQ400", client_id=self.session.client_id,
                        seconds=self._timeout_time,
@@ -215,30 +367,18 @@ class MQTTServerTwistedProtocol(Protocol):
             return None
 
         # New, queued messages
-        while self.session.queued_messages:
-            message = self.session.queued_messages.popleft()
-            self._send_publish(message.topic, message.qos, message.body,
-                               message.retained)
-
-    @inlineCallbacks
-    def _handle(self, data):
-
-        try:
-            res = yield self._handle_data(data)
-            returnValue(res)
-        except Exception:
-            raise
-
-    def _handle_data(self, data):
-
-        events = self._mqtt.data_received(data)
-
-        if events:
-            # We've got at least one full control packet -- the client is
-            # alive, reset the timeout.
-            self._reset_timeout()
-
-        return self._handle_events(events)
+        queue = self.session.queued_messages
+        inflight = self.session.inflight
+        while queue:
+            if queue[0].qos > 0 and self._max_inflight and len(inflight) >= self._max_inflight:
+                # the in-flight window is full -- we continue when the client
+                # acknowledges messages. Messages behind (even QoS 0 ones) wait
+                # as well, to keep the order of messages.
+                break
+            self._send_publish(queue.popleft())
+
+        if not queue:
+            self._queue_full = False
 
     @inlineCallbacks
     def _handle_events(self, events):
@@ -264,7 +404,7 @@ class MQTTServerTwistedProtocol(Protocol):
                     # alive time.
                     if event.keep_alive:
                         self._timeout_time = event.keep_alive * 1.5
-                        self._timeout = self._reactor.callLater(
+                        self._timeout = self._timers.callLater(
                             self._timeout_time, self._lose_connection)
 
                     self.session.client_id = event.client_id
@@ -291,6 +431,13 @@ class MQTTServerTwistedProtocol(Protocol):
                     returnValue(None)
 
                 self.log.debug(log_category="MQ200", client_id=event.client_id)
+
+                if session_present:
+                    # the handler resumed a previous session: resend what was
+                    # in flight, and then what was queued meanwhile
+                    self._resend_inflight()
+                    self._flush_saved_messages()
+
                 continue
 
             elif isinstance(event, Subscribe):
@@ -412,6 +559,8 @@ class MQTTServerTwistedProtocol(Protocol):
                     self.transport.loseConnection()
                     returnValue(None)
 
+                self._acknowledge(event.packet_identifier)
+
             elif isinstance(event, PubREC):
 
                 try:
@@ -422,6 +571,10 @@ class MQTTServerTwistedProtocol(Protocol):
                     self.transport.loseConnection()
                     returnValue(None)
 
+                message = self.session.inflight.get(event.packet_identifier)
+                if message is not None:
+                    message.released = True
+
                 # MQTT-4.3.3-1: MUST send back a PubREL -- even if it's not an
                 # ID we know about, apparently, according to Mosquitto and
                 # ActiveMQ.
@@ -452,6 +605,8 @@ class MQTTServerTwistedProtocol(Protocol):
                     self.transport.loseConnection()
                     returnValue(None)
 
+                self._acknowledge(event.packet_identifier)
+
             elif isinstance(event, Disconnect):
                 # TODO: get rid of some will messages
 
@@ -48,6 +48,8 @@ from twisted.internet.protocol import Protocol, Factory
 from twisted.internet.defer import inlineCallbacks, Deferred, returnValue, succeed
 
 from crossbar.bridge.mqtt.tx import MQTTServerTwistedProtocol
+from crossbar.bridge.mqtt.store import SessionStore
+from crossbar.bridge.mqtt.batch import CodecBatcher
 from crossbar.router.session import RouterSession
 
 from autobahn import util
@@ -115,6 +117,22 @@ def _mqtt_topicfilter_to_wamp(topic):
     return _topic, _match
 
 
+def _mqtt_shared_topicfilter(topic):
+    """
+    Split a MQTT topic filter for a shared subscription ("$share/group/filter")
+    into the share group and the actual topic filter. For topic filters of
+    non-shared subscriptions, the group is ``None``.
+    """
+    if not topic.startswith(u'$share/'):
+        return None, topic
+
+    parts = topic.split(u'/', 2)
+    if len(parts) != 3 or not parts[1] or not parts[2] or u'+' in parts[1] or u'#' in parts[1]:
+        raise TypeError('invalid MQTT shared subscription topic filter "{}"'.format(topic))
+
+    return parts[1], parts[2]
+
+
 def _mqtt_topicname_to_wamp(topic):
     """
     Convert a MQTT topic as used in MQTT Publish to a WAMP URI.
@@ -168,15 +186,31 @@ class WampMQTTServerProtocol(Protocol):
 
     log = make_logger()
 
-    def __init__(self, reactor):
-        self._mqtt = MQTTServerTwistedProtocol(self, reactor)
+    def __init__(self, reactor, timers=None, max_inflight=20, max_queued=1000,
+                 queue_overflow_policy=u'drop_oldest'):
+        self._mqtt = MQTTServerTwistedProtocol(self, reactor, timers=timers,
+                                               max_inflight=max_inflight,
+                                               max_queued=max_queued,
+                                               queue_overflow_policy=queue_overflow_policy)
         self._request_to_packetid = {}
         self._waiting_for_connect = None
         self._inflight_subscriptions = {}
         self._subrequest_to_mqtt_subrequest = {}
         self._subrequest_callbacks = {}
         self._topic_lookup = {}
+        # WAMP subscription ID -> QoS granted to the MQTT client
+        self._subscription_qos = {}
+        # WAMP subscription ID -> share groups joined ("$share/group/filter"),
+        # and the WAMP subscriptions of non-shared MQTT topic filters
+        self._subscription_groups = {}
+        self._plain_subscriptions = set()
         self._wamp_session = None
+        self._client_id = None
+        self._clean_session = True
+        # the persistent session, for clients connecting with clean_session=false
+        self._persistent = None
+        # set when a new connection of the same client took over our session
+        self._taken_over = False
 
     def on_message(self, inc_msg):
 
@@ -198,7 +232,8 @@ class WampMQTTServerProtocol(Protocol):
             self._wamp_session.onMessage(msg)
 
         elif isinstance(inc_msg, message.Welcome):
-            self._waiting_for_connect.callback((0, False))
+            session_present = self._attach_session()
+            self._waiting_for_connect.callback((0, session_present))
 
         elif isinstance(inc_msg, message.Abort):
             self._waiting_for_connect.callback((1, False))
@@ -206,8 +241,23 @@ class WampMQTTServerProtocol(Protocol):
         elif isinstance(inc_msg, message.Subscribed):
             # Successful subscription!
             mqtt_id = self._subrequest_to_mqtt_subrequest[inc_msg.request]
-            self._inflight_subscriptions[mqtt_id][inc_msg.request]["response"] = 0
-            self._topic_lookup[inc_msg.subscription] = self._inflight_subscriptions[mqtt_id][inc_msg.request]["topic"]
+            request = self._inflight_subscriptions[mqtt_id][inc_msg.request]
+            request["response"] = request["qos"]
+            self._topic_lookup[inc_msg.subscription] = request["topic"]
+
+            # multiple MQTT topic filters may end up on the same WAMP subscription,
+            # in which case the highest QoS granted wins (MQTT-3.3.5-1)
+            self._subscription_qos[inc_msg.subscription] = max(
+                request["qos"], self._subscription_qos.get(inc_msg.subscription, 0))
+
+            # a shared and a non-shared MQTT topic filter for the same topics
+            # end up on the same WAMP subscription too
+            if request["group"] is None:
+                self._plain_subscriptions.add(inc_msg.subscription)
+            else:
+                self._subscription_groups.setdefault(inc_msg.subscription, set()).add(request["group"])
+            for group in self._subscription_groups.get(inc_msg.subscription, ()):
+                self._join_shared_group(inc_msg.subscription, group)
 
             if -1 not in [x["response"] for x in self._inflight_subscriptions[mqtt_id].values()]:
                 self._subrequest_callbacks[mqtt_id].callback(None)
@@ -230,7 +280,15 @@ class WampMQTTServerProtocol(Protocol):
             except:
                 self.log.failure()
             else:
-                self._mqtt.send_publish(mapped_topic, 0, payload, retained=inc_msg.retained or False)
+                qos = self._subscription_qos.get(inc_msg.subscription, 0)
+                retained = inc_msg.retained or False
+
+                if self._persistent is not None and not self._persistent.online:
+                    # the client is offline: only QoS 1 events are kept for it
+                    if qos > 0:
+                        self._persistent.queue(mapped_topic, qos, payload, retained)
+                else:
+                    self._mqtt.send_publish(mapped_topic, qos, payload, retained=retained)
 
         elif isinstance(inc_msg, message.Goodbye):
             if self._mqtt.transport:
@@ -240,15 +298,127 @@ class WampMQTTServerProtocol(Protocol):
         else:
             self.log.warn('cannot process unimplemented message: {inc_msg}', inc_msg=inc_msg)
 
+    def _join_shared_group(self, subscription_id, group):
+        """
+        Join the share group of a shared subscription ("$share/group/filter"),
+        so the broker dispatches each event on the subscription to only one of
+        the MQTT clients in the group. When the client also subscribed to a
+        non-shared topic filter on the same WAMP subscription, it keeps
+        receiving every event for that one.
+        """
+        broker = self._wamp_session._router._broker
+        broker.join_shared_group(self._wamp_session, subscription_id, group,
+                                 policy=self.factory._shared_subscription_policy,
+                                 queued=self._queued_messages,
+                                 plain=subscription_id in self._plain_subscriptions)
+
+    def _queued_messages(self):
+        mqtt_session = self._mqtt.session
+        return len(mqtt_session.queued_messages) + len(mqtt_session.inflight)
+
     def connectionMade(self, ignore_handshake=False):
         if ignore_handshake or not ISSLTransport.providedBy(self.transport):
             self._when_ready()
 
     def connectionLost(self, reason):
+        self._mqtt.connectionLost(reason)
+
+        if self._taken_over:
+            # our WAMP session now belongs to a newer connection of the client
+            return
+
+        if self._persistent is not None and self._persistent.protocol is self and self._wamp_session:
+            self._park_session()
+        else:
+            self._close_wamp_session()
+
+    def _close_wamp_session(self):
         if self._wamp_session:
             msg = message.Goodbye()
             self._wamp_session.onMessage(msg)
-            del self._wamp_session
+            self._wamp_session = None
+
+    def _park_session(self):
+        """
+        The client of a persistent session went offline: keep the WAMP session
+        (and its subscriptions) around, so events for the client are queued.
+        """
+        # the WAMP session lives on, so we have to take care of the testaments
+        # ("last will") ourselves. a client disconnecting cleanly discards its will.
+        graceful = self._mqtt.transport is None
+        self._wamp_session.send_testaments(discard=graceful)
+
+        self.factory._session_store.detach(self._client_id)
+
+    def _attach_session(self):
+        """
+        Attach this (authenticated) connection to a persistent session.
+
+        :returns: ``True`` if a previous session of the client was resumed.
+        """
+        store = self.factory._session_store
+        if store is None:
+            return False
+
+        previous = store.get(self._client_id)
+
+        if previous is not None:
+            old = previous.protocol
+            if self._clean_session or not old._wamp_session or not self._same_identity(old._wamp_session):
+                # MQTT-3.1.2-6: a clean session discards the previous session. we
+                # also discard it when the client is now authenticated differently.
+                store.discard(self._client_id)
+                if previous.online and old.transport:
+                    # MQTT-3.1.4-2: disconnect the existing client
+                    old.transport.loseConnection()
+                previous = None
+
+        if self._clean_session:
+            return False
+
+        if previous is None:
+            self._persistent = store.attach(self._client_id, self)
+            return False
+
+        if previous.online:
+            # MQTT-3.1.4-2: disconnect the existing client, and take over its session
+            old._taken_over = True
+            if old.transport:
+                old.transport.loseConnection()
+
+        self._take_over_session(old)
+        self._persistent = store.attach(self._client_id, self)
+        self._persistent.restore()
+        return True
+
+    def _same_identity(self, wamp_session):
+        return (wamp_session._realm == self._wamp_session._realm and
+                wamp_session._authid == self._wamp_session._authid and
+                wamp_session._authrole == self._wamp_session._authrole)
+
+    def _take_over_session(self, old):
+        """
+        Continue with the WAMP session of a previous connection of the client,
+        which still has all the subscriptions, instead of the WAMP session
+        this connection was just authenticated with.
+        """
+        self._wamp_transport.on_message = lambda msg: None
+
+        # we get here while the router is still welcoming the new session,
+        # so close it only after that
+        self.factory._reactor.callLater(0, self._wamp_session.onMessage, message.Goodbye())
+
+        self._wamp_session = old._wamp_session
+        self._wamp_transport = old._wamp_transport
+        self._wamp_transport.on_message = self.on_message
+        self._wamp_transport.transport = self.transport
+        self._topic_lookup = old._topic_lookup
+        self._subscription_qos = old._subscription_qos
+        self._subscription_groups = old._subscription_groups
+        self._plain_subscriptions = old._plain_subscriptions
+        self._mqtt.session = old._mqtt.session
+
+        old._wamp_session = None
 
     def handshakeCompleted(self):
         self._when_ready()
@@ -290,11 +460,14 @@ class WampMQTTServerProtocol(Protocol):
         #         password=None)
         self.log.info('WampMQTTServerProtocol.process_connect(packet={packet})', packet=packet)
 
-        # we don't support session resumption: https://github.com/crossbario/crossbar/issues/892
-        if not packet.flags.clean_session:
-            self.log.warn('denying MQTT connect from {peer}, as the clients wants to resume a session (which we do not support)', peer=peer2str(self.transport.getPeer()))
+        # session resumption may be disabled: https://github.com/crossbario/crossbar/issues/892
+        if not packet.flags.clean_session and self.factory._session_store is None:
+            self.log.warn('denying MQTT connect from {peer}, as the clients wants to resume a session (which is disabled)', peer=peer2str(self.transport.getPeer()))
             return succeed((1, False))
 
+        self._client_id = packet.client_id
+        self._clean_session = packet.flags.clean_session
+
         # we won't support QoS 2: https://github.com/crossbario/crossbar/issues/1046
         if packet.flags.will and packet.flags.will_qos not in [0, 1]:
             self.log.warn('denying MQTT connect from {peer}, as the clients wants to provide a "last will" event with QoS {will_qos} (and we only support QoS 0/1 here)', peer=peer2str(self.transport.getPeer()), will_qos=packet.flags.will_qos)
@@ -393,7 +566,16 @@ class WampMQTTServerProtocol(Protocol):
         forward that on the forwarding WAMP session.
         """
         try:
-            payload_format, mapped_topic, options = yield self.factory.transform_mqtt(event.topic_name, event.payload)
+            if event.retain and not event.payload:
+                # a retained message with an empty payload clears the retained
+                # message on the topic (MQTT-3.3.1-10), and is passed on as is
+                mapped_topic, _ = self.factory._translate_mqtt_topic(event.topic_name)
+                options = {
+                    u'payload': b'',
+                    u'enc_algo': u'mqtt'
+                }
+            else:
+                payload_format, mapped_topic, options = yield self.factory.transform_mqtt(event.topic_name, event.payload)
         except:
             self.log.failure()
             return
@@ -455,21 +637,24 @@ class WampMQTTServerProtocol(Protocol):
 
         for n, x in enumerate(packet.topic_requests):
 
-            topic, match = _mqtt_topicfilter_to_wamp(x.topic_filter)
+            group, topic_filter = _mqtt_shared_topicfilter(x.topic_filter)
+            topic, match = self.factory._translate_topicfilter(topic_filter)
 
-            self.log.info('process_subscribe -> topic={topic}, match={match}', topic=topic, match=match)
+            self.log.info('process_subscribe -> topic={topic}, match={match}, group={group}', topic=topic, match=match, group=group)
 
             request_id = util.id()
 
+            # retained events are not sent on shared subscriptions
             msg = message.Subscribe(
                 request=request_id,
                 topic=topic,
                 match=match,
-                get_retained=True,
+                get_retained=group is None,
             )
 
             try:
-                packet_watch[request_id] = {"response": -1, "topic": x.topic_filter}
+                # we deliver with at most QoS 1 to MQTT subscribers
+                packet_watch[request_id] = {"response": -1, "topic": topic_filter, "qos": min(x.max_qos, 1), "group": group}
                 self._subrequest_to_mqtt_subrequest[request_id] = packet.packet_identifier
                 self._wamp_session.onMessage(msg)
             except:
@@ -502,18 +687,59 @@ class WampMQTTServerFactory(Factory):
         u'ubjson': UBJSONObjectSerializer(),
     }
 
-    def __init__(self, router_session_factory, config, reactor):
+    def __init__(self, router_session_factory, config, reactor, timers=None):
         self._router_session_factory = router_session_factory
         self._router_factory = router_session_factory._routerFactory
         self._options = config.get(u'options', {})
         self._realm = self._options.get(u'realm', None)
         self._reactor = reactor
+        self._timers = timers
+
+        # bounded LRU caches of topic translations, in both directions (and
+        # for topic filters in MQTT subscribes), together with the payload
+        # format that applies to the topic
+        self._topic_cache_size = self._options.get(u'topic_cache_size', 10000)
+        self._mqtt_topic_cache = OrderedDict()
+        self._wamp_topic_cache = OrderedDict()
+        self._topicfilter_cache = OrderedDict()
+
+        # batchers for dynamic payload codec calls, keyed by codec realm,
+        # procedure, batch procedure and batch settings
+        self._codec_batchers = {}
+
         self._payload_mapping = StringTrie()
         for topic, pmap in self._options.get(u'payload_mapping', {}).items():
             self._set_payload_format(topic, pmap)
 
+        # outbound flow control, per MQTT client connection
+        self._max_inflight = self._options.get(u'max_inflight', 20)
+        self._max_queued = self._options.get(u'max_queued_messages', 1000)
+        self._queue_overflow_policy = self._options.get(u'queue_overflow_policy', u'drop_oldest')
+
+        # how events on shared subscriptions are dispatched over the group
+        self._shared_subscription_policy = self._options.get(u'shared_subscription_policy', u'round_robin')
+
+        # persistent sessions (clean_session=false), keyed by MQTT client ID. these
+        # are opt-in, as offline sessions hold on to resources for a while
+        persistent = self._options.get(u'persistent_sessions', {})
+        max_sessions = persistent.get(u'max_sessions', 0)
+        if max_sessions:
+            self._session_store = SessionStore(
+                max_sessions=max_sessions,
+                max_queued=persistent.get(u'max_queued_messages', 1000),
+                spill_dir=persistent.get(u'spill_dir', None),
+                max_spilled=persistent.get(u'max_spilled_messages', 100000),
+                session_expiry=persistent.get(u'session_expiry', 3600),
+                timers=self._timers if self._timers is not None else self._reactor,
+            )
+        else:
+            self._session_store = None
+
     def buildProtocol(self, addr):
-        protocol = self.protocol(self._reactor)
+        protocol = self.protocol(self._reactor, timers=self._timers,
+                                 max_inflight=self._max_inflight,
+                                 max_queued=self._max_queued,
+                                 queue_overflow_policy=self._queue_overflow_policy)
         protocol.factory = self
         return protocol
 
@@ -540,6 +766,66 @@ class WampMQTTServerFactory(Factory):
         else:
             self._payload_mapping[topic] = pmap
 
+        # the mapping is by prefix, so any cached topic may be affected
+        self._mqtt_topic_cache.clear()
+        self._wamp_topic_cache.clear()
+
+    def _cached(self, cache, key, translate):
+        """
+        Look up ``key`` in one of the translation caches, translating and
+        caching it on a miss. Translation errors are not cached.
+        """
+        try:
+            value = cache[key]
+        except KeyError:
+            value = translate(key)
+            if self._topic_cache_size:
+                cache[key] = value
+                if len(cache) > self._topic_cache_size:
+                    cache.popitem(last=False)
+        else:
+            cache.move_to_end(key)
+        return value
+
+    def _translate_mqtt_topic(self, topic):
+        """
+        Map a MQTT topic name (as used in MQTT Publish) to a WAMP URI and the
+        payload format to apply.
+
+        :returns: A pair of WAMP URI and payload format metadata.
+        :rtype: tuple
+        """
+        def translate(topic):
+            # for MQTT->WAMP, the payload mapping is determined from the
+            # transformed WAMP URI (not the original MQTT topic)
+            mapped_topic = _mqtt_topicname_to_wamp(topic)
+            return mapped_topic, self._get_payload_format(mapped_topic)
+        return self._cached(self._mqtt_topic_cache, topic, translate)
+
+    def _translate_wamp_topic(self, topic):
+        """
+        Map a WAMP URI (as used in WAMP Publish) to a MQTT topic and the
+        payload format to apply.
+
+        :returns: A pair of MQTT topic and payload format metadata.
+        :rtype: tuple
+        """
+        def translate(topic):
+            # for WAMP->MQTT, the payload mapping is determined from the
+            # WAMP URI (not the transformed MQTT topic)
+            return _wamp_topic_to_mqtt(topic), self._get_payload_format(topic)
+        return self._cached(self._wamp_topic_cache, topic, translate)
+
+    def _translate_topicfilter(self, topic):
+        """
+        Map a MQTT topic filter (as used in MQTT Subscribe) to a WAMP URI and
+        a match policy.
+
+        :returns: A pair of WAMP URI and match policy.
+        :rtype: tuple
+        """
+        return self._cached(self._topicfilter_cache, topic, _mqtt_topicfilter_to_wamp)
+
     @inlineCallbacks
     def transform_wamp(self, topic, msg):
         # check for cached transformed payload
@@ -551,11 +837,7 @@ class WampMQTTServerFactory(Factory):
             self.log.debug('using cached payload for {cache_key} in message {msg_id}!', msg_id=id(msg), cache_key=cache_key)
         else:
             # convert WAMP URI to MQTT topic
-            mapped_topic = _wamp_topic_to_mqtt(topic)
-
-            # for WAMP->MQTT, the payload mapping is determined from the
-            # WAMP URI (not the transformed MQTT topic)
-            payload_format = self._get_payload_format(topic)
+            mapped_topic, payload_format = self._translate_wamp_topic(topic)
             payload_format_type = payload_format[u'type']
 
             if payload_format_type == u'passthrough':
@@ -568,7 +850,8 @@ class WampMQTTServerFactory(Factory):
             elif payload_format_type == u'dynamic':
                     encoder = payload_format.get(u'encoder', None)
                     codec_realm = payload_format.get(u'realm', self._realm)
-                    payload = yield self._transform_wamp_dynamic(encoder, codec_realm, mapped_topic, topic, msg)
+                    batch = payload_format.get(u'batch', None)
+                    payload = yield self._transform_wamp_dynamic(encoder, codec_realm, mapped_topic, topic, msg, batch)
             else:
                 raise Exception('payload format {} not implemented'.format(payload_format))
 
@@ -577,10 +860,32 @@ class WampMQTTServerFactory(Factory):
         self.log.debug('transform_wamp({topic}, {msg}) -> payload_format={payload_format}, mapped_topic={mapped_topic}, payload={payload}', topic=topic, msg=msg, payload_format=payload_format, mapped_topic=mapped_topic, payload=payload)
         returnValue((payload_format, mapped_topic, payload))
 
+    def _get_codec_session(self, codec_realm):
+        return self._router_factory.get(codec_realm)._realm.session
+
+    def _get_codec_batcher(self, codec_realm, procedure, batch_procedure, batch):
+        # mappings may share a batch procedure, but differ in the procedure
+        # calls fall back to (or in how they batch)
+        key = (codec_realm, procedure, batch_procedure, batch.get(u'max_size', 100), batch.get(u'max_delay', 5))
+        batcher = self._codec_batchers.get(key, None)
+        if batcher is None:
+            batcher = CodecBatcher(self._reactor,
+                                   lambda: self._get_codec_session(codec_realm),
+                                   procedure,
+                                   batch_procedure,
+                                   max_size=batch.get(u'max_size', 100),
+                                   max_delay=batch.get(u'max_delay', 5))
+            self._codec_batchers[key] = batcher
+        return batcher
+
     @inlineCallbacks
-    def _transform_wamp_dynamic(self, encoder, codec_realm, mapped_topic, topic, msg):
-        codec_session = self._router_factory.get(codec_realm)._realm.session
-        payload = yield codec_session.call(encoder, mapped_topic, topic, msg.args, msg.kwargs)
+    def _transform_wamp_dynamic(self, encoder, codec_realm, mapped_topic, topic, msg, batch=None):
+        if batch and batch.get(u'encoder', None):
+            batcher = self._get_codec_batcher(codec_realm, encoder, batch[u'encoder'], batch)
+            payload = yield batcher.call(mapped_topic, topic, msg.args, msg.kwargs)
+        else:
+            codec_session = self._get_codec_session(codec_realm)
+            payload = yield codec_session.call(encoder, mapped_topic, topic, msg.args, msg.kwargs)
         returnValue(payload)
 
     def _transform_wamp_native(self, serializer, msg):
@@ -607,11 +912,7 @@ class WampMQTTServerFactory(Factory):
     @inlineCallbacks
     def transform_mqtt(self, topic, payload):
         # transform MQTT topic to WAMP URI
-        mapped_topic = _mqtt_topicname_to_wamp(topic)
-
-        # for MQTT->WAMP, the payload mapping is determined from the
-        # transformed WAMP URI (not the original MQTT topic)
-        payload_format = self._get_payload_format(mapped_topic)
+        mapped_topic, payload_format = self._translate_mqtt_topic(topic)
         payload_format_type = payload_format[u'type']
 
         if payload_format_type == u'passthrough':
@@ -627,7 +928,8 @@ class WampMQTTServerFactory(Factory):
         elif payload_format_type == u'dynamic':
             decoder = payload_format.get(u'decoder', None)
             codec_realm = payload_format.get(u'realm', self._realm)
-            options = yield self._transform_mqtt_dynamic(decoder, codec_realm, mapped_topic, topic, payload)
+            batch = payload_format.get(u'batch', None)
+            options = yield self._transform_mqtt_dynamic(decoder, codec_realm, mapped_topic, topic, payload, batch)
 
         else:
             raise Exception('payload format {} not implemented'.format(payload_format))
@@ -636,9 +938,13 @@ class WampMQTTServerFactory(Factory):
         returnValue((payload_format, mapped_topic, options))
 
     @inlineCallbacks
-    def _transform_mqtt_dynamic(self, decoder, codec_realm, mapped_topic, topic, payload):
-        codec_session = self._router_factory.get(codec_realm)._realm.session
-        options = yield codec_session.call(decoder, mapped_topic, topic, payload)
+    def _transform_mqtt_dynamic(self, decoder, codec_realm, mapped_topic, topic, payload, batch=None):
+        if batch and batch.get(u'decoder', None):
+            batcher = self._get_codec_batcher(codec_realm, decoder, batch[u'decoder'], batch)
+            options = yield batcher.call(mapped_topic, topic, payload)
+        else:
+            codec_session = self._get_codec_session(codec_realm)
+            options = yield codec_session.call(decoder, mapped_topic, topic, payload)
         returnValue(options)
 
     def _transform_mqtt_native(self, serializer, payload):
@@ -0,0 +1,232 @@
+#####################################################################################
+#
+#  Copyright (c) Crossbar.io Technologies GmbH
+#
+#  Unless a separate license agreement exists between you and Crossbar.io GmbH (e.g.
+#  you have purchased a commercial license), the license terms below apply.
+#
+#  Should you enter into a separate license agreement after having received a copy of
+#  this software, then the terms of such license agreement replace the terms below at
+#  the time at which such license agreement becomes effective.
+#
+#  In case a separate license agreement ends, and such agreement ends without being
+#  replaced by another separate license agreement, the license terms below apply
+#  from the time at which said agreement ends.
+#
+#  LICENSE TERMS
+#
+#  This program is free software: you can redistribute it and/or modify it under the
+#  terms of the GNU Affero General Public License, version 3, as published by the
+#  Free Software Foundation. This program is distributed in the hope that it will be
+#  useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#  See the GNU Affero General Public License Version 3 for more details.
+#
+#  You should have received a copy of the GNU Affero General Public license along
+#  with this program. If not, see <http://www.gnu.org/licenses/agpl-3.0.en.html>.
+#
+#####################################################################################
+
+from __future__ import absolute_import, division
+
+from collections import deque
+
+from txaio import make_logger
+
+__all__ = ('WebhookBatcher',)
+
+
+class WebhookBatcher(object):
+    """
+    Buffers the events forwarded to one URL, and sends them in batches of up
+    to ``max_events`` events, or after an event was held back for
+    ``max_delay`` ms: as one JSON array, or as NDJSON (one event per line).
+
+    Only one batch is in flight at a time, and events keep being buffered
+    meanwhile. When the downstream is slow and ``max_buffered`` events are
+    buffered, further events are either dropped (policy ``"drop"``), or
+    the events source is paused (policy ``"block"``) until there is room
+    again. When the events source cannot be paused, further events are
+    dropped with the ``"block"`` policy too.
+    """
+
+    FORMATS = {
+        u'json': b'application/json',
+        u'ndjson': b'application/x-ndjson',
+    }
+
+    POLICIES = (u'drop', u'block')
+
+    log = make_logger()
+
+    def __init__(self, reactor, send, url, max_events=100, max_delay=50, format=u'json',
+                 max_buffered=10000, policy=u'drop', pause=None, resume=None):
+        """
+
+        :param reactor: Reactor used to schedule sending a batch.
+
+        :param send: Callable ``send(url, body, content_type)`` returning a
+            Deferred, which sends a batch.
+
+        :param url: The URL to send the batches to.
+        :type url: bytes
+
+        :param max_events: Maximum number of events in one batch.
+        :type max_events: int
+
+        :param max_delay: Maximum time in ms an event is held back to be batched.
+        :type max_delay: int
+
+        :param format: The format of a batch, ``"json"`` or ``"ndjson"``.
+        :type format: str
+
+        :param max_buffered: Maximum number of events buffered.
+        :type max_buffered: int
+
+        :param policy: What to do when the buffer is full, ``"drop"`` or ``"block"``.
+        :type policy: str
+
+        :param pause: Callable which pauses the events source (for policy
+            ``"block"``), returning ``False`` if the source cannot be paused.
+
+        :param resume: Callable which resumes the events source (for policy ``"block"``).
+        """
+        assert format in self.FORMATS
+        assert policy in self.POLICIES
+
+        self._reactor = reactor
+        self._send = send
+        self.url = url
+        self.max_events = max_events
+        self.max_delay = max_delay / 1000.
+        self.format = format
+        self.max_buffered = max_buffered
+        self.policy = policy
+        self._pause = pause
+        self._resume = resume
+
+        # (time received, encoded event)
+        self._buffer = deque()
+        self._timer = None
+        self._sending = False
+        self._paused = False
+
+        # statistics
+        self._started = reactor.seconds()
+        self.received = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self._latency_sum = 0.
+        self._latency_max = 0.
+
+    def add(self, event):
+        """
+        Add an (encoded) event to the next batch.
+
+        :param event: The JSON encoded event.
+        :type event: bytes
+        """
+        if len(self._buffer) >= self.max_buffered and (self.policy == u'drop' or not self._paused):
+            # with the block policy, the events source is paused once the
+            # buffer is full, and events already on their way are still
+            # buffered - unless the source could not be paused
+            self.dropped += 1
+            return
+
+        self._buffer.append((self._reactor.seconds(), event))
+        self.received += 1
+
+        if len(self._buffer) >= self.max_buffered and self.policy == u'block' and not self._paused:
+            self._paused = self._pause is not None and self._pause() is not False
+
+        if len(self._buffer) >= self.max_events:
+            self.flush()
+        elif self._timer is None and not self._sending:
+            self._timer = self._reactor.callLater(self.max_delay, self.flush)
+
+    def flush(self):
+        """
+        Send the buffered events (unless a batch is in flight already).
+        """
+        if self._timer is not None:
+            if self._timer.active():
+                self._timer.cancel()
+            self._timer = None
+
+        if self._sending or not self._buffer:
+            return
+
+        batch = [self._buffer.popleft() for _ in range(min(self.max_events, len(self._buffer)))]
+
+        if self._paused and len(self._buffer) < self.max_buffered:
+            self._paused = False
+            self._resume()
+
+        if self.format == u'json':
+            body = b'[' + b','.join(event for _, event in batch) + b']'
+        else:
+            body = b'\n'.join(event for _, event in batch) + b'\n'
+
+        self._sending = True
+        d = self._send(self.url, body, self.FORMATS[self.format])
+        d.addCallbacks(self._on_sent, self._on_failed, callbackArgs=(batch,), errbackArgs=(batch,))
+        d.addBoth(self._on_done)
+        return d
+
+    def _on_sent(self, _, batch):
+        now = self._reactor.seconds()
+        self.batches += 1
+        self.delivered += len(batch)
+        for received, _ in batch:
+            latency = now - received
+            self._latency_sum += latency
+            if latency > self._latency_max:
+                self._latency_max = latency
+
+    def _on_failed(self, failure, batch):
+        self.failed += len(batch)
+        self.log.warn("Failed to forward a batch of {count} events to {url}: {error}",
+                      count=len(batch), url=self.url, error=failure.getErrorMessage())
+
+    def _on_done(self, _):
+        self._sending = False
+        if not self._buffer:
+            return
+        if len(self._buffer) >= self.max_events:
+            self.flush()
+        else:
+            # send the rest once its oldest event was held back long enough
+            delay = max(0, self._buffer[0][0] + self.max_delay - self._reactor.seconds())
+            self._timer = self._reactor.callLater(delay, self.flush)
+
+    def stop(self):
+        """
+        Stop sending batches (the buffered events are discarded).
+        """
+        if self._timer is not None:
+            if self._timer.active():
+                self._timer.cancel()
+            self._timer = None
+        self._buffer.clear()
+
+    def stats(self):
+        """
+        :returns: The delivery statistics of the batcher.
+        :rtype: dict
+        """
+        elapsed = self._reactor.seconds() - self._started
+        return {
+            u'url': self.url.decode('utf8'),
+            u'received': self.received,
+            u'delivered': self.delivered,
+            u'dropped': self.dropped,
+            u'failed': self.failed,
+            u'batches': self.batches,
+            u'buffered': len(self._buffer),
+            u'throughput': self.delivered / elapsed if elapsed > 0 else 0.,
+            u'latency_avg': 1000. * self._latency_sum / self.delivered if self.delivered else 0.,
+            u'latency_max': 1000. * self._latency_max,
+        }
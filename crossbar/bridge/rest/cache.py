@@ -0,0 +1,174 @@
+#####################################################################################
+#
+#  Copyright (c) Crossbar.io Technologies GmbH
+#
+#  Unless a separate license agreement exists between you and Crossbar.io GmbH (e.g.
+#  you have purchased a commercial license), the license terms below apply.
+#
+#  Should you enter into a separate license agreement after having received a copy of
+#  this software, then the terms of such license agreement replace the terms below at
+#  the time at which such license agreement becomes effective.
+#
+#  In case a separate license agreement ends, and such agreement ends without being
+#  replaced by another separate license agreement, the license terms below apply
+#  from the time at which said agreement ends.
+#
+#  LICENSE TERMS
+#
+#  This program is free software: you can redistribute it and/or modify it under the
+#  terms of the GNU Affero General Public License, version 3, as published by the
+#  Free Software Foundation. This program is distributed in the hope that it will be
+#  useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#  See the GNU Affero General Public License Version 3 for more details.
+#
+#  You should have received a copy of the GNU Affero General Public license along
+#  with this program. If not, see <http://www.gnu.org/licenses/agpl-3.0.en.html>.
+#
+#####################################################################################
+
+from __future__ import absolute_import, division
+
+import json
+
+from collections import OrderedDict
+
+from twisted.internet.defer import Deferred, maybeDeferred
+
+__all__ = ('CallCache',)
+
+
+class _ProcedureCache(object):
+    """
+    The cached results of one procedure.
+    """
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        # key -> (expires, result), least recently used first
+        self.entries = OrderedDict()
+
+        # key -> list of deferreds waiting for the call in flight
+        self.inflight = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def stats(self):
+        return {
+            u'ttl': self.ttl,
+            u'max_entries': self.max_entries,
+            u'entries': len(self.entries),
+            u'inflight': len(self.inflight),
+            u'hits': self.hits,
+            u'misses': self.misses,
+            u'coalesced': self.coalesced,
+            u'evictions': self.evictions,
+        }
+
+
+class CallCache(object):
+    """
+    Caches the results of calls of read-only procedures, per procedure for
+    ``ttl`` seconds and up to ``max_entries`` distinct calls (the least
+    recently used results are dropped first).
+
+    Calls are identified by procedure, ``args``, ``kwargs`` and the identity
+    of the client checked for the request (so that results are never shared
+    between clients authenticated differently). While a call is in flight, identical calls wait for its
+    result instead of calling the procedure again (single-flight). Only
+    successful results are cached.
+    """
+
+    def __init__(self, procedures, reactor=None):
+        """
+
+        :param procedures: The procedures to cache results of, mapping a
+            procedure URI to a dict with ``ttl`` (in seconds, default 1)
+            and ``max_entries`` (default 1000).
+        :type procedures: dict
+
+        :param reactor: The reactor, used as clock (default: the global reactor).
+        """
+        if reactor is None:
+            from twisted.internet import reactor
+        self._reactor = reactor
+        self._procedures = {}
+        for procedure, config in procedures.items():
+            self._procedures[procedure] = _ProcedureCache(config.get('ttl', 1),
+                                                          config.get('max_entries', 1000))
+
+    def __contains__(self, procedure):
+        return procedure in self._procedures
+
+    @staticmethod
+    def _key(args, kwargs, identity):
+        return identity, json.dumps([args, kwargs], sort_keys=True, separators=(',', ':'))
+
+    def call(self, procedure, args, kwargs, identity, call):
+        """
+        Get the result of a call, from the cache or by calling ``call()``.
+
+        :param identity: The identity of the client (hashable), or ``None``
+            for anonymous clients.
+
+        :param call: Callable returning the (deferred) result of the call.
+
+        :returns: A deferred firing with the result.
+        """
+        cache = self._procedures.get(procedure, None)
+        if cache is None:
+            return maybeDeferred(call)
+
+        key = self._key(args, kwargs, identity)
+        now = self._reactor.seconds()
+
+        entry = cache.entries.get(key, None)
+        if entry is not None:
+            expires, result = entry
+            if expires > now:
+                # move to the end (most recently used)
+                del cache.entries[key]
+                cache.entries[key] = entry
+                cache.hits += 1
+                d = Deferred()
+                d.callback(result)
+                return d
+            del cache.entries[key]
+
+        d = Deferred()
+        if key in cache.inflight:
+            cache.coalesced += 1
+            cache.inflight[key].append(d)
+            return d
+
+        cache.misses += 1
+        cache.inflight[key] = [d]
+        call_d = maybeDeferred(call)
+        call_d.addCallbacks(self._call_ok, self._call_error, callbackArgs=(cache, key),
+                            errbackArgs=(cache, key))
+        return d
+
+    def _call_ok(self, result, cache, key):
+        cache.entries[key] = (self._reactor.seconds() + cache.ttl, result)
+        while len(cache.entries) > cache.max_entries:
+            cache.entries.popitem(last=False)
+            cache.evictions += 1
+
+        for d in cache.inflight.pop(key):
+            d.callback(result)
+
+    def _call_error(self, failure, cache, key):
+        for d in cache.inflight.pop(key):
+            d.errback(failure)
+
+    def stats(self):
+        """
+        Get the statistics of the cache, per procedure.
+        """
+        return {procedure: cache.stats() for procedure, cache in self._procedures.items()}
@@ -37,16 +37,14 @@ from twisted.web.http_headers import Headers
 
 from autobahn.twisted.wamp import ApplicationSession
 
+from crossbar.bridge.rest.pool import get_pool
+
 
 class RESTCallee(ApplicationSession):
 
     def __init__(self, *args, **kwargs):
         self._webtransport = kwargs.pop("webTransport", None)
 
-        if not self._webtransport:
-            import treq
-            self._webtransport = treq
-
         super(RESTCallee, self).__init__(*args, **kwargs)
 
     @inlineCallbacks
@@ -57,6 +55,8 @@ class RESTCallee(ApplicationSession):
         baseURL = self.config.extra["baseurl"]
         procedure = self.config.extra["procedure"]
 
+        pool = get_pool(self.config.extra.get("pool", None), webtransport=self._webtransport)
+
         @inlineCallbacks
         def on_call(method=None, url=None, body=u"", headers={}, params={}):
 
@@ -64,14 +64,13 @@ class RESTCallee(ApplicationSession):
 
             params = {x.encode('utf8'): y.encode('utf8') for x, y in params.items()}
 
-            res = yield self._webtransport.request(
+            res, content = yield pool.request(
                 method,
                 newURL,
                 data=body.encode('utf8'),
                 headers=Headers(headers),
                 params=params
             )
-            content = yield self._webtransport.text_content(res)
 
             headers = {x.decode('utf8'): [z.decode('utf8') for z in y]
                        for x, y in dict(res.headers.getAllRawHeaders()).items()}
@@ -35,6 +35,7 @@ from twisted.internet.defer import maybeDeferred
 from autobahn.wamp.types import CallResult
 
 from crossbar._util import dump_json
+from crossbar.bridge.rest.cache import CallCache
 from crossbar.bridge.rest.common import _CommonResource
 
 __all__ = ('CallerResource',)
@@ -45,6 +46,21 @@ class CallerResource(_CommonResource):
     A HTTP/POST to WAMP-Caller bridge.
     """
 
+    def __init__(self, options, session, auth_config=None, reactor=None):
+        _CommonResource.__init__(self, options, session, auth_config=auth_config)
+
+        # results of read-only procedures may be cached (per procedure)
+        self._cache = None
+        cache = options.get('cache', {})
+        if cache.get('procedures', None):
+            self._cache = CallCache(cache['procedures'], reactor=reactor)
+
+    def get_cache_stats(self):
+        """
+        Get the hit/miss statistics of the cached procedures.
+        """
+        return self._cache.stats() if self._cache else {}
+
     def _process(self, request, event):
 
         if 'procedure' not in event:
@@ -58,26 +74,17 @@ class CallerResource(_CommonResource):
         args = event['args'] if 'args' in event and event['args'] else []
         kwargs = event['kwargs'] if 'kwargs' in event and event['kwargs'] else {}
 
-        def _call(*args, **kwargs):
-            return self._session.call(*args, **kwargs)
+        def _call():
+            d = self._session.call(procedure, *args, **kwargs)
+            d.addCallback(self._render_result)
+            return d
 
-        d = maybeDeferred(_call, procedure, *args, **kwargs)
-
-        def on_call_ok(value):
-            # a WAMP procedure call result may have a single return value, but also
-            # multiple, positional return values as well as keyword-based return values
-            #
-            if isinstance(value, CallResult):
-                res = {}
-                if value.results:
-                    res['args'] = value.results
-                if value.kwresults:
-                    res['kwargs'] = value.kwresults
-            else:
-                res = {'args': [value]}
-
-            body = dump_json(res, True).encode('utf8')
+        if self._cache is not None and procedure in self._cache:
+            d = self._cache.call(procedure, args, kwargs, request.bridge_identity, _call)
+        else:
+            d = maybeDeferred(_call)
 
+        def on_call_ok(body):
             return self._complete_request(
                 request, 200, body,
                 log_category="AR202")
@@ -90,3 +97,19 @@ class CallerResource(_CommonResource):
                                       log_category="AR458")
 
         return d.addCallbacks(on_call_ok, on_call_error)
+
+    @staticmethod
+    def _render_result(value):
+        # a WAMP procedure call result may have a single return value, but also
+        # multiple, positional return values as well as keyword-based return values
+        #
+        if isinstance(value, CallResult):
+            res = {}
+            if value.results:
+                res['args'] = value.results
+            if value.kwresults:
+                res['kwargs'] = value.kwresults
+        else:
+            res = {'args': [value]}
+
+        return dump_json(res, True).encode('utf8')
@@ -30,6 +30,7 @@
 
 import datetime
 import json
+import time
 import hmac
 import hashlib
 import base64
@@ -49,12 +50,12 @@ from twisted.web import server
 from twisted.web.resource import Resource
 from twisted.internet.defer import maybeDeferred
 
-from autobahn.websocket.utf8validator import Utf8Validator
-_validator = Utf8Validator()
-
 
 _ALLOWED_CONTENT_TYPES = set([b'application/json'])
 
+# newline delimited JSON (one JSON value per line), for bulk requests
+_NDJSON_CONTENT_TYPES = set([b'application/x-ndjson'])
+
 
 class _InvalidUnicode(BaseException):
     """
@@ -62,6 +63,183 @@ class _InvalidUnicode(BaseException):
     """
 
 
+def _parse_content_type(headers):
+    """
+    Parse the Content-Type header of a request.
+
+    :returns: A pair with the list of (lower-cased) elements of the header and
+        a dict of its parameters (like ``charset``).
+    :raises ValueError: if the parameters are malformed.
+    """
+    content_type_header = headers.getRawHeaders(b"content-type", [])
+
+    if len(content_type_header) > 0:
+        content_type_elements = [
+            x.strip().lower()
+            for x in content_type_header[0].split(b";")
+        ]
+    else:
+        content_type_elements = []
+
+    encoding_parts = {}
+
+    if len(content_type_elements) > 1:
+        for item in content_type_elements:
+            if b"=" not in item:
+                # Don't bother looking at things "like application/json"
+                continue
+
+            # Parsing things like:
+            # charset=utf-8
+            _ = native_string(item).split("=")
+            if len(_) != 2:
+                raise ValueError(item)
+
+            # We don't want duplicates
+            key = _[0].strip().lower()
+            if key in encoding_parts:
+                raise ValueError(item)
+            encoding_parts[key] = _[1].strip().lower()
+
+    return content_type_elements, encoding_parts
+
+
+class _BodyReader(object):
+    """
+    Consumes the body of a request while it arrives (see
+    :class:`crossbar.common.twisted.web._StreamingRequest`).
+
+    The body is discarded as soon as it is known to exceed the body limit,
+    either from the announced length or from the bytes received. NDJSON
+    bodies are parsed line by line: each event is either collected in
+    ``events``, or - when ``on_event`` is given - processed right away, with
+    the return values collected in ``results``. The raw body is only kept
+    when needed (always for non-NDJSON bodies, else when ``keep_body``).
+    """
+
+    def __init__(self, limit=0, length=None, ndjson=False, keep_body=False, on_event=None):
+        self.limit = limit
+        self.received = 0
+        self.too_large = bool(limit and length is not None and length > limit)
+        self.error = None
+        self.events = [] if ndjson and on_event is None else None
+        self.results = [] if ndjson and on_event is not None else None
+        self._ndjson = ndjson
+        self._keep_body = keep_body or not ndjson
+        self._on_event = on_event
+        self._chunks = []
+        self._line = []
+
+    def write(self, data):
+        self.received += len(data)
+        if self.too_large:
+            return
+        if self.limit and self.received > self.limit:
+            self.too_large = True
+            self._chunks = []
+            self._line = []
+            return
+        if self._keep_body:
+            self._chunks.append(data)
+        if self._ndjson and self.error is None:
+            start = 0
+            end = data.find(b'\n')
+            while end >= 0:
+                self._line.append(data[start:end])
+                self._parse_line()
+                start = end + 1
+                end = data.find(b'\n', start)
+            if start < len(data):
+                self._line.append(data[start:])
+
+    def close(self):
+        """
+        Called when the whole body has been received.
+        """
+        if self._ndjson and self.error is None and not self.too_large:
+            self._parse_line()
+
+    def getvalue(self):
+        """
+        :returns: The (kept) body.
+        """
+        if len(self._chunks) > 1:
+            # don't hold on to the chunks as well
+            self._chunks = [b''.join(self._chunks)]
+        return self._chunks[0] if self._chunks else b''
+
+    def _parse_line(self):
+        line = self._line[0] if len(self._line) == 1 else b''.join(self._line)
+        self._line = []
+        if self.error is not None or not line.strip():
+            return
+        try:
+            event = json.loads(line.decode('utf8'))
+        except UnicodeDecodeError as e:
+            self.error = ("AR451", e)
+            return
+        except ValueError as e:
+            self.error = ("AR453", e)
+            return
+        if self._on_event is not None:
+            self.results.append(self._on_event(event))
+        else:
+            self.events.append(event)
+
+
+class _ReplayCache(object):
+    """
+    Remembers the signed requests (their ``(seq, nonce)``) seen within a time
+    window, to detect replayed requests.
+
+    The entries are kept in a few buckets, each covering a part of the
+    window: a new bucket is started when the current one is full (in time),
+    and the oldest bucket is dropped then. So memory is bounded by the
+    request rate times the window, and a check is O(1) per bucket.
+    """
+
+    def __init__(self, window, buckets=4, clock=time.time):
+        """
+
+        :param window: The time (in seconds) requests are remembered for (at least).
+        :type window: float
+        :param buckets: The number of buckets.
+        :type buckets: int
+        :param clock: Callable returning the current time.
+        """
+        self._span = float(window) / (buckets - 1)
+        self._buckets = [set() for _ in range(buckets)]
+        self._clock = clock
+        self._rotated = clock()
+
+    def check(self, entry):
+        """
+        Check (and remember) a request.
+
+        :returns: ``True`` if the request was not seen before.
+        :rtype: bool
+        """
+        now = self._clock()
+        if now - self._rotated >= self._span:
+            # drop all buckets which are older than the window
+            rotations = min(int((now - self._rotated) // self._span), len(self._buckets))
+            for _ in range(rotations):
+                self._buckets.pop()
+                self._buckets.insert(0, set())
+            self._rotated += rotations * self._span
+            if now - self._rotated >= self._span:
+                self._rotated = now
+
+        for bucket in self._buckets:
+            if entry in bucket:
+                return False
+        self._buckets[0].add(entry)
+        return True
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self._buckets)
+
+
 class _CommonResource(Resource):
     """
     Shared components between PublisherResource and CallerResource.
@@ -69,6 +247,12 @@ class _CommonResource(Resource):
     isLeaf = True
     decode_as_json = True
 
+    # if True, the body may also be a JSON array (or NDJSON) of many
+    # events, which are processed by _process_bulk. resources allowing bulk
+    # requests must implement _process_bulk, _process_bulk_event and
+    # _complete_bulk, which are only ever called for those
+    allow_bulk = False
+
     def __init__(self, options, session, auth_config=None):
         """
         Ctor.
@@ -94,6 +278,12 @@ class _CommonResource(Resource):
         self._post_body_limit = int(options.get('post_body_limit', 0))
         self._timestamp_delta_limit = int(options.get('timestamp_delta_limit', 300))
 
+        # signed requests with a timestamp are accepted for timestamp_delta_limit
+        # seconds before or after it, so remember them twice as long
+        self._replay_cache = None
+        if self._secret and self._timestamp_delta_limit and options.get('replay_protection', True):
+            self._replay_cache = _ReplayCache(2 * self._timestamp_delta_limit)
+
         self._require_ip = None
         if 'require_ip' in options:
             self._require_ip = [ip_network(net) for net in options['require_ip']]
@@ -107,16 +297,29 @@ class _CommonResource(Resource):
         """
         Called when client request is denied.
         """
+        body = dump_json(self._denial(code, kwargs), True).encode('utf8')
+        request.setResponseCode(code)
+        return body
+
+    def _deny_streamed(self, request, results, code, **kwargs):
+        """
+        Called when a bulk request is denied after (some of) its events were
+        processed already, while the body arrived: the response has the
+        results of those events, followed by the error denying the rest.
+        """
+        d = self._complete_bulk(request, results, code=code,
+                                error=self._denial(code, kwargs))
+        d.addCallback(lambda _: request.finish())
+        return server.NOT_DONE_YET
+
+    def _denial(self, code, kwargs):
         if "log_category" not in kwargs.keys():
             kwargs["log_category"] = "AR" + str(code)
 
         self.log.debug(code=code, **kwargs)
 
         error_str = log_categories[kwargs['log_category']].format(**kwargs)
-        body = dump_json({"error": error_str,
-                          "args": [], "kwargs": {}}, True).encode('utf8')
-        request.setResponseCode(code)
-        return body
+        return {"error": error_str, "args": [], "kwargs": {}}
 
     def _fail_request(self, request, **kwargs):
         """
@@ -187,6 +390,59 @@ class _CommonResource(Resource):
         if headers is not None:
             request.setHeader(b'access-control-allow-headers', headers)
 
+    def body_consumer(self, request, length):
+        """
+        Called by the web site when the headers of a request were received,
+        returns the consumer of the request body.
+
+        :param length: The announced length of the body (or ``None``).
+        :type length: int
+        """
+        return self._body_reader(request, length, stream=True)
+
+    def _body_reader(self, request, length, stream):
+        ndjson = False
+        on_event = None
+        if self.decode_as_json and self.allow_bulk:
+            try:
+                content_type_elements, encoding_parts = _parse_content_type(request.requestHeaders)
+            except ValueError:
+                content_type_elements, encoding_parts = [], {}
+            ndjson = bool(content_type_elements) and \
+                content_type_elements[0] in _NDJSON_CONTENT_TYPES and \
+                encoding_parts.get("charset", "utf-8") in ["utf-8", "utf8"]
+            if ndjson and stream and self._can_stream(request):
+                on_event = self._process_bulk_event
+
+        return _BodyReader(self._post_body_limit, length, ndjson=ndjson,
+                           keep_body=bool(self._secret), on_event=on_event)
+
+    def _can_stream(self, request):
+        """
+        Check if the events of a request can be processed while its body
+        arrives, which requires the request to be accepted before seeing the
+        body: it may be neither signed nor authenticated.
+        """
+        if request.method not in (b"POST", b"PUT"):
+            return False
+        if self._secret or request.requestHeaders.hasHeader(b"authorization"):
+            return False
+        for arg in (b"key", b"timestamp", b"seq", b"nonce", b"signature", b"authmethod"):
+            if arg in request.args:
+                return False
+        if self._require_tls and not request.isSecure():
+            return False
+        if self._require_ip and not self._is_ip_allowed(request.getClientIP()):
+            return False
+        return True
+
+    def _is_ip_allowed(self, client_ip):
+        ip = ip_address(client_ip)
+        for net in self._require_ip:
+            if ip in net:
+                return True
+        return False
+
     def render(self, request):
         """
         Handle the request. All requests start here.
@@ -220,57 +476,41 @@ class _CommonResource(Resource):
         Receives an HTTP/POST|PUT request, and then calls the Publisher/Caller
         processor.
         """
-        # read HTTP/POST|PUT body
-        body = request.content.read()
+        # the HTTP/POST|PUT body was consumed while it arrived - else (when
+        # not served from our web site) read it now
+        reader = getattr(request, 'body_consumer', None)
+        if reader is None:
+            reader = self._body_reader(request, None, stream=False)
+            reader.write(request.content.read())
+        reader.close()
+        body = reader.getvalue()
 
         args = {native_string(x): y[0] for x, y in request.args.items()}
         headers = request.requestHeaders
 
         # check content type + charset encoding
         #
-        content_type_header = headers.getRawHeaders(b"content-type", [])
-
-        if len(content_type_header) > 0:
-            content_type_elements = [
-                x.strip().lower()
-                for x in content_type_header[0].split(b";")
-            ]
-        else:
-            content_type_elements = []
+        try:
+            content_type_elements, encoding_parts = _parse_content_type(headers)
+        except ValueError:
+            return self._deny_request(request, 400, log_category="AR450")
 
         if self.decode_as_json:
+            allowed_content_types = _ALLOWED_CONTENT_TYPES
+            if self.allow_bulk:
+                allowed_content_types = allowed_content_types | _NDJSON_CONTENT_TYPES
+
             # if the client sent a content type, it MUST be one of _ALLOWED_CONTENT_TYPES
             # (but we allow missing content type .. will catch later during JSON
             # parsing anyway)
-            if len(content_type_elements) > 0 and \
-               content_type_elements[0] not in _ALLOWED_CONTENT_TYPES:
-                return self._deny_request(
-                    request, 400,
-                    accepted=list(_ALLOWED_CONTENT_TYPES),
-                    given=content_type_elements[0],
-                    log_category="AR452"
-                )
-
-        encoding_parts = {}
-
-        if len(content_type_elements) > 1:
-            try:
-                for item in content_type_elements:
-                    if b"=" not in item:
-                        # Don't bother looking at things "like application/json"
-                        continue
-
-                    # Parsing things like:
-                    # charset=utf-8
-                    _ = native_string(item).split("=")
-                    assert len(_) == 2
-
-                    # We don't want duplicates
-                    key = _[0].strip().lower()
-                    assert key not in encoding_parts
-                    encoding_parts[key] = _[1].strip().lower()
-            except:
-                return self._deny_request(request, 400, log_category="AR450")
+            if len(content_type_elements) > 0:
+                if content_type_elements[0] not in allowed_content_types:
+                    return self._deny_request(
+                        request, 400,
+                        accepted=list(allowed_content_types),
+                        given=content_type_elements[0],
+                        log_category="AR452"
+                    )
 
         charset_encoding = encoding_parts.get("charset", "utf-8")
 
@@ -279,17 +519,23 @@ class _CommonResource(Resource):
                 request, 400,
                 log_category="AR450")
 
-        # enforce "post_body_limit"
+        def deny_body(code, **kwargs):
+            # the events of a NDJSON body may have been processed while it
+            # arrived already: then tell the client which ones
+            if reader.results:
+                return self._deny_streamed(request, reader.results, code, **kwargs)
+            return self._deny_request(request, code, **kwargs)
+
+        # enforce "post_body_limit" (a body exceeding it was not kept, but
+        # all of its bytes were counted)
         #
-        body_length = len(body)
+        body_length = reader.received
         content_length_header = headers.getRawHeaders(b"content-length", [])
 
         if len(content_length_header) == 1:
             content_length = int(content_length_header[0])
         elif len(content_length_header) > 1:
-            return self._deny_request(
-                request, 400,
-                log_category="AR463")
+            return deny_body(400, log_category="AR463")
         else:
             content_length = body_length
 
@@ -298,13 +544,13 @@ class _CommonResource(Resource):
             # Content-Length. This is so that clients can't lie and bypass
             # length restrictions by giving an incorrect header with a large
             # body.
-            return self._deny_request(request, 400, bodylen=body_length,
-                                      conlen=content_length,
-                                      log_category="AR465")
+            return deny_body(400, bodylen=body_length,
+                             conlen=content_length,
+                             log_category="AR465")
 
         if self._post_body_limit and content_length > self._post_body_limit:
-            return self._deny_request(
-                request, 413,
+            return deny_body(
+                413,
                 length=content_length,
                 accepted=self._post_body_limit
             )
@@ -351,8 +597,7 @@ class _CommonResource(Resource):
         if 'seq' in args:
             seq_str = args["seq"]
             try:
-                # FIXME: check sequence
-                seq = int(seq_str)  # noqa
+                seq = int(seq_str)
             except:
                 return self._deny_request(
                     request, 400,
@@ -370,8 +615,7 @@ class _CommonResource(Resource):
         if 'nonce' in args:
             nonce_str = args["nonce"]
             try:
-                # FIXME: check nonce
-                nonce = int(nonce_str)  # noqa
+                nonce = int(nonce_str)
             except:
                 return self._deny_request(
                     request, 400,
@@ -421,6 +665,12 @@ class _CommonResource(Resource):
                 self.log.debug("REST request signature valid.",
                                log_category="AR203")
 
+            # a signed request can only be used once (within the window it
+            # is accepted in at all)
+            if self._replay_cache is not None and not self._replay_cache.check((seq, nonce)):
+                return self._deny_request(request, 401,
+                                          log_category="AR467")
+
         # user_agent = headers.get("user-agent", "unknown")
         client_ip = request.getClientIP()
         is_secure = request.isSecure()
@@ -428,13 +678,7 @@ class _CommonResource(Resource):
         # enforce client IP address
         #
         if self._require_ip:
-            ip = ip_address(client_ip)
-            allowed = False
-            for net in self._require_ip:
-                if ip in net:
-                    allowed = True
-                    break
-            if not allowed:
+            if not self._is_ip_allowed(client_ip):
                 return self._deny_request(request, 400, log_category="AR466")
 
         # enforce TLS
@@ -447,15 +691,22 @@ class _CommonResource(Resource):
         # authenticate request
         #
 
+        # the identity checked for this very request: the (ticket) authid or
+        # the signing key, or None for anonymous requests (the session of the
+        # bridge is shared by all requests)
+        request.bridge_identity = None
+
         # TODO: also support HTTP Basic AUTH for ticket
 
         def on_auth_ok(value):
             if value is True:
                 # treat like original behavior and just accept the request_id
-                pass
+                if self._secret:
+                    request.bridge_identity = (u'key', native_string(key_str))
             elif isinstance(value, types.Accept):
                 self._session._authid = value.authid
                 self._session._authrole = value.authrole
+                request.bridge_identity = (u'ticket', value.authid)
                 # realm?
             else:
                 # FIXME: not returning deny request... probably not ideal
@@ -463,19 +714,43 @@ class _CommonResource(Resource):
                 request.finish()
                 return
 
-            _validator.reset()
-            validation_result = _validator.validate(body)
+            def finish(value):
+                if isinstance(value, bytes):
+                    request.write(value)
+                request.finish()
+
+            if reader.error is not None:
+                # NDJSON bodies are parsed (and maybe processed) while they
+                # arrive, and this line was bad
+                category, e = reader.error
+                denied = deny_body(400, exc=e, log_category=category)
+                if denied is not server.NOT_DONE_YET:
+                    request.write(denied)
+                    request.finish()
+                return
 
-            # validate() returns a 4-tuple, of which item 0 is whether it
-            # is valid
-            if not validation_result[0]:
+            if reader.results is not None:
+                # the events were processed while the body arrived
+                d = maybeDeferred(self._complete_bulk, request, reader.results)
+                d.addCallback(finish)
+                return
+
+            if reader.events is not None:
+                d = maybeDeferred(self._process_bulk, request, reader.events)
+                d.addCallback(finish)
+                return
+
+            # decoding validates the UTF-8 too
+            try:
+                event = body.decode('utf8')
+            except UnicodeDecodeError:
                 request.write(self._deny_request(
                     request, 400,
                     log_category="AR451"))
                 request.finish()
                 return
 
-            event = body.decode('utf8')
+            process = self._process
 
             if self.decode_as_json:
                 try:
@@ -487,20 +762,19 @@ class _CommonResource(Resource):
                     request.finish()
                     return
 
-                if not isinstance(event, dict):
+                if self.allow_bulk and isinstance(event, list):
+                    # many events in one request: authentication and signature
+                    # were checked once above, for the whole batch
+                    process = self._process_bulk
+
+                elif not isinstance(event, dict):
                     request.write(self._deny_request(
                         request, 400,
                         log_category="AR454"))
                     request.finish()
                     return
 
-            d = maybeDeferred(self._process, request, event)
-
-            def finish(value):
-                if isinstance(value, bytes):
-                    request.write(value)
-                request.finish()
-
+            d = maybeDeferred(process, request, event)
             d.addCallback(finish)
 
         def on_auth_error(err):
@@ -0,0 +1,222 @@
+#####################################################################################
+#
+#  Copyright (c) Crossbar.io Technologies GmbH
+#
+#  Unless a separate license agreement exists between you and Crossbar.io GmbH (e.g.
+#  you have purchased a commercial license), the license terms below apply.
+#
+#  Should you enter into a separate license agreement after having received a copy of
+#  this software, then the terms of such license agreement replace the terms below at
+#  the time at which such license agreement becomes effective.
+#
+#  In case a separate license agreement ends, and such agreement ends without being
+#  replaced by another separate license agreement, the license terms below apply
+#  from the time at which said agreement ends.
+#
+#  LICENSE TERMS
+#
+#  This program is free software: you can redistribute it and/or modify it under the
+#  terms of the GNU Affero General Public License, version 3, as published by the
+#  Free Software Foundation. This program is distributed in the hope that it will be
+#  useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#  See the GNU Affero General Public License Version 3 for more details.
+#
+#  You should have received a copy of the GNU Affero General Public license along
+#  with this program. If not, see <http://www.gnu.org/licenses/agpl-3.0.en.html>.
+#
+#####################################################################################
+
+from __future__ import absolute_import
+
+import random
+
+from six.moves.urllib.parse import urlparse
+
+from twisted.internet.defer import DeferredSemaphore, inlineCallbacks, returnValue, fail
+from twisted.internet.task import deferLater
+
+from autobahn.wamp.exception import ApplicationError
+
+from txaio import make_logger
+
+__all__ = ('HTTPClientPool', 'get_pool')
+
+
+class HTTPClientPool(object):
+    """
+    A pool of persistent (keep-alive) HTTP client connections, used by the
+    HTTP bridge components which make outgoing requests (RESTCallee and
+    MessageForwarder).
+
+    At most ``max_connections_per_host`` requests per host are in flight at
+    any time, further requests wait for a free connection. At most
+    ``max_pending`` requests are in flight or waiting in total, further
+    requests are rejected right away (with
+    ``crossbar.error.http_pool_overloaded``), rather than opening ever more
+    sockets and piling up in memory.
+    """
+
+    log = make_logger()
+
+    def __init__(self, reactor=None, webtransport=None, max_connections_per_host=10,
+                 max_pending=1000, timeout=30, idle_timeout=240):
+        """
+
+        :param reactor: The reactor to use (default: the global reactor).
+        :param webtransport: The HTTP client to use, providing ``request()`` and
+            ``text_content()`` like treq (default: treq, using a persistent
+            connection pool).
+        :param max_connections_per_host: The maximum number of concurrent
+            requests (and so, connections) per host.
+        :type max_connections_per_host: int
+        :param max_pending: The maximum number of requests in flight or waiting
+            for a connection.
+        :type max_pending: int
+        :param timeout: The timeout (in seconds) for a request, including
+            reading the response body. If 0, no timeout.
+        :type timeout: float
+        :param idle_timeout: The time (in seconds) idle connections are kept
+            open for.
+        :type idle_timeout: float
+        """
+        if reactor is None:
+            from twisted.internet import reactor
+        self._reactor = reactor
+
+        if webtransport is None:
+            import treq
+            from treq.client import HTTPClient
+            from twisted.web.client import Agent, HTTPConnectionPool
+
+            connections = HTTPConnectionPool(reactor, persistent=True)
+            connections.maxPersistentPerHost = max_connections_per_host
+            connections.cachedConnectionTimeout = idle_timeout
+            self._webtransport = HTTPClient(Agent(reactor, pool=connections))
+            self._text_content = treq.text_content
+        else:
+            self._webtransport = webtransport
+            self._text_content = webtransport.text_content
+
+        self.max_connections_per_host = max_connections_per_host
+        self.max_pending = max_pending
+        self.timeout = timeout
+
+        # host -> DeferredSemaphore (only for hosts with requests)
+        self._hosts = {}
+
+        # requests in flight or waiting for a connection
+        self.pending = 0
+
+        # statistics
+        self.requests = 0
+        self.retries = 0
+        self.rejected = 0
+
+    def request(self, method, url, retries=0, retry_delay=0.5, **kwargs):
+        """
+        Make a HTTP request (once a connection to the host is available) and
+        read the response body.
+
+        Failed requests (connection errors, timeouts and ``5xx`` responses)
+        are retried up to ``retries`` times, waiting a random time of up to
+        ``retry_delay * 2 ** n`` seconds before the n-th retry.
+
+        :param method: The HTTP method.
+        :param url: The URL to request.
+        :param retries: The number of times to retry a failed request.
+        :type retries: int
+        :param retry_delay: The base delay (in seconds) between retries.
+        :type retry_delay: float
+        :param kwargs: Further arguments for the request (``data``,
+            ``headers``, ``params``).
+
+        :returns: A Deferred firing with a pair ``(response, content)``.
+        """
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            return fail(ApplicationError(
+                u"crossbar.error.http_pool_overloaded",
+                u"too many pending HTTP requests ({})".format(self.pending)))
+
+        self.pending += 1
+
+        def done(res):
+            self.pending -= 1
+            return res
+
+        return self._request(method, url, retries, retry_delay, kwargs).addBoth(done)
+
+    @inlineCallbacks
+    def _request(self, method, url, retries, retry_delay, kwargs):
+        attempt = 0
+        while True:
+            try:
+                res, content = yield self._send(method, url, kwargs)
+            except Exception as e:
+                if attempt >= retries:
+                    raise
+                reason = e
+            else:
+                if res.code < 500 or attempt >= retries:
+                    returnValue((res, content))
+                reason = res.code
+
+            delay = random.uniform(0, retry_delay * 2 ** attempt)
+            attempt += 1
+            self.retries += 1
+            self.log.debug("Retrying HTTP request to {url} in {delay:.2f}s ({reason})",
+                           url=url, delay=delay, reason=reason)
+            yield deferLater(self._reactor, delay, lambda: None)
+
+    def _send(self, method, url, kwargs):
+        host = urlparse(url).netloc
+        slots = self._hosts.get(host)
+        if slots is None:
+            slots = self._hosts[host] = DeferredSemaphore(self.max_connections_per_host)
+
+        def release(res):
+            if slots.tokens == slots.limit and not slots.waiting:
+                self._hosts.pop(host, None)
+            return res
+
+        return slots.run(self._exchange, method, url, kwargs).addBoth(release)
+
+    def _exchange(self, method, url, kwargs):
+        self.requests += 1
+        d = self._webtransport.request(method, url, **kwargs)
+
+        def read(res):
+            # always read the body, so the connection can be reused
+            return self._text_content(res).addCallback(lambda content: (res, content))
+
+        d.addCallback(read)
+        if self.timeout:
+            d.addTimeout(self.timeout, self._reactor)
+        return d
+
+
+# pool options (sorted items) -> pool
+_pools = {}
+
+
+def get_pool(options=None, reactor=None, webtransport=None):
+    """
+    Get the HTTP client pool for the given pool options: all components (of
+    a worker) using the same options share one pool.
+
+    :param options: The pool options (see :class:`HTTPClientPool`).
+    :type options: dict
+    :param webtransport: A HTTP client to use instead of treq. Pools using
+        one are not shared.
+    """
+    options = options or {}
+    if webtransport is not None:
+        return HTTPClientPool(reactor=reactor, webtransport=webtransport, **options)
+
+    key = tuple(sorted(options.items()))
+    pool = _pools.get(key)
+    if pool is None:
+        pool = _pools[key] = HTTPClientPool(reactor=reactor, **options)
+    return pool
@@ -30,6 +30,10 @@
 
 from __future__ import absolute_import, division
 
+from twisted.internet.defer import Deferred, gatherResults
+from twisted.python.failure import Failure
+
+from autobahn.wamp.exception import ApplicationError
 from autobahn.wamp.types import PublishOptions
 
 from crossbar._util import dump_json
@@ -41,30 +45,50 @@ __all__ = ('PublisherResource',)
 class PublisherResource(_CommonResource):
     """
     A HTTP/POST to WAMP-Publisher bridge.
+
+    The request body is either a single event (a JSON object), or - for bulk
+    publishing - a JSON array or newline delimited JSON (NDJSON) stream of
+    events, which are all published in one pass.
     """
 
-    def _process(self, request, event):
+    allow_bulk = True
 
-        if 'topic' not in event:
-            return self._deny_request(request, 400,
-                                      key="topic",
-                                      log_category="AR455")
+    def _publish(self, event):
+        """
+        Publish a single event.
 
+        :returns: A Deferred firing with the publication when the event is
+            acknowledged, else ``None``.
+        """
         topic = event.pop('topic')
 
         args = event['args'] if 'args' in event and event['args'] else []
         kwargs = event['kwargs'] if 'kwargs' in event and event['kwargs'] else {}
         options = event['options'] if 'options' in event and event['options'] else {}
 
-        publish_options = PublishOptions(acknowledge=True,
+        publish_options = PublishOptions(acknowledge=options.get('acknowledge', True),
                                          exclude=options.get('exclude', None),
                                          eligible=options.get('eligible', None))
 
         kwargs['options'] = publish_options
 
+        return self._session.publish(topic, *args, **kwargs)
+
+    def _process(self, request, event):
+
+        if 'topic' not in event:
+            return self._deny_request(request, 400,
+                                      key="topic",
+                                      log_category="AR455")
+
+        # always acknowledge a single event, so we can return its ID
+        options = event.get('options', None) or {}
+        options['acknowledge'] = True
+        event['options'] = options
+
         # http://twistedmatrix.com/documents/current/web/howto/web-in-60/asynchronous-deferred.html
 
-        d = self._session.publish(topic, *args, **kwargs)
+        d = self._publish(event)
 
         def on_publish_ok(pub):
             res = {'id': pub.id}
@@ -75,3 +99,77 @@ class PublisherResource(_CommonResource):
             self._fail_request(request, failure=err, log_category="AR456")
 
         return d.addCallbacks(on_publish_ok, on_publish_error)
+
+    def _process_bulk(self, request, events):
+        """
+        Publish many events, returning a JSON array with one result per
+        event (in order): ``{"id": ..}`` for acknowledged publications,
+        ``{}`` for unacknowledged ones and ``{"error": .., "args": .., "kwargs": ..}``
+        for events which could not be published.
+        """
+        return self._complete_bulk(request, [self._process_bulk_event(event) for event in events])
+
+    def _process_bulk_event(self, event):
+        """
+        Publish one event of a bulk request.
+
+        :returns: The result for the event, or a Deferred firing with it.
+        """
+        if not isinstance(event, dict) or 'topic' not in event:
+            return {'error': u'wamp.error.invalid_argument',
+                    'args': [u"event must be an object with a 'topic' key"],
+                    'kwargs': {}}
+
+        try:
+            d = self._publish(event)
+        except Exception:
+            return self._error_result(Failure())
+
+        if d is None:
+            return {}
+        return d.addCallbacks(self._ok_result, self._error_result)
+
+    def _complete_bulk(self, request, results, code=200, error=None):
+        """
+        Respond to a bulk request once all its events are done.
+
+        :param error: The error denying the rest of the request, after the
+            events were processed (appended to the results).
+        :type error: dict
+        """
+        results = list(results)
+        pending = []
+        for i, res in enumerate(results):
+            if isinstance(res, Deferred):
+                pending.append(res.addCallback(self._set_result, results, i))
+
+        def on_done(_):
+            failed = len([res for res in results if 'error' in res])
+            count = len(results)
+            if error is not None:
+                results.append(error)
+            body = dump_json(results, True).encode('utf8')
+            self._complete_request(request, code, body, log_category="AR204",
+                                   count=count, failed=failed)
+
+        return gatherResults(pending).addCallback(on_done)
+
+    @staticmethod
+    def _set_result(res, results, i):
+        results[i] = res
+
+    @staticmethod
+    def _ok_result(pub):
+        return {'id': pub.id}
+
+    def _error_result(self, err):
+        if isinstance(err.value, ApplicationError):
+            return {'error': err.value.error,
+                    'args': list(err.value.args),
+                    'kwargs': err.value.kwargs or {}}
+
+        # a "CB" error, so return a generic error
+        self.log.failure(None, failure=err, log_category="AR500")
+        return {'error': u'wamp.error.runtime_error',
+                'args': [u"Sorry, Crossbar.io has encountered a problem."],
+                'kwargs': {}}
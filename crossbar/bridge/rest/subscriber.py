@@ -32,9 +32,10 @@ from __future__ import absolute_import
 
 import json
 
+from collections import OrderedDict
 from functools import partial
 
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet.defer import gatherResults, inlineCallbacks
 from twisted.web.http_headers import Headers
 
 from autobahn.twisted.wamp import ApplicationSession
@@ -43,6 +44,9 @@ from autobahn.wamp.types import SubscribeOptions
 
 from txaio import make_logger
 
+from crossbar.bridge.rest.batch import WebhookBatcher
+from crossbar.bridge.rest.pool import get_pool
+
 
 class MessageForwarder(ApplicationSession):
 
@@ -50,10 +54,10 @@ class MessageForwarder(ApplicationSession):
 
     def __init__(self, *args, **kwargs):
         self._webtransport = kwargs.pop("webTransport", None)
-
-        if not self._webtransport:
-            import treq
-            self._webtransport = treq
+        self._reactor = kwargs.pop("reactor", None)
+        self._batchers = []
+        self._paused = 0
+        self._pause_unavailable_logged = False
 
         super(MessageForwarder, self).__init__(*args, **kwargs)
 
@@ -65,27 +69,27 @@ class MessageForwarder(ApplicationSession):
         debug = self.config.extra.get("debug", False)
         method = self.config.extra.get("method", u"POST")
         expectedCode = self.config.extra.get("expectedcode")
+        retries = self.config.extra.get("retries", 0)
+        retryDelay = self.config.extra.get("retry_delay", 0.5)
+        statsProcedure = self.config.extra.get("stats_procedure", None)
 
-        @inlineCallbacks
-        def on_event(url, *args, **kwargs):
+        pool = get_pool(self.config.extra.get("pool", None), webtransport=self._webtransport)
 
-            headers = Headers({
-                b"Content-Type": [b"application/json"]
-            })
+        if self._reactor is None:
+            from twisted.internet import reactor
+            self._reactor = reactor
 
-            body = json.dumps(
-                {"args": args, "kwargs": kwargs},
-                sort_keys=True,
-                separators=(',', ':'),
-                ensure_ascii=False
-            )
+        @inlineCallbacks
+        def forward(url, body, content_type=b"application/json"):
 
             # http://treq.readthedocs.org/en/latest/api.html#treq.request
-            res = yield self._webtransport.request(
+            res, content = yield pool.request(
                 method,
-                url.encode('utf8'),
-                data=body.encode('utf8'),
-                headers=headers
+                url,
+                retries=retries,
+                retry_delay=retryDelay,
+                data=body,
+                headers=Headers({b"Content-Type": [content_type]})
             )
 
             if expectedCode:
@@ -94,19 +98,88 @@ class MessageForwarder(ApplicationSession):
                         "Request returned {}, not the expected {}".format(res.code, expectedCode))
 
             if debug:
-                content = yield self._webtransport.text_content(res)
                 self.log.debug(content)
 
+        def on_event(senders, *args, **kwargs):
+
+            # encode the event once, for all URLs it goes to
+            body = json.dumps(
+                {"args": args, "kwargs": kwargs},
+                sort_keys=True,
+                separators=(',', ':'),
+                ensure_ascii=False
+            ).encode('utf8')
+
+            dl = [d for d in (send(body) for send in senders) if d is not None]
+
+            if len(dl) == 1:
+                return dl[0]
+            return gatherResults(dl, consumeErrors=True)
+
+        # (topic, match) -> senders, so that each event is only received once
+        targets = OrderedDict()
         for s in subscriptions:
             # Assert that there's "topic" and "url" entries
             assert "topic" in s
             assert "url" in s
 
+            url = s["url"].encode('utf8')
+            if "batch" in s:
+                batcher = WebhookBatcher(self._reactor, forward, url,
+                                         pause=self._pause_events,
+                                         resume=self._resume_events,
+                                         **s["batch"])
+                self._batchers.append((s["topic"], batcher))
+                send = batcher.add
+            else:
+                send = partial(forward, url)
+
+            key = (s["topic"], s.get("match", u"exact"))
+            targets.setdefault(key, []).append(send)
+
+        for (topic, match), senders in targets.items():
             yield self.subscribe(
-                partial(on_event, s["url"]),
-                s["topic"],
-                options=SubscribeOptions(match=s.get("match", u"exact"))
+                partial(on_event, senders),
+                topic,
+                options=SubscribeOptions(match=match)
             )
 
             self.log.debug("MessageForwarder subscribed to {topic}",
-                           topic=s["topic"])
+                           topic=topic)
+
+        if statsProcedure:
+            yield self.register(self._get_stats, statsProcedure)
+
+    def onLeave(self, details):
+        for _, batcher in self._batchers:
+            batcher.stop()
+        self._batchers = []
+        return super(MessageForwarder, self).onLeave(details)
+
+    def _get_stats(self):
+        """
+        Get the delivery statistics of the batching subscriptions.
+        """
+        return [dict(batcher.stats(), topic=topic) for topic, batcher in self._batchers]
+
+    def _pause_events(self):
+        # stop reading from the router until all batchers have room again
+        transport = getattr(self._transport, 'transport', None)
+        if transport is None:
+            # router components (embedded in the router) get events right
+            # from the broker, which cannot be paused
+            if not self._pause_unavailable_logged:
+                self._pause_unavailable_logged = True
+                self.log.warn("Webhook subscriber cannot pause the events it receives (it is running "
+                              "embedded in the router): dropping events instead of blocking")
+            return False
+        self._paused += 1
+        if self._paused == 1:
+            transport.pauseProducing()
+
+    def _resume_events(self):
+        self._paused -= 1
+        if self._paused == 0:
+            transport = getattr(self._transport, 'transport', None)
+            if transport is not None:
+                transport.resumeProducing()
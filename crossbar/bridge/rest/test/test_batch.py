@@ -0,0 +1,178 @@
+#####################################################################################
+#
+#  Copyright (c) Crossbar.io Technologies GmbH
+#
+#  Unless a separate license agreement exists between you and Crossbar.io GmbH (e.g.
+#  you have purchased a commercial license), the license terms below apply.
+#
+#  Should you enter into a separate license agreement after having received a copy of
+#  this software, then the terms of such license agreement replace the terms below at
+#  the time at which such license agreement becomes effective.
+#
+#  In case a separate license agreement ends, and such agreement ends without being
+#  replaced by another separate license agreement, the license terms below apply
+#  from the time at which said agreement ends.
+#
+#  LICENSE TERMS
+#
+#  This program is free software: you can redistribute it and/or modify it under the
+#  terms of the GNU Affero General Public License, version 3, as published by the
+#  Free Software Foundation. This program is distributed in the hope that it will be
+#  useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#  See the GNU Affero General Public License Version 3 for more details.
+#
+#  You should have received a copy of the GNU Affero General Public license along
+#  with this program. If not, see <http://www.gnu.org/licenses/agpl-3.0.en.html>.
+#
+#####################################################################################
+
+from __future__ import absolute_import
+
+import json
+
+from twisted.internet.defer import Deferred
+from twisted.internet.task import Clock
+
+from crossbar.test import TestCase
+from crossbar.bridge.rest.batch import WebhookBatcher
+
+
+class WebhookBatcherTests(TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.sent = []
+
+    def _send(self, url, body, content_type):
+        d = Deferred()
+        self.sent.append((url, body, content_type, d))
+        return d
+
+    def _batcher(self, **kwargs):
+        return WebhookBatcher(self.clock, self._send, b"http://sink/events", **kwargs)
+
+    def test_max_events(self):
+        """
+        A batch is sent as a JSON array once it has max_events events.
+        """
+        batcher = self._batcher(max_events=3)
+        for i in range(3):
+            self.assertEqual(self.sent, [])
+            batcher.add(json.dumps({"args": [i]}).encode('utf8'))
+
+        self.assertEqual(len(self.sent), 1)
+        url, body, content_type, _ = self.sent[0]
+        self.assertEqual(url, b"http://sink/events")
+        self.assertEqual(content_type, b"application/json")
+        self.assertEqual(json.loads(body.decode('utf8')), [{"args": [0]}, {"args": [1]}, {"args": [2]}])
+
+    def test_max_delay(self):
+        """
+        A batch is sent (as NDJSON) after max_delay ms.
+        """
+        batcher = self._batcher(max_delay=50, format=u'ndjson')
+        batcher.add(b'{"args":[1]}')
+        self.clock.advance(0.03)
+        batcher.add(b'{"args":[2]}')
+        self.assertEqual(self.sent, [])
+
+        self.clock.advance(0.02)
+        self.assertEqual(len(self.sent), 1)
+        _, body, content_type, d = self.sent[0]
+        self.assertEqual(content_type, b"application/x-ndjson")
+        self.assertEqual(body, b'{"args":[1]}\n{"args":[2]}\n')
+
+        self.clock.advance(0.01)
+        d.callback(None)
+        stats = batcher.stats()
+        self.assertEqual(stats[u'delivered'], 2)
+        self.assertEqual(stats[u'batches'], 1)
+        self.assertAlmostEqual(stats[u'latency_max'], 60.)
+        self.assertAlmostEqual(stats[u'latency_avg'], 45.)
+
+    def test_one_batch_in_flight(self):
+        """
+        Events arriving while a batch is in flight are sent in the next batch.
+        """
+        batcher = self._batcher(max_events=2, max_delay=50)
+        for i in range(5):
+            batcher.add(b'%d' % i)
+        self.assertEqual([body for _, body, _, _ in self.sent], [b'[0,1]'])
+
+        self.sent[0][3].callback(None)
+        self.assertEqual([body for _, body, _, _ in self.sent], [b'[0,1]', b'[2,3]'])
+
+        # the rest waits for max_delay (since it was received)
+        self.sent[1][3].callback(None)
+        self.assertEqual(len(self.sent), 2)
+        self.clock.advance(0.05)
+        self.assertEqual([body for _, body, _, _ in self.sent], [b'[0,1]', b'[2,3]', b'[4]'])
+
+    def test_failed_batch(self):
+        """
+        Events of a failed batch are counted as failed.
+        """
+        batcher = self._batcher(max_events=2)
+        batcher.add(b'1')
+        batcher.add(b'2')
+        self.sent[0][3].errback(RuntimeError("sink down"))
+        self.assertEqual(batcher.stats()[u'failed'], 2)
+        self.assertEqual(batcher.stats()[u'delivered'], 0)
+
+    def test_drop_policy(self):
+        """
+        Events beyond max_buffered are dropped with the drop policy.
+        """
+        batcher = self._batcher(max_events=2, max_buffered=3)
+        for i in range(8):
+            batcher.add(b'%d' % i)
+
+        # 2 in flight, 3 buffered, 3 dropped
+        stats = batcher.stats()
+        self.assertEqual(stats[u'received'], 5)
+        self.assertEqual(stats[u'buffered'], 3)
+        self.assertEqual(stats[u'dropped'], 3)
+
+    def test_block_policy(self):
+        """
+        The events source is paused while the buffer is full with the block
+        policy.
+        """
+        calls = []
+        batcher = self._batcher(max_events=2, max_buffered=3, policy=u'block',
+                                pause=lambda: calls.append('pause'),
+                                resume=lambda: calls.append('resume'))
+        for i in range(6):
+            batcher.add(b'%d' % i)
+        self.assertEqual(calls, ['pause'])
+
+        # events already received are still buffered
+        batcher.add(b'6')
+        self.assertEqual(batcher.stats()[u'dropped'], 0)
+
+        # the next batch leaves the buffer full still
+        self.sent[0][3].callback(None)
+        self.assertEqual(calls, ['pause'])
+        self.assertEqual(batcher.stats()[u'buffered'], 3)
+
+        self.sent[1][3].callback(None)
+        self.assertEqual(calls, ['pause', 'resume'])
+        self.assertEqual(batcher.stats()[u'buffered'], 1)
+
+    def test_block_policy_cannot_pause(self):
+        """
+        With the block policy, events are dropped when the events source
+        cannot be paused.
+        """
+        batcher = self._batcher(max_events=2, max_buffered=3, policy=u'block',
+                                pause=lambda: False, resume=lambda: None)
+        for i in range(8):
+            batcher.add(b'%d' % i)
+
+        # 2 in flight, 3 buffered, 3 dropped
+        stats = batcher.stats()
+        self.assertEqual(stats[u'received'], 5)
+        self.assertEqual(stats[u'buffered'], 3)
+        self.assertEqual(stats[u'dropped'], 3)
@@ -0,0 +1,134 @@
+#####################################################################################
+#
+#  Copyright (c) Crossbar.io Technologies GmbH
+#
+#  Unless a separate license agreement exists between you and Crossbar.io GmbH (e.g.
+#  you have purchased a commercial license), the license terms below apply.
+#
+#  Should you enter into a separate license agreement after having received a copy of
+#  this software, then the terms of such license agreement replace the terms below at
+#  the time at which such license agreement becomes effective.
+#
+#  In case a separate license agreement ends, and such agreement ends without being
+#  replaced by another separate license agreement, the license terms below apply
+#  from the time at which said agreement ends.
+#
+#  LICENSE TERMS
+#
+#  This program is free software: you can redistribute it and/or modify it under the
+#  terms of the GNU Affero General Public License, version 3, as published by the
+#  Free Software Foundation. This program is distributed in the hope that it will be
+#  useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#  See the GNU Affero General Public License Version 3 for more details.
+#
+#  You should have received a copy of the GNU Affero General Public license along
+#  with this program. If not, see <http://www.gnu.org/licenses/agpl-3.0.en.html>.
+#
+#####################################################################################
+
+from __future__ import absolute_import
+
+from twisted.internet.defer import Deferred, fail, succeed
+from twisted.internet.task import Clock
+
+from autobahn.wamp.exception import ApplicationError
+
+from crossbar.test import TestCase
+from crossbar.bridge.rest.cache import CallCache
+
+
+class CallCacheTests(TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.cache = CallCache({u'com.example.status': {u'ttl': 5, u'max_entries': 2}}, reactor=self.clock)
+        self.calls = []
+
+    def call(self, result=b'ok'):
+        def call():
+            self.calls.append(result)
+            return succeed(result)
+        return call
+
+    def test_hit(self):
+        """
+        Identical calls within the TTL are answered from the cache.
+        """
+        results = []
+        for _ in range(3):
+            self.cache.call(u'com.example.status', [1], {}, None, self.call()).addCallback(results.append)
+
+        self.assertEqual(results, [b'ok'] * 3)
+        self.assertEqual(len(self.calls), 1)
+        stats = self.cache.stats()[u'com.example.status']
+        self.assertEqual((stats[u'hits'], stats[u'misses']), (2, 1))
+
+    def test_expired(self):
+        self.cache.call(u'com.example.status', [], {}, None, self.call())
+        self.clock.advance(5)
+        self.cache.call(u'com.example.status', [], {}, None, self.call())
+        self.assertEqual(len(self.calls), 2)
+
+    def test_key(self):
+        """
+        Calls with different arguments or identity are cached separately.
+        """
+        self.cache.call(u'com.example.status', [], {u'a': 1, u'b': 2}, u'alice', self.call())
+        self.cache.call(u'com.example.status', [], {u'b': 2, u'a': 1}, u'alice', self.call())
+        self.cache.call(u'com.example.status', [], {u'a': 1, u'b': 2}, u'bob', self.call())
+        self.cache.call(u'com.example.status', [1], {}, u'bob', self.call())
+        self.assertEqual(len(self.calls), 3)
+
+    def test_eviction(self):
+        for i in [1, 2, 1, 3, 1, 2]:
+            self.cache.call(u'com.example.status', [i], {}, None, self.call())
+
+        # 2 was the least recently used when 3 was added
+        self.assertEqual(len(self.calls), 4)
+        self.assertEqual(self.cache.stats()[u'com.example.status'][u'evictions'], 2)
+
+    def test_single_flight(self):
+        """
+        Identical calls while a call is in flight wait for its result.
+        """
+        pending = Deferred()
+        calls = []
+
+        def call():
+            calls.append(1)
+            return pending
+
+        results = []
+        for _ in range(3):
+            self.cache.call(u'com.example.status', [], {}, None, call).addCallback(results.append)
+        self.assertEqual(results, [])
+
+        pending.callback(b'ok')
+        self.assertEqual(results, [b'ok'] * 3)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.cache.stats()[u'com.example.status'][u'coalesced'], 2)
+
+    def test_error_not_cached(self):
+        """
+        Errors are passed to all waiting callers, but not cached.
+        """
+        pending = Deferred()
+        errors = []
+        for _ in range(2):
+            self.cache.call(u'com.example.status', [], {}, None, lambda: pending).addErrback(errors.append)
+        pending.errback(ApplicationError(u'com.example.error'))
+
+        self.assertEqual(len(errors), 2)
+        self.cache.call(u'com.example.status', [], {}, None, lambda: fail(ApplicationError(u'com.example.error'))).addErrback(errors.append)
+        self.assertEqual(len(errors), 3)
+
+    def test_not_cached(self):
+        """
+        Procedures which are not configured are not cached.
+        """
+        self.cache.call(u'com.example.other', [], {}, None, self.call())
+        self.cache.call(u'com.example.other', [], {}, None, self.call())
+        self.assertEqual(len(self.calls), 2)
+        self.assertNotIn(u'com.example.other', self.cache.stats())
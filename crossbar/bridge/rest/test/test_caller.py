@@ -30,6 +30,7 @@
 
 from __future__ import absolute_import
 
+import base64
 import math
 import json
 
@@ -169,6 +170,112 @@ class CallerTestCase(TestCase):
         self.assertEqual(len(logs), 1)
         self.assertEqual(logs[0]["code"], 200)
 
+    @inlineCallbacks
+    def test_no_bulk(self):
+        """
+        The caller does not take bulk requests: a JSON array or NDJSON body is
+        denied.
+        """
+        session = ApplicationSession(types.ComponentConfig(u'realm1'))
+        self.session_factory.add(session, authrole=u"test_role")
+        resource = CallerResource({}, session)
+
+        for content_type, body, category in [
+                (b"application/json", b'[{"procedure": "com.myapp.sqrt", "args": [2]}]', "AR454"),
+                (b"application/x-ndjson", b'{"procedure": "com.myapp.sqrt", "args": [2]}\n', "AR452")]:
+            with LogCapturer() as l:
+                request = yield renderResource(
+                    resource, b"/",
+                    method=b"POST",
+                    headers={b"Content-Type": [content_type]},
+                    body=body)
+
+            self.assertEqual(request.code, 400)
+            self.assertEqual(len(l.get_category(category)), 1)
+
+    @inlineCallbacks
+    def test_cached(self):
+        """
+        Results of cached procedures are reused for identical calls.
+        """
+        session = TestSession(types.ComponentConfig(u'realm1'))
+        self.session_factory.add(session, authrole=u"test_role")
+
+        session2 = ApplicationSession(types.ComponentConfig(u'realm1'))
+        self.session_factory.add(session2, authrole=u"test_role")
+        resource = CallerResource({u'cache': {u'procedures': {u'com.myapp.sqrt': {u'ttl': 10}}}}, session2)
+
+        calls = []
+        call = session2.call
+
+        def counting_call(*args, **kwargs):
+            calls.append(args)
+            return call(*args, **kwargs)
+        session2.call = counting_call
+
+        for body in [b'{"procedure": "com.myapp.sqrt", "args": [2]}',
+                     b'{"procedure": "com.myapp.sqrt", "args": [2]}',
+                     b'{"procedure": "com.myapp.sqrt", "args": [4]}']:
+            request = yield renderResource(
+                resource, b"/",
+                method=b"POST",
+                headers={b"Content-Type": [b"application/json"]},
+                body=body)
+            self.assertEqual(request.code, 200)
+
+        self.assertEqual(json.loads(native_string(request.get_written_data())), {"args": [2.0]})
+        self.assertEqual(len(calls), 2)
+
+        stats = resource.get_cache_stats()[u'com.myapp.sqrt']
+        self.assertEqual((stats[u'hits'], stats[u'misses']), (1, 2))
+
+    @inlineCallbacks
+    def test_cached_per_authid(self):
+        """
+        Cached results are not shared between clients authenticated with
+        different authids, nor with anonymous clients.
+        """
+        session = TestSession(types.ComponentConfig(u'realm1'))
+        self.session_factory.add(session, authrole=u"test_role")
+
+        session2 = ApplicationSession(types.ComponentConfig(u'realm1'))
+        self.session_factory.add(session2, authrole=u"test_role")
+        auth_config = {
+            u'ticket': {
+                u'type': u'static',
+                u'principals': {
+                    u'alice': {u'ticket': u'secret1', u'role': u'test_role'},
+                    u'bob': {u'ticket': u'secret2', u'role': u'test_role'},
+                }
+            }
+        }
+        resource = CallerResource({u'cache': {u'procedures': {u'com.myapp.sqrt': {u'ttl': 10}}}}, session2,
+                                  auth_config=auth_config)
+
+        calls = []
+        call = session2.call
+
+        def counting_call(*args, **kwargs):
+            calls.append(args)
+            return call(*args, **kwargs)
+        session2.call = counting_call
+
+        for credentials in [b'alice:secret1', b'bob:secret2', None, b'alice:secret1', b'bob:secret2', None]:
+            headers = {b"Content-Type": [b"application/json"]}
+            if credentials:
+                headers[b"Authorization"] = [b"Basic " + base64.b64encode(credentials)]
+            request = yield renderResource(
+                resource, b"/",
+                method=b"POST",
+                headers=headers,
+                body=b'{"procedure": "com.myapp.sqrt", "args": [2]}')
+            self.assertEqual(request.code, 200)
+
+        self.assertEqual(len(calls), 3)
+
+        stats = resource.get_cache_stats()[u'com.myapp.sqrt']
+        self.assertEqual((stats[u'hits'], stats[u'misses']), (3, 3))
+
     @inlineCallbacks
     def test_failure(self):
         """
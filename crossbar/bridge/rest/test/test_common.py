@@ -30,10 +30,13 @@
 
 from __future__ import absolute_import
 
+from twisted.web.test._util import _render
+
 from crossbar.test import TestCase
 from crossbar._logging import LogCapturer
-from crossbar.bridge.rest import PublisherResource
+from crossbar.bridge.rest import CallerResource, PublisherResource
 from crossbar.bridge.rest.test import MockPublisherSession, renderResource
+from crossbar.bridge.rest.test._request import request as makeRequest
 
 publishBody = b'{"topic": "com.test.messages", "args": [1]}'
 
@@ -226,6 +229,49 @@ class RequestBodyTestCase(TestCase):
         self.assertEqual(len(errors), 1)
         self.assertEqual(errors[0]["code"], 413)
 
+    def test_too_large_body_announced(self):
+        """
+        A body announced as too large is not buffered while it arrives, and
+        the request is rejected.
+        """
+        session = MockPublisherSession(self)
+        resource = PublisherResource({"post_body_limit": 10}, session)
+
+        request = makeRequest(b"/", method=b"POST", args={},
+                              headers={b"Content-Type": [b"application/json"],
+                                       b"Content-Length": [b"100"]})
+        reader = resource.body_consumer(request, 100)
+        self.assertTrue(reader.too_large)
+
+        request.body_consumer = reader
+        reader.write(b"x" * 100)
+        self.assertEqual(reader.getvalue(), b"")
+
+        with LogCapturer("debug") as l:
+            self.successResultOf(_render(resource, request))
+
+        self.assertEqual(request.code, 413)
+        self.assertEqual(len(l.get_category("AR413")), 1)
+        self.assertEqual(len(session._published_messages), 0)
+
+    def test_too_large_body_unannounced(self):
+        """
+        A body without a length is no longer buffered once it exceeds the
+        limit.
+        """
+        session = MockPublisherSession(self)
+        resource = PublisherResource({"post_body_limit": 10}, session)
+
+        request = makeRequest(b"/", method=b"POST", args={},
+                              headers={b"Content-Type": [b"application/json"]})
+        reader = resource.body_consumer(request, None)
+        reader.write(b"x" * 8)
+        self.assertFalse(reader.too_large)
+        reader.write(b"x" * 8)
+        self.assertTrue(reader.too_large)
+        self.assertEqual(reader.getvalue(), b"")
+        self.assertEqual(reader.received, 16)
+
     def test_multiple_content_length(self):
         """
         Requests with multiple Content-Length headers will be rejected.
@@ -288,10 +334,11 @@ class RequestBodyTestCase(TestCase):
 
     def test_JSON_list_body(self):
         """
-        A body that is not a JSON dict will be rejected by the server.
+        A body that is not a JSON dict will be rejected by the server, unless
+        the resource accepts bulk requests.
         """
         session = MockPublisherSession(self)
-        resource = PublisherResource({}, session)
+        resource = CallerResource({}, session)
 
         with LogCapturer("debug") as l:
             request = self.successResultOf(renderResource(
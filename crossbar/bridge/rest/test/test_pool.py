@@ -0,0 +1,146 @@
+#####################################################################################
+#
+#  Copyright (c) Crossbar.io Technologies GmbH
+#
+#  Unless a separate license agreement exists between you and Crossbar.io GmbH (e.g.
+#  you have purchased a commercial license), the license terms below apply.
+#
+#  Should you enter into a separate license agreement after having received a copy of
+#  this software, then the terms of such license agreement replace the terms below at
+#  the time at which such license agreement becomes effective.
+#
+#  In case a separate license agreement ends, and such agreement ends without being
+#  replaced by another separate license agreement, the license terms below apply
+#  from the time at which said agreement ends.
+#
+#  LICENSE TERMS
+#
+#  This program is free software: you can redistribute it and/or modify it under the
+#  terms of the GNU Affero General Public License, version 3, as published by the
+#  Free Software Foundation. This program is distributed in the hope that it will be
+#  useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#  See the GNU Affero General Public License Version 3 for more details.
+#
+#  You should have received a copy of the GNU Affero General Public license along
+#  with this program. If not, see <http://www.gnu.org/licenses/agpl-3.0.en.html>.
+#
+#####################################################################################
+
+from __future__ import absolute_import
+
+from collections import namedtuple
+
+from twisted.internet.defer import Deferred, TimeoutError, succeed
+from twisted.internet.error import ConnectionRefusedError
+from twisted.internet.task import Clock
+
+from autobahn.wamp.exception import ApplicationError
+
+from crossbar.test import TestCase
+from crossbar.bridge.rest.pool import HTTPClientPool, get_pool
+
+_Response = namedtuple("_Response", ["code", "content"])
+
+
+class _WebTransport(object):
+    """
+    A HTTP client where the test decides when (and how) requests complete.
+    """
+
+    def __init__(self):
+        self.requests = []
+
+    def request(self, method, url, **kwargs):
+        d = Deferred()
+        self.requests.append((method, url, kwargs, d))
+        return d
+
+    def text_content(self, res):
+        return succeed(res.content)
+
+
+class HTTPClientPoolTests(TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.transport = _WebTransport()
+
+    def test_max_connections_per_host(self):
+        """
+        Requests to a host beyond max_connections_per_host wait for a
+        connection, requests to other hosts don't.
+        """
+        pool = HTTPClientPool(self.clock, self.transport, max_connections_per_host=2)
+
+        results = []
+        for i in range(3):
+            pool.request(b"POST", b"http://a.example.com/hook", data=b"x").addCallback(results.append)
+        pool.request(b"POST", b"http://b.example.com/hook")
+
+        self.assertEqual([url for _, url, _, _ in self.transport.requests],
+                         [b"http://a.example.com/hook"] * 2 + [b"http://b.example.com/hook"])
+        self.assertEqual(self.transport.requests[0][2], {"data": b"x"})
+        self.assertEqual(pool.pending, 4)
+
+        response = _Response(200, u"ok")
+        self.transport.requests[0][3].callback(response)
+        self.assertEqual(results, [(response, u"ok")])
+        self.assertEqual(len(self.transport.requests), 4)
+        self.assertEqual(pool.pending, 3)
+
+    def test_max_pending(self):
+        """
+        Requests beyond max_pending are rejected right away.
+        """
+        pool = HTTPClientPool(self.clock, self.transport, max_pending=2)
+
+        pool.request(b"GET", b"http://a.example.com/")
+        pool.request(b"GET", b"http://b.example.com/")
+        f = self.failureResultOf(pool.request(b"GET", b"http://c.example.com/"), ApplicationError)
+        self.assertEqual(f.value.error, u"crossbar.error.http_pool_overloaded")
+        self.assertEqual(pool.rejected, 1)
+        self.assertEqual(len(self.transport.requests), 2)
+
+    def test_retries(self):
+        """
+        Failing requests are retried after a (random) delay.
+        """
+        pool = HTTPClientPool(self.clock, self.transport)
+
+        d = pool.request(b"POST", b"http://a.example.com/", retries=2, retry_delay=1)
+
+        self.transport.requests[0][3].errback(ConnectionRefusedError())
+        self.assertEqual(len(self.transport.requests), 1)
+        self.clock.advance(1)
+        self.assertEqual(len(self.transport.requests), 2)
+
+        self.transport.requests[1][3].callback(_Response(503, u"busy"))
+        self.clock.advance(2)
+        self.assertEqual(len(self.transport.requests), 3)
+
+        response = _Response(503, u"still busy")
+        self.transport.requests[2][3].callback(response)
+        self.assertEqual(self.successResultOf(d), (response, u"still busy"))
+        self.assertEqual(pool.retries, 2)
+        self.assertEqual(pool.pending, 0)
+
+    def test_timeout(self):
+        """
+        Requests not done within the timeout fail.
+        """
+        pool = HTTPClientPool(self.clock, self.transport, timeout=5)
+
+        d = pool.request(b"GET", b"http://a.example.com/")
+        self.clock.advance(5)
+        self.failureResultOf(d, TimeoutError)
+        self.assertEqual(pool.pending, 0)
+
+    def test_shared(self):
+        """
+        Components using the same pool options share a pool.
+        """
+        options = {u"max_connections_per_host": 3}
+        self.assertIs(get_pool(dict(options)), get_pool(dict(options)))
+        self.assertIsNot(get_pool(options), get_pool())
@@ -33,6 +33,7 @@ from __future__ import absolute_import
 import json
 
 from twisted.internet.defer import inlineCallbacks, maybeDeferred
+from twisted.web.test._util import _render
 
 from autobahn.wamp.exception import ApplicationError
 
@@ -41,7 +42,8 @@ from crossbar._compat import native_string
 from crossbar._logging import LogCapturer
 from crossbar._log_categories import log_categories
 from crossbar.bridge.rest import PublisherResource
-from crossbar.bridge.rest.test import MockPublisherSession, renderResource
+from crossbar.bridge.rest.test import MockPublisherSession, publishedMessage, renderResource
+from crossbar.bridge.rest.test._request import request as makeRequest
 
 
 class PublisherTestCase(TestCase):
@@ -183,3 +185,202 @@ class PublisherTestCase(TestCase):
         self.assertEqual(json.loads(native_string(request.get_written_data())),
                          {"error": log_categories["AR455"].format(key="topic"),
                           "args": [], "kwargs": {}})
+
+    @inlineCallbacks
+    def test_bulk_publish(self):
+        """
+        A JSON array of events is published in one request, with one result
+        per event.
+        """
+        session = MockPublisherSession(self)
+        resource = PublisherResource({}, session)
+
+        with LogCapturer() as l:
+            request = yield renderResource(
+                resource, b"/",
+                method=b"POST",
+                headers={b"Content-Type": [b"application/json"]},
+                body=b'[{"topic": "com.test.a", "args": [1]}, {"args": [2]}, '
+                     b'{"topic": "com.test.b", "kwargs": {"x": 3}}]')
+
+        self.assertEqual(len(session._published_messages), 2)
+        self.assertEqual(session._published_messages[0]["topic"], u"com.test.a")
+        self.assertEqual(session._published_messages[1]["topic"], u"com.test.b")
+
+        self.assertEqual(request.code, 200)
+        logs = l.get_category("AR204")
+        self.assertEqual(len(logs), 1)
+        self.assertEqual(logs[0]["count"], 3)
+        self.assertEqual(logs[0]["failed"], 1)
+
+        results = json.loads(native_string(request.get_written_data()))
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0], {"id": session._published_messages[0]["id"]})
+        self.assertEqual(results[1]["error"], u"wamp.error.invalid_argument")
+        self.assertEqual(results[2], {"id": session._published_messages[1]["id"]})
+
+    @inlineCallbacks
+    def test_bulk_publish_ndjson(self):
+        """
+        Newline delimited JSON is accepted for bulk publishing, and events may
+        opt out of acknowledgements.
+        """
+        class UnacknowledgedPublisherSession(object):
+
+            def __init__(self):
+                self.published = []
+
+            def publish(self, topic, *args, **kwargs):
+                self.published.append((topic, kwargs['options']))
+                # like a real session, unacknowledged publishes return None
+                return None
+
+        session = UnacknowledgedPublisherSession()
+        resource = PublisherResource({}, session)
+
+        request = yield renderResource(
+            resource, b"/",
+            method=b"POST",
+            headers={b"Content-Type": [b"application/x-ndjson"]},
+            body=b'{"topic": "com.test.a", "options": {"acknowledge": false}}\n'
+                 b'\n'
+                 b'{"topic": "com.test.b", "options": {"acknowledge": false}}\n')
+
+        self.assertEqual(request.code, 200)
+        self.assertEqual([topic for topic, _ in session.published],
+                         [u"com.test.a", u"com.test.b"])
+        self.assertEqual(json.loads(native_string(request.get_written_data())),
+                         [{}, {}])
+
+    @inlineCallbacks
+    def test_bulk_publish_error(self):
+        """
+        A failing publish in a bulk request only fails that event.
+        """
+        class RejectingPublisherSession(object):
+
+            def publish(self, topic, *args, **kwargs):
+                return maybeDeferred(self._publish, topic, *args, **kwargs)
+
+            def _publish(self, topic, *args, **kwargs):
+                if topic == u"com.test.denied":
+                    raise ApplicationError(u'wamp.error.not_authorized', foo="bar")
+                return publishedMessage(id=1)
+
+        session = RejectingPublisherSession()
+        resource = PublisherResource({}, session)
+
+        request = yield renderResource(
+            resource, b"/",
+            method=b"POST",
+            headers={b"Content-Type": [b"application/json"]},
+            body=b'[{"topic": "com.test.denied"}, {"topic": "com.test.ok"}]')
+
+        self.assertEqual(request.code, 200)
+        self.assertEqual(json.loads(native_string(request.get_written_data())),
+                         [{"error": "wamp.error.not_authorized",
+                           "args": [], "kwargs": {"foo": "bar"}},
+                          {"id": 1}])
+
+    @inlineCallbacks
+    def test_bulk_publish_streamed(self):
+        """
+        The events of an (unsigned) NDJSON body are published while the body
+        arrives.
+        """
+        session = MockPublisherSession(self)
+        resource = PublisherResource({}, session)
+
+        request = makeRequest(b"/", method=b"POST", args={},
+                              headers={b"Content-Type": [b"application/x-ndjson"]})
+        request.body_consumer = resource.body_consumer(request, None)
+
+        request.body_consumer.write(b'{"topic": "com.test.a", "args": [1]}\n{"topic": "com.te')
+        self.assertEqual(len(session._published_messages), 1)
+
+        request.body_consumer.write(b'st.b", "args": [2]}\n{"topic": "com.test.c"}')
+        self.assertEqual([msg["topic"] for msg in session._published_messages],
+                         [u"com.test.a", u"com.test.b"])
+
+        # the last line has no newline, and is published once the body is complete
+        yield _render(resource, request)
+        self.assertEqual([msg["topic"] for msg in session._published_messages],
+                         [u"com.test.a", u"com.test.b", u"com.test.c"])
+
+        self.assertEqual(request.code, 200)
+        self.assertEqual(json.loads(native_string(request.get_written_data())),
+                         [{"id": msg["id"]} for msg in session._published_messages])
+
+    @inlineCallbacks
+    def test_bulk_publish_streamed_denied(self):
+        """
+        When a streamed NDJSON request is denied after some of its events were
+        published, the response has the results of those, followed by the
+        error.
+        """
+        session = MockPublisherSession(self)
+        resource = PublisherResource({"post_body_limit": 60}, session)
+
+        request = makeRequest(b"/", method=b"POST", args={},
+                              headers={b"Content-Type": [b"application/x-ndjson"]})
+        request.body_consumer = resource.body_consumer(request, None)
+        request.body_consumer.write(b'{"topic": "com.test.a"}\n{"topic": "com.test.b"}\n')
+        request.body_consumer.write(b'{"topic": "com.test.c"}\n')
+
+        with LogCapturer() as l:
+            yield _render(resource, request)
+
+        self.assertEqual([msg["topic"] for msg in session._published_messages],
+                         [u"com.test.a", u"com.test.b"])
+        self.assertEqual(request.code, 413)
+        results = json.loads(native_string(request.get_written_data()))
+        self.assertEqual(results[:2], [{"id": msg["id"]} for msg in session._published_messages])
+        self.assertEqual(len(results), 3)
+        self.assertIn("error", results[2])
+        self.assertEqual(len(l.get_category("AR413")), 1)
+
+    @inlineCallbacks
+    def test_bulk_publish_streamed_bad_line(self):
+        """
+        A bad line in a streamed NDJSON body denies the rest of the request,
+        and the response has the results of the events before it.
+        """
+        session = MockPublisherSession(self)
+        resource = PublisherResource({}, session)
+
+        request = makeRequest(b"/", method=b"POST", args={},
+                              headers={b"Content-Type": [b"application/x-ndjson"]})
+        request.body_consumer = resource.body_consumer(request, None)
+        request.body_consumer.write(b'{"topic": "com.test.a"}\n{"topic": \n{"topic": "com.test.c"}\n')
+
+        with LogCapturer() as l:
+            yield _render(resource, request)
+
+        self.assertEqual([msg["topic"] for msg in session._published_messages], [u"com.test.a"])
+        self.assertEqual(request.code, 400)
+        results = json.loads(native_string(request.get_written_data()))
+        self.assertEqual(results[0], {"id": session._published_messages[0]["id"]})
+        self.assertEqual(len(results), 2)
+        self.assertEqual(len(l.get_category("AR453")), 1)
+
+    @inlineCallbacks
+    def test_bulk_publish_signed_not_streamed(self):
+        """
+        The events of a signed NDJSON body are only published once the
+        signature was checked.
+        """
+        session = MockPublisherSession(self)
+        resource = PublisherResource({"key": "bazapp", "secret": "foobar"}, session)
+
+        request = makeRequest(b"/", method=b"POST", args={},
+                              headers={b"Content-Type": [b"application/x-ndjson"]})
+        request.body_consumer = resource.body_consumer(request, None)
+        request.body_consumer.write(b'{"topic": "com.test.a"}\n{"topic": "com.test.b"}\n')
+        self.assertEqual(len(session._published_messages), 0)
+
+        with LogCapturer() as l:
+            yield _render(resource, request)
+
+        self.assertEqual(len(session._published_messages), 0)
+        self.assertEqual(request.code, 400)
+        self.assertEqual(len(l.get_category("AR461")), 1)
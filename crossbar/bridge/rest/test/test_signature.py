@@ -38,6 +38,7 @@ from crossbar.test import TestCase
 from crossbar._compat import native_string
 from crossbar._logging import LogCapturer
 from crossbar.bridge.rest import PublisherResource
+from crossbar.bridge.rest.common import _ReplayCache
 from crossbar.bridge.rest.test import MockPublisherSession, renderResource, makeSignedArguments
 
 resourceOptions = {
@@ -327,3 +328,90 @@ class SignatureTestCase(TestCase):
         errors = l.get_category("AR462")
         self.assertEqual(len(errors), 1)
         self.assertEqual(errors[0]["code"], 400)
+
+    @inlineCallbacks
+    def test_replayed_request(self):
+        """
+        A signed request can only be used once.
+        """
+        session = MockPublisherSession(self)
+        resource = PublisherResource(resourceOptions, session)
+
+        params = makeSignedArguments({}, "bazapp", "foobar", publishBody)
+
+        request = yield renderResource(
+            resource, b"/", method=b"POST",
+            headers={b"Content-Type": [b"application/json"]},
+            body=publishBody, params=dict(params))
+        self.assertEqual(request.code, 200)
+
+        with LogCapturer() as l:
+            request = yield renderResource(
+                resource, b"/", method=b"POST",
+                headers={b"Content-Type": [b"application/json"]},
+                body=publishBody, params=dict(params))
+
+        self.assertEqual(request.code, 401)
+        self.assertEqual(len(session._published_messages), 1)
+        self.assertEqual(len(l.get_category("AR467")), 1)
+
+    @inlineCallbacks
+    def test_replay_protection_disabled(self):
+        """
+        Replay protection can be switched off.
+        """
+        session = MockPublisherSession(self)
+        resource = PublisherResource(dict(resourceOptions, replay_protection=False), session)
+
+        params = makeSignedArguments({}, "bazapp", "foobar", publishBody)
+
+        for i in range(2):
+            request = yield renderResource(
+                resource, b"/", method=b"POST",
+                headers={b"Content-Type": [b"application/json"]},
+                body=publishBody, params=dict(params))
+            self.assertEqual(request.code, 200)
+
+        self.assertEqual(len(session._published_messages), 2)
+
+
+class ReplayCacheTestCase(TestCase):
+    """
+    Unit tests for L{_ReplayCache}.
+    """
+
+    def setUp(self):
+        self.now = 1000.
+
+    def test_window(self):
+        """
+        Requests are remembered for (at least) the window, and then forgotten.
+        """
+        cache = _ReplayCache(60, buckets=4, clock=lambda: self.now)
+
+        self.assertTrue(cache.check((1, 42)))
+        self.assertFalse(cache.check((1, 42)))
+        self.assertTrue(cache.check((2, 42)))
+
+        self.now += 59
+        self.assertFalse(cache.check((1, 42)))
+
+        self.now += 21
+        self.assertTrue(cache.check((1, 42)))
+
+    def test_bounded(self):
+        """
+        The entries of the buckets older than the window are dropped.
+        """
+        cache = _ReplayCache(30, buckets=4, clock=lambda: self.now)
+
+        for i in range(100):
+            cache.check((i, i))
+            self.now += 1
+
+        # the last 30 seconds, plus the part of the current bucket
+        self.assertTrue(30 <= len(cache) <= 40)
+
+        self.now += 1000
+        cache.check((0, 0))
+        self.assertEqual(len(cache), 1)
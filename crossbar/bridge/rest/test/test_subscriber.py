@@ -32,6 +32,7 @@ from __future__ import absolute_import
 
 from twisted.web.http_headers import Headers
 from twisted.internet.defer import inlineCallbacks
+from twisted.internet.task import Clock
 
 from autobahn.wamp.types import ComponentConfig, PublishOptions
 
@@ -72,3 +73,76 @@ class MessageForwarderTestCase(TestCase):
             "data": b'{"args":["hi"],"kwargs":{}}',
             "headers": Headers({b"Content-Type": [b"application/json"]})
         })
+
+    @inlineCallbacks
+    def test_batched_web(self):
+        """
+        Events of a batching subscription are sent in one request.
+        """
+        extra = {
+            u"subscriptions": [
+                {
+                    u"url": u"https://foo.com/msg",
+                    u"topic": u"io.crossbar.forward1",
+                    u"batch": {u"max_events": 2}
+                }
+            ],
+            u"stats_procedure": u"io.crossbar.forward1.stats"
+        }
+        config = ComponentConfig(realm=u"realm1", extra=extra)
+
+        m = MockWebTransport(self)
+        m._addResponse(200, "whee")
+
+        c = MessageForwarder(config=config, webTransport=m)
+        MockTransport(c)
+
+        yield c.publish(u"io.crossbar.forward1", "hi",
+                        options=PublishOptions(acknowledge=True))
+        self.assertEqual(m.maderequest, None)
+
+        yield c.publish(u"io.crossbar.forward1", "there",
+                        options=PublishOptions(acknowledge=True))
+
+        self.assertEqual(m.maderequest["args"], ("POST", b"https://foo.com/msg"))
+        self.assertEqual(m.maderequest["kwargs"], {
+            "data": b'[{"args":["hi"],"kwargs":{}},{"args":["there"],"kwargs":{}}]',
+            "headers": Headers({b"Content-Type": [b"application/json"]})
+        })
+
+        stats = c._get_stats()
+        self.assertEqual(len(stats), 1)
+        self.assertEqual(stats[0]["topic"], u"io.crossbar.forward1")
+        self.assertEqual(stats[0]["received"], 2)
+
+    @inlineCallbacks
+    def test_block_embedded(self):
+        """
+        A subscriber which cannot pause the events it receives (as when
+        running embedded in the router) drops events with the block policy.
+        """
+        extra = {
+            u"subscriptions": [
+                {
+                    u"url": u"https://foo.com/msg",
+                    u"topic": u"io.crossbar.forward1",
+                    u"batch": {u"max_events": 10, u"max_buffered": 2, u"policy": u"block"}
+                }
+            ]
+        }
+        config = ComponentConfig(realm=u"realm1", extra=extra)
+
+        m = MockWebTransport(self)
+        m._addResponse(200, "whee")
+
+        c = MessageForwarder(config=config, webTransport=m, reactor=Clock())
+        MockTransport(c)
+
+        for i in range(4):
+            yield c.publish(u"io.crossbar.forward1", i,
+                            options=PublishOptions(acknowledge=True))
+
+        stats = c._get_stats()
+        self.assertEqual(stats[0]["received"], 2)
+        self.assertEqual(stats[0]["dropped"], 2)
+        self.assertEqual(c._paused, 0)
@@ -1298,9 +1298,24 @@ def check_web_path_service_static(personality, config):
         check_dict_args({
             'enable_directory_listing': (False, [bool]),
             'mime_types': (False, [Mapping]),
-            'cache_timeout': (False, list(six.integer_types) + [type(None)])
+            'cache_timeout': (False, list(six.integer_types) + [type(None)]),
+            'memory_cache': (False, [Mapping]),
         }, config['options'], "'options' in Web transport 'static' path service")
 
+        if 'memory_cache' in config['options']:
+            memory_cache = config['options']['memory_cache']
+            check_dict_args({
+                'max_size': (False, six.integer_types),
+                'max_file_size': (False, six.integer_types),
+                'compression': (False, [Sequence]),
+                'preload': (False, [bool]),
+                'watch': (False, [bool]),
+            }, memory_cache, "'memory_cache' in Web transport 'static' path service options")
+
+            for encoding in memory_cache.get('compression', []):
+                if encoding not in [u'gzip', u'br']:
+                    raise InvalidConfigException("invalid compression '{}' in 'memory_cache' of Web transport 'static' path service (must be 'gzip' or 'br')".format(encoding))
+
 
 def check_web_path_service_wsgi(personality, config):
     """
@@ -1318,8 +1333,19 @@ def check_web_path_service_wsgi(personality, config):
         'object': (True, [six.text_type]),
         'minthreads': (False, six.integer_types),
         'maxthreads': (False, six.integer_types),
+        'mode': (False, [six.text_type]),
+        'processes': (False, six.integer_types),
+        'max_requests': (False, six.integer_types),
+        'max_queue': (False, six.integer_types),
+        'timeout': (False, list(six.integer_types) + [float]),
     }, config, "Web transport 'wsgi' path service")
 
+    if config.get('mode', u'thread') not in [u'thread', u'process']:
+        raise InvalidConfigException("invalid mode '{}' of Web transport 'wsgi' path service (must be 'thread' or 'process')".format(config['mode']))
+
+    if config.get('processes', 1) < 1:
+        raise InvalidConfigException("'processes' of Web transport 'wsgi' path service must be at least 1")
+
 
 def check_web_path_service_resource(personality, config):
     """
@@ -1363,8 +1389,26 @@ def check_web_path_service_nodeinfo(personality, config):
     """
     check_dict_args({
         'type': (True, [six.text_type]),
+        'options': (False, [Mapping]),
     }, config, "Web transport 'nodeinfo' path service")
 
+    if 'options' in config:
+        check_dict_args({
+            'refresh_interval': (False, list(six.integer_types) + [float]),
+        }, config['options'], "Web transport 'nodeinfo' path service")
+
+
+def check_web_path_service_metrics(personality, config):
+    """
+    Check a "metrics" path service on Web transport.
+
+    :param config: The path service configuration.
+    :type config: dict
+    """
+    check_dict_args({
+        'type': (True, [six.text_type]),
+    }, config, "Web transport 'metrics' path service")
+
 
 def check_web_path_service_reverseproxy(personality, config):
     """
@@ -1448,8 +1492,14 @@ def check_web_path_service_longpoll(personality, config):
             'session_timeout': (False, six.integer_types),
             'queue_limit_bytes': (False, six.integer_types),
             'queue_limit_messages': (False, six.integer_types),
+            'queue_overflow_policy': (False, [six.text_type]),
+            'batch_always': (False, [bool]),
         }, config['options'], "Web transport 'longpoll' path service")
 
+        policy = config['options'].get('queue_overflow_policy', u'kill')
+        if policy not in [u'kill', u'drop']:
+            raise InvalidConfigException("invalid value '{}' for 'queue_overflow_policy' in Web transport 'longpoll' path service (must be 'kill' or 'drop')".format(policy))
+
 
 def check_web_path_service_rest_post_body_limit(limit):
     """
@@ -1503,6 +1553,7 @@ def check_web_path_service_publisher(personality, config):
             'require_ip': (False, [Sequence]),
             'post_body_limit': (False, six.integer_types),
             'timestamp_delta_limit': (False, six.integer_types),
+            'replay_protection': (False, [bool]),
         }, config['options'], "Web transport 'publisher' path service")
 
         if 'post_body_limit' in config['options']:
@@ -1579,8 +1630,23 @@ def check_web_path_service_caller(personality, config):
             'require_ip': (False, [Sequence]),
             'post_body_limit': (False, six.integer_types),
             'timestamp_delta_limit': (False, six.integer_types),
+            'replay_protection': (False, [bool]),
+            'cache': (False, [Mapping]),
         }, config['options'], "Web transport 'caller' path service")
 
+        if 'cache' in config['options']:
+            cache = config['options']['cache']
+            check_dict_args({
+                'procedures': (False, [Mapping]),
+                'stats_procedure': (False, [six.text_type]),
+            }, cache, "'cache' in Web transport 'caller' path service options")
+
+            for procedure, procedure_cache in cache.get('procedures', {}).items():
+                check_dict_args({
+                    'ttl': (False, list(six.integer_types) + [float]),
+                    'max_entries': (False, six.integer_types),
+                }, procedure_cache, "procedure '{}' in 'cache' of Web transport 'caller' path service options".format(procedure))
+
         if 'post_body_limit' in config['options']:
             check_web_path_service_rest_post_body_limit(config['options']['post_body_limit'])
 
@@ -1747,6 +1813,7 @@ def check_listening_transport_web(personality, transport, with_endpoint=True, ig
             'hsts',
             'hsts_max_age',
             'client_timeout',
+            'http2',
         ] + ignore
         for k in options.keys():
             if k not in valid_options:
@@ -1793,6 +1860,25 @@ def check_listening_transport_web(personality, transport, with_endpoint=True, ig
                     )
                 )
 
+        if 'http2' in options:
+            http2 = options['http2']
+            if not isinstance(http2, Mapping):
+                raise InvalidConfigException("'http2' attribute in 'options' in Web transport must be dictionary ({} encountered)".format(type(http2)))
+            check_dict_args({
+                'enable': (False, [bool]),
+                'max_concurrent_streams': (False, six.integer_types),
+                'initial_window_size': (False, six.integer_types),
+                'connection_window_size': (False, six.integer_types),
+                'max_frame_size': (False, six.integer_types),
+            }, http2, "'http2' in Web transport 'options'")
+
+            for window in ['initial_window_size', 'connection_window_size']:
+                if window in http2 and not (0 < http2[window] < 2**31):
+                    raise InvalidConfigException("'{}' in 'http2' in Web transport 'options' must be between 1 and 2^31 - 1".format(window))
+
+            if 'max_frame_size' in http2 and not (2**14 <= http2['max_frame_size'] < 2**24):
+                raise InvalidConfigException("'max_frame_size' in 'http2' in Web transport 'options' must be between 2^14 and 2^24 - 1")
+
 
 def check_listening_transport_mqtt(personality, transport, with_endpoint=True):
     """
@@ -1821,10 +1907,41 @@ def check_listening_transport_mqtt(personality, transport, with_endpoint=True):
         'realm': (True, [six.text_type]),
         'role': (False, [six.text_type]),
         'payload_mapping': (False, [Mapping]),
+        'max_inflight': (False, six.integer_types),
+        'max_queued_messages': (False, six.integer_types),
+        'queue_overflow_policy': (False, [six.text_type]),
+        'persistent_sessions': (False, [Mapping]),
+        'topic_cache_size': (False, six.integer_types),
+        'shared_subscription_policy': (False, [six.text_type]),
     }, options, "invalid MQTT options")
 
     check_realm_name(options['realm'])
 
+    for k in ['max_inflight', 'max_queued_messages', 'topic_cache_size']:
+        if k in options and options[k] < 0:
+            raise InvalidConfigException("invalid value {} for '{}' in MQTT options - must be non-negative".format(options[k], k))
+
+    if 'queue_overflow_policy' in options:
+        if options['queue_overflow_policy'] not in [u'drop_oldest', u'drop_newest', u'disconnect']:
+            raise InvalidConfigException("invalid value '{}' for 'queue_overflow_policy' in MQTT options".format(options['queue_overflow_policy']))
+
+    if 'shared_subscription_policy' in options:
+        if options['shared_subscription_policy'] not in [u'round_robin', u'least_queued']:
+            raise InvalidConfigException("invalid value '{}' for 'shared_subscription_policy' in MQTT options".format(options['shared_subscription_policy']))
+
+    if 'persistent_sessions' in options:
+        persistent_sessions = options['persistent_sessions']
+        check_dict_args({
+            'max_sessions': (False, six.integer_types),
+            'max_queued_messages': (False, six.integer_types),
+            'spill_dir': (False, [six.text_type]),
+            'max_spilled_messages': (False, six.integer_types),
+            'session_expiry': (False, six.integer_types + (float,)),
+        }, persistent_sessions, "invalid MQTT persistent_sessions options")
+        for k in ['max_sessions', 'max_queued_messages', 'max_spilled_messages', 'session_expiry']:
+            if k in persistent_sessions and persistent_sessions[k] < 0:
+                raise InvalidConfigException("invalid value {} for '{}' in MQTT persistent_sessions options - must be non-negative".format(persistent_sessions[k], k))
+
     if 'payload_mapping' in options:
         for k, v in options['payload_mapping'].items():
             if type(k) != six.text_type:
@@ -1848,6 +1965,20 @@ def check_listening_transport_mqtt(personality, transport, with_endpoint=True):
                 decoder = v.get(u'decoder', None)
                 if type(decoder) != six.text_type:
                     raise InvalidConfigException('invalid decoder "{}" in MQTT payload mapping'.format(decoder))
+                if u'batch' in v:
+                    batch = v[u'batch']
+                    if not isinstance(batch, Mapping):
+                        raise InvalidConfigException('invalid batch {} in MQTT payload mapping'.format(type(batch)))
+                    check_dict_args({
+                        'encoder': (False, [six.text_type]),
+                        'decoder': (False, [six.text_type]),
+                        'max_size': (False, six.integer_types),
+                        'max_delay': (False, six.integer_types),
+                    }, batch, "invalid batch in MQTT payload mapping")
+                    if batch.get(u'max_size', 1) < 1:
+                        raise InvalidConfigException('invalid max_size {} in MQTT payload mapping batch - must be positive'.format(batch[u'max_size']))
+                    if batch.get(u'max_delay', 0) < 0:
+                        raise InvalidConfigException('invalid max_delay {} in MQTT payload mapping batch - must be non-negative'.format(batch[u'max_delay']))
             else:
                 raise Exception('logic error')
 
@@ -2463,7 +2594,7 @@ def check_router_realm(personality, realm, ignore=[]):
             "Realm 'options' must be a dict"
         )
     for arg, val in options.items():
-        if arg not in ['event_dispatching_chunk_size', 'uri_check', 'enable_meta_api', 'bridge_meta_api'] + ignore:
+        if arg not in ['event_dispatching_chunk_size', 'uri_check', 'enable_meta_api', 'bridge_meta_api', 'disabled_meta_events', 'max_retained_topics', 'traffic_accounting'] + ignore:
             raise InvalidConfigException(
                 "Unknown realm option '{}'".format(arg)
             )
@@ -2477,6 +2608,31 @@ def check_router_realm(personality, realm, ignore=[]):
                 "Realm option 'event_dispatching_chunk_size' must be a positive int"
             )
 
+    if 'max_retained_topics' in options:
+        if type(options['max_retained_topics']) not in six.integer_types or options['max_retained_topics'] < 0:
+            raise InvalidConfigException(
+                "Realm option 'max_retained_topics' must be a non-negative int"
+            )
+
+    if 'traffic_accounting' in options:
+        traffic_accounting = options['traffic_accounting']
+        if not isinstance(traffic_accounting, Mapping):
+            raise InvalidConfigException(
+                "Realm option 'traffic_accounting' must be a dict ({} encountered)".format(type(traffic_accounting))
+            )
+        check_dict_args({
+            'top': (False, six.integer_types),
+            'publish_interval': (False, six.integer_types + (float,)),
+        }, traffic_accounting, "Realm option 'traffic_accounting'")
+        if traffic_accounting.get('top', 100) <= 0:
+            raise InvalidConfigException(
+                "'top' in realm option 'traffic_accounting' must be a positive int"
+            )
+        if traffic_accounting.get('publish_interval', 10) < 0:
+            raise InvalidConfigException(
+                "'publish_interval' in realm option 'traffic_accounting' must be non-negative"
+            )
+
     if 'enable_meta_api' in options:
         if type(options['enable_meta_api']) != bool:
             raise InvalidConfigException("Invalid type {} for enable_meta_api in realm options".format(type(options['enable_meta_api'])))
@@ -2485,6 +2641,14 @@ def check_router_realm(personality, realm, ignore=[]):
         if type(options['bridge_meta_api']) != bool:
             raise InvalidConfigException("Invalid type {} for bridge_meta_api in realm options".format(type(options['bridge_meta_api'])))
 
+    if 'disabled_meta_events' in options:
+        disabled_meta_events = options['disabled_meta_events']
+        if type(disabled_meta_events) != list:
+            raise InvalidConfigException("Invalid type {} for disabled_meta_events in realm options".format(type(disabled_meta_events)))
+        for topic in disabled_meta_events:
+            if not isinstance(topic, six.text_type):
+                raise InvalidConfigException("Invalid type {} for topic in disabled_meta_events in realm options".format(type(topic)))
+
 
 def check_router_realm_role(personality, role):
     """
@@ -2810,7 +2974,7 @@ def check_native_worker_options(personality, options, ignore=[]):
 
     for k in options:
         if k not in ['title', 'python', 'pythonpath', 'cpu_affinity',
-                     'env', 'expose_controller', 'expose_shared'] + ignore:
+                     'env', 'expose_controller', 'expose_shared', 'sampling_profiler'] + ignore:
             raise InvalidConfigException(
                 "encountered unknown attribute '{}' in 'options' in worker"
                 " configuration".format(k)
@@ -2845,6 +3009,22 @@ def check_native_worker_options(personality, options, ignore=[]):
     if 'env' in options:
         check_process_env(options['env'])
 
+    if 'sampling_profiler' in options:
+        sampling_profiler = options['sampling_profiler']
+        if not isinstance(sampling_profiler, Mapping):
+            raise InvalidConfigException("'sampling_profiler' in 'options' in worker configuration must be a dict ({} encountered)".format(type(sampling_profiler)))
+        check_dict_args({
+            'period': (False, six.integer_types + (float,)),
+            'window': (False, six.integer_types + (float,)),
+            'resolution': (False, six.integer_types + (float,)),
+            'clock': (False, [six.text_type]),
+        }, sampling_profiler, "'sampling_profiler' in 'options' in worker configuration")
+        for k in ['period', 'window', 'resolution']:
+            if k in sampling_profiler and sampling_profiler[k] <= 0:
+                raise InvalidConfigException("'{}' in 'sampling_profiler' in 'options' in worker configuration must be positive".format(k))
+        if sampling_profiler.get('clock', u'cpu') not in [u'cpu', u'wall']:
+            raise InvalidConfigException("'clock' in 'sampling_profiler' in 'options' in worker configuration must be \"cpu\" or \"wall\"")
+
     # this feature requires crossbarfx
     if 'expose_controller' in options:
         expose_controller = options['expose_controller']
@@ -87,6 +87,7 @@ if HAS_FS_WATCHER:
 
                 self._handler.on_any_event = on_any_event
                 self._observer.start()
+                self._started = True
 
         def stop(self):
             """
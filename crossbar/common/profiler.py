@@ -31,7 +31,10 @@
 from __future__ import absolute_import
 
 import os
+import signal
 import tempfile
+import time
+from collections import deque
 
 import six
 
@@ -48,9 +51,12 @@ try:
 except ImportError:
     _HAS_VMPROF = False
 
+# the sampling profiler is driven by interval timers and signals
+_HAS_ITIMER = hasattr(signal, 'setitimer')
+
 PROFILERS = {}
 
-__all__ = ('PROFILERS')
+__all__ = ('PROFILERS', 'SamplingProfiler', 'collapse', 'diff_collapsed')
 
 
 class Profiler(object):
@@ -87,6 +93,10 @@ class Profiler(object):
         # by VMprof will be stored
         self._profile_dir = tempfile.gettempdir()
 
+    @property
+    def is_running(self):
+        return self._state == Profiler.STATE_RUNNING
+
     def marshal(self):
         return {
             u'id': self._id,
@@ -226,3 +236,274 @@ if _HAS_VMPROF:
             return self._profile_id, self._finished
 
     PROFILERS['vmprof'] = VMprof('vmprof', config={'period': 0.01})
+
+
+# pseudo frames (at the root of the stacks sampled)
+_TRUNCATED = u'[truncated]'
+_OTHER = u'[other]'
+
+
+def _frame_name(code):
+    """
+    Name of a stack frame in collapsed stacks (which separate frames with ";").
+    """
+    if isinstance(code, six.text_type):
+        return code
+    return u'{} ({}:{})'.format(code.co_name, code.co_filename, code.co_firstlineno).replace(u';', u':')
+
+
+class _Bucket(object):
+    """
+    Stacks sampled during one part of the window of a sampling profiler.
+    """
+
+    __slots__ = ('started', 'ended', 'samples', 'stacks')
+
+    def __init__(self, started):
+        self.started = started
+        self.ended = started
+        self.samples = 0
+
+        # map: stack (tuple of code objects, leaf first) -> samples
+        self.stacks = {}
+
+
+class SamplingProfiler(object):
+    """
+    Continuous statistical profiler.
+
+    The stack of the main thread (which runs the reactor) is sampled from a
+    signal handler driven by an interval timer, and the samples are aggregated
+    by stack. The profiler keeps a rolling window of the aggregated stacks
+    made of a fixed number of buckets, each holding at most ``max_stacks``
+    stacks, so memory use is bounded however long the profiler runs.
+    """
+
+    log = make_logger()
+
+    # map: clock -> (interval timer, signal). the "cpu" clock only samples
+    # while the process is running, the "wall" clock also while it is waiting
+    CLOCKS = {
+        u'cpu': ('ITIMER_PROF', 'SIGPROF'),
+        u'wall': ('ITIMER_REAL', 'SIGALRM'),
+    }
+
+    def __init__(self):
+        self._period = None
+        self._clock = None
+        self._resolution = None
+        self._max_stacks = None
+        self._max_depth = None
+
+        # rolling window of buckets (the last is the current bucket)
+        self._buckets = None
+
+        # the signal handler installed before the profiler was started
+        self._previous_handler = None
+
+        # seconds spent in the signal handler
+        self._overhead = 0.
+
+        # None or UTC timestamp when profiler was started
+        self._started = None
+
+    @property
+    def is_running(self):
+        return self._buckets is not None
+
+    def start(self, period=0.01, window=300, resolution=10, clock=u'cpu', max_stacks=1000, max_depth=64):
+        """
+        Start sampling.
+
+        :param period: The sampling period in seconds.
+        :type period: float
+        :param window: Keep the stacks sampled during (at least) this many seconds.
+        :type window: float
+        :param resolution: Windows can be selected in steps of this many seconds.
+        :type resolution: float
+        :param clock: Sample in CPU time (``"cpu"``) or wall time (``"wall"``).
+        :type clock: str
+        :param max_stacks: Keep at most this many distinct stacks per step (further stacks
+            are counted as ``[other]``).
+        :type max_stacks: int
+        :param max_depth: Keep at most this many frames per stack (further frames
+            are cut off at the root and counted as ``[truncated]``).
+        :type max_depth: int
+        """
+        if not _HAS_ITIMER:
+            raise Exception("sampling profiler not available on this platform")
+
+        if self.is_running:
+            raise Exception("sampling profiler already running")
+
+        if clock not in self.CLOCKS:
+            raise Exception("invalid clock '{}' (must be one of {})".format(clock, sorted(self.CLOCKS)))
+
+        if period <= 0 or window <= 0 or resolution <= 0 or max_stacks <= 0 or max_depth <= 0:
+            raise Exception("period, window, resolution, max_stacks and max_depth must be positive")
+
+        self._period = period
+        self._clock = clock
+        self._resolution = resolution
+        self._max_stacks = max_stacks
+        self._max_depth = max_depth
+        self._overhead = 0.
+        self._started = utcnow()
+
+        # one more bucket than the window holds, as the current bucket is not complete
+        self._buckets = deque([_Bucket(time.time())], maxlen=int(-(-window // resolution)) + 1)
+
+        timer, signum = self.CLOCKS[clock]
+        self._previous_handler = signal.signal(getattr(signal, signum), self._sample)
+        signal.setitimer(getattr(signal, timer), period, period)
+
+        self.log.info("Sampling profiler started (period={period}s, window={window}s, clock={clock})",
+                      period=period, window=window, clock=clock)
+
+    def stop(self):
+        """
+        Stop sampling (and discard the stacks sampled).
+        """
+        if not self.is_running:
+            raise Exception("sampling profiler not running")
+
+        timer, signum = self.CLOCKS[self._clock]
+        signal.setitimer(getattr(signal, timer), 0)
+        signal.signal(getattr(signal, signum), self._previous_handler or signal.SIG_DFL)
+
+        self._buckets = None
+        self._previous_handler = None
+        self._started = None
+
+        self.log.info("Sampling profiler stopped")
+
+    def _sample(self, signum, frame):
+        now = time.time()
+
+        bucket = self._buckets[-1]
+        if now - bucket.started >= self._resolution:
+            bucket = _Bucket(now)
+            self._buckets.append(bucket)
+
+        stack = []
+        depth = self._max_depth
+        while frame is not None and depth:
+            stack.append(frame.f_code)
+            frame = frame.f_back
+            depth -= 1
+        if frame is not None:
+            stack.append(_TRUNCATED)
+        stack = tuple(stack)
+
+        stacks = bucket.stacks
+        if stack in stacks:
+            stacks[stack] += 1
+        elif len(stacks) < self._max_stacks:
+            stacks[stack] = 1
+        else:
+            stacks[(_OTHER,)] = stacks.get((_OTHER,), 0) + 1
+        bucket.samples += 1
+        bucket.ended = now
+
+        self._overhead += time.time() - now
+
+    def snapshot(self, seconds=None, offset=0):
+        """
+        Aggregate the stacks sampled during a window.
+
+        The window is rounded to whole steps (of ``resolution`` seconds) of the
+        rolling window of the profiler: a step belongs to the window if it
+        started within the window.
+
+        :param seconds: The length of the window in seconds (``None`` for the whole
+            rolling window).
+        :type seconds: float or None
+        :param offset: The window ends this many seconds ago.
+        :type offset: float
+
+        :returns: The window with the stacks sampled in collapsed form (frames,
+            root first, separated by ``;``), mapped to the number of samples.
+        :rtype: dict
+        """
+        if not self.is_running:
+            raise Exception("sampling profiler not running")
+
+        ended = time.time() - offset
+        started = ended - seconds if seconds is not None else None
+
+        res = {
+            u'started': None,
+            u'ended': None,
+            u'samples': 0,
+            u'stacks': {},
+        }
+        stacks = res[u'stacks']
+        for bucket in list(self._buckets):
+            # buckets belong to the window they started in, so windows
+            # which do not overlap never share samples
+            if not bucket.samples or bucket.started > ended or (started is not None and bucket.started <= started):
+                continue
+            if res[u'started'] is None:
+                res[u'started'] = bucket.started
+            res[u'ended'] = bucket.ended
+            res[u'samples'] += bucket.samples
+            for stack, count in list(bucket.stacks.items()):
+                collapsed = u';'.join(_frame_name(code) for code in reversed(stack))
+                stacks[collapsed] = stacks.get(collapsed, 0) + count
+        return res
+
+    def marshal(self):
+        samples = sum(bucket.samples for bucket in self._buckets) if self.is_running else 0
+        return {
+            u'running': self.is_running,
+            u'started': self._started,
+            u'period': self._period,
+            u'clock': self._clock,
+            u'resolution': self._resolution,
+            u'window': (self._buckets.maxlen - 1) * self._resolution if self.is_running else None,
+            u'samples': samples,
+            u'overhead': self._overhead,
+        }
+
+
+def collapse(stacks):
+    """
+    Render stacks in the collapsed stack format (as consumed by flame graph tools):
+    one line per stack with the frames and the number of samples.
+
+    :param stacks: Collapsed stacks mapped to the number of samples.
+    :type stacks: dict
+
+    :returns: The collapsed stacks, sorted.
+    :rtype: str
+    """
+    return u''.join(u'{} {}\n'.format(stack, count) for stack, count in sorted(stacks.items()))
+
+
+def diff_collapsed(before, after, normalize=True):
+    """
+    Render the difference of stacks sampled in two windows in the format of
+    differential flame graphs: one line per stack with the frames and the
+    number of samples before and after.
+
+    :param before: Collapsed stacks mapped to the number of samples (baseline).
+    :type before: dict
+    :param after: Collapsed stacks mapped to the number of samples.
+    :type after: dict
+    :param normalize: Scale the samples before to the total number of samples after,
+        so that windows with different load can be compared.
+    :type normalize: bool
+
+    :returns: The collapsed stacks with the number of samples before and after, sorted.
+    :rtype: str
+    """
+    scale = 1.
+    if normalize:
+        total_before = sum(before.values())
+        if total_before:
+            scale = float(sum(after.values())) / total_before
+
+    lines = []
+    for stack in sorted(set(before) | set(after)):
+        lines.append(u'{} {} {}\n'.format(stack, int(round(before.get(stack, 0) * scale)), after.get(stack, 0)))
+    return u''.join(lines)
@@ -0,0 +1,259 @@
+#####################################################################################
+#
+#  Copyright (c) Crossbar.io Technologies GmbH
+#
+#  Unless a separate license agreement exists between you and Crossbar.io GmbH (e.g.
+#  you have purchased a commercial license), the license terms below apply.
+#
+#  Should you enter into a separate license agreement after having received a copy of
+#  this software, then the terms of such license agreement replace the terms below at
+#  the time at which such license agreement becomes effective.
+#
+#  In case a separate license agreement ends, and such agreement ends without being
+#  replaced by another separate license agreement, the license terms below apply
+#  from the time at which said agreement ends.
+#
+#  LICENSE TERMS
+#
+#  This program is free software: you can redistribute it and/or modify it under the
+#  terms of the GNU Affero General Public License, version 3, as published by the
+#  Free Software Foundation. This program is distributed in the hope that it will be
+#  useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#  See the GNU Affero General Public License Version 3 for more details.
+#
+#  You should have received a copy of the GNU Affero General Public license along
+#  with this program. If not, see <http://www.gnu.org/licenses/agpl-3.0.en.html>.
+#
+#####################################################################################
+
+from __future__ import absolute_import
+
+import txaio
+txaio.use_twisted()  # noqa
+
+from twisted.internet import reactor
+from twisted.internet.defer import inlineCallbacks
+from twisted.internet.task import deferLater
+from twisted.test.proto_helpers import StringTransport
+from twisted.trial.unittest import TestCase
+from twisted.web import http
+from twisted.web.resource import Resource
+
+from crossbar.common.twisted.web import Site
+
+
+class _Consumer(object):
+
+    def __init__(self, length):
+        self.length = length
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(data)
+
+
+class _StreamingResource(Resource):
+    isLeaf = True
+
+    def __init__(self):
+        Resource.__init__(self)
+        self.consumers = []
+        self.rendered = []
+
+    def body_consumer(self, request, length):
+        if request.args.get(b'buffer'):
+            return None
+        consumer = _Consumer(length)
+        self.consumers.append(consumer)
+        return consumer
+
+    def render_POST(self, request):
+        self.rendered.append((getattr(request, 'body_consumer', None), request.content.read()))
+        return b'ok'
+
+
+class StreamingRequestTests(TestCase):
+    """
+    Tests for the request body streaming of our web site.
+    """
+
+    def setUp(self):
+        self.resource = _StreamingResource()
+        root = Resource()
+        root.putChild(b'stream', self.resource)
+        root.putChild(b'other', self.resource)
+        site = Site(root, stream_request_paths=[b'/stream'])
+        self.channel = site.buildProtocol(None)
+        self.channel.makeConnection(StringTransport())
+
+    def test_body_streamed_to_consumer(self):
+        """
+        The body chunks go to the consumer of the resource while they arrive,
+        before the request is rendered.
+        """
+        self.channel.dataReceived(b'POST /stream?x=1 HTTP/1.1\r\nHost: localhost\r\n'
+                                  b'Content-Length: 10\r\n\r\nhello')
+        self.assertEqual(len(self.resource.consumers), 1)
+        consumer = self.resource.consumers[0]
+        self.assertEqual(consumer.length, 10)
+        self.assertEqual(consumer.chunks, [b'hello'])
+        self.assertEqual(self.resource.rendered, [])
+
+        self.channel.dataReceived(b'world')
+        self.assertEqual(consumer.chunks, [b'hello', b'world'])
+        self.assertEqual(self.resource.rendered, [(consumer, b'')])
+
+    def test_body_buffered_without_consumer(self):
+        """
+        Resources which return no consumer get the body buffered as usual.
+        """
+        self.channel.dataReceived(b'POST /stream?buffer=1 HTTP/1.1\r\nHost: localhost\r\n'
+                                  b'Content-Length: 5\r\n\r\nhello')
+        self.assertEqual(self.resource.rendered, [(None, b'hello')])
+
+    def test_body_buffered_on_other_paths(self):
+        """
+        Resources are only looked up early below the streaming paths.
+        """
+        self.channel.dataReceived(b'POST /other HTTP/1.1\r\nHost: localhost\r\n'
+                                  b'Content-Length: 5\r\n\r\nhello')
+        self.assertEqual(self.resource.consumers, [])
+        self.assertEqual(self.resource.rendered, [(None, b'hello')])
+
+    def test_body_buffered_on_other_sites(self):
+        """
+        Sites not set up for streaming request bodies buffer them as usual.
+        """
+        root = Resource()
+        root.putChild(b'stream', self.resource)
+        channel = Site(root).buildProtocol(None)
+        channel.makeConnection(StringTransport())
+
+        channel.dataReceived(b'POST /stream HTTP/1.1\r\nHost: localhost\r\n'
+                             b'Content-Length: 5\r\n\r\nhello')
+        self.assertEqual(self.resource.consumers, [])
+        self.assertEqual(self.resource.rendered, [(None, b'hello')])
+
+
+class _TLSStringTransport(StringTransport):
+    """
+    A transport which negotiated a protocol with ALPN.
+    """
+
+    def __init__(self, negotiatedProtocol):
+        StringTransport.__init__(self)
+        self.negotiatedProtocol = negotiatedProtocol
+
+
+class _Page(Resource):
+    isLeaf = True
+
+    def render_GET(self, request):
+        return b'hello'
+
+
+class HTTP2Tests(TestCase):
+    """
+    Tests for HTTP/2 on our web site.
+    """
+
+    if not http.H2_ENABLED:
+        skip = 'h2 is not installed'
+
+    def _connect(self, site):
+        from h2.connection import H2Connection
+        from h2.config import H2Configuration
+
+        channel = site.buildProtocol(None)
+        transport = _TLSStringTransport(b'h2')
+        channel.makeConnection(transport)
+
+        client = H2Connection(H2Configuration(client_side=True))
+        client.initiate_connection()
+        channel.dataReceived(client.data_to_send())
+        return channel, transport, client
+
+    def _receive(self, client, transport):
+        events = client.receive_data(transport.value())
+        transport.clear()
+        return events
+
+    def test_acceptable_protocols(self):
+        """
+        HTTP/2 is offered before HTTP/1.1 unless it is disabled.
+        """
+        self.assertEqual(Site(_Page()).acceptableProtocols(), [b'h2', b'http/1.1'])
+        self.assertEqual(Site(_Page(), http2={'enable': False}).acceptableProtocols(), [b'http/1.1'])
+
+    def test_protocol_switch(self):
+        """
+        Twisted switches a TLS connection which negotiated HTTP/2 to an
+        H2Connection on the first dataReceived() call, even with no data: the
+        HTTP/2 settings are applied right after that. This relies on internals
+        of Twisted, and is checked with the pinned Twisted version (18.7) by
+        the "pinned" tox environments too.
+        """
+        from twisted.web._http2 import H2Connection
+
+        protocol = Site(_Page()).buildProtocol(None)
+        protocol.makeConnection(_TLSStringTransport(b'h2'))
+
+        http._GenericHTTPChannelProtocol.dataReceived(protocol, b'')
+        self.assertEqual(protocol._negotiatedProtocol, b'h2')
+        self.assertIsInstance(protocol._channel, H2Connection)
+        self.assertTrue(hasattr(protocol._channel, 'conn'))
+        protocol.connectionLost(None)
+
+    def test_settings_applied(self):
+        """
+        The configured settings and connection window are announced to clients.
+        """
+        from h2.events import RemoteSettingsChanged, WindowUpdated
+        from h2.settings import SettingCodes
+
+        site = Site(_Page(), http2={
+            'max_concurrent_streams': 50,
+            'initial_window_size': 1048576,
+            'connection_window_size': 4194304,
+        })
+        channel, transport, client = self._connect(site)
+        events = self._receive(client, transport)
+
+        settings = {}
+        for event in events:
+            if isinstance(event, RemoteSettingsChanged):
+                for code, setting in event.changed_settings.items():
+                    settings[code] = setting.new_value
+        self.assertEqual(settings[SettingCodes.MAX_CONCURRENT_STREAMS], 50)
+        self.assertEqual(settings[SettingCodes.INITIAL_WINDOW_SIZE], 1048576)
+
+        windows = [event.delta for event in events if isinstance(event, WindowUpdated) and event.stream_id == 0]
+        self.assertEqual(windows, [4194304 - 65535])
+        channel.connectionLost(None)
+
+    @inlineCallbacks
+    def test_request(self):
+        """
+        Requests are served over HTTP/2.
+        """
+        from h2.events import DataReceived, ResponseReceived, StreamEnded
+
+        channel, transport, client = self._connect(Site(_Page()))
+        client.send_headers(1, [(':method', 'GET'), (':path', '/'),
+                                (':authority', 'localhost'), (':scheme', 'https')], end_stream=True)
+        channel.dataReceived(client.data_to_send())
+
+        # the HTTP/2 connection sends response data from scheduled calls
+        events = []
+        for _ in range(10):
+            yield deferLater(reactor, 0, lambda: None)
+            events.extend(self._receive(client, transport))
+            if any(isinstance(event, StreamEnded) for event in events):
+                break
+
+        responses = [event for event in events if isinstance(event, ResponseReceived)]
+        self.assertEqual(dict(responses[0].headers)[b':status'], b'200')
+        self.assertEqual(b''.join(event.data for event in events if isinstance(event, DataReceived)), b'hello')
+        channel.connectionLost(None)
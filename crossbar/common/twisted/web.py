@@ -30,8 +30,18 @@
 
 from txaio import make_logger
 
-from twisted.web import server
-from twisted.web.http import HTTPChannel
+from io import BytesIO
+
+from twisted.web import http, server
+from twisted.web.http import HTTPChannel, parse_qs, unquote
+
+try:
+    from h2.settings import SettingCodes
+except ImportError:
+    SettingCodes = None
+
+# the initial flow control window of HTTP/2 connections and streams
+_H2_DEFAULT_WINDOW_SIZE = 65535
 
 
 def createHSTSRequestFactory(requestFactory, hstsMaxAge=31536000):
@@ -49,6 +59,67 @@ def createHSTSRequestFactory(requestFactory, hstsMaxAge=31536000):
     return makeRequest
 
 
+class _StreamingRequest(server.Request):
+    """
+    A request that allows the resource to consume the request body while it
+    arrives, rather than having it buffered in ``request.content``.
+
+    As soon as the request headers have been received, the resource for a
+    request with a body below one of the streaming paths of the site is
+    looked up. If it has a ``body_consumer(request, length)``
+    method (where ``length`` is the announced length of the body, or ``None``),
+    the object it returns gets all chunks of the body via ``write(data)``, and
+    is available to the resource as ``request.body_consumer`` when rendering.
+    The resource may also return ``None`` to have the body buffered as usual.
+    """
+
+    log = make_logger()
+
+    body_consumer = None
+
+    def gotLength(self, length):
+        consumer = None
+
+        # the request line is not available from the request before the body
+        # was received: HTTP/1.1 channels hold it in _command and _path (in
+        # Twisted 18.7, the pinned version, to 21.2 at least), HTTP/2 streams
+        # in command and path. without those, the body is buffered as usual
+        path = getattr(self.channel, '_path', None) or getattr(self.channel, 'path', None)
+        command = getattr(self.channel, '_command', None) or getattr(self.channel, 'command', None)
+        if path is not None and length != 0 and self.channel.site._streams_request_body(path):
+            try:
+                resource = self._getResourceEarly(command, path)
+                if hasattr(resource, 'body_consumer'):
+                    consumer = resource.body_consumer(self, length)
+            except Exception:
+                self.log.failure("Failed to set up streaming of request body: {log_failure}")
+                consumer = None
+
+        if consumer is None:
+            server.Request.gotLength(self, length)
+        else:
+            # the body goes to the consumer, so request.content stays empty
+            self.body_consumer = consumer
+            self.content = BytesIO()
+
+    def handleContentChunk(self, data):
+        if self.body_consumer is not None:
+            self.body_consumer.write(data)
+        else:
+            server.Request.handleContentChunk(self, data)
+
+    def _getResourceEarly(self, command, path):
+        # set up the request like requestReceived() and process() do, so the
+        # resource can be looked up - both are done again later anyway
+        self.method, self.uri = command, path
+        parts = path.split(b'?', 1)
+        self.path = parts[0]
+        self.args = parse_qs(parts[1], 1) if len(parts) == 2 else {}
+        self.prepath = []
+        self.postpath = list(map(unquote, self.path[1:].split(b'/')))
+        return self.channel.site.getResourceFor(self)
+
+
 class _LessNoisyHTTPChannel(HTTPChannel):
     """
     Internal helper.
@@ -70,18 +141,62 @@ class _LessNoisyHTTPChannel(HTTPChannel):
         self.loseConnection()
 
 
+class _HTTPChannelProtocol(http._GenericHTTPChannelProtocol):
+    """
+    The protocol of Web transports: HTTP/1.1, or HTTP/2 when negotiated
+    with ALPN (on TLS), with the HTTP/2 settings of the site applied.
+    """
+
+    _log = make_logger()
+
+    _http2_configured = False
+
+    def dataReceived(self, data):
+        if not self._http2_configured and self._negotiatedProtocol is None:
+            self._http2_configured = True
+            if getattr(self._channel.transport, 'negotiatedProtocol', None) == b'h2':
+                # switch to HTTP/2 (which sends the initial settings) before
+                # processing any frames, and update the settings right away.
+                # this relies on internals of Twisted (checked with Twisted
+                # 18.7, the pinned version, to 21.2): the switch happens on the first dataReceived() call, even
+                # with no data, and leaves the H2Connection in _channel (see
+                # HTTP2Tests.test_protocol_switch)
+                http._GenericHTTPChannelProtocol.dataReceived(self, b'')
+                if self._negotiatedProtocol == b'h2' and hasattr(self._channel, 'conn'):
+                    self._site._configure_http2(self._channel)
+                else:
+                    self._log.warn("Could not apply the HTTP/2 settings: unexpected Twisted HTTP channel internals")
+
+        return http._GenericHTTPChannelProtocol.dataReceived(self, data)
+
+
+def _http_channel_protocol_factory(site):
+    return _HTTPChannelProtocol(HTTPChannel())
+
+
 class Site(server.Site):
 
+    protocol = _http_channel_protocol_factory
+
     def __init__(self,
                  resource,
                  client_timeout=None,
                  access_log=None,
                  display_tracebacks=None,
                  hsts=None,
-                 hsts_max_age=None):
+                 hsts_max_age=None,
+                 http2=None,
+                 stream_request_paths=None):
 
         server.Site.__init__(self, resource, timeout=client_timeout)
 
+        # let resources below the given URL paths consume request bodies while
+        # they arrive: this costs an early resource lookup per request with a
+        # body below those paths
+        self._stream_request_paths = tuple(path.rstrip(b'/') for path in stream_request_paths or ())
+        if self._stream_request_paths:
+            self.requestFactory = _StreamingRequest
+
         # Web access logging
         if not access_log:
             self.noisy = False
@@ -95,6 +210,44 @@ class Site(server.Site):
             hsts_max_age = hsts_max_age or 31536000
             self.requestFactory = createHSTSRequestFactory(self.requestFactory, hsts_max_age)
 
+        # HTTP/2 (offered via ALPN on TLS endpoints, when the h2 package is installed)
+        http2 = http2 or {}
+        self.http2 = http.H2_ENABLED and http2.get('enable', True)
+        self._http2_settings = {}
+        self._http2_window_size = http2.get('connection_window_size', None)
+        if self.http2:
+            if 'max_concurrent_streams' in http2:
+                self._http2_settings[SettingCodes.MAX_CONCURRENT_STREAMS] = http2['max_concurrent_streams']
+            if 'initial_window_size' in http2:
+                self._http2_settings[SettingCodes.INITIAL_WINDOW_SIZE] = http2['initial_window_size']
+            if 'max_frame_size' in http2:
+                self._http2_settings[SettingCodes.MAX_FRAME_SIZE] = http2['max_frame_size']
+
+    def _streams_request_body(self, path):
+        path = path.split(b'?', 1)[0]
+        for prefix in self._stream_request_paths:
+            if path == prefix or path.startswith(prefix + b'/'):
+                return True
+        return False
+
+    def acceptableProtocols(self):
+        """
+        Protocols this server can speak.
+        """
+        if self.http2:
+            return [b'h2', b'http/1.1']
+        return [b'http/1.1']
+
+    def _configure_http2(self, connection):
+        conn = connection.conn
+        if self._http2_settings:
+            conn.update_settings(self._http2_settings)
+        if self._http2_window_size and self._http2_window_size > _H2_DEFAULT_WINDOW_SIZE:
+            conn.increment_flow_control_window(self._http2_window_size - _H2_DEFAULT_WINDOW_SIZE)
+        data = conn.data_to_send()
+        if data:
+            connection.transport.write(data)
+
 
 def patchFileContentTypes(root):
     """
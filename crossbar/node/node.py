@@ -438,6 +438,13 @@ class Node(object):
                 self.log.debug("{worker}: CPU affinity set to {affinity}",
                                worker=worker_logname, affinity=new_affinity)
 
+        # the sampling profiler only covers the worker from here on, which is
+        # fine as it is meant to watch the worker while it is running
+        if 'sampling_profiler' in worker_options:
+            yield self._controller.call(u'crossbar.worker.{}.start_sampling_profiler'.format(worker_id), options=CallOptions(), **worker_options['sampling_profiler'])
+            self.log.debug("{worker}: sampling profiler started",
+                           worker=worker_logname)
+
         # this is fine to start after the worker has been started, as manhole is
         # CB developer/support feature anyways (like a vendor diagnostics port)
         if 'manhole' in worker:
@@ -196,6 +196,7 @@ class Personality(object):
         'reverseproxy': checkconfig.check_web_path_service_reverseproxy,
 
         'nodeinfo': checkconfig.check_web_path_service_nodeinfo,
+        'metrics': checkconfig.check_web_path_service_metrics,
         'json': checkconfig.check_web_path_service_json,
         'cgi': checkconfig.check_web_path_service_cgi,
 
@@ -223,6 +224,7 @@ class Personality(object):
         'reverseproxy': base.RouterWebServiceReverseWeb,
 
         'nodeinfo': misc.RouterWebServiceNodeInfo,
+        'metrics': misc.RouterWebServiceMetrics,
         'json': misc.RouterWebServiceJson,
         'cgi': misc.RouterWebServiceCgi,
 
@@ -38,20 +38,41 @@ class RouterOptions(object):
     URI_CHECK_LOOSE = "loose"
     URI_CHECK_STRICT = "strict"
 
-    def __init__(self, uri_check=None, event_dispatching_chunk_size=None):
+    # default maximum number of topics with retained events
+    MAX_RETAINED_TOPICS = 100000
+
+    def __init__(self, uri_check=None, event_dispatching_chunk_size=None, max_retained_topics=None,
+                 traffic_accounting=None):
         """
 
         :param uri_check: Method which should be applied to check WAMP URIs.
         :type uri_check: str
+
+        :param max_retained_topics: Maximum number of topics with retained
+            events (``0`` means no limit, default is
+            :attr:`RouterOptions.MAX_RETAINED_TOPICS`).
+        :type max_retained_topics: int
+
+        :param traffic_accounting: Per-URI traffic accounting configuration
+            (``None`` means no accounting).
+        :type traffic_accounting: dict or None
         """
         self.uri_check = uri_check or RouterOptions.URI_CHECK_STRICT
         self.event_dispatching_chunk_size = event_dispatching_chunk_size or 100
+        if max_retained_topics is None:
+            max_retained_topics = RouterOptions.MAX_RETAINED_TOPICS
+        self.max_retained_topics = max_retained_topics
+        self.traffic_accounting = traffic_accounting
 
     def __str__(self):
         return (
             "RouterOptions(uri_check = {0}, "
-            "event_dispatching_chunk_size = {1})".format(
+            "event_dispatching_chunk_size = {1}, "
+            "max_retained_topics = {2}, "
+            "traffic_accounting = {3})".format(
                 self.uri_check,
                 self.event_dispatching_chunk_size,
+                self.max_retained_topics,
+                self.traffic_accounting,
             )
         )
@@ -44,7 +44,9 @@ from autobahn.wamp.message import \
     _URI_PAT_STRICT_LAST_EMPTY, _URI_PAT_LOOSE_LAST_EMPTY
 
 from crossbar.router.observation import UriObservationMap
+from crossbar.router.retained import RetainedStore
 from crossbar.router import RouterOptions
+from crossbar.router.metering import now, serialized_size
 
 from txaio import make_logger
 
@@ -71,12 +73,103 @@ class RetainedEvent(object):
         self.publisher_authrole = publisher_authrole
 
 
+class SharedSubscriptionGroup(object):
+    """
+    A named group of sessions sharing a subscription: every event on the
+    subscription is dispatched to only one of the members of the group.
+    """
+
+    __slots__ = (
+        'name',
+        'policy',
+        'members',
+        '_ring',
+        '_next',
+    )
+
+    POLICIES = (u'round_robin', u'least_queued')
+
+    def __init__(self, name, policy=u'round_robin'):
+        self.name = name
+        self.policy = policy
+
+        # map of member session to a callable returning the number of events
+        # queued for the session (or None)
+        self.members = {}
+
+        # the member sessions in order of joining the group, and the position
+        # in there to start picking the next member from
+        self._ring = []
+        self._next = 0
+
+    def join(self, session, queued=None):
+        if session not in self.members:
+            self._ring.append(session)
+        self.members[session] = queued
+
+    def leave(self, session):
+        if session not in self.members:
+            return
+        del self.members[session]
+        index = self._ring.index(session)
+        del self._ring[index]
+        if index < self._next:
+            self._next -= 1
+        if self._next >= len(self._ring):
+            self._next = 0
+
+    def pick(self, receivers):
+        """
+        Pick the member to receive an event.
+
+        Members are taken in turns, starting after the member picked last, so
+        with all members being receivers, a pick is O(1) for "round_robin".
+        For "least_queued", all members are looked at (and ties are broken in
+        turns).
+
+        :param receivers: The receivers of the event on the subscription.
+        :type receivers: set
+
+        :returns: The member session picked, or ``None`` if no member of the
+            group is a receiver.
+        """
+        ring = self._ring
+        count = len(ring)
+        picked = None
+        picked_at = None
+        least = None
+        for i in range(count):
+            index = (self._next + i) % count
+            member = ring[index]
+            if member not in receivers:
+                continue
+            if self.policy != u'least_queued':
+                picked, picked_at = member, index
+                break
+            queued = self._queued(member)
+            if least is None or queued < least:
+                picked, picked_at, least = member, index, queued
+
+        if picked is not None:
+            self._next = (picked_at + 1) % count
+        return picked
+
+    def _queued(self, member):
+        queued = self.members[member]
+        return queued() if queued else 0
+
+
 class SubscriptionExtra(object):
 
-    __slots__ = ('retained_events',)
+    __slots__ = ('shared_groups', 'shared_only')
 
-    def __init__(self, retained_events=None):
-        self.retained_events = retained_events or []
+    def __init__(self):
+        # map of group name to SharedSubscriptionGroup (if any)
+        self.shared_groups = None
+
+        # subscribers receiving events only through their shared subscription
+        # groups, and not every event on the subscription
+        self.shared_only = set()
 
 
 class Broker(object):
@@ -99,6 +192,10 @@ class Broker(object):
         self._reactor = reactor
         self._options = options or RouterOptions()
 
+        # metrics of the realm
+        self._metrics = router._metrics
+        self._traffic = router._traffic
+
         # generator for WAMP request IDs
         self._request_id_gen = util.IdGenerator()
 
@@ -108,6 +205,9 @@ class Broker(object):
         # map: session -> set of subscriptions (needed for detach)
         self._session_to_subscriptions = {}
 
+        # retained events, indexed by topic URI components
+        self._retained = RetainedStore(max_topics=self._options.max_retained_topics)
+
         # check all topic URIs with strict rules
         self._option_uri_strict = self._options.uri_check == RouterOptions.URI_CHECK_STRICT
 
@@ -151,12 +251,13 @@ class Broker(object):
 
             for subscription in self._session_to_subscriptions[session]:
 
+                self._leave_shared_groups(subscription, session)
                 was_subscribed, was_last_subscriber = self._subscription_map.drop_observer(session, subscription)
                 was_deleted = False
 
-                # delete it if there are no subscribers and no retained events
+                # delete it if there are no subscribers
                 #
-                if was_subscribed and was_last_subscriber and not subscription.extra.retained_events:
+                if was_subscribed and was_last_subscriber:
                     was_deleted = True
                     self._subscription_map.delete_observation(subscription)
 
@@ -167,36 +268,134 @@ class Broker(object):
                    self._router._realm.session and \
                    not subscription.uri.startswith(u'wamp.'):
 
-                    def _publish():
-                        service_session = self._router._realm.session
-                        options = types.PublishOptions(
-                            correlation_id=None,
-                            correlation_is_anchor=True,
-                            correlation_is_last=False
+                    # the service session postpones actual sending of meta events
+                    # until we return to this client session
+                    service_session = self._router._realm.session
+                    if was_subscribed:
+                        service_session.publish(
+                            u'wamp.subscription.on_unsubscribe',
+                            session._session_id,
+                            subscription.id,
+                            options=types.PublishOptions(
+                                correlation_id=None,
+                                correlation_is_anchor=True,
+                                correlation_is_last=False
+                            ),
+                        )
+                    if was_deleted:
+                        service_session.publish(
+                            u'wamp.subscription.on_delete',
+                            session._session_id,
+                            subscription.id,
+                            options=types.PublishOptions(
+                                correlation_id=None,
+                                correlation_is_anchor=True,
+                                correlation_is_last=True
+                            ),
                         )
-                        if was_subscribed:
-                            service_session.publish(
-                                u'wamp.subscription.on_unsubscribe',
-                                session._session_id,
-                                subscription.id,
-                                options=options,
-                            )
-                        if was_deleted:
-                            options.correlation_is_last = True
-                            service_session.publish(
-                                u'wamp.subscription.on_delete',
-                                session._session_id,
-                                subscription.id,
-                                options=options,
-                            )
-                    # we postpone actual sending of meta events until we return to this client session
-                    self._reactor.callLater(0, _publish)
 
             del self._session_to_subscriptions[session]
 
         else:
             raise Exception("session with ID {} not attached".format(session._session_id))
 
+    def join_shared_group(self, session, subscription_id, group, policy=u'round_robin', queued=None, plain=False):
+        """
+        Make a session subscribed to a subscription a member of a shared
+        subscription group, so events on the subscription are load-balanced
+        over the members of the group, instead of being sent to every member.
+
+        The members of a group are a receiver set of their own: a session which
+        also subscribed to the subscription outside of the group (``plain``)
+        still receives every event on the subscription.
+
+        :param session: The subscribed session.
+        :type session: :class:`crossbar.router.session.RouterSession`
+
+        :param subscription_id: The ID of the subscription.
+        :type subscription_id: int
+
+        :param group: The name of the group.
+        :type group: str
+
+        :param policy: How to pick the member receiving an event:
+            ``u'round_robin'`` or ``u'least_queued'``. The policy of a group
+            is set by its first member.
+        :type policy: str
+
+        :param queued: A callable returning the number of events queued for
+            the session, used by the ``u'least_queued'`` policy.
+        :type queued: callable
+
+        :param plain: Whether the session also subscribed to the subscription
+            outside of any shared subscription group.
+        :type plain: bool
+
+        :returns: ``True`` if the session joined the group, ``False`` if it is
+            not subscribed to the subscription.
+        :rtype: bool
+        """
+        if policy not in SharedSubscriptionGroup.POLICIES:
+            raise ValueError(u'invalid shared subscription policy "{}"'.format(policy))
+
+        subscription = self._subscription_map.get_observation_by_id(subscription_id)
+        if subscription is None or session not in subscription.observers:
+            return False
+
+        if subscription.extra is None:
+            subscription.extra = SubscriptionExtra()
+        if subscription.extra.shared_groups is None:
+            subscription.extra.shared_groups = {}
+
+        shared_group = subscription.extra.shared_groups.get(group, None)
+        if shared_group is None:
+            shared_group = SharedSubscriptionGroup(group, policy)
+            subscription.extra.shared_groups[group] = shared_group
+
+        shared_group.join(session, queued)
+
+        if plain:
+            subscription.extra.shared_only.discard(session)
+        else:
+            subscription.extra.shared_only.add(session)
+        return True
+
+    def _leave_shared_groups(self, subscription, session):
+        if subscription.extra is None:
+            return
+        shared_groups = subscription.extra.shared_groups
+        if shared_groups:
+            for name, shared_group in list(shared_groups.items()):
+                shared_group.leave(session)
+                if not shared_group.members:
+                    del shared_groups[name]
+        subscription.extra.shared_only.discard(session)
+
+    def _pick_shared_receivers(self, extra, receivers):
+        """
+        Reduce the receivers of an event to the plain subscribers, plus one
+        member per shared subscription group.
+        """
+        picked_receivers = set(receivers)
+        picked_receivers.difference_update(extra.shared_only)
+        for shared_group in extra.shared_groups.values():
+            picked = shared_group.pick(receivers)
+            if picked is not None:
+                picked_receivers.add(picked)
+        return picked_receivers
+
+    def _log_retained_evicted(self, topic):
+        # warn once when the bound is hit first, as from then on, every new
+        # topic with retained events evicts another one
+        if self._retained.evicted == 1:
+            self.log.warn(
+                "maximum number of topics with retained events ({max_topics}) reached: evicting retained events on the least recently retained topics (first evicted: '{topic}')",
+                max_topics=self._options.max_retained_topics,
+                topic=topic,
+            )
+        else:
+            self.log.debug("evicted retained events on topic '{topic}'", topic=topic)
+
     def _filter_publish_receivers(self, receivers, publish):
         """
         Internal helper.
@@ -261,6 +460,9 @@ class Broker(object):
         """
         Implements :func:`crossbar.router.interfaces.IBroker.processPublish`
         """
+        started = now()
+        self._metrics.published += 1
+
         if self._router.is_traced:
             if not publish.correlation_id:
                 publish.correlation_id = self._router.new_correlation_id()
@@ -350,6 +552,9 @@ class Broker(object):
         #
         if not (subscriptions or publish.acknowledge or store_event or retain_event):
 
+            if self._traffic is not None:
+                self._traffic.account_publish(publish.topic, 0, 0)
+
             # the received PUBLISH message is the only one received/sent
             # for this WAMP action, so mark it as "last" (there is another code path below!)
             if self._router.is_traced:
@@ -452,32 +657,20 @@ class Broker(object):
                     # retain event on the topic
                     #
                     if retain_event:
-                        retained_event = RetainedEvent(publish, publisher, publisher_authid, publisher_authrole)
-
-                        observation = self._subscription_map.get_observation(publish.topic)
-
-                        if not observation:
-                            # No observation, lets make a new one
-                            observation = self._subscription_map.create_observation(publish.topic, extra=SubscriptionExtra())
+                        if publish.payload == b'':
+                            # an empty (transparent) payload clears the retained
+                            # events on the topic, as in MQTT
+                            self._retained.discard(publish.topic)
                         else:
-                            # this can happen if event-history is
-                            # enabled on the topic: the event-store
-                            # creates an observation before any client
-                            # could possible hit the code above
-                            if observation.extra is None:
-                                observation.extra = SubscriptionExtra()
-                            elif not isinstance(observation.extra, SubscriptionExtra):
-                                raise Exception(
-                                    "incorrect 'extra' for '{}'".format(publish.topic)
-                                )
-
-                        if observation.extra.retained_events:
-                            if not publish.eligible and not publish.exclude:
-                                observation.extra.retained_events = [retained_event]
+                            retained_event = RetainedEvent(publish, publisher, publisher_authid, publisher_authrole)
+                            retained_events = self._retained.get(publish.topic)
+                            if retained_events and (publish.eligible or publish.exclude):
+                                retained_events.append(retained_event)
                             else:
-                                observation.extra.retained_events.append(retained_event)
-                        else:
-                            observation.extra.retained_events = [retained_event]
+                                retained_events = [retained_event]
+                            evicted = self._retained.set(publish.topic, retained_events)
+                            if evicted is not None:
+                                self._log_retained_evicted(evicted)
 
                     subscription_to_receivers = {}
                     total_receivers_cnt = 0
@@ -498,6 +691,11 @@ class Broker(object):
                         receivers = subscription.observers
                         receivers = self._filter_publish_receivers(receivers, publish)
 
+                        # .. of which only one per shared subscription group
+                        #
+                        if subscription.extra is not None and subscription.extra.shared_groups:
+                            receivers = self._pick_shared_receivers(subscription.extra, receivers)
+
                         # if receivers is non-empty, dispatch event ..
                         #
                         receivers_cnt = len(receivers) - (1 if self in receivers else 0)
@@ -532,6 +730,9 @@ class Broker(object):
                     # event has been sent out to all applicable receivers
                     all_dl = []
 
+                    # size of the events sent
+                    event_size = 0
+
                     if total_receivers_cnt:
 
                         # list of receivers that should have received the event, but we could not
@@ -550,7 +751,7 @@ class Broker(object):
                             else:
                                 topic = None
 
-                            if publish.payload:
+                            if publish.payload is not None:
                                 msg = message.Event(subscription.id,
                                                     publication,
                                                     payload=publish.payload,
@@ -652,6 +853,14 @@ class Broker(object):
                                 if (me_also or recv != session) and recv != self._event_store
                             ])
 
+                            if self._traffic is not None:
+                                event_size = max(event_size, serialized_size(msg))
+
+                    self._metrics.events += total_receivers_cnt
+                    self._metrics.publish_duration.record_since(started)
+                    if self._traffic is not None:
+                        self._traffic.account_publish(publish.topic, total_receivers_cnt, event_size)
+
                     return txaio.gather(all_dl)
 
             def on_authorize_error(err):
@@ -758,87 +967,97 @@ class Broker(object):
 
                     has_follow_up_messages = True
 
-                    def _publish():
-                        service_session = self._router._realm.session
-                        options = types.PublishOptions(
-                            correlation_id=subscribe.correlation_id,
-                            correlation_is_anchor=False,
-                            correlation_is_last=False,
+                    # the service session postpones actual sending of meta events
+                    # until we return to this client session
+                    service_session = self._router._realm.session
+                    if is_first_subscriber:
+                        subscription_details = {
+                            u'id': subscription.id,
+                            u'created': subscription.created,
+                            u'uri': subscription.uri,
+                            u'match': subscription.match,
+                        }
+                        service_session.publish(
+                            u'wamp.subscription.on_create',
+                            session._session_id,
+                            subscription_details,
+                            options=types.PublishOptions(
+                                correlation_id=subscribe.correlation_id,
+                                correlation_is_anchor=False,
+                                correlation_is_last=False,
+                            ),
+                        )
+                    if not was_already_subscribed:
+                        service_session.publish(
+                            u'wamp.subscription.on_subscribe',
+                            session._session_id,
+                            subscription.id,
+                            options=types.PublishOptions(
+                                correlation_id=subscribe.correlation_id,
+                                correlation_is_anchor=False,
+                                correlation_is_last=True,
+                            ),
                         )
-                        if is_first_subscriber:
-                            subscription_details = {
-                                u'id': subscription.id,
-                                u'created': subscription.created,
-                                u'uri': subscription.uri,
-                                u'match': subscription.match,
-                            }
-                            service_session.publish(
-                                u'wamp.subscription.on_create',
-                                session._session_id,
-                                subscription_details,
-                                options=options,
-                            )
-                        if not was_already_subscribed:
-                            options.correlation_is_last = True
-                            service_session.publish(
-                                u'wamp.subscription.on_subscribe',
-                                session._session_id,
-                                subscription.id,
-                                options=options,
-                            )
-                    # we postpone actual sending of meta events until we return to this client session
-                    self._reactor.callLater(0, _publish)
 
                 else:
                     has_follow_up_messages = False
 
                 # check for retained events
                 #
-                def _get_retained_event():
+                def _get_retained_events():
+                    msgs = []
 
-                    if subscription.extra.retained_events:
-                        retained_events = list(subscription.extra.retained_events)
-                        retained_events.reverse()
-
-                        for retained_event in retained_events:
-                            authorized = False
+                    # for pattern-based subscriptions, there may be retained events on
+                    # any number of topics, and the EVENT must contain the actual topic
+                    #
+                    for topic, retained_events in self._retained.match(subscription.uri, subscription.match):
 
+                        # the newest retained event the session is authorized to get
+                        #
+                        for retained_event in reversed(retained_events):
                             if not retained_event.publish.exclude and not retained_event.publish.eligible:
-                                authorized = True
+                                break
                             elif session._session_id in retained_event.publish.eligible and session._session_id not in retained_event.publish.exclude:
-                                authorized = True
-
-                            if authorized:
-                                publication = util.id()
-
-                                if retained_event.publish.payload:
-                                    msg = message.Event(subscription.id,
-                                                        publication,
-                                                        payload=retained_event.publish.payload,
-                                                        enc_algo=retained_event.publish.enc_algo,
-                                                        enc_key=retained_event.publish.enc_key,
-                                                        enc_serializer=retained_event.publish.enc_serializer,
-                                                        publisher=retained_event.publisher,
-                                                        publisher_authid=retained_event.publisher_authid,
-                                                        publisher_authrole=retained_event.publisher_authrole,
-                                                        retained=True)
-                                else:
-                                    msg = message.Event(subscription.id,
-                                                        publication,
-                                                        args=retained_event.publish.args,
-                                                        kwargs=retained_event.publish.kwargs,
-                                                        publisher=retained_event.publisher,
-                                                        publisher_authid=retained_event.publisher_authid,
-                                                        publisher_authrole=retained_event.publisher_authrole,
-                                                        retained=True)
-
-                                msg.correlation_id = subscribe.correlation_id
-                                msg.correlation_uri = subscribe.topic
-                                msg.correlation_is_anchor = False
-                                msg.correlation_is_last = False
-
-                                return [msg]
-                    return []
+                                break
+                        else:
+                            continue
+
+                        if subscription.match == message.Subscribe.MATCH_EXACT:
+                            topic = None
+
+                        publication = util.id()
+
+                        if retained_event.publish.payload:
+                            msg = message.Event(subscription.id,
+                                                publication,
+                                                payload=retained_event.publish.payload,
+                                                enc_algo=retained_event.publish.enc_algo,
+                                                enc_key=retained_event.publish.enc_key,
+                                                enc_serializer=retained_event.publish.enc_serializer,
+                                                publisher=retained_event.publisher,
+                                                publisher_authid=retained_event.publisher_authid,
+                                                publisher_authrole=retained_event.publisher_authrole,
+                                                topic=topic,
+                                                retained=True)
+                        else:
+                            msg = message.Event(subscription.id,
+                                                publication,
+                                                args=retained_event.publish.args,
+                                                kwargs=retained_event.publish.kwargs,
+                                                publisher=retained_event.publisher,
+                                                publisher_authid=retained_event.publisher_authid,
+                                                publisher_authrole=retained_event.publisher_authrole,
+                                                topic=topic,
+                                                retained=True)
+
+                        msg.correlation_id = subscribe.correlation_id
+                        msg.correlation_uri = subscribe.topic
+                        msg.correlation_is_anchor = False
+                        msg.correlation_is_last = False
+
+                        msgs.append(msg)
+
+                    return msgs
 
                 # acknowledge subscribe with subscription ID
                 #
@@ -848,7 +1067,7 @@ class Broker(object):
                 replies[0].correlation_is_anchor = False
                 replies[0].correlation_is_last = False
                 if subscribe.get_retained:
-                    replies.extend(_get_retained_event())
+                    replies.extend(_get_retained_events())
 
                 replies[-1].correlation_is_last = not has_follow_up_messages
 
@@ -934,10 +1153,11 @@ class Broker(object):
 
         # drop session from subscription observers
         #
+        self._leave_shared_groups(subscription, session)
         was_subscribed, was_last_subscriber = self._subscription_map.drop_observer(session, subscription)
         was_deleted = False
 
-        if was_subscribed and was_last_subscriber and not subscription.extra.retained_events:
+        if was_subscribed and was_last_subscriber:
             self._subscription_map.delete_observation(subscription)
             was_deleted = True
 
@@ -956,39 +1176,34 @@ class Broker(object):
 
             has_follow_up_messages = True
 
-            def _publish():
-                service_session = self._router._realm.session
-
-                if unsubscribe and self._router.is_traced:
-                    options = types.PublishOptions(
+            # the service session postpones actual sending of meta events
+            # until we return to this client session
+            service_session = self._router._realm.session
+            traced = unsubscribe and self._router.is_traced
+
+            if was_subscribed:
+                service_session.publish(
+                    u'wamp.subscription.on_unsubscribe',
+                    session._session_id,
+                    subscription.id,
+                    options=types.PublishOptions(
                         correlation_id=unsubscribe.correlation_id,
                         correlation_is_anchor=False,
                         correlation_is_last=False
-                    )
-                else:
-                    options = None
-
-                if was_subscribed:
-                    service_session.publish(
-                        u'wamp.subscription.on_unsubscribe',
-                        session._session_id,
-                        subscription.id,
-                        options=options,
-                    )
-
-                if was_deleted:
-                    if options:
-                        options.correlation_is_last = True
-
-                    service_session.publish(
-                        u'wamp.subscription.on_delete',
-                        session._session_id,
-                        subscription.id,
-                        options=options,
-                    )
-
-            # we postpone actual sending of meta events until we return to this client session
-            self._reactor.callLater(0, _publish)
+                    ) if traced else None,
+                )
+
+            if was_deleted:
+                service_session.publish(
+                    u'wamp.subscription.on_delete',
+                    session._session_id,
+                    subscription.id,
+                    options=types.PublishOptions(
+                        correlation_id=unsubscribe.correlation_id,
+                        correlation_is_anchor=False,
+                        correlation_is_last=True
+                    ) if traced else None,
+                )
 
         else:
 
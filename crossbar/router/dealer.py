@@ -47,6 +47,7 @@ from autobahn.wamp.message import \
 
 from crossbar.router.observation import UriObservationMap
 from crossbar.router import RouterOptions
+from crossbar.router.metering import now, serialized_size
 
 from txaio import make_logger
 
@@ -58,7 +59,7 @@ class InvocationRequest(object):
     Holding information for an individual invocation.
     """
 
-    __slots__ = ('id', 'registration', 'caller', 'call', 'callee', 'canceled')
+    __slots__ = ('id', 'registration', 'caller', 'call', 'callee', 'canceled', 'started')
 
     def __init__(self, id, registration, caller, call, callee):
         self.id = id
@@ -67,6 +68,7 @@ class InvocationRequest(object):
         self.call = call
         self.callee = callee
         self.canceled = False
+        self.started = now()
 
 
 class RegistrationExtra(object):
@@ -116,6 +118,10 @@ class Dealer(object):
         self._reactor = reactor
         self._options = options or RouterOptions()
 
+        # metrics of the realm
+        self._metrics = router._metrics
+        self._traffic = router._traffic
+
         # generator for WAMP request IDs
         self._request_id_gen = util.IdGenerator()
 
@@ -239,27 +245,26 @@ class Dealer(object):
                    self._router._realm.session and \
                    not registration.uri.startswith(u'wamp.'):
 
-                    def _publish(registration):
-                        service_session = self._router._realm.session
-                        options = types.PublishOptions(
-                            correlation_id=None
+                    # the service session postpones actual sending of meta events
+                    # until we return to this client session
+                    service_session = self._router._realm.session
+                    options = types.PublishOptions(
+                        correlation_id=None
+                    )
+                    if was_registered:
+                        service_session.publish(
+                            u'wamp.registration.on_unregister',
+                            session._session_id,
+                            registration.id,
+                            options=options,
+                        )
+                    if was_last_callee:
+                        service_session.publish(
+                            u'wamp.registration.on_delete',
+                            session._session_id,
+                            registration.id,
+                            options=options,
                         )
-                        if was_registered:
-                            service_session.publish(
-                                u'wamp.registration.on_unregister',
-                                session._session_id,
-                                registration.id,
-                                options=options,
-                            )
-                        if was_last_callee:
-                            service_session.publish(
-                                u'wamp.registration.on_delete',
-                                session._session_id,
-                                registration.id,
-                                options=options,
-                            )
-                    # we postpone actual sending of meta events until we return to this client session
-                    self._reactor.callLater(0, _publish, registration)
 
             del self._session_to_registrations[session]
 
@@ -434,45 +439,41 @@ class Dealer(object):
 
                     reply.correlation_is_last = False
 
-                    def _publish():
-                        service_session = self._router._realm.session
-
-                        if self._router.is_traced:
-                            options = types.PublishOptions(
+                    # the service session postpones actual sending of meta events
+                    # until we return to this client session
+                    service_session = self._router._realm.session
+                    traced = self._router.is_traced
+
+                    if is_first_callee:
+                        registration_details = {
+                            u'id': registration.id,
+                            u'created': registration.created,
+                            u'uri': registration.uri,
+                            u'match': registration.match,
+                            u'invoke': registration.extra.invoke,
+                        }
+                        service_session.publish(
+                            u'wamp.registration.on_create',
+                            session._session_id,
+                            registration_details,
+                            options=types.PublishOptions(
                                 correlation_id=register.correlation_id,
                                 correlation_is_anchor=False,
                                 correlation_is_last=False,
-                            )
-                        else:
-                            options = None
-
-                        if is_first_callee:
-                            registration_details = {
-                                u'id': registration.id,
-                                u'created': registration.created,
-                                u'uri': registration.uri,
-                                u'match': registration.match,
-                                u'invoke': registration.extra.invoke,
-                            }
-                            service_session.publish(
-                                u'wamp.registration.on_create',
-                                session._session_id,
-                                registration_details,
-                                options=options
-                            )
-
-                        if not was_already_registered:
-                            if options:
-                                options.correlation_is_last = True
-
-                            service_session.publish(
-                                u'wamp.registration.on_register',
-                                session._session_id,
-                                registration.id,
-                                options=options
-                            )
-                    # we postpone actual sending of meta events until we return to this client session
-                    self._reactor.callLater(0, _publish)
+                            ) if traced else None
+                        )
+
+                    if not was_already_registered:
+                        service_session.publish(
+                            u'wamp.registration.on_register',
+                            session._session_id,
+                            registration.id,
+                            options=types.PublishOptions(
+                                correlation_id=register.correlation_id,
+                                correlation_is_anchor=False,
+                                correlation_is_last=True,
+                            ) if traced else None
+                        )
 
                 else:
                     reply.correlation_is_last = True
@@ -581,39 +582,34 @@ class Dealer(object):
 
             has_follow_up_messages = True
 
-            def _publish():
-                service_session = self._router._realm.session
-
-                if unregister and self._router.is_traced:
-                    options = types.PublishOptions(
+            # the service session postpones actual sending of meta events
+            # until we return to this client session
+            service_session = self._router._realm.session
+            traced = unregister and self._router.is_traced
+
+            if was_registered:
+                service_session.publish(
+                    u'wamp.registration.on_unregister',
+                    session._session_id,
+                    registration.id,
+                    options=types.PublishOptions(
                         correlation_id=unregister.correlation_id,
                         correlation_is_anchor=False,
                         correlation_is_last=False
-                    )
-                else:
-                    options = None
-
-                if was_registered:
-                    service_session.publish(
-                        u'wamp.registration.on_unregister',
-                        session._session_id,
-                        registration.id,
-                        options=options
-                    )
-
-                if was_deleted:
-                    if options:
-                        options.correlation_is_last = True
-
-                    service_session.publish(
-                        u'wamp.registration.on_delete',
-                        session._session_id,
-                        registration.id,
-                        options=options
-                    )
+                    ) if traced else None
+                )
 
-            # we postpone actual sending of meta events until we return to this client session
-            self._reactor.callLater(0, _publish)
+            if was_deleted:
+                service_session.publish(
+                    u'wamp.registration.on_delete',
+                    session._session_id,
+                    registration.id,
+                    options=types.PublishOptions(
+                        correlation_id=unregister.correlation_id,
+                        correlation_is_anchor=False,
+                        correlation_is_last=True
+                    ) if traced else None
+                )
 
         else:
             has_follow_up_messages = False
@@ -902,7 +898,10 @@ class Dealer(object):
         invocation.correlation_is_last = False
 
         self._add_invoke_request(invocation_request_id, registration, session, call, callee)
+        self._metrics.calls += 1
         self._router.send(callee, invocation)
+        if self._traffic is not None:
+            self._traffic.account_call(call.procedure, serialized_size(invocation))
         return True
 
     def _add_invoke_request(self, invocation_request_id, registration, session, call, callee):
@@ -991,6 +990,8 @@ class Dealer(object):
 
         if yield_.request in self._invocations:
 
+            self._metrics.yields += 1
+
             # get the invocation request tracked for the caller
             #
             invocation_request = self._invocations[yield_.request]
@@ -1047,6 +1048,10 @@ class Dealer(object):
 
                 # cleanup the (individual) invocation
                 self._remove_invoke_request(invocation_request)
+                self._metrics.call_duration.record_since(invocation_request.started)
+                if self._traffic is not None:
+                    self._traffic.account_call_done(invocation_request.call.procedure, serialized_size(reply),
+                                                    invocation_request.started, error=not is_valid)
 
                 # check for any calls queued on the registration for which an
                 # invocation just returned, and hence there is likely concurrency
@@ -1132,6 +1137,10 @@ class Dealer(object):
             #
             invoke = self._invocations[error.request]
             self._remove_invoke_request(invoke)
+            self._metrics.call_errors += 1
+            self._metrics.call_duration.record_since(invoke.started)
+            if self._traffic is not None:
+                self._traffic.account_call_done(invoke.call.procedure, serialized_size(reply), invoke.started, error=True)
 
         else:
             raise ProtocolError(u"Dealer.onInvocationError(): ERROR received for non-pending request_type {0} and request ID {1}".format(error.request_type, error.request))
@@ -31,9 +31,10 @@
 from __future__ import absolute_import
 
 import json
+import struct
 import six
 
-from collections import deque
+from collections import deque, OrderedDict
 
 from twisted.web.resource import Resource, NoResource
 
@@ -44,6 +45,7 @@ from twisted.web.server import NOT_DONE_YET
 
 from autobahn.util import generate_token, _LazyHexFormatter
 
+from autobahn.wamp import message
 from autobahn.wamp.websocket import parseSubprotocolIdentifier
 
 from autobahn.wamp.exception import SerializationError, \
@@ -108,7 +110,7 @@ class WampLongPollResourceSessionSend(Resource):
         else:
             request.setResponseCode(http.NO_CONTENT)
             self._parent._parent._set_standard_headers(request)
-            self._parent._isalive = True
+            self._parent._parent._touch(self._parent._transport_id)
             return b""
 
 
@@ -133,6 +135,10 @@ class WampLongPollResourceSessionReceive(Resource):
         self._request = None
         self._killed = False
 
+        # gauges/counters for the send queue of this transport
+        self.queued_bytes = 0
+        self.dropped_messages = 0
+
         # FIXME: can we read the loglevel from self.log currently set?
         if False:
             def logqueue():
@@ -147,14 +153,60 @@ class WampLongPollResourceSessionReceive(Resource):
                     self.reactor.callLater(1, logqueue)
             logqueue()
 
-    def queue(self, data):
+    @property
+    def queued_messages(self):
+        """
+        Number of messages currently waiting to be polled by the client.
+        """
+        return len(self._queue)
+
+    def queue(self, data, droppable=False):
         """
         Enqueue data to be received by client.
 
+        When the send queue has reached the configured limits, the slow-consumer
+        policy of the parent resource applies: with ``"kill"``, the session is
+        killed, while with ``"drop"``, droppable data (events) is discarded.
+
         :param data: The data to be received by the client.
         :type data: bytes
+        :param droppable: Flag indicating the data may be discarded on queue overflow.
+        :type droppable: bool
         """
+        if self._killed:
+            return
+
+        resource = self._parent._parent
+        limit_messages = resource._queueLimitMessages
+        limit_bytes = resource._queueLimitBytes
+
+        if (limit_messages and len(self._queue) >= limit_messages) or \
+           (limit_bytes and self.queued_bytes + len(data) > limit_bytes):
+            if resource._queueOverflowPolicy == u'drop':
+                if droppable:
+                    self.dropped_messages += 1
+                    self.log.debug(
+                        "WampLongPoll: send queue of transport '{tid}' full - dropping message",
+                        tid=self._parent._transport_id,
+                    )
+                    return
+            else:
+                self.log.warn(
+                    "WampLongPoll: send queue of transport '{tid}' exceeded limits ({messages} messages, {octets} bytes) - killing slow consumer",
+                    tid=self._parent._transport_id,
+                    messages=len(self._queue),
+                    octets=self.queued_bytes,
+                )
+                self._killed = True
+                self._queue.clear()
+                self.queued_bytes = 0
+
+                # do not close the session from within the (router) send path
+                self.reactor.callLater(0, self._parent._expire, u"send queue limit exceeded")
+                return
+
         self._queue.append(data)
+        self.queued_bytes += len(data)
         self._trigger()
 
     def _kill(self):
@@ -173,13 +225,31 @@ class WampLongPollResourceSessionReceive(Resource):
         if self._request and len(self._queue):
 
             if self._parent._serializer._serializer._batched:
-                # in batched mode, write all pending messages
-                while len(self._queue) > 0:
-                    msg = self._queue.popleft()
-                    self._request.write(msg)
+                # in batched mode, write all pending messages (already framed by the serializer)
+                data = b''.join(self._queue)
+                self._queue.clear()
+                self.queued_bytes = 0
+                self._request.write(data)
+
+            elif self._parent._parent._batchAlways:
+                # write all pending messages, framed as with the batched variant of the serializer
+                framed = []
+                if self._parent._serializer.SERIALIZER_ID.startswith(u'json'):
+                    for msg in self._queue:
+                        framed.append(msg)
+                        framed.append(b'\x1e')
+                else:
+                    for msg in self._queue:
+                        framed.append(struct.pack("!L", len(msg)))
+                        framed.append(msg)
+                self._queue.clear()
+                self.queued_bytes = 0
+                self._request.write(b''.join(framed))
+
             else:
                 # in unbatched mode, only write 1 pending message
                 msg = self._queue.popleft()
+                self.queued_bytes -= len(msg)
                 if type(msg) == six.binary_type:
                     self._request.write(msg)
                 else:
@@ -218,7 +288,7 @@ class WampLongPollResourceSessionReceive(Resource):
 
         request.notifyFinish().addErrback(cancel)
 
-        self._parent._isalive = True
+        self._parent._parent._touch(self._parent._transport_id)
         self._trigger()
 
         return NOT_DONE_YET
@@ -304,33 +374,11 @@ class WampLongPollResourceSession(Resource):
         self.putChild(b"receive", self._receive)
         self.putChild(b"close", self._close)
 
-        self._isalive = False
-
-        # kill inactive sessions after this timeout
+        # kill inactive sessions after a timeout: this is driven by a single sweeper
+        # in the parent resource which tracks the last activity of all sessions
         #
-        killAfter = self._parent._killAfter
-        if killAfter > 0:
-            def killIfDead():
-                if not self._isalive:
-                    self.log.debug(
-                        "WampLongPoll: killing inactive WAMP session with transport '{tid}'",
-                        tid=self._transport_id,
-                    )
-
-                    self.onClose(False, 5000, "session inactive")
-                    self._receive._kill()
-                    if self._transport_id in self._parent._transports:
-                        del self._parent._transports[self._transport_id]
-                else:
-                    self.log.debug(
-                        "WampLongPoll: transport '{tid}' is still alive",
-                        tid=self._transport_id,
-                    )
-
-                    self._isalive = False
-                    self.reactor.callLater(killAfter, killIfDead)
-
-            self.reactor.callLater(killAfter, killIfDead)
+        if self._parent._killAfter > 0:
+            self._parent._touch(self._transport_id)
         else:
             self.log.debug(
                 "WampLongPoll: transport '{tid}' automatic killing of inactive session disabled",
@@ -349,10 +397,25 @@ class WampLongPollResourceSession(Resource):
 
         res = {
             u'transport': self._transport_id,
-            u'session': self._session._session_id if self._session else None
+            u'session': self._session._session_id if self._session else None,
+            u'queued_messages': self._receive.queued_messages,
+            u'queued_bytes': self._receive.queued_bytes,
+            u'dropped_messages': self._receive.dropped_messages,
         }
         return json.dumps(res).encode()
 
+    def _expire(self, reason):
+        """
+        Forcefully end the WAMP session of this transport (e.g. when inactive or
+        when the client cannot keep up with the messages sent to it).
+
+        :param reason: The reason for expiring the session.
+        :type reason: str
+        """
+        self.onClose(False, 5000, reason)
+        self._receive._kill()
+        self._parent._discard(self._transport_id)
+
     def close(self):
         """
         Implements :func:`autobahn.wamp.interfaces.ITransport.close`
@@ -360,7 +423,7 @@ class WampLongPollResourceSession(Resource):
         if self.isOpen():
             self.onClose(True, 1000, u"session closed")
             self._receive._kill()
-            del self._parent._transports[self._transport_id]
+            self._parent._discard(self._transport_id)
         else:
             raise TransportLost()
 
@@ -371,7 +434,7 @@ class WampLongPollResourceSession(Resource):
         if self.isOpen():
             self.onClose(True, 1000, u"session aborted")
             self._receive._kill()
-            del self._parent._transports[self._transport_id]
+            self._parent._discard(self._transport_id)
         else:
             raise TransportLost()
 
@@ -432,7 +495,7 @@ class WampLongPollResourceSession(Resource):
                 self.log.debug("{tb}", tb=failure_format_traceback(f))
                 raise SerializationError("unable to serialize WAMP application payload ({0})".format(e))
             else:
-                self._receive.queue(payload)
+                self._receive.queue(payload, droppable=isinstance(msg, message.Event))
         else:
             raise TransportLost()
 
@@ -582,8 +645,13 @@ class WampLongPollResource(Resource):
                  killAfter=30,
                  queueLimitBytes=128 * 1024,
                  queueLimitMessages=100,
+                 queueOverflowPolicy=u'kill',
+                 batchAlways=False,
+                 sweepInterval=1,
+                 sweepBatch=1000,
                  debug_transport_id=None,
-                 reactor=None):
+                 reactor=None,
+                 timers=None):
         """
         Create new HTTP WAMP Web resource.
 
@@ -599,12 +667,25 @@ class WampLongPollResource(Resource):
         :type queueLimitBytes: int
         :param queueLimitMessages: Kill WAMP session after accumulation of this many message in send queue (XHR poll).
         :type queueLimitMessages: int
+        :param queueOverflowPolicy: What to do when a send queue limit is reached: ``"kill"`` the
+            session (the default), or ``"drop"`` events (other messages are still queued).
+        :type queueOverflowPolicy: str
+        :param batchAlways: Flag to write all pending messages in one poll response even for
+            unbatched serializers, using the framing of the batched variant of the serializer.
+        :type batchAlways: bool
+        :param sweepInterval: Interval in seconds at which inactive WAMP sessions are looked for.
+        :type sweepInterval: float
+        :param sweepBatch: Maximum number of inactive WAMP sessions killed in one reactor iteration.
+        :type sweepBatch: int
         :param debug: Enable debug logging.
         :type debug: bool
         :param debug_transport_id: If given, use this fixed transport ID.
         :type debug_transport_id: str
         :param reactor: The Twisted reactor to run under.
         :type reactor: obj
+        :param timers: Timer wheel to schedule the sweeping of inactive sessions on. If not
+            given, use the reactor.
+        :type timers: obj
         """
         Resource.__init__(self)
 
@@ -615,12 +696,17 @@ class WampLongPollResource(Resource):
         if reactor is None:
             from twisted.internet import reactor
         self.reactor = reactor
+        self._timers = timers if timers is not None else reactor
 
         self._debug_transport_id = debug_transport_id
         self._timeout = timeout
         self._killAfter = killAfter
         self._queueLimitBytes = queueLimitBytes
         self._queueLimitMessages = queueLimitMessages
+        self._queueOverflowPolicy = queueOverflowPolicy
+        self._batchAlways = batchAlways
+        self._sweepInterval = sweepInterval
+        self._sweepBatch = sweepBatch
 
         if serializers is None:
             serializers = []
@@ -666,6 +752,11 @@ class WampLongPollResource(Resource):
 
         self._transports = {}
 
+        # map of transport ID to time of last activity, ordered by the latter,
+        # and the (single) delayed call to sweep inactive sessions
+        self._activity = OrderedDict()
+        self._sweeper = None
+
         # <Base URL>/open
         #
         self.putChild(b"open", WampLongPollResourceOpen(self))
@@ -701,6 +792,62 @@ class WampLongPollResource(Resource):
         else:
             return NoResource("invalid WAMP transport operation '{0}'".format(request.postpath))
 
+    def _touch(self, transport_id):
+        """
+        Record activity on a transport, keeping its WAMP session from being killed.
+
+        :param transport_id: The ID of the transport with activity.
+        :type transport_id: str
+        """
+        if self._killAfter > 0:
+            self._activity[transport_id] = self.reactor.seconds()
+            self._activity.move_to_end(transport_id)
+            if self._sweeper is None:
+                self._sweeper = self._timers.callLater(self._sweepInterval, self._sweep)
+
+    def _discard(self, transport_id):
+        """
+        Forget about a transport that has been closed.
+
+        :param transport_id: The ID of the transport closed.
+        :type transport_id: str
+        """
+        self._transports.pop(transport_id, None)
+        self._activity.pop(transport_id, None)
+
+    def _sweep(self):
+        """
+        Kill WAMP sessions which were inactive for longer than ``killAfter``.
+
+        Since sessions are ordered by last activity, only the inactive ones
+        are visited. At most ``sweepBatch`` sessions are killed in one go, the
+        remaining ones on the next reactor iteration.
+        """
+        self._sweeper = None
+
+        deadline = self.reactor.seconds() - self._killAfter
+        killed = 0
+        while self._activity and killed < self._sweepBatch:
+            transport_id, last_activity = next(iter(self._activity.items()))
+            if last_activity > deadline:
+                break
+            del self._activity[transport_id]
+            transport = self._transports.get(transport_id, None)
+            if transport:
+                self.log.debug(
+                    "WampLongPoll: killing inactive WAMP session with transport '{tid}'",
+                    tid=transport_id,
+                )
+                transport._expire(u"session inactive")
+                killed += 1
+
+        if self._activity:
+            if killed >= self._sweepBatch:
+                delay = 0
+            else:
+                delay = self._sweepInterval
+            self._sweeper = self._timers.callLater(delay, self._sweep)
+
     def _set_standard_headers(self, request):
         """
         Set standard HTTP response headers.
@@ -28,4 +28,574 @@
 #
 #####################################################################################
 
-from __future__ import absolute_import
+from __future__ import absolute_import, division
+
+import heapq
+import time
+
+import six
+
+__all__ = (
+    'now',
+    'Histogram',
+    'RealmMetrics',
+    'MetricsRegistry',
+    'TopK',
+    'TrafficAccounting',
+)
+
+# current time of a monotonic clock, to pass to Histogram.record_since()
+try:
+    now = time.perf_counter
+except AttributeError:
+    # Python 2
+    now = time.time
+
+# histograms have this many linear sub-buckets per power of two, which bounds
+# the relative error of recorded values to 1/16 (as a HdrHistogram would with
+# a bit more than 1 significant digit) at a fixed, small number of buckets
+_SUB_BUCKET_BITS = 4
+_SUB_BUCKETS = 1 << _SUB_BUCKET_BITS
+
+# largest value (in microseconds, ~19 hours) histograms track, larger values are clamped
+_MAX_VALUE = (1 << 36) - 1
+
+
+def _bucket_index(value):
+    if value < _SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - _SUB_BUCKET_BITS - 1
+    return (shift << _SUB_BUCKET_BITS) + (value >> shift)
+
+
+def _bucket_value(index):
+    # the highest value recorded into the bucket with the given index
+    if index < 2 * _SUB_BUCKETS:
+        return index
+    shift = (index >> _SUB_BUCKET_BITS) - 1
+    top = index - (shift << _SUB_BUCKET_BITS)
+    return ((top + 1) << shift) - 1
+
+
+_BUCKET_COUNT = _bucket_index(_MAX_VALUE) + 1
+
+
+class Histogram(object):
+    """
+    A latency histogram with log-linear buckets (in the style of HdrHistogram).
+
+    Values are recorded in (integer) microseconds in constant time, and any
+    percentile can be computed from the buckets with a bounded relative error.
+    """
+
+    __slots__ = (
+        'counts',
+        'count',
+        'sum',
+        'max',
+    )
+
+    def __init__(self):
+        self.counts = [0] * _BUCKET_COUNT
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def record(self, value):
+        """
+        Record a value.
+
+        :param value: The value (in microseconds) to record.
+        :type value: int
+        """
+        if value < _SUB_BUCKETS:
+            if value < 0:
+                value = 0
+            index = value
+        else:
+            if value > _MAX_VALUE:
+                value = _MAX_VALUE
+            shift = value.bit_length() - _SUB_BUCKET_BITS - 1
+            index = (shift << _SUB_BUCKET_BITS) + (value >> shift)
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def record_since(self, started):
+        """
+        Record the time elapsed since a point in time.
+
+        :param started: The point in time as returned from :func:`now`.
+        :type started: float
+        """
+        # this is on the hot path of routing: same as record(), inlined
+        value = int((now() - started) * 1000000)
+        if value < _SUB_BUCKETS:
+            if value < 0:
+                value = 0
+            index = value
+        else:
+            if value > _MAX_VALUE:
+                value = _MAX_VALUE
+            shift = value.bit_length() - _SUB_BUCKET_BITS - 1
+            index = (shift << _SUB_BUCKET_BITS) + (value >> shift)
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percentile):
+        """
+        Compute a percentile of the recorded values.
+
+        :param percentile: The percentile to compute (from 0 to 100).
+        :type percentile: float
+
+        :returns: The value (in microseconds) below or at which the given
+            percentage of recorded values lie, or ``0`` when nothing was recorded.
+        :rtype: int
+        """
+        if not self.count:
+            return 0
+        rank = max(1, int(round(self.count * percentile / 100.)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(_bucket_value(index), self.max)
+        return self.max
+
+    def merge(self, other):
+        """
+        Add the values recorded in another histogram to this histogram.
+        """
+        counts = self.counts
+        for index, count in enumerate(other.counts):
+            if count:
+                counts[index] += count
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def marshal(self):
+        return {
+            u'count': self.count,
+            u'sum': self.sum,
+            u'max': self.max,
+            u'mean': self.sum // self.count if self.count else 0,
+            u'p50': self.percentile(50),
+            u'p90': self.percentile(90),
+            u'p99': self.percentile(99),
+            u'p999': self.percentile(99.9),
+        }
+
+
+class RealmMetrics(object):
+    """
+    Metrics of the router of one realm.
+
+    Counters are plain attributes incremented by the broker, dealer and
+    router as they process messages, and histograms record latencies in
+    microseconds.
+    """
+
+    COUNTERS = (
+        (u'published', u'PUBLISH messages received.'),
+        (u'events', u'EVENT messages dispatched to subscribers.'),
+        (u'calls', u'CALLs routed to callees.'),
+        (u'yields', u'YIELD messages received from callees.'),
+        (u'call_errors', u'Calls which failed in the callee.'),
+        (u'authorizations', u'Actions authorized.'),
+        (u'authorizations_denied', u'Actions for which the authorization was denied.'),
+        (u'meta_events', u'WAMP meta events published.'),
+        (u'meta_events_suppressed', u'WAMP meta events not published as nobody subscribed to them.'),
+    )
+
+    HISTOGRAMS = (
+        (u'publish_duration', u'Time from receiving a PUBLISH until its events are dispatched.'),
+        (u'call_duration', u'Time from routing a CALL until the callee returned.'),
+        (u'authorize_duration', u'Time to authorize an action by a dynamic authorizer.'),
+    )
+
+    __slots__ = ('realm',) + tuple(name for name, _ in COUNTERS + HISTOGRAMS)
+
+    def __init__(self, realm):
+        self.realm = realm
+        for name, _ in self.COUNTERS:
+            setattr(self, name, 0)
+        for name, _ in self.HISTOGRAMS:
+            setattr(self, name, Histogram())
+
+    def merge(self, other):
+        """
+        Add the metrics of another realm to this one.
+        """
+        for name, _ in self.COUNTERS:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        for name, _ in self.HISTOGRAMS:
+            getattr(self, name).merge(getattr(other, name))
+
+    def marshal(self):
+        obj = {}
+        for name, _ in self.COUNTERS:
+            obj[name] = getattr(self, name)
+        for name, _ in self.HISTOGRAMS:
+            obj[name] = getattr(self, name).marshal()
+        return obj
+
+
+def _label(value):
+    return six.text_type(value).replace(u'\\', u'\\\\').replace(u'"', u'\\"').replace(u'\n', u'\\n')
+
+
+class MetricsRegistry(object):
+    """
+    Metrics of all realms of a router worker.
+    """
+
+    # quantiles of latency histograms in the Prometheus exposition
+    QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+    def __init__(self, worker=None):
+        """
+
+        :param worker: The ID of the worker (used as a label in expositions).
+        :type worker: str or None
+        """
+        self.worker = worker
+        self._realms = {}
+
+    def realm(self, realm):
+        """
+        Get the metrics of a realm, creating them if necessary.
+
+        :param realm: The name of the realm.
+        :type realm: str
+
+        :rtype: instance of :class:`RealmMetrics`
+        """
+        metrics = self._realms.get(realm, None)
+        if metrics is None:
+            metrics = RealmMetrics(realm)
+            self._realms[realm] = metrics
+        return metrics
+
+    def remove(self, realm):
+        """
+        Forget the metrics of a realm (e.g. when the realm is stopped).
+        """
+        self._realms.pop(realm, None)
+
+    def total(self):
+        """
+        The metrics aggregated over all realms.
+
+        :rtype: instance of :class:`RealmMetrics`
+        """
+        total = RealmMetrics(None)
+        for metrics in self._realms.values():
+            total.merge(metrics)
+        return total
+
+    def marshal(self):
+        return {
+            u'worker': self.worker,
+            u'realms': {realm: metrics.marshal() for realm, metrics in self._realms.items()},
+            u'total': self.total().marshal(),
+        }
+
+    def render(self):
+        """
+        Render all metrics in the Prometheus text exposition format.
+
+        :returns: The exposition (UTF-8 encoded).
+        :rtype: bytes
+        """
+        realms = [self._realms[realm] for realm in sorted(self._realms)]
+        lines = []
+
+        def labels(metrics, extra=u''):
+            if self.worker is not None:
+                return u'{{worker="{}",realm="{}"{}}}'.format(_label(self.worker), _label(metrics.realm), extra)
+            return u'{{realm="{}"{}}}'.format(_label(metrics.realm), extra)
+
+        for name, description in RealmMetrics.COUNTERS:
+            metric = u'crossbar_router_{}_total'.format(name)
+            lines.append(u'# HELP {} {}'.format(metric, description))
+            lines.append(u'# TYPE {} counter'.format(metric))
+            for metrics in realms:
+                lines.append(u'{}{} {}'.format(metric, labels(metrics), getattr(metrics, name)))
+
+        for name, description in RealmMetrics.HISTOGRAMS:
+            metric = u'crossbar_router_{}_seconds'.format(name)
+            lines.append(u'# HELP {} {}'.format(metric, description))
+            lines.append(u'# TYPE {} summary'.format(metric))
+            for metrics in realms:
+                histogram = getattr(metrics, name)
+                for quantile in self.QUANTILES:
+                    lines.append(u'{}{} {}'.format(metric, labels(metrics, u',quantile="{}"'.format(quantile)),
+                                                   histogram.percentile(quantile * 100) / 1000000.))
+                lines.append(u'{}_sum{} {}'.format(metric, labels(metrics), histogram.sum / 1000000.))
+                lines.append(u'{}_count{} {}'.format(metric, labels(metrics), histogram.count))
+
+        lines.append(u'')
+        return u'\n'.join(lines).encode('utf8')
+
+
+def serialized_size(msg):
+    """
+    Size of a WAMP message as sent to peers.
+
+    Messages are serialized (once per serializer) when they are sent, so
+    this only looks up the size of the serialization already done. Messages
+    only sent to sessions running inside the router are never serialized.
+
+    :returns: The size (in bytes) or ``0`` if the message wasn't serialized.
+    :rtype: int
+    """
+    serialized = msg._serialized
+    if serialized:
+        return max(len(data) for data in serialized.values())
+    return 0
+
+
+class _TrafficEntry(object):
+    """
+    Traffic on one URI, as tracked in a :class:`TopK`.
+    """
+
+    __slots__ = (
+        'uri',
+        'count',
+        'error',
+        'bytes_in',
+        'event_bytes',
+        'bytes_out',
+        'fanout',
+        'max_fanout',
+        'errors',
+        'latency',
+    )
+
+    def __init__(self, uri, count, error):
+        self.uri = uri
+        self.count = count
+        self.error = error
+        self.bytes_in = 0
+        self.event_bytes = 0
+        self.bytes_out = 0
+        self.fanout = 0
+        self.max_fanout = 0
+        self.errors = 0
+        self.latency = None
+
+    def marshal_topic(self):
+        return {
+            u'uri': self.uri,
+            u'count': self.count,
+            u'error': self.error,
+            u'event_bytes': self.event_bytes,
+            u'bytes_out': self.bytes_out,
+            u'fanout': self.fanout,
+            u'max_fanout': self.max_fanout,
+        }
+
+    def marshal_procedure(self):
+        obj = {
+            u'uri': self.uri,
+            u'count': self.count,
+            u'error': self.error,
+            u'bytes_in': self.bytes_in,
+            u'bytes_out': self.bytes_out,
+        }
+        if self.latency is not None:
+            obj[u'errors'] = self.errors
+            obj[u'latency'] = self.latency.marshal()
+        return obj
+
+
+class TopK(object):
+    """
+    The URIs with the most messages, tracked in fixed memory with the
+    space-saving algorithm (Metwally et al.).
+
+    At most ``capacity`` URIs are tracked. When a URI that isn't tracked
+    comes in and all slots are taken, it replaces the URI with the lowest
+    count, taking over that count (as its ``error``). Every URI with more
+    than ``1 / capacity`` of all messages is guaranteed to be tracked, and
+    counts overestimate by at most their ``error``.
+
+    Statistics other than the count are gathered from the time a URI is
+    tracked on.
+    """
+
+    def __init__(self, capacity=100):
+        """
+
+        :param capacity: The number of URIs to track.
+        :type capacity: int
+        """
+        assert capacity > 0
+        self.capacity = capacity
+        self.total = 0
+
+        # map: URI -> _TrafficEntry
+        self._entries = {}
+
+        # min-heap of (count, URI) with one item per tracked URI. counts only
+        # ever grow, so items are brought up to date lazily when evicting
+        self._heap = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, uri):
+        return uri in self._entries
+
+    def hit(self, uri):
+        """
+        Count a message on a URI.
+
+        :returns: The entry of the URI (to add statistics to).
+        :rtype: instance of :class:`_TrafficEntry`
+        """
+        self.total += 1
+        entry = self._entries.get(uri, None)
+        if entry is not None:
+            entry.count += 1
+            return entry
+
+        if len(self._entries) < self.capacity:
+            entry = _TrafficEntry(uri, 1, 0)
+        else:
+            heap = self._heap
+            while True:
+                count, evicted = heap[0]
+                current = self._entries[evicted].count
+                if current == count:
+                    break
+                heapq.heapreplace(heap, (current, evicted))
+            heapq.heappop(heap)
+            del self._entries[evicted]
+            entry = _TrafficEntry(uri, count + 1, count)
+
+        self._entries[uri] = entry
+        heapq.heappush(self._heap, (entry.count, uri))
+        return entry
+
+    def get(self, uri):
+        """
+        Get the entry of a URI, without counting a message.
+
+        :returns: The entry or ``None`` if the URI is not tracked (anymore).
+        :rtype: instance of :class:`_TrafficEntry` or None
+        """
+        return self._entries.get(uri, None)
+
+    def top(self, limit=None):
+        """
+        The tracked URIs, by descending count.
+
+        :param limit: Return at most this many URIs.
+        :type limit: int or None
+
+        :rtype: list of :class:`_TrafficEntry`
+        """
+        entries = sorted(self._entries.values(), key=lambda entry: entry.count, reverse=True)
+        if limit is not None:
+            entries = entries[:limit]
+        return entries
+
+
+class TrafficAccounting(object):
+    """
+    Per-URI traffic on the topics and procedures of a realm.
+
+    Bytes are taken from the serialized messages the router sends: events
+    for topics (event bytes: one event per publication, bytes out: all
+    events), and invocations (bytes in) and results or errors (bytes out)
+    for procedures. The publications received are not serialized again, so
+    their size is not known.
+    """
+
+    def __init__(self, top=100):
+        """
+
+        :param top: The number of topics and of procedures to track.
+        :type top: int
+        """
+        self.topics = TopK(top)
+        self.procedures = TopK(top)
+
+    def account_publish(self, topic, receivers, size):
+        """
+        Account a publication.
+
+        :param topic: The topic published to.
+        :type topic: str
+        :param receivers: The number of events dispatched.
+        :type receivers: int
+        :param size: The size of the event sent (in bytes), ``0`` if none was
+            serialized (no receivers, or only sessions inside the router).
+        :type size: int
+        """
+        entry = self.topics.hit(topic)
+        entry.event_bytes += size
+        entry.bytes_out += size * receivers
+        entry.fanout += receivers
+        if receivers > entry.max_fanout:
+            entry.max_fanout = receivers
+
+    def account_call(self, procedure, size):
+        """
+        Account a call routed to a callee.
+
+        :param procedure: The procedure called.
+        :type procedure: str
+        :param size: The size of the invocation sent (in bytes).
+        :type size: int
+        """
+        entry = self.procedures.hit(procedure)
+        entry.bytes_in += size
+
+    def account_call_done(self, procedure, size, started, error=False):
+        """
+        Account the (final) result or error of a call.
+
+        :param procedure: The procedure called.
+        :type procedure: str
+        :param size: The size of the result or error sent (in bytes).
+        :type size: int
+        :param started: The time (as returned from :func:`now`) the call was routed.
+        :type started: float
+        :param error: Whether the call failed.
+        :type error: bool
+        """
+        entry = self.procedures.get(procedure)
+        if entry is not None:
+            entry.bytes_out += size
+            if error:
+                entry.errors += 1
+            if entry.latency is None:
+                entry.latency = Histogram()
+            entry.latency.record_since(started)
+
+    def marshal(self, limit=None):
+        """
+        Marshal the heaviest topics and procedures.
+
+        :param limit: Return at most this many topics and procedures.
+        :type limit: int or None
+
+        :returns: Topics and procedures, ordered by message count (descending).
+        :rtype: dict
+        """
+        return {
+            u'topics': [entry.marshal_topic() for entry in self.topics.top(limit)],
+            u'procedures': [entry.marshal_procedure() for entry in self.procedures.top(limit)],
+            u'publications': self.topics.total,
+            u'calls': self.procedures.total,
+        }
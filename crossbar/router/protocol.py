@@ -461,6 +461,10 @@ class WampWebSocketServerFactory(websocket.WampWebSocketServerFactory):
                                                       server=server,
                                                       externalPort=externalPort)
 
+        # use the timer wheel shared in the router worker for WebSocket
+        # handshake timeouts and auto-pings
+        self._batched_timer = factory._routerFactory._timers
+
         # Crossbar.io node directory
         self._cbdir = cbdir
 
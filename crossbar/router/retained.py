@@ -0,0 +1,210 @@
+#####################################################################################
+#
+#  Copyright (c) Crossbar.io Technologies GmbH
+#
+#  Unless a separate license agreement exists between you and Crossbar.io GmbH (e.g.
+#  you have purchased a commercial license), the license terms below apply.
+#
+#  Should you enter into a separate license agreement after having received a copy of
+#  this software, then the terms of such license agreement replace the terms below at
+#  the time at which such license agreement becomes effective.
+#
+#  In case a separate license agreement ends, and such agreement ends without being
+#  replaced by another separate license agreement, the license terms below apply
+#  from the time at which said agreement ends.
+#
+#  LICENSE TERMS
+#
+#  This program is free software: you can redistribute it and/or modify it under the
+#  terms of the GNU Affero General Public License, version 3, as published by the
+#  Free Software Foundation. This program is distributed in the hope that it will be
+#  useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#  See the GNU Affero General Public License Version 3 for more details.
+#
+#  You should have received a copy of the GNU Affero General Public license along
+#  with this program. If not, see <http://www.gnu.org/licenses/agpl-3.0.en.html>.
+#
+#####################################################################################
+
+from __future__ import absolute_import
+
+from collections import OrderedDict
+
+__all__ = ('RetainedStore',)
+
+
+class _Node(object):
+    """
+    A node in the URI component tree of a retained store.
+    """
+
+    __slots__ = ('children', 'topic')
+
+    def __init__(self):
+        # map of URI component to child node (created when needed, as most
+        # nodes are leaves)
+        self.children = None
+
+        # the full topic, if events are retained on the topic of this node
+        self.topic = None
+
+
+class RetainedStore(object):
+    """
+    Retained events of a broker, indexed by URI components, so that the
+    retained events matching a prefix or wildcard subscription can be looked
+    up without scanning all topics with retained events.
+
+    The number of topics with retained events can be bounded, in which case
+    the topics retained on the longest time ago are evicted first.
+    """
+
+    def __init__(self, max_topics=0):
+        """
+
+        :param max_topics: Maximum number of topics with retained events
+            (``0`` means no limit).
+        :type max_topics: int
+        """
+        self._max_topics = max_topics
+        self._root = _Node()
+
+        # map of topic to list of retained events, ordered by last update
+        self._topics = OrderedDict()
+
+        # number of topics evicted because of the bound on topics
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._topics)
+
+    def __contains__(self, topic):
+        return topic in self._topics
+
+    def get(self, topic):
+        """
+        Get the retained events on a topic.
+
+        :returns: The list of retained events (may be empty).
+        :rtype: list
+        """
+        return self._topics.get(topic, [])
+
+    def set(self, topic, retained_events):
+        """
+        Set the retained events on a topic, replacing any previous ones.
+
+        :param retained_events: The list of retained events.
+        :type retained_events: list
+
+        :returns: The topic evicted to stay within the bound on topics, if any.
+        :rtype: str or None
+        """
+        if topic in self._topics:
+            self._topics.move_to_end(topic)
+        else:
+            node = self._root
+            for component in topic.split(u'.'):
+                if node.children is None:
+                    node.children = {}
+                child = node.children.get(component, None)
+                if child is None:
+                    child = node.children[component] = _Node()
+                node = child
+            node.topic = topic
+
+        self._topics[topic] = retained_events
+
+        if self._max_topics and len(self._topics) > self._max_topics:
+            evicted = next(iter(self._topics))
+            self.discard(evicted)
+            self.evicted += 1
+            return evicted
+
+    def discard(self, topic):
+        """
+        Discard the retained events on a topic, if any.
+        """
+        if topic not in self._topics:
+            return
+        del self._topics[topic]
+
+        # find the node, and remove it (and parents left empty) from the tree
+        path = []
+        node = self._root
+        for component in topic.split(u'.'):
+            path.append((node, component))
+            node = node.children[component]
+        node.topic = None
+
+        while path and not node.children and node.topic is None:
+            parent, component = path.pop()
+            del parent.children[component]
+            if not parent.children:
+                parent.children = None
+            node = parent
+
+    def match(self, uri, match=u'exact'):
+        """
+        Find the retained events on all topics matching a subscription.
+
+        :param uri: The URI of the subscription.
+        :type uri: str
+
+        :param match: The match policy of the subscription: ``u'exact'``,
+            ``u'prefix'`` or ``u'wildcard'``.
+        :type match: str
+
+        :returns: An iterator over pairs of topic and list of retained events.
+        """
+        if match == u'exact':
+            if uri in self._topics:
+                yield uri, self._topics[uri]
+            return
+
+        components = uri.split(u'.')
+
+        if match == u'prefix':
+            # all components but the last one must match exactly, while the
+            # last one is a (string) prefix of the component on that level
+            node = self._root
+            for component in components[:-1]:
+                node = node.children.get(component, None) if node.children else None
+                if node is None:
+                    return
+            if not node.children:
+                return
+            last = components[-1]
+            nodes = [child for component, child in node.children.items()
+                     if component.startswith(last)]
+            while nodes:
+                node = nodes.pop()
+                if node.topic is not None:
+                    yield node.topic, self._topics[node.topic]
+                if node.children:
+                    nodes.extend(node.children.values())
+
+        elif match == u'wildcard':
+            # empty components match any component on that level
+            depth = len(components)
+            nodes = [(self._root, 0)]
+            while nodes:
+                node, level = nodes.pop()
+                if level == depth:
+                    if node.topic is not None:
+                        yield node.topic, self._topics[node.topic]
+                    continue
+                if not node.children:
+                    continue
+                component = components[level]
+                if component:
+                    child = node.children.get(component, None)
+                    if child is not None:
+                        nodes.append((child, level + 1))
+                else:
+                    nodes.extend((child, level + 1) for child in node.children.values())
+
+        else:
+            raise ValueError(u'invalid match policy "{}"'.format(match))
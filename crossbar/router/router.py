@@ -42,6 +42,8 @@ from autobahn.wamp.exception import ProtocolError
 from crossbar.router import RouterOptions
 from crossbar.router.broker import Broker
 from crossbar.router.dealer import Dealer
+from crossbar.router.metering import MetricsRegistry, TrafficAccounting, now
+from crossbar.router.timerwheel import TimerWheel
 from crossbar.router.role import RouterRole, \
     RouterTrustedRole, RouterRoleStaticAuth, \
     RouterRoleDynamicAuth
@@ -105,6 +107,15 @@ class Router(object):
         # map: authrole -> set(session)
         self._authrole_to_sessions = {}
 
+        # metrics of this realm (in the registry of the router worker)
+        self._metrics = factory._metrics.realm(self.realm)
+
+        # optional per-URI traffic accounting
+        if self._options.traffic_accounting is not None:
+            self._traffic = TrafficAccounting(top=self._options.traffic_accounting.get(u'top', 100))
+        else:
+            self._traffic = None
+
         self._broker = self.broker(self, factory._reactor, self._options)
         self._dealer = self.dealer(self, factory._reactor, self._options)
         self._attached = 0
@@ -345,6 +356,8 @@ class Router(object):
         assert(type(uri) == six.text_type)
         assert(action in [u'call', u'register', u'publish', u'subscribe'])
 
+        self._metrics.authorizations += 1
+
         # the role under which the session that wishes to perform the given action on
         # the given URI was authenticated under
         role = session._authrole
@@ -372,6 +385,9 @@ class Router(object):
             if auto_disclose_trusted and role == u'trusted' and action in [u'call', u'publish']:
                 authorization[u'disclose'] = True
 
+            if not authorization.get(u'allow', False):
+                self._metrics.authorizations_denied += 1
+
             self.log.debug("Authorized action '{action}' for URI '{uri}' by session {session_id} with authid '{authid}' and authrole '{authrole}' -> authorization: {authorization}",
                            session_id=session._session_id,
                            uri=uri,
@@ -382,6 +398,16 @@ class Router(object):
 
             return authorization
 
+        # only authorizations which did not complete right away (that is, by
+        # dynamic authorizers) are worth measuring
+        if not txaio.is_called(d):
+            started = now()
+
+            def record_duration(authorization):
+                self._metrics.authorize_duration.record_since(started)
+                return authorization
+            d.addBoth(record_duration)
+
         d.addCallback(got_authorization)
         return d
 
@@ -418,6 +444,13 @@ class RouterFactory(object):
         from twisted.internet import reactor
         self._reactor = reactor
 
+        # timer wheel shared by all routers, transports and bridges of the worker,
+        # so that many timeouts do not each need a timer in the reactor
+        self._timers = TimerWheel(self._reactor)
+
+        # metrics of all realms of the worker
+        self._metrics = MetricsRegistry(worker=getattr(worker, '_worker_id', None))
+
     def get(self, realm):
         """
         Implements :func:`autobahn.wamp.interfaces.IRouterFactory.get`
@@ -473,8 +506,10 @@ class RouterFactory(object):
         options = RouterOptions(
             uri_check=self._options.uri_check,
             event_dispatching_chunk_size=self._options.event_dispatching_chunk_size,
+            max_retained_topics=self._options.max_retained_topics,
+            traffic_accounting=self._options.traffic_accounting,
         )
-        for arg in ['uri_check', 'event_dispatching_chunk_size']:
+        for arg in ['uri_check', 'event_dispatching_chunk_size', 'max_retained_topics', 'traffic_accounting']:
             if arg in realm.config.get('options', {}):
                 setattr(options, arg, realm.config['options'][arg])
 
@@ -497,6 +532,7 @@ class RouterFactory(object):
         router = self._routers[realm]
         del self._routers[realm]
         detached_sessions = router.detach()
+        self._metrics.remove(realm)
 
         return detached_sessions
 
@@ -30,7 +30,7 @@
 
 from __future__ import absolute_import
 
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet.defer import Deferred, inlineCallbacks, succeed
 from twisted.python.failure import Failure
 
 from autobahn import wamp, util
@@ -109,36 +109,96 @@ class RouterServiceAgent(ApplicationSession):
 
             self._expose_on_sessions.append((management_session, bridge_meta_api_prefix, u'-'))
 
+        # WAMP meta events (topics) that should never be published on this realm
+        disabled_meta_events = self.config.extra.get('disabled_meta_events', None) if self.config.extra else None
+        self._disabled_meta_events = set(disabled_meta_events or [])
+
+        # meta events queued for publication on the next tick
+        self._meta_queue = []
+        self._meta_flush_pending = False
+
+        # periodic publication of the per-URI traffic accounting
+        self._traffic_call = None
+
     def publish(self, topic, *args, **kwargs):
         # WAMP meta events published over the service session are published on the
         # service session itself (the first in the list of sessions to expose), and potentially
         # more sessions - namely the management session on the local node router
-        dl = []
-        for session, prefix, replace_dots in self._expose_on_sessions:
+        #
+        # meta events are not sent right away, but queued and published on the
+        # next tick (after the reply to the client session they were triggered
+        # by), and meta events nobody is subscribed to on the user router-realm
+        # are suppressed altogether
+        #
+        # like ApplicationSession.publish, this returns a Deferred: it fires (with
+        # None) when the meta event has been published - failures to publish are
+        # logged rather than propagated
+        if topic in self._disabled_meta_events:
+            return succeed(None)
 
-            translated_topic = topic
+        sessions = []
+        for exposed in self._expose_on_sessions:
+            # the management session (and from there, CFC) is on a different router, so
+            # we cannot cheaply tell if someone is listening there - always forward
+            if exposed[0] is not self or self._has_subscribers(topic):
+                sessions.append(exposed)
 
-            # we cannot subscribe in CFC to topics of the form
-            # crossbarfabriccenter.node.<node_id>.worker.<worker_id>.realm.<realm_id>.root.*,
-            # where * is an arbitrary suffix including dots, eg "wamp.session.on_join"
-            #
-            # to work around that, we replace the "."s in the suffix with "-", and reverse that
-            # in CFC
-            if replace_dots:
-                translated_topic = translated_topic.replace(u'.', replace_dots)
+        if not sessions:
+            self._router._metrics.meta_events_suppressed += 1
+            return succeed(None)
 
-            if prefix:
-                translated_topic = u'{}{}'.format(prefix, translated_topic)
+        published = Deferred()
+        self._meta_queue.append((sessions, topic, args, kwargs, published))
+        if not self._meta_flush_pending:
+            self._meta_flush_pending = True
+            self._router._factory._timers.call_soon(self._flush_meta_events)
+        return published
 
-            self.log.debug('RouterServiceAgent.publish("{topic}") -> "{translated_topic}" on "{realm}"',
-                           topic=topic, translated_topic=translated_topic, realm=session._realm)
+    def _has_subscribers(self, topic):
+        """
+        Check if there is at least one subscriber on the user router-realm
+        that would receive an event published to the given topic.
+        """
+        for observation in self._router._broker._subscription_map.match_observations(topic):
+            if observation.observers:
+                return True
+        return False
+
+    def _flush_meta_events(self):
+        """
+        Publish all meta events queued during the last tick.
+        """
+        self._meta_flush_pending = False
+        queue, self._meta_queue = self._meta_queue, []
+        self._router._metrics.meta_events += len(queue)
 
-            dl.append(ApplicationSession.publish(session, translated_topic, *args, **kwargs))
+        for sessions, topic, args, kwargs, published in queue:
+            for session, prefix, replace_dots in sessions:
 
-        # to keep the interface of ApplicationSession.publish, we only return the first
-        # publish return (that is the return from publishing to the user router-realm)
-        if len(dl) > 0:
-            return dl[0]
+                translated_topic = topic
+
+                # we cannot subscribe in CFC to topics of the form
+                # crossbarfabriccenter.node.<node_id>.worker.<worker_id>.realm.<realm_id>.root.*,
+                # where * is an arbitrary suffix including dots, eg "wamp.session.on_join"
+                #
+                # to work around that, we replace the "."s in the suffix with "-", and reverse that
+                # in CFC
+                if replace_dots:
+                    translated_topic = translated_topic.replace(u'.', replace_dots)
+
+                if prefix:
+                    translated_topic = u'{}{}'.format(prefix, translated_topic)
+
+                self.log.debug('RouterServiceAgent.publish("{topic}") -> "{translated_topic}" on "{realm}"',
+                               topic=topic, translated_topic=translated_topic, realm=session._realm)
+
+                try:
+                    ApplicationSession.publish(session, translated_topic, *args, **kwargs)
+                except Exception:
+                    self.log.failure('Failed to publish WAMP meta event "{topic}": {log_failure.value}',
+                                     topic=translated_topic)
+
+            published.callback(None)
 
     @inlineCallbacks
     def onJoin(self, details):
@@ -173,6 +233,29 @@ class RouterServiceAgent(ApplicationSession):
             self.log.info('RouterServiceAgent ready (realm_name="{realm}", on_ready={on_ready})', realm=self._realm, on_ready=on_ready)
             if on_ready:
                 on_ready.callback(self)
+            self._schedule_traffic()
+
+    def onLeave(self, details):
+        if self._traffic_call is not None:
+            self._traffic_call.cancel()
+            self._traffic_call = None
+        return ApplicationSession.onLeave(self, details)
+
+    def _schedule_traffic(self):
+        """
+        Schedule the next publication of the per-URI traffic accounting
+        (if traffic accounting is enabled on this realm).
+        """
+        if self._router._traffic is None:
+            return
+        interval = self._router._options.traffic_accounting.get(u'publish_interval', 10)
+        if interval:
+            self._traffic_call = self._router._factory._timers.callLater(interval, self._publish_traffic)
+
+    def _publish_traffic(self):
+        self._traffic_call = None
+        self.publish(u'wamp.metrics.on_traffic', self._router._traffic.marshal())
+        self._schedule_traffic()
 
     def onUserError(self, failure, msg):
         # ApplicationError's are raised explicitly and by purpose to signal
@@ -857,6 +940,45 @@ class RouterServiceAgent(ApplicationSession):
                 u'no subscription with ID {} exists on this broker'.format(subscription_id),
             )
 
+    @wamp.register(u'wamp.metrics.get')
+    def metrics_get(self, details=None):
+        """
+        Return the metrics of the router for this realm.
+
+        Counters count messages processed since the realm was started,
+        and latencies are given in microseconds.
+
+        :returns: Counters and latency percentiles.
+        :rtype: dict
+        """
+        self.log.debug('metrics_get()')
+
+        return self._router._metrics.marshal()
+
+    @wamp.register(u'wamp.metrics.get_traffic')
+    def metrics_get_traffic(self, limit=None, details=None):
+        """
+        Return the per-URI traffic of the heaviest topics and procedures on this realm.
+
+        Counts of topics and procedures which were not tracked all the time
+        are overestimated by at most their ``error``.
+
+        :param limit: Return at most this many topics and procedures.
+        :type limit: int or None
+
+        :returns: Topics and procedures, ordered by message count (descending).
+        :rtype: dict
+        """
+        self.log.debug('metrics_get_traffic({limit})', limit=limit)
+
+        if self._router._traffic is None:
+            raise ApplicationError(
+                u'wamp.error.traffic_accounting_unavailable',
+                message=u'traffic accounting not enabled on this realm',
+            )
+
+        return self._router._traffic.marshal(limit)
+
     def schema_describe(self, uri=None, details=None):
         """
         Describe a given URI or all URIs.
@@ -791,6 +791,22 @@ class RouterSession(BaseSession):
         # anything in this impl?
         pass
 
+    def send_testaments(self, discard=False):
+        """
+        Publish the testaments of this session (as when the session leaves),
+        or discard them. Either way, the session has no testaments left.
+
+        :param discard: Discard the testaments instead of publishing them.
+        :type discard: bool
+        """
+        if self._router is None:
+            return
+        for scope in [u"detatched", u"destroyed"]:
+            if not discard:
+                for msg in self._testaments[scope]:
+                    self._router.process(self, msg)
+            self._testaments[scope] = []
+
     def onLeave(self, details):
 
         # _router can be None when, e.g., authentication fails hard
@@ -798,11 +814,7 @@ class RouterSession(BaseSession):
         # because they hit a syntax error)
         if self._router is not None:
             # todo: move me into detatch when session resumption happens
-            for msg in self._testaments[u"detatched"]:
-                self._router.process(self, msg)
-
-            for msg in self._testaments[u"destroyed"]:
-                self._router.process(self, msg)
+            self.send_testaments()
 
             self._router._session_left(self, self._session_details)
 
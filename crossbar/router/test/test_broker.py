@@ -41,9 +41,10 @@ from autobahn.wamp import role
 from autobahn.twisted.wamp import ApplicationSession
 
 from crossbar.worker.types import RouterRealm
+from crossbar.router import RouterOptions
 from crossbar.router.router import RouterFactory
 from crossbar.router.session import RouterSessionFactory, RouterSession
-from crossbar.router.broker import Broker
+from crossbar.router.broker import Broker, SharedSubscriptionGroup
 from crossbar.router.role import RouterRoleStaticAuth
 
 from twisted.internet import defer, reactor
@@ -511,6 +512,175 @@ class TestBrokerPublish(unittest.TestCase):
             self.assertFalse(events[2].correlation_is_last)
             self.assertTrue(events[3].correlation_is_last)
 
+    def _make_shared_group(self, count, policy=u'round_robin', queued=None):
+        """
+        Make a broker with ``count`` sessions subscribed to "test.topic", all
+        in the shared subscription group "g1", and a publishing session.
+        """
+        class TestSession(ApplicationSession):
+            pass
+
+        router = mock.MagicMock()
+        router.send = mock.Mock()
+        router.new_correlation_id = lambda: u'fake correlation id'
+        router.is_traced = False
+        router.authorize = mock.MagicMock(side_effect=lambda *args, **kw: txaio.create_future_success(dict(allow=True, cache=False, disclose=True)))
+        broker = Broker(router, reactor)
+
+        sessions = []
+        for i in range(count + 1):
+            session = TestSession()
+            session._session_id = 1000 + i
+            session._transport = mock.MagicMock()
+            session._transport.get_channel_id = mock.MagicMock(return_value=b'deadbeef')
+            sessions.append(session)
+
+        for session in sessions[1:]:
+            subscription, _, _ = broker._subscription_map.add_observer(session, u'test.topic')
+            broker._session_to_subscriptions[session] = set([subscription])
+            self.assertTrue(broker.join_shared_group(session, subscription.id, u'g1', policy,
+                                                     queued=queued(session) if queued else None))
+
+        return router, broker, subscription, sessions[0], sessions[1:]
+
+    def _receivers(self, router, sessions):
+        receivers = [call[1][0] for call in router.send.mock_calls
+                     if call[1][0] in sessions]
+        router.send.reset_mock()
+        return receivers
+
+    def test_publish_shared_round_robin(self):
+        """
+        Events on a shared subscription are dispatched to one member of the
+        group, taking turns.
+        """
+        router, broker, subscription, publisher, members = self._make_shared_group(3)
+
+        receivers = []
+        for i in range(6):
+            broker.processPublish(publisher, message.Publish(i, u'test.topic'))
+            received = self._receivers(router, members)
+            self.assertEqual(len(received), 1)
+            receivers.extend(received)
+
+        for member in members:
+            self.assertEqual(receivers.count(member), 2)
+
+    def test_publish_shared_plain_subscriber(self):
+        """
+        Subscribers not in a shared subscription group receive every event.
+        """
+        router, broker, subscription, publisher, members = self._make_shared_group(2)
+
+        class TestSession(ApplicationSession):
+            pass
+        plain = TestSession()
+        plain._session_id = 2000
+        plain._transport = mock.MagicMock()
+        broker._subscription_map.add_observer(plain, u'test.topic')
+
+        for i in range(4):
+            broker.processPublish(publisher, message.Publish(i, u'test.topic'))
+            received = self._receivers(router, members + [plain])
+            self.assertEqual(len(received), 2)
+            self.assertIn(plain, received)
+
+    def test_publish_shared_least_queued(self):
+        """
+        With the "least_queued" policy, the member with the fewest queued
+        events receives the event.
+        """
+        queued = {}
+
+        def make_queued(session):
+            return lambda: queued[session]
+
+        router, broker, subscription, publisher, members = self._make_shared_group(
+            3, policy=u'least_queued', queued=make_queued)
+        queued.update({members[0]: 5, members[1]: 1, members[2]: 3})
+
+        for i in range(3):
+            broker.processPublish(publisher, message.Publish(i, u'test.topic'))
+            self.assertEqual(self._receivers(router, members), [members[1]])
+
+    def test_shared_group_left_on_unsubscribe(self):
+        """
+        A session unsubscribing leaves the shared subscription group.
+        """
+        router, broker, subscription, publisher, members = self._make_shared_group(2)
+
+        broker._unsubscribe(subscription, members[0])
+        self.assertEqual(list(subscription.extra.shared_groups[u'g1'].members), [members[1]])
+
+        for i in range(2):
+            broker.processPublish(publisher, message.Publish(i, u'test.topic'))
+            self.assertEqual(self._receivers(router, members), [members[1]])
+
+        broker._unsubscribe(subscription, members[1])
+        self.assertEqual(subscription.extra.shared_groups, {})
+
+    def test_publish_shared_member_also_plain(self):
+        """
+        A member of a shared subscription group which also subscribed outside
+        of the group receives every event, while the others still take turns.
+        """
+        router, broker, subscription, publisher, members = self._make_shared_group(2)
+        self.assertTrue(broker.join_shared_group(members[0], subscription.id, u'g1', plain=True))
+
+        received_by_other = 0
+        for i in range(4):
+            broker.processPublish(publisher, message.Publish(i, u'test.topic'))
+            received = self._receivers(router, members)
+            self.assertIn(members[0], received)
+            received_by_other += received.count(members[1])
+
+        # the group alternates between both members
+        self.assertEqual(received_by_other, 2)
+
+    def test_retained_topics_bounded(self):
+        """
+        Past the maximum number of topics with retained events, the least
+        recently retained topics are evicted, and a warning is logged once.
+        """
+        router = mock.MagicMock()
+        router.new_correlation_id = lambda: u'fake correlation id'
+        router.is_traced = False
+        router.authorize = mock.MagicMock(side_effect=lambda *args, **kw: txaio.create_future_success(dict(allow=True, cache=False, disclose=True)))
+        broker = Broker(router, reactor, RouterOptions(max_retained_topics=2))
+        broker.log = mock.Mock()
+
+        publisher = ApplicationSession()
+        publisher._session_id = 1000
+        publisher._transport = mock.MagicMock()
+
+        for i in range(4):
+            broker.processPublish(publisher, message.Publish(i, u'test.topic{}'.format(i), args=[i], retain=True))
+
+        self.assertEqual(len(broker._retained), 2)
+        self.assertEqual(sorted(topic for topic, _ in broker._retained.match(u'test.', u'prefix')),
+                         [u'test.topic2', u'test.topic3'])
+        self.assertEqual(broker._retained.evicted, 2)
+        self.assertEqual(len(broker.log.warn.mock_calls), 1)
+
+    def test_shared_group_pick(self):
+        """
+        Members left or not receiving an event are skipped when picking,
+        without losing the turns of the others.
+        """
+        group = SharedSubscriptionGroup(u'g1')
+        for member in (u'a', u'b', u'c', u'd'):
+            group.join(member)
+
+        self.assertEqual(group.pick({u'a', u'b', u'c', u'd'}), u'a')
+        self.assertEqual(group.pick({u'a', u'c', u'd'}), u'c')
+        group.leave(u'a')
+        self.assertEqual(group.pick({u'b', u'c', u'd'}), u'd')
+        self.assertEqual(group.pick({u'b', u'c', u'd'}), u'b')
+        group.leave(u'd')
+        self.assertEqual(group.pick({u'b', u'c'}), u'c')
+        self.assertEqual(group.pick({u'b', u'c'}), u'b')
+        self.assertEqual(group.pick({u'x'}), None)
+
 
 class TestRouterSession(unittest.TestCase):
     """
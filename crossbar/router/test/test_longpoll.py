@@ -0,0 +1,271 @@
+#####################################################################################
+#
+#  Copyright (c) Crossbar.io Technologies GmbH
+#
+#  Unless a separate license agreement exists between you and Crossbar.io GmbH (e.g.
+#  you have purchased a commercial license), the license terms below apply.
+#
+#  Should you enter into a separate license agreement after having received a copy of
+#  this software, then the terms of such license agreement replace the terms below at
+#  the time at which such license agreement becomes effective.
+#
+#  In case a separate license agreement ends, and such agreement ends without being
+#  replaced by another separate license agreement, the license terms below apply
+#  from the time at which said agreement ends.
+#
+#  LICENSE TERMS
+#
+#  This program is free software: you can redistribute it and/or modify it under the
+#  terms of the GNU Affero General Public License, version 3, as published by the
+#  Free Software Foundation. This program is distributed in the hope that it will be
+#  useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#  See the GNU Affero General Public License Version 3 for more details.
+#
+#  You should have received a copy of the GNU Affero General Public license along
+#  with this program. If not, see <http://www.gnu.org/licenses/agpl-3.0.en.html>.
+#
+#####################################################################################
+
+from __future__ import absolute_import
+
+import json
+import struct
+
+import txaio
+txaio.use_twisted()  # noqa
+
+from twisted.trial.unittest import TestCase
+from twisted.internet.task import Clock
+from twisted.web.test.requesthelper import DummyRequest
+
+from autobahn.wamp import message
+from autobahn.wamp.serializer import JsonSerializer
+
+from crossbar.router.longpoll import WampLongPollResource
+from crossbar.router.timerwheel import TimerWheel
+
+
+class FakeSession(object):
+    """
+    A WAMP session that just records the transport it was opened on.
+    """
+
+    def __init__(self):
+        self.transport = None
+        self.closed = False
+
+    def onOpen(self, transport):
+        self.transport = transport
+
+    def onMessage(self, msg):
+        pass
+
+    def onClose(self, wasClean):
+        self.closed = True
+
+
+class LongPollTestMixin(object):
+    """
+    Helpers to create long-poll transports without a Web server.
+    """
+
+    def _create(self, serializer=None, **kwargs):
+        self.clock = kwargs.pop('clock', None) or Clock()
+        self.sessions = []
+
+        def factory():
+            session = FakeSession()
+            self.sessions.append(session)
+            return session
+
+        kwargs.setdefault('killAfter', 0)
+        resource = WampLongPollResource(factory, reactor=self.clock, **kwargs)
+        transport = self._open(resource, u'tid1', serializer)
+        return resource, transport
+
+    def _open(self, resource, transport_id, serializer=None):
+        serializer = serializer or JsonSerializer()
+        transport_details = {
+            u'transport': transport_id,
+            u'serializer': serializer,
+            u'protocol': u'wamp.2.{}'.format(serializer.SERIALIZER_ID),
+            u'peer': u'127.0.0.1',
+            u'http_headers_received': {},
+            u'http_headers_sent': None,
+        }
+        transport = resource.protocol(resource, transport_details)
+        resource._transports[transport_id] = transport
+        return transport
+
+    def _poll(self, transport):
+        request = DummyRequest([b'receive'])
+        request.method = b'POST'
+        transport._receive.render_POST(request)
+        return b''.join(request.written)
+
+    def _event(self, i):
+        return message.Event(1, i, args=[i])
+
+
+class LongPollQueueTests(LongPollTestMixin, TestCase):
+    """
+    Tests for the send queue of long-poll transports.
+    """
+
+    def test_unbatched_one_message_per_poll(self):
+        """
+        With an unbatched serializer, each poll returns a single message.
+        """
+        resource, transport = self._create()
+        for i in range(3):
+            transport.send(self._event(i))
+        self.assertEqual(transport._receive.queued_messages, 3)
+
+        data = self._poll(transport)
+        self.assertEqual(json.loads(data.decode('utf8')), [36, 1, 0, {}, [0]])
+        self.assertEqual(transport._receive.queued_messages, 2)
+
+    def test_batch_always(self):
+        """
+        With ``batchAlways``, all pending messages are returned in one poll,
+        framed as with the batched serializer.
+        """
+        resource, transport = self._create(batchAlways=True)
+        for i in range(3):
+            transport.send(self._event(i))
+        self.assertTrue(transport._receive.queued_bytes > 0)
+
+        data = self._poll(transport)
+        parts = data.split(b'\x1e')
+        self.assertEqual(parts[-1], b'')
+        self.assertEqual([json.loads(p.decode('utf8'))[2] for p in parts[:-1]], [0, 1, 2])
+        self.assertEqual(transport._receive.queued_messages, 0)
+        self.assertEqual(transport._receive.queued_bytes, 0)
+
+    def test_batch_always_binary_framing(self):
+        """
+        Binary serializers are framed with a length prefix.
+        """
+        try:
+            from autobahn.wamp.serializer import MsgPackSerializer
+        except ImportError:
+            raise self.skipTest("MsgPack serializer not available")
+
+        resource, transport = self._create(serializer=MsgPackSerializer(), batchAlways=True)
+        transport.send(self._event(0))
+        transport.send(self._event(1))
+
+        data = self._poll(transport)
+        first = struct.unpack("!L", data[:4])[0]
+        second = struct.unpack("!L", data[4 + first:8 + first])[0]
+        self.assertEqual(len(data), 8 + first + second)
+
+    def test_overflow_kill(self):
+        """
+        A slow consumer exceeding the queue limit is killed.
+        """
+        resource, transport = self._create(queueLimitMessages=2)
+        for i in range(3):
+            transport.send(self._event(i))
+
+        self.assertEqual(transport._receive.queued_messages, 0)
+        self.assertFalse(self.sessions[0].closed)
+
+        # session is closed outside of the send path
+        self.clock.advance(0)
+        self.assertTrue(self.sessions[0].closed)
+        self.assertNotIn(u'tid1', resource._transports)
+
+    def test_overflow_drop(self):
+        """
+        With the "drop" policy, events exceeding the queue limit are dropped,
+        but other messages are still queued.
+        """
+        resource, transport = self._create(queueLimitMessages=2, queueOverflowPolicy=u'drop')
+        for i in range(4):
+            transport.send(self._event(i))
+        self.assertEqual(transport._receive.queued_messages, 2)
+        self.assertEqual(transport._receive.dropped_messages, 2)
+
+        transport.send(message.Result(1, args=[1]))
+        self.assertEqual(transport._receive.queued_messages, 3)
+
+        self.clock.advance(0)
+        self.assertFalse(self.sessions[0].closed)
+
+
+class LongPollSweepTests(LongPollTestMixin, TestCase):
+    """
+    Tests for killing inactive long-poll sessions.
+    """
+
+    def test_single_timer(self):
+        """
+        Only one reactor timer is used no matter how many sessions there are.
+        """
+        resource, transport = self._create(killAfter=30)
+        for i in range(100):
+            self._open(resource, u'tid-{}'.format(i))
+        self.assertEqual(len(self.clock.getDelayedCalls()), 1)
+
+    def test_inactive_killed(self):
+        """
+        Sessions without activity are killed, active ones are kept.
+        """
+        resource, transport = self._create(killAfter=30)
+        other = self._open(resource, u'tid2')
+
+        self.clock.advance(20)
+        self._poll(other)
+        self.clock.advance(11)
+
+        self.assertTrue(self.sessions[0].closed)
+        self.assertNotIn(u'tid1', resource._transports)
+        self.assertFalse(self.sessions[1].closed)
+        self.assertIn(u'tid2', resource._transports)
+
+        self.clock.advance(20)
+        self.assertTrue(self.sessions[1].closed)
+        self.assertEqual(resource._transports, {})
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test_killed_in_batches(self):
+        """
+        Inactive sessions are killed at most ``sweepBatch`` per reactor iteration.
+        """
+        resource, transport = self._create(killAfter=30, sweepBatch=10)
+        for i in range(24):
+            self._open(resource, u'tid-{}'.format(i))
+
+        # run the sweep by hand to observe each batch
+        resource._sweeper.cancel()
+        self.clock.rightNow = 30
+        resource._sweep()
+        self.assertEqual(len(resource._transports), 15)
+        self.assertEqual(resource._sweeper.getTime(), 30)
+
+        self.clock.advance(0)
+        self.assertEqual(resource._transports, {})
+
+    def test_timer_wheel(self):
+        """
+        Sweeping can be scheduled on a (shared) timer wheel.
+        """
+        clock = Clock()
+        timers = TimerWheel(clock)
+        resource, transport = self._create(killAfter=30, clock=clock, timers=timers)
+        self.assertEqual(len(timers), 1)
+
+        clock.pump([0.1] * 310)
+        self.assertTrue(self.sessions[0].closed)
+        self.assertEqual(len(timers), 0)
+
+    def test_closed_forgotten(self):
+        """
+        Closing a session stops tracking its activity.
+        """
+        resource, transport = self._create(killAfter=30)
+        transport.close()
+        self.assertEqual(len(resource._activity), 0)
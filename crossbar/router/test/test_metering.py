@@ -33,6 +33,21 @@ import shutil
 import random
 import unittest
 
+import mock
+import txaio
+txaio.use_twisted()  # noqa
+
+from twisted.internet import defer
+from twisted.trial.unittest import TestCase
+
+from autobahn.wamp import message, role
+from autobahn.wamp.serializer import JsonSerializer
+
+from crossbar.router.metering import Histogram, MetricsRegistry, TopK, TrafficAccounting, serialized_size
+from crossbar.router.router import RouterFactory
+from crossbar.router.session import RouterApplicationSession
+from crossbar.worker.types import RouterRealm
+
 
 class TestLmdb(unittest.TestCase):
 
@@ -97,3 +112,333 @@ class TestLmdb(unittest.TestCase):
                     data_read.append((key, value))
 
         self.assertEqual(data_read, data[5:])
+
+
+class HistogramTests(unittest.TestCase):
+    """
+    Tests for the latency histograms of router metrics.
+    """
+
+    def test_percentiles(self):
+        """
+        Percentiles are exact for small values, and within the bucket
+        resolution for larger ones.
+        """
+        histogram = Histogram()
+        for value in range(1, 10001):
+            histogram.record(value)
+
+        self.assertEqual(histogram.count, 10000)
+        self.assertEqual(histogram.max, 10000)
+        self.assertEqual(histogram.sum, 50005000)
+        for percentile in [1, 10, 50, 90, 99, 99.9]:
+            expected = 10000 * percentile / 100.
+            self.assertTrue(expected <= histogram.percentile(percentile) <= expected * 17 / 16.,
+                            (percentile, histogram.percentile(percentile)))
+        self.assertEqual(histogram.percentile(100), 10000)
+
+    def test_empty(self):
+        self.assertEqual(Histogram().percentile(99), 0)
+        self.assertEqual(Histogram().marshal()[u'mean'], 0)
+
+    def test_clamped(self):
+        """
+        Values out of range are clamped.
+        """
+        histogram = Histogram()
+        histogram.record(-5)
+        histogram.record(1 << 40)
+        self.assertEqual(histogram.count, 2)
+        self.assertEqual(histogram.percentile(0), 0)
+        self.assertEqual(histogram.max, (1 << 36) - 1)
+
+    def test_merge(self):
+        first, second = Histogram(), Histogram()
+        first.record(10)
+        second.record(1000)
+        first.merge(second)
+        self.assertEqual(first.count, 2)
+        self.assertEqual(first.sum, 1010)
+        self.assertEqual(first.max, 1000)
+        self.assertEqual(first.percentile(50), 10)
+
+
+class MetricsRegistryTests(unittest.TestCase):
+    """
+    Tests for the aggregation and exposition of router metrics.
+    """
+
+    def test_total(self):
+        registry = MetricsRegistry()
+        registry.realm(u'realm1').published += 2
+        registry.realm(u'realm2').published += 3
+        registry.realm(u'realm2').call_duration.record(100)
+
+        obj = registry.marshal()
+        self.assertEqual(sorted(obj[u'realms']), [u'realm1', u'realm2'])
+        self.assertEqual(obj[u'total'][u'published'], 5)
+        self.assertEqual(obj[u'total'][u'call_duration'][u'count'], 1)
+
+        registry.remove(u'realm2')
+        self.assertEqual(registry.total().published, 2)
+
+    def test_render(self):
+        """
+        Metrics are rendered in the Prometheus text format, labeled with
+        the worker and realm.
+        """
+        registry = MetricsRegistry(worker=u'worker001')
+        metrics = registry.realm(u'realm"1')
+        metrics.calls += 7
+        metrics.call_duration.record(1500)
+
+        lines = registry.render().decode('utf8').splitlines()
+        self.assertIn(u'# TYPE crossbar_router_calls_total counter', lines)
+        self.assertIn(u'crossbar_router_calls_total{worker="worker001",realm="realm\\"1"} 7', lines)
+        self.assertIn(u'# TYPE crossbar_router_call_duration_seconds summary', lines)
+        self.assertIn(u'crossbar_router_call_duration_seconds{worker="worker001",realm="realm\\"1",quantile="0.99"} 0.0015', lines)
+        self.assertIn(u'crossbar_router_call_duration_seconds_count{worker="worker001",realm="realm\\"1"} 1', lines)
+
+
+class RouterMetricsTests(TestCase):
+    """
+    Tests for the metrics recorded by the router, broker and dealer.
+    """
+
+    def setUp(self):
+        self.router_factory = RouterFactory(None, None)
+        self.router_factory.start_realm(RouterRealm(u'realm-001', {u'name': u'realm1'}))
+        self.router = self.router_factory.get(u'realm1')
+        self.metrics = self.router._metrics
+
+    def _session(self, **roles):
+        session = mock.Mock()
+        session._realm = u'realm1'
+        rap = RouterApplicationSession(session, self.router_factory, authrole=u'trusted')
+        rap.send(message.Hello(u'realm1', roles))
+        return session, rap
+
+    def _received(self, session, klass):
+        return [c[1][0] for c in session.onMessage.mock_calls if c[1] and isinstance(c[1][0], klass)]
+
+    def test_publish(self):
+        session, rap = self._session(publisher=role.RolePublisherFeatures(),
+                                     subscriber=role.RoleSubscriberFeatures())
+        rap.send(message.Subscribe(1, u'com.example.topic'))
+        rap.send(message.Publish(2, u'com.example.topic', args=[1], exclude_me=False))
+        rap.send(message.Publish(3, u'com.example.other'))
+
+        self.assertEqual(self.metrics.published, 2)
+        self.assertEqual(self.metrics.events, 1)
+        self.assertEqual(self.metrics.publish_duration.count, 1)
+        self.assertEqual(self.router_factory._metrics.realm(u'realm1'), self.metrics)
+
+    def test_call(self):
+        callee, callee_rap = self._session(callee=role.RoleCalleeFeatures())
+        caller, caller_rap = self._session(caller=role.RoleCallerFeatures())
+        callee_rap.send(message.Register(1, u'com.example.proc'))
+
+        caller_rap.send(message.Call(2, u'com.example.proc'))
+        caller_rap.send(message.Call(3, u'com.example.proc'))
+        self.assertEqual(self.metrics.calls, 2)
+
+        first, second = self._received(callee, message.Invocation)
+        callee_rap.send(message.Yield(first.request, args=[1]))
+        callee_rap.send(message.Error(message.Invocation.MESSAGE_TYPE, second.request, u'com.example.error'))
+
+        self.assertEqual(self.metrics.yields, 1)
+        self.assertEqual(self.metrics.call_errors, 1)
+        self.assertEqual(self.metrics.call_duration.count, 2)
+
+    def test_authorize_denied(self):
+        session = mock.Mock()
+        session._authrole = u'anonymous'
+        d = self.router.authorize(session, u'com.example.proc', u'call', {})
+
+        results = []
+        d.addCallback(results.append)
+        self.assertEqual(results, [{u'allow': False, u'cache': False, u'disclose': False}])
+        self.assertEqual(self.metrics.authorizations, 1)
+        self.assertEqual(self.metrics.authorizations_denied, 1)
+
+        # the authorization completed right away, so it wasn't measured
+        self.assertEqual(self.metrics.authorize_duration.count, 0)
+
+    def test_authorize_dynamic(self):
+        """
+        The duration of authorizations which complete later (as by dynamic
+        authorizers) is recorded.
+        """
+        authorized = defer.Deferred()
+        authorizer = mock.Mock()
+        authorizer.authorize = mock.Mock(return_value=authorized)
+        self.router._roles[u'dynamic'] = authorizer
+
+        session = mock.Mock()
+        session._authrole = u'dynamic'
+        d = self.router.authorize(session, u'com.example.proc', u'call', {})
+        self.assertEqual(self.metrics.authorize_duration.count, 0)
+
+        authorized.callback({u'allow': True, u'disclose': False, u'cache': False})
+        self.assertEqual(self.successResultOf(d)[u'allow'], True)
+        self.assertEqual(self.metrics.authorize_duration.count, 1)
+        self.assertEqual(self.metrics.authorizations_denied, 0)
+
+
+class TopKTests(unittest.TestCase):
+    """
+    Tests for the space-saving top-K tracking.
+    """
+
+    def test_top(self):
+        topk = TopK(3)
+        for uri, hits in [(u'a', 5), (u'b', 3), (u'c', 1)]:
+            for _ in range(hits):
+                topk.hit(uri)
+
+        self.assertEqual([(e.uri, e.count, e.error) for e in topk.top()],
+                         [(u'a', 5, 0), (u'b', 3, 0), (u'c', 1, 0)])
+        self.assertEqual([e.uri for e in topk.top(2)], [u'a', u'b'])
+        self.assertEqual(topk.total, 9)
+
+    def test_evict(self):
+        """
+        A new URI replaces the URI with the lowest count, and inherits its
+        count as the error.
+        """
+        topk = TopK(2)
+        for uri in [u'a', u'a', u'a', u'b', u'b', u'c']:
+            topk.hit(uri)
+
+        self.assertEqual(len(topk), 2)
+        self.assertNotIn(u'b', topk)
+        self.assertIsNone(topk.get(u'b'))
+        entry = topk.get(u'c')
+        self.assertEqual((entry.count, entry.error), (3, 2))
+
+    def test_heavy_hitters(self):
+        """
+        URIs used more often than total / capacity are always tracked.
+        """
+        rng = random.Random(42)
+        topk = TopK(10)
+        for _ in range(10000):
+            if rng.random() < 0.5:
+                topk.hit(u'com.example.heavy{}'.format(rng.randrange(3)))
+            else:
+                topk.hit(u'com.example.light{}'.format(rng.randrange(1000)))
+
+        self.assertEqual(len(topk), 10)
+        self.assertEqual(set(e.uri for e in topk.top(3)),
+                         set([u'com.example.heavy0', u'com.example.heavy1', u'com.example.heavy2']))
+        for entry in topk.top():
+            self.assertTrue(entry.count - entry.error <= entry.count)
+
+
+class TrafficAccountingTests(unittest.TestCase):
+    """
+    Tests for the per-URI traffic accounting.
+    """
+
+    def test_publish(self):
+        traffic = TrafficAccounting()
+        traffic.account_publish(u'com.example.topic', 3, 20)
+        traffic.account_publish(u'com.example.topic', 1, 10)
+        traffic.account_publish(u'com.example.other', 0, 0)
+
+        obj = traffic.marshal()
+        self.assertEqual(obj[u'publications'], 3)
+        self.assertEqual(obj[u'topics'][0], {
+            u'uri': u'com.example.topic',
+            u'count': 2,
+            u'error': 0,
+            u'event_bytes': 30,
+            u'bytes_out': 70,
+            u'fanout': 4,
+            u'max_fanout': 3,
+        })
+        self.assertEqual(obj[u'topics'][1][u'event_bytes'], 0)
+        self.assertEqual(obj[u'topics'][1][u'fanout'], 0)
+        self.assertEqual(len(traffic.marshal(limit=1)[u'topics']), 1)
+
+    def test_call(self):
+        traffic = TrafficAccounting()
+        traffic.account_call(u'com.example.proc', 15)
+        traffic.account_call(u'com.example.proc', 15)
+        traffic.account_call_done(u'com.example.proc', 40, 0)
+        traffic.account_call_done(u'com.example.proc', 25, 0, error=True)
+
+        # not tracked (anymore), so ignored
+        traffic.account_call_done(u'com.example.gone', 25, 0)
+
+        procedure, = traffic.marshal()[u'procedures']
+        self.assertEqual(procedure[u'count'], 2)
+        self.assertEqual(procedure[u'bytes_in'], 30)
+        self.assertEqual(procedure[u'bytes_out'], 65)
+        self.assertEqual(procedure[u'errors'], 1)
+        self.assertEqual(procedure[u'latency'][u'count'], 2)
+
+    def test_serialized_size(self):
+        msg = message.Event(1, 2, args=[u'hello'])
+        self.assertEqual(serialized_size(msg), 0)
+
+        data, _ = JsonSerializer().serialize(msg)
+        self.assertEqual(serialized_size(msg), len(data))
+
+
+class RouterTrafficTests(TestCase):
+    """
+    Tests for the traffic accounted by the broker and dealer.
+    """
+
+    def _start(self, **options):
+        self.router_factory = RouterFactory(None, None)
+        self.router_factory.start_realm(RouterRealm(u'realm-001', {u'name': u'realm1', u'options': options}))
+        self.router = self.router_factory.get(u'realm1')
+
+    def _session(self, **roles):
+        session = mock.Mock()
+        session._realm = u'realm1'
+        rap = RouterApplicationSession(session, self.router_factory, authrole=u'trusted')
+        rap.send(message.Hello(u'realm1', roles))
+        return session, rap
+
+    def test_disabled(self):
+        self._start()
+        self.assertIsNone(self.router._traffic)
+
+    def test_publish(self):
+        self._start(traffic_accounting={u'top': 10})
+        session, rap = self._session(publisher=role.RolePublisherFeatures(),
+                                     subscriber=role.RoleSubscriberFeatures())
+        rap.send(message.Subscribe(1, u'com.example.topic'))
+        rap.send(message.Publish(2, u'com.example.topic', args=[1], exclude_me=False))
+        rap.send(message.Publish(3, u'com.example.other'))
+
+        traffic = self.router._traffic.marshal()
+        self.assertEqual(traffic[u'publications'], 2)
+        self.assertEqual(sorted((t[u'uri'], t[u'count'], t[u'fanout']) for t in traffic[u'topics']),
+                         [(u'com.example.other', 1, 0), (u'com.example.topic', 1, 1)])
+
+        # the event only went to a session inside the router: not serialized
+        self.assertEqual([t[u'event_bytes'] for t in traffic[u'topics']], [0, 0])
+
+    def test_call(self):
+        self._start(traffic_accounting={})
+        callee, callee_rap = self._session(callee=role.RoleCalleeFeatures())
+        caller, caller_rap = self._session(caller=role.RoleCallerFeatures())
+        callee_rap.send(message.Register(1, u'com.example.proc'))
+
+        caller_rap.send(message.Call(2, u'com.example.proc'))
+        caller_rap.send(message.Call(3, u'com.example.proc'))
+
+        first, second = [c[1][0] for c in callee.onMessage.mock_calls
+                         if c[1] and isinstance(c[1][0], message.Invocation)]
+        callee_rap.send(message.Yield(first.request, args=[1]))
+        callee_rap.send(message.Error(message.Invocation.MESSAGE_TYPE, second.request, u'com.example.error'))
+
+        procedure, = self.router._traffic.marshal()[u'procedures']
+        self.assertEqual(procedure[u'uri'], u'com.example.proc')
+        self.assertEqual(procedure[u'count'], 2)
+        self.assertEqual(procedure[u'errors'], 1)
+        self.assertEqual(procedure[u'latency'][u'count'], 2)
@@ -0,0 +1,114 @@
+#####################################################################################
+#
+#  Copyright (c) Crossbar.io Technologies GmbH
+#
+#  Unless a separate license agreement exists between you and Crossbar.io GmbH (e.g.
+#  you have purchased a commercial license), the license terms below apply.
+#
+#  Should you enter into a separate license agreement after having received a copy of
+#  this software, then the terms of such license agreement replace the terms below at
+#  the time at which such license agreement becomes effective.
+#
+#  In case a separate license agreement ends, and such agreement ends without being
+#  replaced by another separate license agreement, the license terms below apply
+#  from the time at which said agreement ends.
+#
+#  LICENSE TERMS
+#
+#  This program is free software: you can redistribute it and/or modify it under the
+#  terms of the GNU Affero General Public License, version 3, as published by the
+#  Free Software Foundation. This program is distributed in the hope that it will be
+#  useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#  See the GNU Affero General Public License Version 3 for more details.
+#
+#  You should have received a copy of the GNU Affero General Public license along
+#  with this program. If not, see <http://www.gnu.org/licenses/agpl-3.0.en.html>.
+#
+#####################################################################################
+
+from __future__ import absolute_import
+
+from twisted.trial import unittest
+
+from crossbar.router import RouterOptions
+from crossbar.router.retained import RetainedStore
+
+
+class TestRetainedStore(unittest.TestCase):
+
+    def setUp(self):
+        self.store = RetainedStore()
+        for topic in [u'sensors.1.temp', u'sensors.1.humidity', u'sensors.2.temp',
+                      u'sensors.20.temp', u'sensors.2', u'other.1.temp']:
+            self.store.set(topic, [topic])
+
+    def _match(self, uri, match):
+        return sorted(topic for topic, _ in self.store.match(uri, match))
+
+    def test_exact(self):
+        self.assertEqual(self._match(u'sensors.1.temp', u'exact'), [u'sensors.1.temp'])
+        self.assertEqual(self._match(u'sensors.1', u'exact'), [])
+        self.assertEqual(self.store.get(u'sensors.2.temp'), [u'sensors.2.temp'])
+        self.assertEqual(self.store.get(u'sensors.3.temp'), [])
+
+    def test_wildcard(self):
+        self.assertEqual(self._match(u'sensors..temp', u'wildcard'),
+                         [u'sensors.1.temp', u'sensors.2.temp', u'sensors.20.temp'])
+        self.assertEqual(self._match(u'.1.temp', u'wildcard'),
+                         [u'other.1.temp', u'sensors.1.temp'])
+        self.assertEqual(self._match(u'sensors.', u'wildcard'), [u'sensors.2'])
+        self.assertEqual(self._match(u'sensors...', u'wildcard'), [])
+
+    def test_prefix(self):
+        self.assertEqual(self._match(u'sensors.2', u'prefix'),
+                         [u'sensors.2', u'sensors.2.temp', u'sensors.20.temp'])
+        self.assertEqual(self._match(u'sensors.2.', u'prefix'), [u'sensors.2.temp'])
+        self.assertEqual(self._match(u'', u'prefix'),
+                         sorted(self.store._topics.keys()))
+
+    def test_discard(self):
+        """
+        Discarding a topic removes it from the index, including the tree
+        nodes that are left empty.
+        """
+        self.store.discard(u'sensors.20.temp')
+        self.store.discard(u'sensors.20.temp')
+        self.assertNotIn(u'sensors.20.temp', self.store)
+        self.assertNotIn(u'20', self.store._root.children[u'sensors'].children)
+        self.assertEqual(self._match(u'sensors..temp', u'wildcard'),
+                         [u'sensors.1.temp', u'sensors.2.temp'])
+
+        # the node of "sensors.2" still has a child
+        self.store.discard(u'sensors.2')
+        self.assertEqual(self._match(u'sensors.2', u'prefix'), [u'sensors.2.temp'])
+
+        for topic in list(self.store._topics):
+            self.store.discard(topic)
+        self.assertEqual(len(self.store), 0)
+        self.assertEqual(self.store._root.children, None)
+
+    def test_max_topics(self):
+        """
+        When bounded, the topics retained on the longest time ago are dropped.
+        """
+        store = RetainedStore(max_topics=2)
+        self.assertEqual(store.set(u'a.1', [1]), None)
+        self.assertEqual(store.set(u'a.2', [2]), None)
+        self.assertEqual(store.set(u'a.1', [3]), None)
+        self.assertEqual(store.set(u'a.3', [4]), u'a.2')
+        self.assertEqual(store.evicted, 1)
+
+        self.assertEqual(len(store), 2)
+        self.assertEqual(sorted(topic for topic, _ in store.match(u'a.', u'prefix')),
+                         [u'a.1', u'a.3'])
+        self.assertEqual(store.get(u'a.1'), [3])
+
+    def test_default_bound(self):
+        """
+        Routers bound the number of topics with retained events by default.
+        """
+        self.assertEqual(RouterOptions().max_retained_topics, RouterOptions.MAX_RETAINED_TOPICS)
+        self.assertTrue(RouterOptions.MAX_RETAINED_TOPICS > 0)
+        self.assertEqual(RouterOptions(max_retained_topics=0).max_retained_topics, 0)
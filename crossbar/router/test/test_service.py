@@ -0,0 +1,233 @@
+#####################################################################################
+#
+#  Copyright (c) Crossbar.io Technologies GmbH
+#
+#  Unless a separate license agreement exists between you and Crossbar.io GmbH (e.g.
+#  you have purchased a commercial license), the license terms below apply.
+#
+#  Should you enter into a separate license agreement after having received a copy of
+#  this software, then the terms of such license agreement replace the terms below at
+#  the time at which such license agreement becomes effective.
+#
+#  In case a separate license agreement ends, and such agreement ends without being
+#  replaced by another separate license agreement, the license terms below apply
+#  from the time at which said agreement ends.
+#
+#  LICENSE TERMS
+#
+#  This program is free software: you can redistribute it and/or modify it under the
+#  terms of the GNU Affero General Public License, version 3, as published by the
+#  Free Software Foundation. This program is distributed in the hope that it will be
+#  useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#  See the GNU Affero General Public License Version 3 for more details.
+#
+#  You should have received a copy of the GNU Affero General Public license along
+#  with this program. If not, see <http://www.gnu.org/licenses/agpl-3.0.en.html>.
+#
+#####################################################################################
+
+from __future__ import absolute_import
+
+import txaio
+txaio.use_twisted()  # noqa
+
+import mock
+
+from twisted.trial import unittest
+from twisted.test.proto_helpers import Clock
+
+from autobahn.wamp.exception import ApplicationError
+from autobahn.wamp.types import ComponentConfig, CloseDetails
+
+from crossbar.router import RouterOptions
+from crossbar.router.metering import RealmMetrics, TrafficAccounting
+from crossbar.router.observation import UriObservationMap
+from crossbar.router.service import RouterServiceAgent
+from crossbar.router.timerwheel import TimerWheel
+
+
+class FakeRouter(object):
+
+    def __init__(self, clock):
+        self._factory = mock.Mock()
+        self._factory._timers = TimerWheel(clock)
+        self._broker = mock.Mock()
+        self._broker._subscription_map = UriObservationMap()
+        self._options = RouterOptions()
+        self._metrics = RealmMetrics(u'realm1')
+        self._traffic = None
+
+
+class MetaEventTests(unittest.TestCase):
+    """
+    Tests for the deferred publication and suppression of WAMP meta events.
+    """
+
+    def setUp(self):
+        self.clock = Clock()
+        self.router = FakeRouter(self.clock)
+        patcher = mock.patch('crossbar.router.service.ApplicationSession.publish')
+        self.publish = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _create(self, **extra):
+        return RouterServiceAgent(ComponentConfig(u'realm1', extra), self.router)
+
+    def _subscribe(self, topic, match=u'exact'):
+        self.router._broker._subscription_map.add_observer(object(), topic, match=match)
+
+    def test_no_subscribers(self):
+        """
+        Meta events nobody is subscribed to are not published at all.
+        """
+        agent = self._create()
+        agent.publish(u'wamp.session.on_join', {u'session': 1})
+        self.clock.advance(0)
+
+        self.assertEqual(self.publish.call_count, 0)
+        self.assertEqual(agent._meta_queue, [])
+        self.assertEqual(self.router._metrics.meta_events_suppressed, 1)
+        self.assertEqual(self.router._metrics.meta_events, 0)
+
+    def test_next_tick(self):
+        """
+        Meta events are published on the next tick, in order.
+        """
+        self._subscribe(u'wamp.session', match=u'prefix')
+        agent = self._create()
+        agent.publish(u'wamp.session.on_join', 1)
+        agent.publish(u'wamp.session.on_leave', 1)
+        agent.publish(u'wamp.session.on_join', 2)
+
+        # nothing is sent synchronously
+        self.assertEqual(self.publish.call_count, 0)
+
+        self.clock.advance(0)
+        self.assertEqual(self.router._metrics.meta_events, 3)
+        self.assertEqual(
+            [c[0] for c in self.publish.call_args_list],
+            [
+                (agent, u'wamp.session.on_join', 1),
+                (agent, u'wamp.session.on_leave', 1),
+                (agent, u'wamp.session.on_join', 2),
+            ]
+        )
+
+        agent.publish(u'wamp.session.on_leave', 2)
+        self.clock.advance(0)
+        self.assertEqual(self.router._metrics.meta_events, 4)
+        self.assertEqual(self.publish.call_count, 4)
+
+    def test_returns_deferred(self):
+        """
+        Like ApplicationSession.publish, publish returns a Deferred, which fires
+        when the meta event was published (or right away when suppressed).
+        """
+        self._subscribe(u'wamp.session.on_join')
+        agent = self._create()
+
+        d = agent.publish(u'wamp.session.on_join', 1)
+        self.assertNoResult(d)
+        self.clock.advance(0)
+        self.assertIsNone(self.successResultOf(d))
+
+        d = agent.publish(u'wamp.session.on_leave', 1)
+        self.assertIsNone(self.successResultOf(d))
+
+    def test_disabled(self):
+        """
+        Meta events disabled in the realm configuration are never published.
+        """
+        self._subscribe(u'wamp.session', match=u'prefix')
+        agent = self._create(disabled_meta_events=[u'wamp.session.on_join'])
+        agent.publish(u'wamp.session.on_join', 1)
+        agent.publish(u'wamp.session.on_leave', 1)
+        self.clock.advance(0)
+
+        self.assertEqual(
+            [c[0] for c in self.publish.call_args_list],
+            [(agent, u'wamp.session.on_leave', 1)]
+        )
+
+    def test_bridged(self):
+        """
+        Meta events bridged to the management session are forwarded even
+        without local subscribers, with the topic translated.
+        """
+        management_session = mock.Mock()
+        agent = self._create(
+            bridge_meta_api=True,
+            bridge_meta_api_prefix=u'crossbar.worker.worker1.realm.realm1.root.',
+            management_session=management_session,
+        )
+        agent.publish(u'wamp.session.on_join', 1)
+        self.clock.advance(0)
+
+        self.assertEqual(
+            [c[0] for c in self.publish.call_args_list],
+            [(management_session, u'crossbar.worker.worker1.realm.realm1.root.wamp-session-on_join', 1)]
+        )
+
+
+class TrafficTests(unittest.TestCase):
+    """
+    Tests for retrieving and publishing the per-URI traffic accounting.
+    """
+
+    def setUp(self):
+        self.clock = Clock()
+        self.router = FakeRouter(self.clock)
+        patcher = mock.patch('crossbar.router.service.ApplicationSession.publish')
+        self.publish = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _create(self, **traffic_accounting):
+        self.router._options = RouterOptions(traffic_accounting=traffic_accounting)
+        self.router._traffic = TrafficAccounting()
+        self.router._broker._subscription_map.add_observer(object(), u'wamp.metrics.on_traffic')
+        return RouterServiceAgent(ComponentConfig(u'realm1', {}), self.router)
+
+    def test_get_disabled(self):
+        agent = RouterServiceAgent(ComponentConfig(u'realm1', {}), self.router)
+        with self.assertRaises(ApplicationError) as ctx:
+            agent.metrics_get_traffic()
+        self.assertEqual(ctx.exception.error, u'wamp.error.traffic_accounting_unavailable')
+
+        # nothing to publish
+        agent._schedule_traffic()
+        self.assertIsNone(agent._traffic_call)
+
+    def test_get(self):
+        agent = self._create()
+        self.router._traffic.account_publish(u'com.example.a', 1, 10)
+        self.router._traffic.account_publish(u'com.example.b', 1, 10)
+        self.router._traffic.account_publish(u'com.example.b', 1, 10)
+
+        traffic = agent.metrics_get_traffic(limit=1)
+        self.assertEqual([t[u'uri'] for t in traffic[u'topics']], [u'com.example.b'])
+        self.assertEqual(traffic[u'publications'], 3)
+
+    def test_published(self):
+        """
+        The traffic is published periodically, until the agent leaves.
+        """
+        agent = self._create(publish_interval=5)
+        agent._schedule_traffic()
+
+        self.clock.advance(5.1)
+        self.assertEqual([c[0][1] for c in self.publish.call_args_list], [u'wamp.metrics.on_traffic'])
+
+        self.clock.advance(5.1)
+        self.assertEqual(self.publish.call_count, 2)
+
+        agent.onLeave(CloseDetails())
+        self.assertIsNone(agent._traffic_call)
+        self.clock.advance(10)
+        self.assertEqual(self.publish.call_count, 2)
+
+    def test_not_published(self):
+        agent = self._create(publish_interval=0)
+        agent._schedule_traffic()
+        self.assertIsNone(agent._traffic_call)
@@ -32,6 +32,8 @@ from __future__ import absolute_import
 
 import six
 
+import mock
+
 from twisted.trial import unittest
 from twisted.internet.defer import inlineCallbacks
 
@@ -39,6 +41,7 @@ from autobahn.twisted.wamp import ApplicationSession
 
 from .helpers import make_router_and_realm, connect_application_session
 from crossbar._logging import LogCapturer
+from crossbar.router.session import RouterSession
 
 
 class TestamentTests(unittest.TestCase):
@@ -232,3 +235,32 @@ class TestamentTests(unittest.TestCase):
 
         # Just the detatched testament is sent
         self.assertEqual(ob_session.events, [{"args": (u'detatched',), "kwargs": {}}])
+
+
+class SendTestamentsTests(unittest.TestCase):
+    """
+    Tests for RouterSession.send_testaments, used by transports keeping a
+    session around when its client went away.
+    """
+
+    def _session(self):
+        session = RouterSession(mock.Mock())
+        session._router = mock.Mock()
+        session._testaments[u"detatched"].append(u"detatched-msg")
+        session._testaments[u"destroyed"].append(u"destroyed-msg")
+        return session
+
+    def test_send(self):
+        session = self._session()
+        session.send_testaments()
+
+        self.assertEqual([c[0][1] for c in session._router.process.call_args_list],
+                         [u"detatched-msg", u"destroyed-msg"])
+        self.assertEqual(session._testaments, {u"detatched": [], u"destroyed": []})
+
+    def test_discard(self):
+        session = self._session()
+        session.send_testaments(discard=True)
+
+        self.assertEqual(session._router.process.call_count, 0)
+        self.assertEqual(session._testaments, {u"detatched": [], u"destroyed": []})
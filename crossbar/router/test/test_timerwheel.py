@@ -0,0 +1,168 @@
+#####################################################################################
+#
+#  Copyright (c) Crossbar.io Technologies GmbH
+#
+#  Unless a separate license agreement exists between you and Crossbar.io GmbH (e.g.
+#  you have purchased a commercial license), the license terms below apply.
+#
+#  Should you enter into a separate license agreement after having received a copy of
+#  this software, then the terms of such license agreement replace the terms below at
+#  the time at which such license agreement becomes effective.
+#
+#  In case a separate license agreement ends, and such agreement ends without being
+#  replaced by another separate license agreement, the license terms below apply
+#  from the time at which said agreement ends.
+#
+#  LICENSE TERMS
+#
+#  This program is free software: you can redistribute it and/or modify it under the
+#  terms of the GNU Affero General Public License, version 3, as published by the
+#  Free Software Foundation. This program is distributed in the hope that it will be
+#  useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#  See the GNU Affero General Public License Version 3 for more details.
+#
+#  You should have received a copy of the GNU Affero General Public license along
+#  with this program. If not, see <http://www.gnu.org/licenses/agpl-3.0.en.html>.
+#
+#####################################################################################
+
+from __future__ import absolute_import, division
+
+import txaio
+txaio.use_twisted()  # noqa
+
+from twisted.trial.unittest import TestCase
+from twisted.internet.task import Clock
+
+from crossbar.router.timerwheel import TimerWheel
+
+
+class TimerWheelTests(TestCase):
+    """
+    Tests for :class:`crossbar.router.timerwheel.TimerWheel`.
+    """
+
+    def setUp(self):
+        self.clock = Clock()
+        self.wheel = TimerWheel(self.clock, resolution=0.1, slots=16)
+        self.fired = []
+
+    def _fire(self, name):
+        self.fired.append((name, round(self.clock.seconds(), 6)))
+
+    def test_call_later(self):
+        """
+        Calls fire at their time, in order.
+        """
+        self.wheel.callLater(0.3, self._fire, u'b')
+        self.wheel.callLater(0.2, self._fire, u'a')
+        self.clock.advance(0.1)
+        self.assertEqual(self.fired, [])
+        self.clock.advance(0.1)
+        self.assertEqual(self.fired, [(u'a', 0.2)])
+        self.clock.advance(0.1)
+        self.assertEqual(self.fired, [(u'a', 0.2), (u'b', 0.3)])
+
+    def test_single_reactor_timer(self):
+        """
+        The reactor only holds one timer, no matter how many calls are pending.
+        """
+        for i in range(100):
+            self.wheel.callLater(i / 10., self._fire, i)
+        self.assertEqual(len(self.wheel), 100)
+        self.assertEqual(len(self.clock.getDelayedCalls()), 1)
+
+        self.clock.pump([0.1] * 100)
+        self.assertEqual([name for name, _ in self.fired], list(range(100)))
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test_beyond_revolution(self):
+        """
+        Calls further out than one revolution of the wheel fire at their time.
+        """
+        self.wheel.callLater(3.0, self._fire, u'a')
+        self.clock.pump([0.1] * 29)
+        self.assertEqual(self.fired, [])
+        self.clock.advance(0.1)
+        self.assertEqual(self.fired, [(u'a', 3.0)])
+
+    def test_stalled_reactor(self):
+        """
+        All calls due fire, even when the reactor was stalled for several revolutions.
+        """
+        self.wheel.callLater(0.5, self._fire, u'a')
+        self.wheel.callLater(5.0, self._fire, u'b')
+        self.wheel.callLater(20.0, self._fire, u'c')
+        self.clock.advance(10)
+        self.assertEqual([name for name, _ in self.fired], [u'a', u'b'])
+        self.clock.advance(10)
+        self.assertEqual([name for name, _ in self.fired], [u'a', u'b', u'c'])
+
+    def test_cancel(self):
+        """
+        Cancelled calls do not fire, and cancelling twice is harmless.
+        """
+        call = self.wheel.callLater(0.2, self._fire, u'a')
+        self.assertTrue(call.active())
+        call.cancel()
+        call.cancel()
+        self.assertFalse(call.active())
+        self.assertEqual(len(self.wheel), 0)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+        self.clock.advance(1)
+        self.assertEqual(self.fired, [])
+
+    def test_reset(self):
+        """
+        Resetting a call moves it to a new time.
+        """
+        call = self.wheel.callLater(0.2, self._fire, u'a')
+        self.clock.advance(0.1)
+        call.reset(0.5)
+        self.assertAlmostEqual(call.getTime(), 0.6)
+        self.clock.pump([0.1] * 4)
+        self.assertEqual(self.fired, [])
+        self.clock.advance(0.1)
+        self.assertEqual(self.fired, [(u'a', 0.6)])
+        self.assertFalse(call.active())
+
+    def test_cancel_from_call(self):
+        """
+        A call due in the same tick, but cancelled by another call, does not fire.
+        """
+        calls = []
+
+        def cancel_other():
+            self._fire(u'a')
+            calls[1].cancel()
+
+        calls.append(self.wheel.callLater(0.1, cancel_other))
+        calls.append(self.wheel.callLater(0.1, self._fire, u'b'))
+        self.clock.advance(0.1)
+        self.assertEqual(self.fired, [(u'a', 0.1)])
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_exception_in_call(self):
+        """
+        An exception raised from one call does not prevent other calls from firing.
+        """
+        def fail():
+            raise RuntimeError("oops")
+
+        self.wheel.callLater(0.1, fail)
+        self.wheel.callLater(0.1, self._fire, u'a')
+        self.clock.advance(0.1)
+        self.assertEqual(self.fired, [(u'a', 0.1)])
+        self.assertEqual(len(self.flushLoggedErrors(RuntimeError)), 1)
+
+    def test_call_soon(self):
+        """
+        Calls scheduled to run soon share one reactor timer.
+        """
+        self.wheel.call_soon(self._fire, u'a')
+        self.wheel.call_soon(self._fire, u'b')
+        self.assertEqual(len(self.clock.getDelayedCalls()), 1)
+        self.clock.advance(0)
+        self.assertEqual(self.fired, [(u'a', 0), (u'b', 0)])
@@ -0,0 +1,257 @@
+#####################################################################################
+#
+#  Copyright (c) Crossbar.io Technologies GmbH
+#
+#  Unless a separate license agreement exists between you and Crossbar.io GmbH (e.g.
+#  you have purchased a commercial license), the license terms below apply.
+#
+#  Should you enter into a separate license agreement after having received a copy of
+#  this software, then the terms of such license agreement replace the terms below at
+#  the time at which such license agreement becomes effective.
+#
+#  In case a separate license agreement ends, and such agreement ends without being
+#  replaced by another separate license agreement, the license terms below apply
+#  from the time at which said agreement ends.
+#
+#  LICENSE TERMS
+#
+#  This program is free software: you can redistribute it and/or modify it under the
+#  terms of the GNU Affero General Public License, version 3, as published by the
+#  Free Software Foundation. This program is distributed in the hope that it will be
+#  useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#  See the GNU Affero General Public License Version 3 for more details.
+#
+#  You should have received a copy of the GNU Affero General Public license along
+#  with this program. If not, see <http://www.gnu.org/licenses/agpl-3.0.en.html>.
+#
+#####################################################################################
+
+from __future__ import absolute_import, division
+
+import math
+
+from txaio import make_logger
+
+__all__ = (
+    'TimerWheel',
+    'TimerWheelCall',
+)
+
+# tolerance (in ticks) for floating point errors in reactor time
+_EPSILON = 1e-6
+
+
+class TimerWheelCall(object):
+    """
+    A call scheduled on a :class:`TimerWheel`.
+
+    This mimics (the relevant parts of) :class:`twisted.internet.interfaces.IDelayedCall`,
+    so it can be used in place of a delayed call returned from ``reactor.callLater``.
+    Differing from Twisted, cancelling or resetting a call that is no longer active is
+    silently ignored.
+    """
+
+    __slots__ = (
+        '_wheel',
+        '_tick',
+        'func',
+        'args',
+        'kw',
+    )
+
+    def __init__(self, wheel, func, args, kw):
+        self._wheel = wheel
+        self._tick = None
+        self.func = func
+        self.args = args
+        self.kw = kw
+
+    def getTime(self):
+        """
+        Time (in reactor seconds) this call is scheduled to run at.
+        """
+        if self._tick is None:
+            return None
+        return self._tick * self._wheel._resolution
+
+    def active(self):
+        """
+        Check if this call is still scheduled to run.
+        """
+        return self._tick is not None
+
+    def cancel(self):
+        """
+        Unschedule this call (O(1)).
+        """
+        if self._tick is not None:
+            self._wheel._remove(self)
+
+    def reset(self, secondsFromNow):
+        """
+        Reschedule this call to run in ``secondsFromNow`` seconds (O(1)).
+        """
+        if self._tick is not None:
+            self._wheel._remove(self)
+            self._wheel._insert(self, secondsFromNow)
+
+    def __repr__(self):
+        return "<TimerWheelCall tick={} func={}>".format(self._tick, self.func)
+
+
+class TimerWheel(object):
+    """
+    A hashed timer wheel for scheduling (large numbers of) timeouts.
+
+    Timeouts are kept in a fixed number of slots, each covering ``resolution``
+    seconds, with timeouts further out than one revolution of the wheel sharing slots.
+    Arming, resetting and cancelling a timeout are O(1), and only one reactor timer
+    (firing once per tick while there are timeouts pending) is used, no matter how
+    many timeouts are pending. The price is that timeouts fire up to ``resolution``
+    seconds late.
+
+    The wheel provides ``callLater()`` (as in :class:`twisted.internet.interfaces.IReactorTime`)
+    and ``call_later()`` (as in :class:`txaio.IBatchedTimer`), so it can be handed to code
+    expecting either of these.
+    """
+
+    log = make_logger()
+
+    def __init__(self, reactor=None, resolution=0.1, slots=1024):
+        """
+
+        :param reactor: The Twisted reactor to run under.
+        :type reactor: obj
+        :param resolution: Duration of one tick of the wheel in seconds.
+        :type resolution: float
+        :param slots: Number of slots in the wheel.
+        :type slots: int
+        """
+        # lazy import to avoid reactor install upon module import
+        if reactor is None:
+            from twisted.internet import reactor
+        self._reactor = reactor
+
+        self._resolution = float(resolution)
+        self._slots = [dict() for _ in range(slots)]
+
+        # number of calls scheduled
+        self._count = 0
+
+        # last tick processed, and reactor timer for processing the next tick
+        self._current = 0
+        self._ticker = None
+
+        # calls to be run on the next reactor iteration, and the reactor timer for that
+        self._soon = []
+        self._soon_call = None
+
+    def __len__(self):
+        return self._count
+
+    def seconds(self):
+        return self._reactor.seconds()
+
+    def callLater(self, delay, func, *args, **kw):
+        """
+        Schedule ``func(*args, **kw)`` to run in ``delay`` seconds.
+
+        :returns: The scheduled call, which can be cancelled or reset.
+        :rtype: instance of :class:`TimerWheelCall`
+        """
+        call = TimerWheelCall(self, func, args, kw)
+        self._insert(call, delay)
+        return call
+
+    def call_later(self, delay, func, *args, **kw):
+        """
+        Implements :func:`txaio.IBatchedTimer.call_later`
+        """
+        return self.callLater(delay, func, *args, **kw)
+
+    def call_soon(self, func, *args, **kw):
+        """
+        Schedule ``func(*args, **kw)`` to run on the next reactor iteration.
+
+        All calls scheduled like this within one reactor iteration share a single
+        reactor timer, and run in the order scheduled.
+        """
+        self._soon.append((func, args, kw))
+        if self._soon_call is None:
+            self._soon_call = self._reactor.callLater(0, self._run_soon)
+
+    def _run_soon(self):
+        self._soon_call = None
+        soon, self._soon = self._soon, []
+        for func, args, kw in soon:
+            try:
+                func(*args, **kw)
+            except Exception:
+                self.log.failure("Exception raised from call scheduled on timer wheel: {log_failure.value}")
+
+    def _insert(self, call, delay):
+        now = self._reactor.seconds()
+        if self._ticker is None:
+            # the wheel was idle: move it to the current time
+            self._current = int(math.floor(now / self._resolution + _EPSILON))
+
+        tick = int(math.ceil((now + delay) / self._resolution - _EPSILON))
+        if tick <= self._current:
+            tick = self._current + 1
+
+        call._tick = tick
+        self._slots[tick % len(self._slots)][call] = None
+        self._count += 1
+
+        if self._ticker is None:
+            self._schedule_tick(now)
+
+    def _schedule_tick(self, now):
+        delay = (self._current + 1 - _EPSILON / 2) * self._resolution - now
+        self._ticker = self._reactor.callLater(max(0., delay), self._advance)
+
+    def _remove(self, call):
+        self._slots[call._tick % len(self._slots)].pop(call, None)
+        call._tick = None
+        self._count -= 1
+
+        if self._count == 0 and self._ticker is not None:
+            self._ticker.cancel()
+            self._ticker = None
+
+    def _advance(self):
+        self._ticker = None
+
+        now = self._reactor.seconds()
+        target = int(math.floor(now / self._resolution + _EPSILON))
+
+        # collect all calls due: even if the reactor was stalled for longer than a
+        # revolution of the wheel, visiting each slot once is sufficient
+        due = []
+        last = min(target, self._current + len(self._slots))
+        for tick in range(self._current + 1, last + 1):
+            slot = self._slots[tick % len(self._slots)]
+            if slot:
+                for call in [call for call in slot if call._tick <= target]:
+                    del slot[call]
+                    due.append(call)
+        self._current = target
+
+        if len(due) > 1:
+            due.sort(key=lambda call: call._tick)
+
+        for call in due:
+            # skip calls cancelled or reset by a call run before
+            if call._tick is None or call._tick > target:
+                continue
+            call._tick = None
+            self._count -= 1
+            try:
+                call.func(*call.args, **call.kw)
+            except Exception:
+                self.log.failure("Exception raised from call scheduled on timer wheel: {log_failure.value}")
+
+        if self._count > 0 and self._ticker is None:
+            self._schedule_tick(now)
@@ -434,6 +434,80 @@ class CheckRealmTests(TestCase):
             self.personality.check_router_realm, self.personality, config_realm,
         )
 
+    def test_traffic_accounting(self):
+        config_realm = {
+            "name": "realm1",
+            "options": {
+                "traffic_accounting": {
+                    "top": 50,
+                    "publish_interval": 2.5
+                }
+            }
+        }
+
+        self.personality.check_router_realm(self.personality, config_realm)
+
+    def test_traffic_accounting_invalid_top(self):
+        config_realm = {
+            "name": "realm1",
+            "options": {
+                "traffic_accounting": {
+                    "top": 0
+                }
+            }
+        }
+
+        self.assertRaises(
+            checkconfig.InvalidConfigException,
+            self.personality.check_router_realm, self.personality, config_realm,
+        )
+
+
+class CheckNativeWorkerOptionsTests(TestCase):
+    """
+    Tests for check_native_worker_options.
+    """
+
+    def setUp(self):
+        self.personality = _DEFAULT_PERSONALITY_CLASS
+        return super(TestCase, self).setUp()
+
+    def test_sampling_profiler(self):
+        options = {
+            "sampling_profiler": {
+                "period": 0.02,
+                "window": 600,
+                "resolution": 10,
+                "clock": "wall"
+            }
+        }
+
+        checkconfig.check_native_worker_options(self.personality, options)
+
+    def test_sampling_profiler_invalid_clock(self):
+        options = {
+            "sampling_profiler": {
+                "clock": "sundial"
+            }
+        }
+
+        self.assertRaises(
+            checkconfig.InvalidConfigException,
+            checkconfig.check_native_worker_options, self.personality, options,
+        )
+
+    def test_sampling_profiler_invalid_period(self):
+        options = {
+            "sampling_profiler": {
+                "period": 0
+            }
+        }
+
+        self.assertRaises(
+            checkconfig.InvalidConfigException,
+            checkconfig.check_native_worker_options, self.personality, options,
+        )
+
 
 class CheckOnion(TestCase):
 
@@ -477,3 +551,45 @@ class CheckOnion(TestCase):
             "encountered for attribute 'port'",
             str(ctx.exception)
         )
+
+
+class CheckWebTransportTests(TestCase):
+    """
+    Tests for C{check_listening_transport_web}.
+    """
+
+    def setUp(self):
+        self.personality = _DEFAULT_PERSONALITY_CLASS
+        return super(TestCase, self).setUp()
+
+    def _transport(self, options):
+        return {
+            u"type": u"web",
+            u"endpoint": {u"type": u"tcp", u"port": 8080},
+            u"paths": {u"/": {u"type": u"static", u"directory": u"."}},
+            u"options": options,
+        }
+
+    def test_http2(self):
+        checkconfig.check_listening_transport_web(self.personality, self._transport({
+            u"http2": {
+                u"enable": True,
+                u"max_concurrent_streams": 100,
+                u"initial_window_size": 1048576,
+                u"connection_window_size": 4194304,
+            }
+        }))
+
+    def test_http2_window_too_large(self):
+        with self.assertRaises(checkconfig.InvalidConfigException) as ctx:
+            checkconfig.check_listening_transport_web(self.personality, self._transport({
+                u"http2": {u"initial_window_size": 2**31}
+            }))
+        self.assertIn("initial_window_size", str(ctx.exception))
+
+    def test_http2_unknown_attr(self):
+        with self.assertRaises(checkconfig.InvalidConfigException) as ctx:
+            checkconfig.check_listening_transport_web(self.personality, self._transport({
+                u"http2": {u"push": True}
+            }))
+        self.assertIn("push", str(ctx.exception))
@@ -0,0 +1,193 @@
+#####################################################################################
+#
+#  Copyright (c) Crossbar.io Technologies GmbH
+#
+#  Unless a separate license agreement exists between you and Crossbar.io GmbH (e.g.
+#  you have purchased a commercial license), the license terms below apply.
+#
+#  Should you enter into a separate license agreement after having received a copy of
+#  this software, then the terms of such license agreement replace the terms below at
+#  the time at which such license agreement becomes effective.
+#
+#  In case a separate license agreement ends, and such agreement ends without being
+#  replaced by another separate license agreement, the license terms below apply
+#  from the time at which said agreement ends.
+#
+#  LICENSE TERMS
+#
+#  This program is free software: you can redistribute it and/or modify it under the
+#  terms of the GNU Affero General Public License, version 3, as published by the
+#  Free Software Foundation. This program is distributed in the hope that it will be
+#  useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#  See the GNU Affero General Public License Version 3 for more details.
+#
+#  You should have received a copy of the GNU Affero General Public license along
+#  with this program. If not, see <http://www.gnu.org/licenses/agpl-3.0.en.html>.
+#
+#####################################################################################
+
+from __future__ import absolute_import
+
+import sys
+import time
+
+import txaio
+txaio.use_twisted()  # noqa
+
+import mock
+
+from twisted.trial.unittest import TestCase
+
+from crossbar.common import profiler
+from crossbar.common.profiler import SamplingProfiler, collapse, diff_collapsed
+
+
+def _leaf():
+    return sys._getframe()
+
+
+def _caller():
+    return _leaf()
+
+
+class SamplingProfilerTests(TestCase):
+    """
+    Tests for the continuous sampling profiler.
+    """
+
+    if not profiler._HAS_ITIMER:
+        skip = "interval timers not available on this platform"
+
+    def setUp(self):
+        self.now = 1000.
+        patcher = mock.patch('crossbar.common.profiler.time.time', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.profiler = SamplingProfiler()
+
+        # a period long enough for no real sample to be taken: samples are taken
+        # explicitly by the tests
+        self.profiler.start(period=1000, window=30, resolution=10)
+        self.addCleanup(lambda: self.profiler.stop() if self.profiler.is_running else None)
+
+    def _sample(self, frame, count=1):
+        for _ in range(count):
+            self.profiler._sample(None, frame)
+
+    def test_collapsed(self):
+        frame = _caller()
+        self._sample(frame, 3)
+
+        snapshot = self.profiler.snapshot()
+        self.assertEqual(snapshot[u'samples'], 3)
+        (stack, count), = snapshot[u'stacks'].items()
+        self.assertEqual(count, 3)
+
+        frames = stack.split(u';')
+        self.assertTrue(frames[-1].startswith(u'_leaf ('))
+        self.assertTrue(frames[-2].startswith(u'_caller ('))
+        self.assertIn(__file__.rstrip('c'), frames[-1])
+
+    def test_rolling_window(self):
+        """
+        Samples older than the window are dropped.
+        """
+        frame = _leaf()
+        for _ in range(6):
+            self._sample(frame)
+            self.now += 10
+
+        # the current step and 3 complete steps (the window) are kept
+        self.assertEqual(self.profiler.snapshot()[u'samples'], 4)
+        self.assertEqual(self.profiler.marshal()[u'samples'], 4)
+        self.assertEqual(self.profiler.marshal()[u'window'], 30)
+
+    def test_windows(self):
+        """
+        Windows select the steps which started in them, so adjacent windows
+        do not share samples.
+        """
+        first, second = _leaf(), _caller()
+        self._sample(first, 2)
+        self.now += 10
+        self._sample(second, 5)
+        self.now += 5
+
+        after = self.profiler.snapshot(seconds=10)
+        before = self.profiler.snapshot(seconds=10, offset=10)
+        self.assertEqual((before[u'samples'], after[u'samples']), (2, 5))
+        self.assertEqual(before[u'started'], 1000.)
+        self.assertEqual(after[u'started'], 1010.)
+
+    def test_max_stacks(self):
+        self.profiler.stop()
+        self.profiler.start(period=1000, max_stacks=1)
+
+        self._sample(_leaf())
+        self._sample(_caller(), 2)
+
+        stacks = self.profiler.snapshot()[u'stacks']
+        self.assertEqual(len(stacks), 2)
+        self.assertEqual(stacks[u'[other]'], 2)
+
+    def test_max_depth(self):
+        self.profiler.stop()
+        self.profiler.start(period=1000, max_depth=1)
+
+        self._sample(_caller())
+
+        stack, = self.profiler.snapshot()[u'stacks']
+        self.assertEqual(stack.split(u';')[0], u'[truncated]')
+        self.assertEqual(len(stack.split(u';')), 2)
+
+    def test_invalid(self):
+        self.assertRaises(Exception, self.profiler.start)
+        self.profiler.stop()
+        self.assertRaises(Exception, self.profiler.stop)
+        self.assertRaises(Exception, self.profiler.snapshot)
+        self.assertRaises(Exception, self.profiler.start, clock=u'sundial')
+        self.assertRaises(Exception, self.profiler.start, period=0)
+        self.assertFalse(self.profiler.is_running)
+
+
+class SamplingTests(TestCase):
+    """
+    Tests for sampling driven by an interval timer.
+    """
+
+    if not profiler._HAS_ITIMER:
+        skip = "interval timers not available on this platform"
+
+    def test_sampled(self):
+        sampler = SamplingProfiler()
+        sampler.start(period=0.001)
+        try:
+            started = time.time()
+            while time.time() - started < 0.5 and not sampler.marshal()[u'samples']:
+                sum(range(1000))
+            self.assertIn(u'test_sampled', u''.join(sampler.snapshot()[u'stacks']))
+        finally:
+            sampler.stop()
+
+
+class CollapsedTests(TestCase):
+    """
+    Tests for rendering collapsed stacks.
+    """
+
+    def test_collapse(self):
+        self.assertEqual(collapse({u'a;b': 2, u'a': 1}), u'a 1\na;b 2\n')
+
+    def test_diff(self):
+        before = {u'a;b': 2, u'a;c': 2}
+        after = {u'a;b': 4, u'a;d': 4}
+        self.assertEqual(diff_collapsed(before, after, normalize=False), u'a;b 2 4\na;c 2 0\na;d 0 4\n')
+
+    def test_diff_normalized(self):
+        before = {u'a;b': 2, u'a;c': 2}
+        after = {u'a;b': 4, u'a;d': 4}
+        self.assertEqual(diff_collapsed(before, after), u'a;b 4 4\na;c 4 0\na;d 0 4\n')
+        self.assertEqual(diff_collapsed({}, after), u'a;b 0 4\na;d 0 4\n')
@@ -134,6 +134,14 @@ class RouterWebService(object):
         web_path = path.encode('utf8')
         self._resource.putChild(web_path, webservice._resource)
 
+    def stop(self):
+        """
+        Stop this Web service and the Web services on its subpaths (release
+        what they hold beyond their resources, like threads).
+        """
+        for webservice in self._paths.values():
+            webservice.stop()
+
     @property
     def path(self):
         return self._path
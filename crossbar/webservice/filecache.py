@@ -0,0 +1,363 @@
+#####################################################################################
+#
+#  Copyright (c) Crossbar.io Technologies GmbH
+#
+#  Unless a separate license agreement exists between you and Crossbar.io GmbH (e.g.
+#  you have purchased a commercial license), the license terms below apply.
+#
+#  Should you enter into a separate license agreement after having received a copy of
+#  this software, then the terms of such license agreement replace the terms below at
+#  the time at which such license agreement becomes effective.
+#
+#  In case a separate license agreement ends, and such agreement ends without being
+#  replaced by another separate license agreement, the license terms below apply
+#  from the time at which said agreement ends.
+#
+#  LICENSE TERMS
+#
+#  This program is free software: you can redistribute it and/or modify it under the
+#  terms of the GNU Affero General Public License, version 3, as published by the
+#  Free Software Foundation. This program is distributed in the hope that it will be
+#  useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#  See the GNU Affero General Public License Version 3 for more details.
+#
+#  You should have received a copy of the GNU Affero General Public license along
+#  with this program. If not, see <http://www.gnu.org/licenses/agpl-3.0.en.html>.
+#
+#####################################################################################
+
+from __future__ import absolute_import
+
+import gzip
+import hashlib
+import io
+import os
+import sys
+
+from collections import OrderedDict
+
+from twisted.internet.threads import deferToThread
+from twisted.web import http
+
+from txaio import make_logger
+
+try:
+    import brotli
+except ImportError:
+    HAS_BROTLI = False
+else:
+    HAS_BROTLI = True
+
+__all__ = ('FileCache', 'HAS_BROTLI')
+
+
+# content types worth compressing (besides text/*)
+COMPRESSIBLE_TYPES = set([
+    'application/javascript',
+    'application/json',
+    'application/xml',
+    'application/wasm',
+    'image/svg+xml',
+])
+
+
+def _native_path(path):
+    # absolute paths as native strings: paths of Twisted File resources are bytes on Python 3, while file
+    # system watcher events carry str paths
+    if isinstance(path, bytes) and not isinstance(path, str):
+        path = path.decode(sys.getfilesystemencoding())
+    return os.path.abspath(path)
+
+
+def _accepted_encodings(accept_encoding):
+    """
+    Parse an Accept-Encoding header into a map of content coding to
+    quality value.
+    """
+    accepted = {}
+    for part in accept_encoding.lower().split(b','):
+        params = part.split(b';')
+        quality = 1.
+        for param in params[1:]:
+            name, _, value = param.partition(b'=')
+            if name.strip() == b'q':
+                try:
+                    quality = float(value.strip())
+                except ValueError:
+                    quality = 0.
+        accepted[params[0].strip()] = quality
+    return accepted
+
+
+def _gzip(data):
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=9, mtime=0) as f:
+        f.write(data)
+    return buf.getvalue()
+
+
+class CachedFile(object):
+    """
+    A file held in memory, with its precomputed compressed variants and
+    HTTP validators.
+    """
+
+    __slots__ = ('path', 'mtime', 'size', 'data', 'variants', 'compressing', 'etag', 'last_modified')
+
+    def __init__(self, path, mtime, data, variants, etag):
+        self.path = path
+        self.mtime = mtime
+        self.size = len(data)
+        self.data = data
+
+        # content encoding (b'gzip' or b'br') -> compressed data
+        self.variants = variants
+
+        # Deferred firing when the compressed variants are done (while they
+        # are computed in a thread)
+        self.compressing = None
+
+        self.etag = etag
+        self.last_modified = http.datetimeToString(mtime)
+
+    @property
+    def memory(self):
+        return self.size + sum(len(data) for data in self.variants.values())
+
+    def select(self, accept_encoding):
+        """
+        Select the variant to send, given the Accept-Encoding header of a
+        request.
+
+        :returns: A triple ``(encoding, data, etag)``, where encoding is
+            ``None`` for the uncompressed file.
+        """
+        if accept_encoding and self.variants:
+            accepted = _accepted_encodings(accept_encoding)
+            selected, selected_quality = None, 0.
+            for encoding in (b'br', b'gzip'):
+                if encoding in self.variants:
+                    # a quality of 0 means "not acceptable"
+                    quality = accepted.get(encoding, accepted.get(b'*', 0.))
+                    if quality > selected_quality:
+                        selected, selected_quality = encoding, quality
+            if selected is not None:
+                return selected, self.variants[selected], self.etag[:-1] + b'-' + selected + b'"'
+        return None, self.data, self.etag
+
+
+class FileCache(object):
+    """
+    In-memory cache of the files served by a static Web service.
+
+    Files up to ``max_file_size`` bytes are loaded on first request (or
+    preloaded), with their gzip (and brotli, when available) compressed
+    variants and ETag computed once. The variants are compressed in a
+    thread, and the file is served uncompressed until they are done. The
+    cache holds at most ``max_size`` bytes (including the compressed
+    variants), evicting the least recently used files.
+
+    Cached files are invalidated by calling :meth:`invalidate` (e.g. from a
+    :class:`crossbar.common.fswatcher.FilesystemWatcher`). When nothing
+    calls it (``validate=True``), files are checked for modification on
+    every request instead (against the modification time and size passed
+    to :meth:`get`, or with a ``stat()``).
+    """
+
+    log = make_logger()
+
+    def __init__(self, max_size=64 * 2**20, max_file_size=2**20, compression=(u'gzip', u'br'),
+                 min_compress_size=256, validate=True, compress_in_thread=True):
+        """
+
+        :param max_size: The maximum size (in bytes) of all cached data.
+        :type max_size: int
+        :param max_file_size: The maximum size (in bytes) of a file to be cached.
+        :type max_file_size: int
+        :param compression: The compressed variants to store.
+        :type compression: list of str
+        :param min_compress_size: The minimum size (in bytes) of a file to be compressed.
+        :type min_compress_size: int
+        :param validate: Check files for modification on every request.
+        :type validate: bool
+        :param compress_in_thread: Compress files in a thread (else right
+            when they are loaded).
+        :type compress_in_thread: bool
+        """
+        self.max_size = max_size
+        self.max_file_size = max_file_size
+        self.min_compress_size = min_compress_size
+        self.validate = validate
+        self.compress_in_thread = compress_in_thread
+
+        self._compressors = []
+        if u'br' in compression and HAS_BROTLI:
+            self._compressors.append((b'br', brotli.compress))
+        if u'gzip' in compression:
+            self._compressors.append((b'gzip', _gzip))
+
+        # path -> CachedFile, least recently used first
+        self._files = OrderedDict()
+        self.size = 0
+
+        # statistics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._files)
+
+    def get(self, path, content_type=None, mtime=None, size=None):
+        """
+        Get a file from the cache, loading it when needed.
+
+        :param path: The absolute path of the file.
+        :param content_type: The content type of the file (to decide whether
+            to compress it).
+        :param mtime: The modification time of the file, when the caller
+            just got it (to validate the cached file without a ``stat()``).
+        :param size: The size of the file (along with ``mtime``).
+
+        :returns: The cached file, or ``None`` if the file is not cached (not
+            a regular file, or too large).
+        :rtype: :class:`CachedFile`
+        """
+        path = _native_path(path)
+        entry = self._files.get(path, None)
+        if entry is not None:
+            if self.validate and not self._is_valid(entry, mtime, size):
+                self._remove(path)
+            else:
+                self._touch(path, entry)
+                self.hits += 1
+                return entry
+
+        self.misses += 1
+        entry = self._load(path, content_type)
+        if entry is not None:
+            self._add(entry)
+        return entry
+
+    def invalidate(self, path):
+        """
+        Drop a file - or all files under a directory - from the cache.
+        """
+        path = _native_path(path)
+        if path in self._files:
+            self._remove(path)
+            return
+        prefix = path.rstrip(os.sep) + os.sep
+        for cached in [p for p in self._files if p.startswith(prefix)]:
+            self._remove(cached)
+
+    def on_filesystem_event(self, event):
+        """
+        Callback for :meth:`crossbar.common.fswatcher.FilesystemWatcher.start`.
+        """
+        self.invalidate(event[u'abs_path'])
+
+    def preload(self, directory, content_type=None):
+        """
+        Load all (cacheable) files of a directory (until the cache is full).
+
+        :param content_type: Callable returning the content type for a path.
+        """
+        directory = _native_path(directory)
+        for dirpath, _, filenames in os.walk(directory):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                if path not in self._files:
+                    entry = self._load(path, content_type(path) if content_type else None)
+                    if entry is not None:
+                        if self.size + entry.memory > self.max_size:
+                            return
+                        self._add(entry)
+
+    def _is_valid(self, entry, mtime=None, size=None):
+        if mtime is None:
+            try:
+                st = os.stat(entry.path)
+            except OSError:
+                return False
+            mtime, size = st.st_mtime, st.st_size
+        return mtime == entry.mtime and size == entry.size
+
+    def _load(self, path, content_type):
+        try:
+            st = os.stat(path)
+            if not os.path.isfile(path) or st.st_size > self.max_file_size:
+                return None
+            with open(path, 'rb') as f:
+                data = f.read()
+        except (IOError, OSError):
+            return None
+
+        etag = u'"{}"'.format(hashlib.sha1(data).hexdigest()[:20]).encode('ascii')
+        entry = CachedFile(path, st.st_mtime, data, {}, etag)
+
+        if self._compressors and len(data) >= self.min_compress_size and self._is_compressible(content_type):
+            if self.compress_in_thread:
+                # compressing at the highest levels takes too long for the
+                # reactor thread (up to many ms per file)
+                entry.compressing = deferToThread(self._compress, data)
+                entry.compressing.addCallbacks(self._on_compressed, self._on_compress_failed,
+                                               callbackArgs=(entry,), errbackArgs=(entry,))
+            else:
+                entry.variants = self._compress(data)
+
+        return entry
+
+    def _compress(self, data):
+        variants = {}
+        for encoding, compress in self._compressors:
+            compressed = compress(data)
+            # only worth it when it saves a bit
+            if len(compressed) < len(data) * 0.9:
+                variants[encoding] = compressed
+        return variants
+
+    def _on_compressed(self, variants, entry):
+        entry.compressing = None
+        if self._files.get(entry.path, None) is not entry:
+            # dropped from the cache meanwhile
+            return
+        entry.variants = variants
+        self.size += entry.memory - entry.size
+        self._evict()
+
+    def _on_compress_failed(self, failure, entry):
+        entry.compressing = None
+        self.log.failure("Failed to compress {path}: {log_failure}", path=entry.path, failure=failure)
+
+    def _is_compressible(self, content_type):
+        if not content_type:
+            return False
+        if isinstance(content_type, bytes):
+            content_type = content_type.decode('ascii', 'ignore')
+        content_type = content_type.split(';')[0].strip().lower()
+        return content_type.startswith('text/') or content_type in COMPRESSIBLE_TYPES
+
+    def _add(self, entry):
+        if entry.memory > self.max_size:
+            return
+        self._files[entry.path] = entry
+        self.size += entry.memory
+        self._evict()
+
+    def _evict(self):
+        while self.size > self.max_size:
+            path = next(iter(self._files))
+            self._remove(path)
+            self.evictions += 1
+
+    def _touch(self, path, entry):
+        # Python 2 OrderedDict has no move_to_end()
+        del self._files[path]
+        self._files[path] = entry
+
+    def _remove(self, path):
+        entry = self._files.pop(path)
+        self.size -= entry.memory
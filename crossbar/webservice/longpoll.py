@@ -93,7 +93,10 @@ class RouterWebServiceLongPoll(RouterWebService):
                                         killAfter=options.get('session_timeout', 30),
                                         queueLimitBytes=options.get('queue_limit_bytes', 128 * 1024),
                                         queueLimitMessages=options.get('queue_limit_messages', 100),
-                                        debug_transport_id=options.get('debug_transport_id', None))
+                                        queueOverflowPolicy=options.get('queue_overflow_policy', u'kill'),
+                                        batchAlways=options.get('batch_always', False),
+                                        debug_transport_id=options.get('debug_transport_id', None),
+                                        timers=transport._worker._router_factory._timers)
         resource._templates = transport.templates
 
         return RouterWebServiceLongPoll(transport, path, config, resource)
@@ -28,12 +28,16 @@
 #
 #####################################################################################
 
+import hashlib
 import json
 import os
 
+from txaio import make_logger
+
 from twisted.python.filepath import FilePath
 from twisted.internet import reactor
-from twisted.web import server
+from twisted.internet.defer import Deferred, succeed
+from twisted.web import http, server
 from twisted.web.resource import Resource, NoResource
 from twisted.web.static import File
 from twisted.web.twcgi import CGIScript, CGIProcessProtocol
@@ -45,35 +49,109 @@ from crossbar.webservice.base import RouterWebService, Resource404, set_cross_or
 class NodeInfoResource(Resource):
     """
     Node information page.
+
+    The page is rendered from the node status, which is fetched from the
+    node controller at most every ``refresh_interval`` seconds (and served
+    from memory in between).
     """
 
     isLeaf = True
 
-    def __init__(self, templates, controller_session):
+    log = make_logger()
+
+    # placeholder the (per-request) peer is rendered as
+    _PEER = u'\ue000peer\ue000'
+
+    def __init__(self, templates, controller_session, refresh_interval=10, reactor=None):
         Resource.__init__(self)
         self._page = templates.get_template('cb_node_info.html')
         self._pid = u'{}'.format(os.getpid())
         self._controller_session = controller_session
+        self._refresh_interval = refresh_interval
+        if reactor is None:
+            from twisted.internet import reactor
+        self._reactor = reactor
+
+        # (page before peer, page after peer, ETag) of the last rendered page
+        self._rendered = None
+        self._rendered_at = None
+        self._refreshing = False
+
+        # requests waiting for the first page
+        self._waiters = []
+
+    def _get_rendered(self):
+        now = self._reactor.seconds()
+        if self._rendered is None or now - self._rendered_at >= self._refresh_interval:
+            self._refresh()
+
+        # serve the last page while a new one is being fetched
+        if self._rendered is not None:
+            return succeed(self._rendered)
+
+        d = Deferred()
+        self._waiters.append(d)
+        return d
+
+    def _refresh(self):
+        if self._refreshing:
+            return
+        self._refreshing = True
+
+        # http://twistedmatrix.com/documents/current/web/howto/web-in-60/asynchronous-deferred.html
+        d = self._controller_session.call(u'crossbar.get_status')
+        d.addCallbacks(self._refreshed, self._refresh_failed)
+
+    def _refreshed(self, node_info):
+        self._refreshing = False
+
+        s = self._page.render(cbVersion=crossbar.__version__,
+                              workerPid=self._pid,
+                              peer=self._PEER,
+                              **node_info).encode('utf8')
+        before, _, after = s.partition(self._PEER.encode('utf8'))
+
+        # weak, as the page varies with the peer
+        etag = u'W/"{}"'.format(hashlib.sha1(s).hexdigest()[:20]).encode('ascii')
+
+        self._rendered = before, after, etag
+        self._rendered_at = self._reactor.seconds()
+
+        waiters, self._waiters = self._waiters, []
+        for d in waiters:
+            d.callback(self._rendered)
+
+    def _refresh_failed(self, failure):
+        self._refreshing = False
+        self.log.warn('Could not get node status: {error}', error=failure.getErrorMessage())
+
+        waiters, self._waiters = self._waiters, []
+        for d in waiters:
+            d.errback(failure)
+
+    def _delayedRender(self, rendered, request):
+        before, after, etag = rendered
+
+        if request.setETag(etag) is http.CACHED:
+            request.finish()
+            return
 
-    def _delayedRender(self, node_info, request):
         try:
             peer = request.transport.getPeer()
             peer = u'{}:{}'.format(peer.host, peer.port)
         except:
             peer = u'?:?'
 
-        s = self._page.render(cbVersion=crossbar.__version__,
-                              workerPid=self._pid,
-                              peer=peer,
-                              **node_info)
+        request.write(before + peer.encode('utf8') + after)
+        request.finish()
 
-        request.write(s.encode('utf8'))
+    def _render_error(self, failure, request):
+        request.setResponseCode(http.SERVICE_UNAVAILABLE)
         request.finish()
 
     def render_GET(self, request):
-        # http://twistedmatrix.com/documents/current/web/howto/web-in-60/asynchronous-deferred.html
-        d = self._controller_session.call(u'crossbar.get_status')
-        d.addCallback(self._delayedRender, request)
+        d = self._get_rendered()
+        d.addCallbacks(self._delayedRender, self._render_error, callbackArgs=(request,), errbackArgs=(request,))
         return server.NOT_DONE_YET
 
 
@@ -87,16 +165,52 @@ class RouterWebServiceNodeInfo(RouterWebService):
         personality = transport.worker.personality
         personality.WEB_SERVICE_CHECKERS['nodeinfo'](personality, config)
 
-        resource = NodeInfoResource(transport.templates, transport.worker)
+        options = config.get('options', {})
+        resource = NodeInfoResource(transport.templates, transport.worker,
+                                    refresh_interval=options.get('refresh_interval', 10))
 
         return RouterWebServiceNodeInfo(transport, path, config, resource)
 
 
+class MetricsResource(Resource):
+    """
+    Metrics of the router worker in the Prometheus text exposition format.
+    """
+
+    isLeaf = True
+
+    def __init__(self, registry):
+        Resource.__init__(self)
+        self._registry = registry
+
+    def render_GET(self, request):
+        request.setHeader(b'content-type', b'text/plain; version=0.0.4; charset=utf-8')
+        request.setHeader(b'cache-control', b'no-store, no-cache, must-revalidate, max-age=0')
+        return self._registry.render()
+
+
+class RouterWebServiceMetrics(RouterWebService):
+    """
+    Router metrics Web service (to be scraped by Prometheus).
+    """
+
+    @staticmethod
+    def create(transport, path, config):
+        personality = transport.worker.personality
+        personality.WEB_SERVICE_CHECKERS['metrics'](personality, config)
+
+        resource = MetricsResource(transport.worker.router_factory._metrics)
+
+        return RouterWebServiceMetrics(transport, path, config, resource)
+
+
 class JsonResource(Resource):
     """
     Static Twisted Web resource that renders to a JSON document.
     """
 
+    log = make_logger()
+
     def __init__(self, value, options=None):
         Resource.__init__(self)
         options = options or {}
@@ -109,6 +223,9 @@ class JsonResource(Resource):
         # Twisted Web render_METHOD methods are expected to return a byte string
         self._data = self._data.encode('utf8')
 
+        # the value never changes, so neither does the ETag
+        self._etag = u'"{}"'.format(hashlib.sha1(self._data).hexdigest()[:20]).encode('ascii')
+
         self._allow_cross_origin = options.get('allow_cross_origin', True)
         self._discourage_caching = options.get('discourage_caching', False)
 
@@ -122,7 +239,7 @@ class JsonResource(Resource):
         # note: both args to request.setHeader are supposed to be byte strings
         # https://twistedmatrix.com/documents/current/api/twisted.web.http.Request.html#setHeader
         #
-        request.setHeader(b'content-type', b'application/json; charset=utf8-8')
+        request.setHeader(b'content-type', b'application/json; charset=utf-8')
 
         # set response headers for cross-origin requests
         #
@@ -138,6 +255,11 @@ class JsonResource(Resource):
         if self._requests_served % 10000 == 0:
             self.log.debug("Served {requests_served} requests", requests_served=self._requests_served)
 
+        # answer conditional requests with the same ETag with a 304
+        #
+        if request.setETag(self._etag) is http.CACHED:
+            return b''
+
         return self._data
 
 
@@ -153,7 +275,7 @@ class RouterWebServiceJson(RouterWebService):
 
         value = config['value']
 
-        resource = JsonResource(value)
+        resource = JsonResource(value, config.get('options', {}))
 
         return RouterWebServiceJson(transport, path, config, resource)
 
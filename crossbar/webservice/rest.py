@@ -90,6 +90,12 @@ class RouterWebServiceRestCaller(RouterWebService):
         #
         resource = CallerResource(config.get('options', {}), caller_session)
 
+        # expose the hit/miss statistics of the response cache
+        #
+        stats_procedure = config.get('options', {}).get('cache', {}).get('stats_procedure', None)
+        if stats_procedure:
+            caller_session.register(resource.get_cache_stats, stats_procedure)
+
         return RouterWebServiceRestCaller(transport, path, config, resource)
 
 
@@ -37,9 +37,11 @@ import importlib
 
 from autobahn.wamp import ApplicationError
 from twisted.web import http
-from twisted.web.static import File
+from twisted.web.static import File, getTypeAndEncoding
 
+from crossbar.common.fswatcher import HAS_FS_WATCHER, FilesystemWatcher
 from crossbar.common.twisted.web import patchFileContentTypes
+from crossbar.webservice.filecache import FileCache
 from crossbar.webservice.base import RouterWebService, Resource404, set_cross_origin_headers
 
 DEFAULT_CACHE_TIMEOUT = 12 * 60 * 60
@@ -58,6 +60,7 @@ class StaticResource(File):
     def __init__(self, *args, **kwargs):
         self._cache_timeout = kwargs.pop('cache_timeout', None)
         self._allow_cross_origin = kwargs.pop('allow_cross_origin', True)
+        self._file_cache = kwargs.pop('file_cache', None)
         File.__init__(self, *args, **kwargs)
 
     def render_GET(self, request):
@@ -70,8 +73,66 @@ class StaticResource(File):
         if self._allow_cross_origin:
             set_cross_origin_headers(request)
 
+        if self._file_cache is not None:
+            body = self._render_cached(request)
+            if body is not None:
+                return body
+
         return File.render_GET(self, request)
 
+    def _render_cached(self, request):
+        """
+        Serve a regular file from the in-memory file cache.
+
+        :returns: The response body, or ``None`` when the file can't be served
+            from the cache (range requests, directories, pre-encoded or
+            too large files).
+        """
+        if request.getHeader(b'range') is not None:
+            return None
+
+        # the file was stat()ed to find the resource (or is now, once): neither
+        # this check nor validating the cached file needs another stat()
+        if not self.isfile():
+            return None
+
+        if self.type is None:
+            self.type, self.encoding = getTypeAndEncoding(self.basename(), self.contentTypes,
+                                                          self.contentEncodings, self.defaultType)
+        if self.encoding is not None:
+            return None
+
+        entry = self._file_cache.get(self.path, self.type, mtime=self.getModificationTime(), size=self.getsize())
+        if entry is None:
+            return None
+
+        encoding, data, etag = entry.select(request.getHeader(b'accept-encoding'))
+
+        request.setHeader(b'accept-ranges', b'bytes')
+        if self.type:
+            request.setHeader(b'content-type', self.type)
+        if entry.variants or entry.compressing is not None:
+            request.setHeader(b'vary', b'Accept-Encoding')
+        if encoding is not None:
+            request.setHeader(b'content-encoding', encoding)
+
+        if request.setETag(etag) is http.CACHED:
+            return b''
+
+        request.setHeader(b'last-modified', entry.last_modified)
+        if request.getHeader(b'if-none-match') is None:
+            modified_since = request.getHeader(b'if-modified-since')
+            if modified_since is not None:
+                try:
+                    modified_since = http.stringToDatetime(modified_since.split(b';', 1)[0])
+                except ValueError:
+                    modified_since = None
+                if modified_since is not None and modified_since >= int(entry.mtime):
+                    request.setResponseCode(http.NOT_MODIFIED)
+                    return b''
+
+        return data
+
     def createSimilarFile(self, *args, **kwargs):
         #
         # File.getChild uses File.createSimilarFile to make a new resource of the same class to serve actual files under
@@ -82,6 +143,7 @@ class StaticResource(File):
 
         # need to manually set this - above explicitly enumerates constructor args
         similar_file._cache_timeout = self._cache_timeout
+        similar_file._file_cache = self._file_cache
 
         return similar_file
 
@@ -100,6 +162,19 @@ class RouterWebServiceStatic(RouterWebService):
     Static file serving Web service.
     """
 
+    # FilesystemWatcher invalidating the in-memory file cache (if any)
+    _watcher = None
+
+    def stop(self):
+        RouterWebService.stop(self)
+        if self._watcher is not None:
+            watcher, trigger = self._watcher
+            self._watcher = None
+            watcher.stop()
+
+            from twisted.internet import reactor
+            reactor.removeSystemEventTrigger(trigger)
+
     @staticmethod
     def create(transport, path, config):
 
@@ -144,7 +219,14 @@ class RouterWebServiceStatic(RouterWebService):
         cache_timeout = static_options.get('cache_timeout', DEFAULT_CACHE_TIMEOUT)
         allow_cross_origin = static_options.get('allow_cross_origin', True)
 
-        resource = static_resource_class(static_dir, cache_timeout=cache_timeout, allow_cross_origin=allow_cross_origin)
+        # in-memory cache of (small) files, with precomputed compressed variants
+        #
+        file_cache, watcher = None, None
+        if 'memory_cache' in static_options:
+            file_cache, watcher = RouterWebServiceStatic._create_file_cache(static_dir, static_options['memory_cache'])
+
+        resource = static_resource_class(static_dir, cache_timeout=cache_timeout, allow_cross_origin=allow_cross_origin,
+                                         file_cache=file_cache)
 
         # set extra MIME types
         #
@@ -157,4 +239,35 @@ class RouterWebServiceStatic(RouterWebService):
         #
         resource.childNotFound = Resource404(transport.templates, static_dir)
 
-        return RouterWebServiceStatic(transport, path, config, resource)
+        if file_cache is not None and static_options['memory_cache'].get('preload', False):
+            def content_type(filename):
+                return getTypeAndEncoding(filename, resource.contentTypes, resource.contentEncodings,
+                                          resource.defaultType)[0]
+            file_cache.preload(static_dir, content_type)
+
+        webservice = RouterWebServiceStatic(transport, path, config, resource)
+        webservice._watcher = watcher
+        return webservice
+
+    @staticmethod
+    def _create_file_cache(static_dir, options):
+        watch = options.get('watch', True) and HAS_FS_WATCHER
+
+        file_cache = FileCache(max_size=options.get('max_size', 64 * 2**20),
+                               max_file_size=options.get('max_file_size', 2**20),
+                               compression=options.get('compression', [u'gzip', u'br']),
+                               validate=not watch)
+
+        if not watch:
+            return file_cache, None
+
+        # invalidate cached files when they change on disk, instead of
+        # checking every file on every request. the watcher thread is
+        # stopped with the Web service, or else at shutdown
+        watcher = FilesystemWatcher(watched_dirs=[static_dir.decode('ascii')])
+        watcher.start(file_cache.on_filesystem_event)
+
+        from twisted.internet import reactor
+        trigger = reactor.addSystemEventTrigger('before', 'shutdown', watcher.stop)
+
+        return file_cache, (watcher, trigger)
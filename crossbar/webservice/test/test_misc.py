@@ -0,0 +1,168 @@
+#####################################################################################
+#
+#  Copyright (c) Crossbar.io Technologies GmbH
+#
+#  Unless a separate license agreement exists between you and Crossbar.io GmbH (e.g.
+#  you have purchased a commercial license), the license terms below apply.
+#
+#  Should you enter into a separate license agreement after having received a copy of
+#  this software, then the terms of such license agreement replace the terms below at
+#  the time at which such license agreement becomes effective.
+#
+#  In case a separate license agreement ends, and such agreement ends without being
+#  replaced by another separate license agreement, the license terms below apply
+#  from the time at which said agreement ends.
+#
+#  LICENSE TERMS
+#
+#  This program is free software: you can redistribute it and/or modify it under the
+#  terms of the GNU Affero General Public License, version 3, as published by the
+#  Free Software Foundation. This program is distributed in the hope that it will be
+#  useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#  See the GNU Affero General Public License Version 3 for more details.
+#
+#  You should have received a copy of the GNU Affero General Public license along
+#  with this program. If not, see <http://www.gnu.org/licenses/agpl-3.0.en.html>.
+#
+#####################################################################################
+
+from __future__ import absolute_import
+
+import os
+
+import jinja2
+import txaio
+txaio.use_twisted()  # noqa
+
+from twisted.internet.defer import Deferred, succeed
+from twisted.internet.task import Clock
+from twisted.trial.unittest import TestCase
+from twisted.web import http
+from twisted.web.test.requesthelper import DummyRequest
+from twisted.web.test._util import _render
+
+import crossbar
+from crossbar.router.metering import MetricsRegistry
+from crossbar.webservice.misc import JsonResource, MetricsResource, NodeInfoResource
+
+STATUS = {
+    u'title': u'Crossbar.io',
+    u'started': u'2018-07-01T00:00:00.000Z',
+    u'controller_pid': 1234,
+    u'running_workers': 2,
+    u'directory': u'/tmp/.crossbar',
+    u'pubkey': u'42c1e06fb527d041ba5f9b14166153d95fcb6123353fad4265a7fd469b269f42',
+}
+
+
+class _Request(DummyRequest):
+    """
+    A request which tells when the ETag matches.
+    """
+
+    def __init__(self, etag=None):
+        DummyRequest.__init__(self, [b''])
+        self._etag = etag
+        self.etag = None
+
+    def setETag(self, etag):
+        self.etag = etag
+        if etag == self._etag:
+            self.setResponseCode(http.NOT_MODIFIED)
+            return http.CACHED
+
+
+class JsonResourceTests(TestCase):
+
+    def test_etag(self):
+        resource = JsonResource({u'a': [1, 2]})
+
+        request = _Request()
+        self.assertEqual(resource.render_GET(request), b'{"a":[1,2]}')
+        self.assertEqual(request.responseHeaders.getRawHeaders(b'content-type'), [b'application/json; charset=utf-8'])
+
+        request = _Request(etag=request.etag)
+        self.assertEqual(resource.render_GET(request), b'')
+        self.assertEqual(request.responseCode, http.NOT_MODIFIED)
+
+
+class MetricsResourceTests(TestCase):
+
+    def test_render(self):
+        registry = MetricsRegistry(worker=u'worker001')
+        registry.realm(u'realm1').published += 1
+        resource = MetricsResource(registry)
+
+        request = _Request()
+        body = resource.render_GET(request)
+        self.assertIn(b'crossbar_router_published_total{worker="worker001",realm="realm1"} 1\n', body)
+        self.assertEqual(request.responseHeaders.getRawHeaders(b'content-type'),
+                         [b'text/plain; version=0.0.4; charset=utf-8'])
+
+
+class _Controller(object):
+
+    def __init__(self):
+        self.calls = []
+
+    def call(self, procedure):
+        d = Deferred()
+        self.calls.append(d)
+        return d
+
+
+class NodeInfoResourceTests(TestCase):
+
+    def setUp(self):
+        templates = jinja2.Environment(loader=jinja2.FileSystemLoader(
+            os.path.join(os.path.dirname(crossbar.__file__), 'webservice', 'templates')), autoescape=True)
+        self.clock = Clock()
+        self.controller = _Controller()
+        self.resource = NodeInfoResource(templates, self.controller, refresh_interval=10, reactor=self.clock)
+
+    def render(self, etag=None):
+        request = _Request(etag)
+        _render(self.resource, request)
+        return request
+
+    def test_refresh_interval(self):
+        """
+        The node status is fetched once per refresh interval.
+        """
+        first = self.render()
+        second = self.render()
+        self.assertEqual(len(self.controller.calls), 1)
+        self.assertEqual(first.written, [])
+
+        self.controller.calls[0].callback(STATUS)
+        for request in (first, second):
+            page = b''.join(request.written)
+            self.assertIn(STATUS[u'pubkey'].encode('ascii'), page)
+            self.assertIn(b'Served for ', page)
+
+        self.clock.advance(5)
+        self.render()
+        self.assertEqual(len(self.controller.calls), 1)
+
+        # the last page is served while the status is refreshed
+        self.clock.advance(5)
+        stale = self.render()
+        self.assertEqual(len(self.controller.calls), 2)
+        self.assertTrue(stale.finished)
+
+    def test_etag(self):
+        self.controller.call = lambda procedure: succeed(STATUS)
+        etag = self.render().etag
+        self.assertTrue(etag.startswith(b'W/"'))
+
+        request = self.render(etag)
+        self.assertEqual(request.responseCode, http.NOT_MODIFIED)
+        self.assertEqual(request.written, [])
+
+    def test_failure(self):
+        request = self.render()
+        self.controller.calls[0].errback(RuntimeError('controller gone'))
+        self.assertEqual(request.responseCode, http.SERVICE_UNAVAILABLE)
+        self.assertTrue(request.finished)
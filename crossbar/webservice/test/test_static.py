@@ -0,0 +1,300 @@
+#####################################################################################
+#
+#  Copyright (c) Crossbar.io Technologies GmbH
+#
+#  Unless a separate license agreement exists between you and Crossbar.io GmbH (e.g.
+#  you have purchased a commercial license), the license terms below apply.
+#
+#  Should you enter into a separate license agreement after having received a copy of
+#  this software, then the terms of such license agreement replace the terms below at
+#  the time at which such license agreement becomes effective.
+#
+#  In case a separate license agreement ends, and such agreement ends without being
+#  replaced by another separate license agreement, the license terms below apply
+#  from the time at which said agreement ends.
+#
+#  LICENSE TERMS
+#
+#  This program is free software: you can redistribute it and/or modify it under the
+#  terms of the GNU Affero General Public License, version 3, as published by the
+#  Free Software Foundation. This program is distributed in the hope that it will be
+#  useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#  See the GNU Affero General Public License Version 3 for more details.
+#
+#  You should have received a copy of the GNU Affero General Public license along
+#  with this program. If not, see <http://www.gnu.org/licenses/agpl-3.0.en.html>.
+#
+#####################################################################################
+
+from __future__ import absolute_import
+
+import gzip
+import io
+import os
+
+import mock
+import txaio
+txaio.use_twisted()  # noqa
+
+from twisted.internet import reactor
+from twisted.internet.defer import inlineCallbacks
+from twisted.trial.unittest import TestCase
+from twisted.web import http, server
+from twisted.web.resource import Resource, getChildForRequest
+from twisted.web.test.test_web import DummyChannel
+
+from crossbar.common.fswatcher import HAS_FS_WATCHER
+from crossbar.webservice.base import RouterWebService
+from crossbar.webservice.filecache import FileCache
+from crossbar.webservice.static import RouterWebServiceStatic, StaticResource
+
+
+SCRIPT = b'function hello() { return "Hello, world!"; }\n' * 100
+
+
+class FileCacheTests(TestCase):
+
+    def setUp(self):
+        self.directory = self.mktemp()
+        os.makedirs(os.path.join(self.directory, 'js'))
+        self.path = os.path.join(self.directory, 'js', 'app.js')
+        self.write(self.path, SCRIPT)
+
+    def write(self, path, data):
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def test_compressed_variant(self):
+        """
+        Compressible files get a smaller gzip variant with its own ETag.
+        """
+        cache = FileCache(compression=[u'gzip'], compress_in_thread=False)
+        entry = cache.get(self.path, 'application/javascript')
+
+        self.assertEqual(entry.data, SCRIPT)
+        with gzip.GzipFile(fileobj=io.BytesIO(entry.variants[b'gzip'])) as f:
+            self.assertEqual(f.read(), SCRIPT)
+
+        encoding, data, etag = entry.select(b'deflate, gzip;q=1.0')
+        self.assertEqual(encoding, b'gzip')
+        self.assertEqual(data, entry.variants[b'gzip'])
+        self.assertNotEqual(etag, entry.etag)
+
+        self.assertEqual(entry.select(None), (None, SCRIPT, entry.etag))
+
+    def test_quality_values(self):
+        """
+        Content codings with a quality value of 0 are not acceptable, and the
+        highest quality wins.
+        """
+        cache = FileCache(compression=[u'gzip'], compress_in_thread=False)
+        entry = cache.get(self.path, 'application/javascript')
+        entry.variants[b'br'] = b'brotli'
+
+        self.assertEqual(entry.select(b'gzip;q=0')[0], None)
+        self.assertEqual(entry.select(b'gzip;q=0, br;q=0.0')[0], None)
+        self.assertEqual(entry.select(b'*;q=0, identity')[0], None)
+        self.assertEqual(entry.select(b'br;q=0.5, gzip')[0], b'gzip')
+        self.assertEqual(entry.select(b'br, gzip')[0], b'br')
+        self.assertEqual(entry.select(b'*')[0], b'br')
+        self.assertEqual(entry.select(b'br;q=0, *')[0], b'gzip')
+
+    @inlineCallbacks
+    def test_compressed_in_thread(self):
+        """
+        Files are compressed in a thread, and served uncompressed meanwhile.
+        """
+        cache = FileCache(compression=[u'gzip'])
+        entry = cache.get(self.path, 'application/javascript')
+        size = cache.size
+
+        self.assertEqual(entry.variants, {})
+        self.assertEqual(entry.select(b'gzip'), (None, SCRIPT, entry.etag))
+
+        yield entry.compressing
+        self.assertIsNone(entry.compressing)
+        self.assertEqual(entry.select(b'gzip')[0], b'gzip')
+        self.assertEqual(cache.size, size + len(entry.variants[b'gzip']))
+
+    def test_not_compressible(self):
+        """
+        Binary files are not compressed.
+        """
+        cache = FileCache()
+        entry = cache.get(self.path, 'image/png')
+        self.assertEqual(entry.variants, {})
+
+    def test_hits(self):
+        """
+        Files are loaded once, and reloaded when modified.
+        """
+        cache = FileCache(validate=True)
+        first = cache.get(self.path)
+        self.assertIs(cache.get(self.path), first)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        self.write(self.path, b'changed')
+        os.utime(self.path, (first.mtime + 10, first.mtime + 10))
+        self.assertEqual(cache.get(self.path).data, b'changed')
+
+    def test_validate_with_stat(self):
+        """
+        Files are validated against the modification time and size passed in,
+        without another stat().
+        """
+        cache = FileCache(validate=True)
+        first = cache.get(self.path)
+
+        with mock.patch('os.stat', side_effect=AssertionError('stat() called')):
+            self.assertIs(cache.get(self.path, mtime=first.mtime, size=first.size), first)
+
+        self.write(self.path, b'changed')
+        self.assertEqual(cache.get(self.path, mtime=first.mtime + 10, size=7).data, b'changed')
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_invalidate_directory(self):
+        """
+        Invalidating a directory drops all files below it.
+        """
+        cache = FileCache(validate=False)
+        cache.get(self.path)
+        self.assertEqual(len(cache), 1)
+
+        cache.on_filesystem_event({u'abs_path': os.path.abspath(os.path.join(self.directory, 'js'))})
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.size, 0)
+
+    def test_eviction(self):
+        """
+        The least recently used files are evicted when the cache is full.
+        """
+        paths = []
+        for i in range(3):
+            path = os.path.join(self.directory, 'file{}.bin'.format(i))
+            self.write(path, b'x' * 100)
+            paths.append(path)
+
+        cache = FileCache(max_size=250)
+        cache.get(paths[0])
+        cache.get(paths[1])
+        cache.get(paths[0])
+        cache.get(paths[2])
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual(cache.size, 200)
+        self.assertEqual(cache.hits, 1)
+        cache.get(paths[0])
+        self.assertEqual(cache.hits, 2)
+
+    def test_too_large(self):
+        """
+        Files larger than max_file_size are not cached.
+        """
+        cache = FileCache(max_file_size=100)
+        self.assertIsNone(cache.get(self.path))
+        self.assertIsNone(cache.get(self.directory))
+
+    def test_preload(self):
+        cache = FileCache()
+        cache.preload(self.directory)
+        self.assertEqual(len(cache), 1)
+        cache.get(self.path)
+        self.assertEqual((cache.hits, cache.misses), (1, 0))
+
+
+class StaticResourceTests(TestCase):
+
+    def setUp(self):
+        self.directory = self.mktemp()
+        os.makedirs(self.directory)
+        with open(os.path.join(self.directory, 'app.js'), 'wb') as f:
+            f.write(SCRIPT)
+        self.cache = FileCache(compression=[u'gzip'], compress_in_thread=False)
+        self.resource = StaticResource(self.directory.encode('ascii'), file_cache=self.cache)
+
+    def render(self, headers=None):
+        request = server.Request(DummyChannel(), False)
+        request.method = b'GET'
+        request.uri = request.path = b'/app.js'
+        request.prepath = []
+        request.postpath = [b'app.js']
+        for name, value in (headers or {}).items():
+            request.requestHeaders.setRawHeaders(name, [value])
+        resource = getChildForRequest(self.resource, request)
+        body = resource.render(request)
+        return request, body
+
+    def test_gzip(self):
+        """
+        Clients accepting gzip get the precomputed compressed file.
+        """
+        request, body = self.render({b'accept-encoding': b'gzip'})
+        entry = self.cache.get(os.path.abspath(os.path.join(self.directory, 'app.js')))
+
+        self.assertEqual(body, entry.variants[b'gzip'])
+        self.assertEqual(request.responseHeaders.getRawHeaders(b'content-encoding'), [b'gzip'])
+        self.assertEqual(request.responseHeaders.getRawHeaders(b'vary'), [b'Accept-Encoding'])
+        self.assertEqual(request.responseHeaders.getRawHeaders(b'last-modified'), [entry.last_modified])
+
+    def test_identity(self):
+        request, body = self.render()
+        self.assertEqual(body, SCRIPT)
+        self.assertIsNone(request.responseHeaders.getRawHeaders(b'content-encoding'))
+
+    def test_not_modified(self):
+        """
+        Conditional requests matching the ETag get a 304.
+        """
+        request, body = self.render()
+        etag = request.etag
+        last_modified = request.responseHeaders.getRawHeaders(b'last-modified')[0]
+
+        request, body = self.render({b'if-none-match': etag})
+        self.assertEqual(request.code, http.NOT_MODIFIED)
+        self.assertEqual(body, b'')
+
+        request, body = self.render({b'if-modified-since': last_modified})
+        self.assertEqual(request.code, http.NOT_MODIFIED)
+
+    def test_range_from_disk(self):
+        """
+        Range requests bypass the cache.
+        """
+        self.render({b'range': b'bytes=0-9'})
+        self.assertEqual(len(self.cache), 0)
+
+
+class RouterWebServiceStaticTests(TestCase):
+
+    def setUp(self):
+        self.directory = os.path.abspath(self.mktemp())
+        os.makedirs(self.directory)
+
+    def test_stop_watcher(self):
+        """
+        The filesystem watcher of the file cache is stopped with the Web
+        service, also when stopping the Web service it is nested under.
+        """
+        if not HAS_FS_WATCHER:
+            raise self.skipTest('watchdog not installed')
+
+        file_cache, watcher = RouterWebServiceStatic._create_file_cache(self.directory.encode('ascii'), {})
+        self.assertFalse(file_cache.validate)
+        self.addCleanup(watcher[0].stop)
+        self.assertTrue(watcher[0].is_started())
+
+        webservice = RouterWebServiceStatic(mock.Mock(), u'static', {}, Resource())
+        webservice._watcher = watcher
+        root = RouterWebService(mock.Mock(), u'/', {}, Resource())
+        root[u'static'] = webservice
+
+        with mock.patch.object(reactor, 'removeSystemEventTrigger') as remove:
+            root.stop()
+            webservice.stop()
+
+        self.assertFalse(watcher[0].is_started())
+        remove.assert_called_once_with(watcher[1])
+        reactor.removeSystemEventTrigger(watcher[1])
@@ -0,0 +1,274 @@
+#####################################################################################
+#
+#  Copyright (c) Crossbar.io Technologies GmbH
+#
+#  Unless a separate license agreement exists between you and Crossbar.io GmbH (e.g.
+#  you have purchased a commercial license), the license terms below apply.
+#
+#  Should you enter into a separate license agreement after having received a copy of
+#  this software, then the terms of such license agreement replace the terms below at
+#  the time at which such license agreement becomes effective.
+#
+#  In case a separate license agreement ends, and such agreement ends without being
+#  replaced by another separate license agreement, the license terms below apply
+#  from the time at which said agreement ends.
+#
+#  LICENSE TERMS
+#
+#  This program is free software: you can redistribute it and/or modify it under the
+#  terms of the GNU Affero General Public License, version 3, as published by the
+#  Free Software Foundation. This program is distributed in the hope that it will be
+#  useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#  See the GNU Affero General Public License Version 3 for more details.
+#
+#  You should have received a copy of the GNU Affero General Public license along
+#  with this program. If not, see <http://www.gnu.org/licenses/agpl-3.0.en.html>.
+#
+#####################################################################################
+
+from __future__ import absolute_import
+
+import io
+import json
+import os
+import time
+
+import txaio
+txaio.use_twisted()  # noqa
+
+from twisted.internet import reactor
+from twisted.internet.defer import CancelledError, inlineCallbacks, gatherResults
+from twisted.internet.error import ConnectionDone
+from twisted.internet.task import Clock
+from twisted.python.failure import Failure
+from twisted.trial.unittest import TestCase
+from twisted.web import http, server
+from twisted.web.test.test_web import DummyChannel
+
+from crossbar.webservice.wsgipool import WSGIProcessPool, WSGIProcessResource
+
+
+def application(environ, start_response):
+    """
+    WSGI application run by the worker processes of the tests.
+    """
+    if environ['PATH_INFO'] == '/sleep':
+        time.sleep(float(environ['QUERY_STRING']))
+    elif environ['PATH_INFO'] == '/crash':
+        os._exit(1)
+    elif environ['PATH_INFO'] == '/error':
+        raise RuntimeError('oops')
+
+    body = json.dumps({
+        'pid': os.getpid(),
+        'path': environ['PATH_INFO'],
+        'body': environ['wsgi.input'].read().decode('utf8'),
+    }).encode('utf8')
+    start_response('200 OK', [('Content-Type', 'application/json')])
+    return [body]
+
+
+def _environ(path, query=''):
+    return {'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query}
+
+
+class WSGIProcessPoolTests(TestCase):
+
+    def pool(self, **kwargs):
+        pool = WSGIProcessPool(reactor, __name__, 'application', **kwargs)
+        pool.start()
+        self.addCleanup(pool.stop)
+        return pool
+
+    @inlineCallbacks
+    def test_request(self):
+        pool = self.pool(processes=1)
+        status, headers, body = yield pool.submit(_environ('/hello'), b'payload')
+
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(headers, [('Content-Type', 'application/json')])
+        result = json.loads(body.decode('utf8'))
+        self.assertNotEqual(result['pid'], os.getpid())
+        self.assertEqual(result['path'], '/hello')
+        self.assertEqual(result['body'], 'payload')
+
+    @inlineCallbacks
+    def test_concurrent(self):
+        """
+        Concurrent requests are spread over the processes.
+        """
+        pool = self.pool(processes=2)
+        responses = yield gatherResults([pool.submit(_environ('/sleep', '0.2'), b'') for _ in range(4)])
+        pids = set(json.loads(body.decode('utf8'))['pid'] for _, _, body in responses)
+        self.assertEqual(len(pids), 2)
+
+    @inlineCallbacks
+    def test_max_requests(self):
+        """
+        Processes are replaced after max_requests requests.
+        """
+        pool = self.pool(processes=1, max_requests=2)
+        pids = []
+        for _ in range(4):
+            _, _, body = yield pool.submit(_environ('/'), b'')
+            pids.append(json.loads(body.decode('utf8'))['pid'])
+        self.assertEqual(pids[0], pids[1])
+        self.assertEqual(pids[2], pids[3])
+        self.assertNotEqual(pids[1], pids[2])
+
+    @inlineCallbacks
+    def test_overloaded(self):
+        """
+        Requests beyond max_queue are rejected right away.
+        """
+        pool = self.pool(processes=1, max_queue=1)
+        yield pool.submit(_environ('/'), b'')
+
+        busy = pool.submit(_environ('/sleep', '0.2'), b'')
+        queued = pool.submit(_environ('/'), b'')
+        try:
+            yield pool.submit(_environ('/'), b'')
+        except Exception as e:
+            self.assertEqual(e.error, u'crossbar.error.wsgi_overloaded')
+        else:
+            self.fail('request not rejected')
+        yield gatherResults([busy, queued])
+
+    @inlineCallbacks
+    def test_crash(self):
+        """
+        A crashing process fails its request and is restarted.
+        """
+        pool = self.pool(processes=1)
+        try:
+            yield pool.submit(_environ('/crash'), b'')
+        except Exception as e:
+            self.assertEqual(e.error, u'crossbar.error.wsgi_process_lost')
+        else:
+            self.fail('request did not fail')
+
+        status, _, _ = yield pool.submit(_environ('/'), b'')
+        self.assertEqual(status, '200 OK')
+
+    @inlineCallbacks
+    def test_timeout(self):
+        pool = self.pool(processes=1, timeout=2)
+        try:
+            yield pool.submit(_environ('/sleep', '10'), b'')
+        except Exception as e:
+            self.assertEqual(e.error, u'crossbar.error.wsgi_timeout')
+        else:
+            self.fail('request did not time out')
+
+        status, _, _ = yield pool.submit(_environ('/'), b'')
+        self.assertEqual(status, '200 OK')
+
+    def test_timeout_queued(self):
+        """
+        The timeout covers the time a request waits for a process.
+        """
+        clock = Clock()
+        pool = WSGIProcessPool(clock, __name__, 'application', processes=1, timeout=5)
+        d = pool.submit(_environ('/'), b'')
+        self.assertEqual(pool.stats()[u'queued'], 1)
+
+        clock.advance(5)
+        self.assertEqual(self.failureResultOf(d).value.error, u'crossbar.error.wsgi_timeout')
+        self.assertEqual(pool.stats()[u'queued'], 0)
+
+    def test_cancel_queued(self):
+        clock = Clock()
+        pool = WSGIProcessPool(clock, __name__, 'application', processes=1, timeout=5)
+        d = pool.submit(_environ('/'), b'')
+
+        d.cancel()
+        self.failureResultOf(d, CancelledError)
+        self.assertEqual(pool.stats()[u'queued'], 0)
+        self.assertEqual(clock.getDelayedCalls(), [])
+
+    @inlineCallbacks
+    def test_application_not_loaded(self):
+        """
+        Waiting requests fail when the processes cannot load the application.
+        """
+        pool = WSGIProcessPool(reactor, __name__, 'no_such_application', processes=1)
+        pool.start()
+        self.addCleanup(pool.stop)
+        try:
+            yield pool.submit(_environ('/'), b'')
+        except Exception as e:
+            self.assertEqual(e.error, u'crossbar.error.wsgi_unavailable')
+            self.assertIn(u'no_such_application', e.args[0])
+        else:
+            self.fail('request did not fail')
+
+    @inlineCallbacks
+    def test_application_error(self):
+        pool = self.pool(processes=1)
+        status, _, _ = yield pool.submit(_environ('/error'), b'')
+        self.assertEqual(status, '500 Internal Server Error')
+
+
+def _request(path):
+    request = server.Request(DummyChannel(), False)
+    request.method = b'GET'
+    request.uri = request.path = path
+    request.prepath = []
+    request.postpath = path.split(b'?')[0].split(b'/')[1:]
+    request.clientproto = b'HTTP/1.1'
+    request.content = io.BytesIO()
+    return request
+
+
+class WSGIProcessResourceTests(TestCase):
+
+    @inlineCallbacks
+    def test_render(self):
+        pool = WSGIProcessPool(reactor, __name__, 'application', processes=1)
+        pool.start()
+        self.addCleanup(pool.stop)
+
+        request = _request(b'/hello?x=1')
+        channel = request.channel
+        WSGIProcessResource(pool).render(request)
+        yield request.notifyFinish()
+
+        self.assertEqual(request.code, 200)
+        self.assertEqual(request.responseHeaders.getRawHeaders(b'content-type'), [b'application/json'])
+        response = channel.transport.written.getvalue()
+        self.assertIn(b'"path": "/hello"', response)
+
+    def test_overloaded(self):
+        pool = WSGIProcessPool(reactor, __name__, 'application', processes=1, max_queue=0)
+
+        request = _request(b'/')
+        WSGIProcessResource(pool).render(request)
+
+        self.assertEqual(request.code, http.SERVICE_UNAVAILABLE)
+        self.assertEqual(request.responseHeaders.getRawHeaders(b'retry-after'), [b'1'])
+
+    def test_timeout_queued(self):
+        clock = Clock()
+        pool = WSGIProcessPool(clock, __name__, 'application', processes=1, timeout=5)
+
+        request = _request(b'/')
+        WSGIProcessResource(pool).render(request)
+        clock.advance(5)
+
+        self.assertEqual(request.code, http.GATEWAY_TIMEOUT)
+        self.assertTrue(request.finished)
+
+    def test_client_gone(self):
+        """
+        A request waiting for a process is dropped when the client goes away.
+        """
+        pool = WSGIProcessPool(Clock(), __name__, 'application', processes=1, timeout=5)
+
+        request = _request(b'/')
+        WSGIProcessResource(pool).render(request)
+        self.assertEqual(pool.stats()[u'queued'], 1)
+
+        request.connectionLost(Failure(ConnectionDone()))
+        self.assertEqual(pool.stats()[u'queued'], 0)
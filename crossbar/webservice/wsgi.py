@@ -31,6 +31,7 @@
 import sys
 import importlib
 
+from twisted.python.runtime import platform
 from twisted.python.threadpool import ThreadPool
 from twisted.web.wsgi import WSGIResource
 
@@ -38,6 +39,7 @@ from autobahn.wamp import ApplicationError
 from autobahn.twisted.resource import WSGIRootResource
 
 from crossbar.webservice.base import RouterWebService
+from crossbar.webservice.wsgipool import WSGIProcessPool, WSGIProcessResource
 
 
 class RouterWebServiceWsgi(RouterWebService):
@@ -56,6 +58,15 @@ class RouterWebServiceWsgi(RouterWebService):
         if 'object' not in config:
             raise ApplicationError(u'crossbar.error.invalid_configuration', 'missing WSGI app object')
 
+        if config.get('mode', u'thread') == u'process':
+            # the application is imported by the worker processes only (which
+            # report when it cannot be loaded), so that neither its import side
+            # effects nor its memory end up in the router
+            resource = RouterWebServiceWsgi._create_process_resource(transport, config)
+            if path == '/':
+                resource = WSGIRootResource(resource, {})
+            return RouterWebServiceWsgi(transport, path, config, resource)
+
         # import WSGI app module and object
         mod_name = config['module']
         try:
@@ -85,3 +96,24 @@ class RouterWebServiceWsgi(RouterWebService):
             raise ApplicationError(u'crossbar.error.invalid_configuration', 'could not instantiate WSGI resource: {}'.format(e))
         else:
             return RouterWebServiceWsgi(transport, path, config, resource)
+
+    @staticmethod
+    def _create_process_resource(transport, config):
+        # run the WSGI requests in a pool of worker processes, so that
+        # application code doesn't stall (or hold the GIL of) the router
+        if platform.isWindows():
+            raise ApplicationError(u'crossbar.error.invalid_configuration', 'WSGI process mode is not supported on Windows')
+
+        if getattr(sys, 'frozen', False):
+            raise ApplicationError(u'crossbar.error.invalid_configuration', 'WSGI process mode is not supported by frozen executables')
+
+        pool = WSGIProcessPool(transport.reactor, config['module'], config['object'],
+                               processes=config.get('processes', 4),
+                               max_requests=config.get('max_requests', 0),
+                               max_queue=config.get('max_queue', 100),
+                               timeout=config.get('timeout', 60),
+                               path=transport.cbdir)
+        transport.reactor.addSystemEventTrigger('before', 'shutdown', pool.stop)
+        pool.start()
+
+        return WSGIProcessResource(pool)
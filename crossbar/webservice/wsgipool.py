@@ -0,0 +1,480 @@
+#####################################################################################
+#
+#  Copyright (c) Crossbar.io Technologies GmbH
+#
+#  Unless a separate license agreement exists between you and Crossbar.io GmbH (e.g.
+#  you have purchased a commercial license), the license terms below apply.
+#
+#  Should you enter into a separate license agreement after having received a copy of
+#  this software, then the terms of such license agreement replace the terms below at
+#  the time at which such license agreement becomes effective.
+#
+#  In case a separate license agreement ends, and such agreement ends without being
+#  replaced by another separate license agreement, the license terms below apply
+#  from the time at which said agreement ends.
+#
+#  LICENSE TERMS
+#
+#  This program is free software: you can redistribute it and/or modify it under the
+#  terms of the GNU Affero General Public License, version 3, as published by the
+#  Free Software Foundation. This program is distributed in the hope that it will be
+#  useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#  See the GNU Affero General Public License Version 3 for more details.
+#
+#  You should have received a copy of the GNU Affero General Public license along
+#  with this program. If not, see <http://www.gnu.org/licenses/agpl-3.0.en.html>.
+#
+#####################################################################################
+
+from __future__ import absolute_import
+
+import os
+import pickle
+import struct
+import sys
+
+from collections import deque
+
+from twisted.internet import protocol
+from twisted.internet.defer import Deferred, DeferredList, fail
+from twisted.web import http, server
+from twisted.web.resource import Resource
+
+from autobahn.wamp.exception import ApplicationError
+
+from txaio import make_logger
+
+import crossbar
+
+__all__ = ('WSGIProcessPool', 'WSGIProcessResource')
+
+_HEADER = struct.Struct('!I')
+
+
+class _WSGIRequest(object):
+    """
+    A request submitted to a :class:`WSGIProcessPool`.
+    """
+
+    __slots__ = ('environ', 'body', 'd', 'timeout', 'worker')
+
+    def __init__(self, environ, body, d):
+        self.environ = environ
+        self.body = body
+        self.d = d
+
+        # the timeout call (started when the request is submitted, so that
+        # it covers the time waiting for a process)
+        self.timeout = None
+
+        # the worker serving the request (None while waiting for one)
+        self.worker = None
+
+    def callback(self, result):
+        if self.timeout is not None and self.timeout.active():
+            self.timeout.cancel()
+        # the deferred was already called when the request was cancelled
+        if not self.d.called:
+            self.d.callback(result)
+
+    def errback(self, error):
+        if self.timeout is not None and self.timeout.active():
+            self.timeout.cancel()
+        if not self.d.called:
+            self.d.errback(error)
+
+
+class _WSGIWorker(protocol.ProcessProtocol):
+    """
+    A WSGI worker process, serving one request at a time.
+    """
+
+    def __init__(self, pool):
+        self._pool = pool
+        self._buffer = b''
+        self.pid = None
+        self.served = 0
+
+        # the process loaded the application
+        self.ready = False
+
+        # no more requests are dispatched to a retired process
+        self.retired = False
+
+        # a new process was started in place of this one
+        self.replaced = False
+
+        # the request in flight
+        self.current = None
+        self.ended = Deferred()
+
+    def connectionMade(self):
+        self.pid = self.transport.pid
+
+    def dispatch(self, request):
+        request.worker = self
+        self.current = request
+        data = pickle.dumps((request.environ, request.body), 2)
+        self.transport.writeToChild(0, _HEADER.pack(len(data)) + data)
+
+    def retire(self):
+        self.retired = True
+        self.transport.closeChildFD(0)
+
+    def timed_out(self):
+        self.current = None
+        self._pool.log.warn('WSGI process {pid} did not respond within {timeout}s - killing it',
+                            pid=self.pid, timeout=self._pool.timeout)
+        self.retired = True
+        try:
+            self.transport.signalProcess('KILL')
+        except Exception:
+            pass
+
+    def childDataReceived(self, childFD, data):
+        if childFD != 3:
+            for line in data.decode('utf8', 'replace').splitlines():
+                if not line:
+                    continue
+                if childFD == 2:
+                    self._pool.log.warn('WSGI process {pid}: {line}', pid=self.pid, line=line)
+                else:
+                    self._pool.log.info('WSGI process {pid}: {line}', pid=self.pid, line=line)
+            return
+
+        self._buffer += data
+        while len(self._buffer) >= _HEADER.size:
+            length = _HEADER.unpack(self._buffer[:_HEADER.size])[0]
+            if len(self._buffer) < _HEADER.size + length:
+                break
+            message = self._buffer[_HEADER.size:_HEADER.size + length]
+            self._buffer = self._buffer[_HEADER.size + length:]
+
+            if not self.ready:
+                if message:
+                    # the application could not be loaded (the process exits)
+                    self._pool._worker_failed(self, pickle.loads(message))
+                    continue
+                # the first (empty) message tells the application was loaded
+                self.ready = True
+                self._pool._worker_idle(self)
+                continue
+
+            if self.current is None:
+                # response to a request that timed out
+                continue
+            request = self.current
+            self.current = None
+            self.served += 1
+            self._pool._worker_idle(self)
+            request.callback(pickle.loads(message))
+
+    def processEnded(self, reason):
+        if self.current is not None:
+            request = self.current
+            self.current = None
+            request.errback(ApplicationError(u'crossbar.error.wsgi_process_lost',
+                                             u'WSGI process {} exited while serving the request'.format(self.pid)))
+        self._pool._worker_ended(self, reason)
+        self.ended.callback(None)
+
+
+class WSGIProcessPool(object):
+    """
+    A pool of worker processes running a WSGI application.
+
+    Requests are dispatched, one at a time, to idle processes. When all
+    ``processes`` are busy, up to ``max_queue`` requests wait for a process,
+    further requests are rejected (with ``crossbar.error.wsgi_overloaded``).
+    Requests not answered within ``timeout`` seconds (waiting included) fail
+    with ``crossbar.error.wsgi_timeout``. A process is replaced after
+    ``max_requests`` requests, when it crashed, or when it didn't respond in
+    time.
+
+    The processes run :mod:`crossbar.webservice.wsgiworker`, reading
+    requests from their ``stdin`` and writing responses to FD 3 (like native
+    workers, so that the application may freely write to ``stdout`` and
+    ``stderr``, which are logged).
+    """
+
+    log = make_logger()
+
+    def __init__(self, reactor, module, obj, processes=4, max_requests=0, max_queue=100, timeout=60,
+                 executable=None, env=None, path=None):
+        """
+
+        :param reactor: The reactor to use.
+        :param module: The module of the WSGI application.
+        :type module: str
+        :param obj: The WSGI application object in the module.
+        :type obj: str
+        :param processes: The number of worker processes.
+        :type processes: int
+        :param max_requests: The number of requests a process serves before
+            it is replaced. If 0, processes are not replaced.
+        :type max_requests: int
+        :param max_queue: The maximum number of requests waiting for a process.
+        :type max_queue: int
+        :param timeout: The timeout (in seconds) for a request, from its
+            submission. If 0, no timeout.
+        :type timeout: float
+        :param executable: The Python executable (default: the one of the router).
+        :param env: The environment of the processes (default: the one of the
+            router, with the Python search path of the router).
+        :param path: The working directory of the processes (default: the one of
+            the router).
+        """
+        self._reactor = reactor
+        self._module = module
+        self._object = obj
+        self.processes = processes
+        self.max_requests = max_requests
+        self.max_queue = max_queue
+        self.timeout = timeout
+
+        self._executable = executable or sys.executable
+        if env is None:
+            env = dict(os.environ)
+            # the processes must find the same Crossbar.io (and application)
+            # as the router
+            pythonpath = [os.path.dirname(os.path.dirname(os.path.abspath(crossbar.__file__)))]
+            pythonpath.extend(os.path.abspath(p) for p in sys.path)
+            env['PYTHONPATH'] = os.pathsep.join(pythonpath)
+        self._env = env
+        self._path = path or os.getcwd()
+
+        self._workers = set()
+        self._idle = []
+        self._queue = deque()
+        self._stopping = False
+
+        # number of processes in a row which exited right after starting
+        self._failures = 0
+
+    def start(self):
+        for _ in range(self.processes):
+            self._spawn()
+
+    def stop(self):
+        """
+        Stop all worker processes, failing all waiting requests.
+
+        :returns: A deferred firing when all processes exited.
+        """
+        self._stopping = True
+        self._fail_queue(ApplicationError(u'crossbar.error.wsgi_stopped', u'WSGI process pool stopped'))
+        ended = []
+        for worker in list(self._workers):
+            ended.append(worker.ended)
+            if not worker.retired:
+                worker.retire()
+        return DeferredList(ended)
+
+    def submit(self, environ, body):
+        """
+        Run a request in a worker process.
+
+        :param environ: The WSGI environment (without the ``wsgi.*`` keys).
+        :type environ: dict
+        :param body: The request body.
+        :type body: bytes
+
+        :returns: A deferred firing with a triple ``(status, headers, body)``.
+            Cancelling it drops the request when it is still waiting for a
+            process.
+        """
+        if self._stopping:
+            return fail(ApplicationError(u'crossbar.error.wsgi_stopped', u'WSGI process pool stopped'))
+
+        if not self._idle and len(self._queue) >= self.max_queue:
+            return fail(ApplicationError(
+                u'crossbar.error.wsgi_overloaded',
+                u'all {} WSGI processes are busy and {} requests are waiting'.format(self.processes, len(self._queue))))
+
+        request = _WSGIRequest(environ, body, Deferred(lambda _: self._cancel(request)))
+        if self.timeout:
+            request.timeout = self._reactor.callLater(self.timeout, self._timed_out, request)
+        if self._idle:
+            self._idle.pop().dispatch(request)
+        else:
+            self._queue.append(request)
+        return request.d
+
+    def stats(self):
+        return {
+            u'processes': len(self._workers),
+            u'idle': len(self._idle),
+            u'queued': len(self._queue),
+        }
+
+    def _cancel(self, request):
+        # a request in flight keeps its timeout, which kills a hanging process
+        if request.worker is None:
+            self._queue.remove(request)
+            if request.timeout is not None and request.timeout.active():
+                request.timeout.cancel()
+
+    def _timed_out(self, request):
+        if request.worker is None:
+            self._queue.remove(request)
+        else:
+            request.worker.timed_out()
+        request.errback(ApplicationError(u'crossbar.error.wsgi_timeout',
+                                         u'WSGI request timed out after {}s'.format(self.timeout)))
+
+    def _fail_queue(self, error):
+        while self._queue:
+            self._queue.popleft().errback(error)
+
+    def _spawn(self):
+        worker = _WSGIWorker(self)
+        args = [self._executable, '-u', '-m', 'crossbar.webservice.wsgiworker', self._module, self._object]
+        self._reactor.spawnProcess(worker, self._executable, args, env=self._env, path=self._path,
+                                   childFDs={0: 'w', 1: 'r', 2: 'r', 3: 'r'})
+        self._workers.add(worker)
+
+    def _worker_idle(self, worker):
+        if worker.retired:
+            return
+        if self.max_requests and worker.served >= self.max_requests:
+            self.log.debug('WSGI process {pid} served {served} requests - replacing it',
+                           pid=worker.pid, served=worker.served)
+            worker.retire()
+            worker.replaced = True
+            self._spawn()
+        elif self._queue:
+            worker.dispatch(self._queue.popleft())
+        else:
+            self._idle.append(worker)
+
+    def _worker_failed(self, worker, error):
+        self.log.error('WSGI application {module}.{object} could not be loaded: {error}',
+                       module=self._module, object=self._object, error=error)
+        self._fail_queue(ApplicationError(u'crossbar.error.wsgi_unavailable',
+                                          u'WSGI application could not be loaded: {}'.format(error)))
+
+    def _worker_ended(self, worker, reason):
+        self._workers.discard(worker)
+        if worker in self._idle:
+            self._idle.remove(worker)
+
+        if self._stopping or worker.replaced:
+            return
+
+        # crashed (or killed after a timeout)
+        if not worker.ready:
+            self._failures += 1
+        else:
+            self._failures = 0
+        self.log.warn('WSGI process {pid} exited ({reason}) - restarting it',
+                      pid=worker.pid, reason=reason.getErrorMessage())
+
+        # back off when processes die before loading the application
+        delay = min(2 ** self._failures, 60) if self._failures > 1 else 0
+        self._reactor.callLater(delay, self._respawn)
+
+    def _respawn(self):
+        if not self._stopping and len(self._workers) < self.processes:
+            self._spawn()
+
+
+class WSGIProcessResource(Resource):
+    """
+    Twisted Web resource running a WSGI application in a
+    :class:`WSGIProcessPool`.
+    """
+
+    isLeaf = True
+    log = make_logger()
+
+    def __init__(self, pool):
+        Resource.__init__(self)
+        self._pool = pool
+
+    def render(self, request):
+        request.content.seek(0)
+        body = request.content.read()
+
+        d = self._pool.submit(self._environ(request), body)
+
+        finished = []
+
+        def on_finished(result):
+            finished.append(result)
+            # the client went away: drop the request when it still waits
+            d.cancel()
+
+        request.notifyFinish().addBoth(on_finished)
+        d.addCallbacks(self._respond, self._fail, callbackArgs=(request, finished),
+                       errbackArgs=(request, finished))
+        return server.NOT_DONE_YET
+
+    @staticmethod
+    def _native(value):
+        if isinstance(value, bytes) and not isinstance(value, str):
+            return value.decode('iso-8859-1')
+        return value
+
+    def _environ(self, request):
+        # the same environment as twisted.web.wsgi.WSGIResource provides
+        if request.prepath:
+            script_name = b'/' + b'/'.join(request.prepath)
+        else:
+            script_name = b''
+
+        if request.postpath:
+            path_info = b'/' + b'/'.join(request.postpath)
+        else:
+            path_info = b''
+
+        parts = request.uri.split(b'?', 1)
+        query_string = parts[1] if len(parts) == 2 else b''
+
+        native = self._native
+        environ = {
+            'REQUEST_METHOD': native(request.method),
+            'REMOTE_ADDR': native(getattr(request.getClientAddress(), 'host', '')),
+            'SCRIPT_NAME': native(script_name),
+            'PATH_INFO': native(path_info),
+            'QUERY_STRING': native(query_string),
+            'CONTENT_TYPE': native(request.getHeader(b'content-type') or b''),
+            'CONTENT_LENGTH': native(request.getHeader(b'content-length') or b''),
+            'SERVER_NAME': native(request.getRequestHostname()),
+            'SERVER_PORT': str(request.getHost().port),
+            'SERVER_PROTOCOL': native(request.clientproto),
+            'wsgi.url_scheme': 'https' if request.isSecure() else 'http',
+        }
+        for name, values in request.requestHeaders.getAllRawHeaders():
+            name = 'HTTP_' + native(name).upper().replace('-', '_')
+            environ[name] = ','.join(native(v) for v in values)
+        return environ
+
+    def _respond(self, response, request, finished):
+        if finished:
+            return
+        status, headers, body = response
+        code, _, message = status.partition(' ')
+        request.setResponseCode(int(code), message.encode('iso-8859-1'))
+        for name, value in headers:
+            request.responseHeaders.addRawHeader(name.encode('iso-8859-1'), value.encode('iso-8859-1'))
+        request.write(body)
+        request.finish()
+
+    def _fail(self, failure, request, finished):
+        if finished:
+            return
+        error = getattr(failure.value, 'error', None)
+        if error == u'crossbar.error.wsgi_overloaded':
+            request.setResponseCode(http.SERVICE_UNAVAILABLE)
+            request.setHeader(b'retry-after', b'1')
+        elif error == u'crossbar.error.wsgi_timeout':
+            request.setResponseCode(http.GATEWAY_TIMEOUT)
+        else:
+            request.setResponseCode(http.BAD_GATEWAY)
+        self.log.warn('WSGI request {method} {uri} failed: {error}', method=request.method,
+                      uri=request.uri, error=failure.getErrorMessage())
+        request.setHeader(b'content-type', b'text/plain; charset=utf-8')
+        request.write(http.RESPONSES.get(request.code, b'Error'))
+        request.finish()
@@ -0,0 +1,152 @@
+#####################################################################################
+#
+#  Copyright (c) Crossbar.io Technologies GmbH
+#
+#  Unless a separate license agreement exists between you and Crossbar.io GmbH (e.g.
+#  you have purchased a commercial license), the license terms below apply.
+#
+#  Should you enter into a separate license agreement after having received a copy of
+#  this software, then the terms of such license agreement replace the terms below at
+#  the time at which such license agreement becomes effective.
+#
+#  In case a separate license agreement ends, and such agreement ends without being
+#  replaced by another separate license agreement, the license terms below apply
+#  from the time at which said agreement ends.
+#
+#  LICENSE TERMS
+#
+#  This program is free software: you can redistribute it and/or modify it under the
+#  terms of the GNU Affero General Public License, version 3, as published by the
+#  Free Software Foundation. This program is distributed in the hope that it will be
+#  useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#  See the GNU Affero General Public License Version 3 for more details.
+#
+#  You should have received a copy of the GNU Affero General Public license along
+#  with this program. If not, see <http://www.gnu.org/licenses/agpl-3.0.en.html>.
+#
+#####################################################################################
+
+"""
+WSGI worker process of a process-pool WSGI Web service (see
+:class:`crossbar.webservice.wsgipool.WSGIProcessPool`).
+
+Loads a WSGI application and serves requests read from FD 0 (``stdin``),
+writing responses to FD 3 (preceded by an empty message once the
+application is loaded, or by an error message when it cannot be loaded). Both are framed as a 4 byte (big endian) length
+followed by a pickled message. FD 1 and 2 (``stdout`` and ``stderr``) are
+logged by the router.
+
+    python -m crossbar.webservice.wsgiworker <module> <object>
+"""
+
+from __future__ import absolute_import
+
+import importlib
+import io
+import os
+import pickle
+import struct
+import sys
+import traceback
+
+__all__ = ('serve', 'call_application')
+
+_HEADER = struct.Struct('!I')
+
+
+def _read_exactly(stream, length):
+    chunks = []
+    while length:
+        data = stream.read(length)
+        if not data:
+            return None
+        chunks.append(data)
+        length -= len(data)
+    return b''.join(chunks)
+
+
+def call_application(app, environ, body):
+    """
+    Call a WSGI application for one request.
+
+    :returns: A triple ``(status, headers, body)``.
+    """
+    environ.update({
+        'wsgi.version': (1, 0),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': False,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    })
+    response = {}
+    chunks = []
+
+    def start_response(status, headers, exc_info=None):
+        if exc_info and response:
+            raise exc_info[1]
+        response['status'] = status
+        response['headers'] = headers
+        return chunks.append
+
+    try:
+        result = app(environ, start_response)
+        try:
+            for chunk in result:
+                chunks.append(chunk)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return response['status'], list(response['headers']), b''.join(chunks)
+    except Exception:
+        traceback.print_exc()
+        return '500 Internal Server Error', [('Content-Type', 'text/plain')], b'Internal Server Error'
+
+
+def _write(responses, data):
+    responses.write(_HEADER.pack(len(data)) + data)
+    responses.flush()
+
+
+def serve(app, requests, responses):
+    """
+    Serve requests until the router closes the requests pipe.
+    """
+    # tell the router we're ready
+    _write(responses, b'')
+
+    while True:
+        header = _read_exactly(requests, _HEADER.size)
+        if header is None:
+            return
+        data = _read_exactly(requests, _HEADER.unpack(header)[0])
+        if data is None:
+            return
+        environ, body = pickle.loads(data)
+
+        _write(responses, pickle.dumps(call_application(app, environ, body), 2))
+
+
+def main():
+    module, obj = sys.argv[1:3]
+
+    requests = os.fdopen(0, 'rb')
+    responses = os.fdopen(3, 'wb')
+    try:
+        app = getattr(importlib.import_module(module), obj)
+    except Exception as e:
+        # tell the router why the application could not be loaded
+        traceback.print_exc()
+        _write(responses, pickle.dumps(u'{}: {}'.format(type(e).__name__, e), 2))
+        sys.exit(1)
+
+    try:
+        serve(app, requests, responses)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -48,7 +48,7 @@ from txaio import make_logger
 
 from crossbar.common.reloader import TrackingModuleReloader
 from crossbar.common.process import NativeProcess
-from crossbar.common.profiler import PROFILERS
+from crossbar.common.profiler import PROFILERS, SamplingProfiler, collapse, diff_collapsed, _HAS_ITIMER
 
 __all__ = ('WorkerController',)
 
@@ -83,6 +83,9 @@ class WorkerController(NativeProcess):
 
         self._profiles = {}
 
+        # continuous sampling profiler (if started)
+        self._sampling_profiler = SamplingProfiler()
+
         # flag indicating when worker is shutting down
         self._is_shutting_down = False
 
@@ -125,6 +128,8 @@ class WorkerController(NativeProcess):
 
     def onLeave(self, details):
         self.log.debug("Worker-to-controller session detached")
+        if self._sampling_profiler.is_running:
+            self._sampling_profiler.stop()
         self.disconnect()
 
     def onDisconnect(self):
@@ -239,6 +244,11 @@ class WorkerController(NativeProcess):
 
         profiler = PROFILERS[profiler]
 
+        # profilers and the sampling profiler both use the profiling interval timer
+        # and signal, so only one of them can run at a time
+        if self._sampling_profiler.is_running:
+            raise ApplicationError(u'crossbar.error.already_running', 'cannot start profiler while the sampling profiler is running')
+
         self.log.debug("Starting profiler {profiler}, running for {secs} seconds", profiler=profiler, secs=runtime)
 
         # run the selected profiler, producing a profile. "profile_finished" is a Deferred
@@ -329,6 +339,158 @@ class WorkerController(NativeProcess):
         else:
             raise ApplicationError(u'crossbar.error.no_such_object', 'no profile with ID {} saved'.format(profile_id))
 
+    @wamp.register(None)
+    def start_sampling_profiler(self, period=0.01, window=300, resolution=10, clock=u'cpu', details=None):
+        """
+        Start the continuous sampling profiler, which keeps the stacks of the
+        worker sampled during a rolling window in memory.
+
+        This procedure is registered under WAMP URI
+        ``crossbar.worker.<worker_id>.start_sampling_profiler``.
+
+        **Errors:**
+
+        * ``crossbar.error.feature_unavailable`` - interval timers are not available on this platform
+        * ``crossbar.error.already_running`` - the sampling profiler (or another profiler) is already running
+        * ``crossbar.error.invalid_configuration`` - the parameters are invalid
+
+        :param period: The sampling period in seconds.
+        :type period: float
+        :param window: Keep the stacks sampled during this many seconds.
+        :type window: float
+        :param resolution: Windows can be selected in steps of this many seconds.
+        :type resolution: float
+        :param clock: Sample in CPU time (``"cpu"``) or wall time (``"wall"``).
+        :type clock: str
+
+        :returns: The sampling profiler status.
+        :rtype: dict
+        """
+        if not _HAS_ITIMER:
+            raise ApplicationError(u'crossbar.error.feature_unavailable', 'sampling profiler not available on this platform')
+
+        if self._sampling_profiler.is_running:
+            raise ApplicationError(u'crossbar.error.already_running', 'sampling profiler already running')
+
+        if any(p.is_running for p in PROFILERS.values()):
+            raise ApplicationError(u'crossbar.error.already_running', 'cannot start sampling profiler while a profiler is running')
+
+        try:
+            self._sampling_profiler.start(period=period, window=window, resolution=resolution, clock=clock)
+        except Exception as e:
+            raise ApplicationError(u'crossbar.error.invalid_configuration', 'could not start sampling profiler: {}'.format(e))
+
+        status = self._sampling_profiler.marshal()
+        self.publish(u'{}.on_sampling_profiler_started'.format(self._uri_prefix), status)
+        return status
+
+    @wamp.register(None)
+    def stop_sampling_profiler(self, details=None):
+        """
+        Stop the continuous sampling profiler (discarding the stacks sampled).
+
+        This procedure is registered under WAMP URI
+        ``crossbar.worker.<worker_id>.stop_sampling_profiler``.
+
+        When the sampling profiler is not running, a WAMP error
+        ``crossbar.error.not_running`` is raised.
+        """
+        if not self._sampling_profiler.is_running:
+            raise ApplicationError(u'crossbar.error.not_running', 'sampling profiler not running')
+
+        status = self._sampling_profiler.marshal()
+        self._sampling_profiler.stop()
+        self.publish(u'{}.on_sampling_profiler_stopped'.format(self._uri_prefix), status)
+        return status
+
+    @wamp.register(None)
+    def get_sampling_profiler(self, details=None):
+        """
+        Get the status of the continuous sampling profiler.
+
+        This procedure is registered under WAMP URI
+        ``crossbar.worker.<worker_id>.get_sampling_profiler``.
+        """
+        return self._sampling_profiler.marshal()
+
+    @wamp.register(None)
+    def get_sampled_profile(self, seconds=None, offset=0, details=None):
+        """
+        Get the stacks sampled during a window of the continuous sampling profiler,
+        in collapsed stack format (as consumed by flame graph tools).
+
+        This procedure is registered under WAMP URI
+        ``crossbar.worker.<worker_id>.get_sampled_profile``.
+
+        When the sampling profiler is not running, a WAMP error
+        ``crossbar.error.not_running`` is raised.
+
+        :param seconds: The length of the window in seconds (``None`` for the whole
+            rolling window).
+        :type seconds: float or None
+        :param offset: The window ends this many seconds ago.
+        :type offset: float
+
+        :returns: The start and end of the window (Unix time), the number of samples
+            and the collapsed stacks.
+        :rtype: dict
+        """
+        if not self._sampling_profiler.is_running:
+            raise ApplicationError(u'crossbar.error.not_running', 'sampling profiler not running')
+
+        snapshot = self._sampling_profiler.snapshot(seconds=seconds, offset=offset)
+        snapshot[u'stacks'] = collapse(snapshot[u'stacks'])
+        return snapshot
+
+    @wamp.register(None)
+    def diff_sampled_profile(self, seconds, offset=0, baseline_offset=None, normalize=True, details=None):
+        """
+        Compare the stacks sampled during a window of the continuous sampling
+        profiler to the stacks sampled during an earlier (baseline) window of
+        the same length, in the format of differential flame graphs (one line
+        per stack with the number of samples in the baseline and in the window).
+
+        This procedure is registered under WAMP URI
+        ``crossbar.worker.<worker_id>.diff_sampled_profile``.
+
+        When the sampling profiler is not running, a WAMP error
+        ``crossbar.error.not_running`` is raised.
+
+        :param seconds: The length of the windows in seconds.
+        :type seconds: float
+        :param offset: The window ends this many seconds ago.
+        :type offset: float
+        :param baseline_offset: The baseline window ends this many seconds ago (default:
+            right before the window).
+        :type baseline_offset: float or None
+        :param normalize: Scale the samples of the baseline to the number of samples of the window.
+        :type normalize: bool
+
+        :returns: The number of samples of both windows and the collapsed stacks.
+        :rtype: dict
+        """
+        if not self._sampling_profiler.is_running:
+            raise ApplicationError(u'crossbar.error.not_running', 'sampling profiler not running')
+
+        if baseline_offset is None:
+            baseline_offset = offset + seconds
+
+        before = self._sampling_profiler.snapshot(seconds=seconds, offset=baseline_offset)
+        after = self._sampling_profiler.snapshot(seconds=seconds, offset=offset)
+        return {
+            u'baseline': {
+                u'started': before[u'started'],
+                u'ended': before[u'ended'],
+                u'samples': before[u'samples'],
+            },
+            u'window': {
+                u'started': after[u'started'],
+                u'ended': after[u'ended'],
+                u'samples': after[u'samples'],
+            },
+            u'stacks': diff_collapsed(before[u'stacks'], after[u'stacks'], normalize=normalize),
+        }
+
     @wamp.register(None)
     def get_pythonpath(self, details=None):
         """
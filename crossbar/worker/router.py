@@ -265,6 +265,9 @@ class RouterController(WorkerController):
             'bridge_meta_api': bridge_meta_api,
             'bridge_meta_api_prefix': bridge_meta_api_prefix,
 
+            # WAMP meta events (topics) that should never be published on the realm
+            'disabled_meta_events': options.get('disabled_meta_events', []),
+
             # the management session on the local node management router to which
             # the WAMP meta API is exposed to additionally, when the bridge_meta_api option is set
             'management_session': self,
@@ -399,6 +402,21 @@ class RouterController(WorkerController):
 
         del self.realms[id].roles[role_id]
 
+    @wamp.register(None)
+    def get_router_metrics(self, details=None):
+        """
+        Get the metrics of all realms running on this router worker.
+
+        :param details: Call details.
+        :type details: autobahn.wamp.types.CallDetails
+
+        :returns: Metrics per realm (by realm name) and aggregated over all realms.
+        :rtype: dict
+        """
+        self.log.debug("{name}.get_router_metrics", name=self.__class__.__name__)
+
+        return self._router_factory._metrics.marshal()
+
     @wamp.register(None)
     def get_router_realm_uplinks(self, id, details=None):
         """
@@ -883,7 +901,7 @@ class RouterController(WorkerController):
             self.log.error(emsg)
             raise ApplicationError(u'crossbar.error.not_running', emsg)
 
-        if path not in transport:
+        if path not in transport.root:
             emsg = "Cannot stop service on Web transport {}: no service running on path '{}'".format(transport_id, path)
             self.log.error(emsg)
             raise ApplicationError(u'crossbar.error.not_running', emsg)
@@ -896,7 +914,9 @@ class RouterController(WorkerController):
 
         # now actually remove the web service ..
         # Note: currently this is NOT async, but direct/sync.
-        transport.remove_web_service(path)
+        webservice = transport.root[path]
+        del transport.root[path]
+        webservice.stop()
 
         on_web_transport_service_stopped = {
             u'transport_id': transport_id,
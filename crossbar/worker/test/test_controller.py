@@ -0,0 +1,122 @@
+#####################################################################################
+#
+#  Copyright (c) Crossbar.io Technologies GmbH
+#
+#  Unless a separate license agreement exists between you and Crossbar.io GmbH (e.g.
+#  you have purchased a commercial license), the license terms below apply.
+#
+#  Should you enter into a separate license agreement after having received a copy of
+#  this software, then the terms of such license agreement replace the terms below at
+#  the time at which such license agreement becomes effective.
+#
+#  In case a separate license agreement ends, and such agreement ends without being
+#  replaced by another separate license agreement, the license terms below apply
+#  from the time at which said agreement ends.
+#
+#  LICENSE TERMS
+#
+#  This program is free software: you can redistribute it and/or modify it under the
+#  terms of the GNU Affero General Public License, version 3, as published by the
+#  Free Software Foundation. This program is distributed in the hope that it will be
+#  useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#  See the GNU Affero General Public License Version 3 for more details.
+#
+#  You should have received a copy of the GNU Affero General Public license along
+#  with this program. If not, see <http://www.gnu.org/licenses/agpl-3.0.en.html>.
+#
+#####################################################################################
+
+from __future__ import absolute_import
+
+import sys
+
+import txaio
+txaio.use_twisted()  # noqa
+
+import mock
+
+from twisted.trial.unittest import TestCase
+
+from autobahn.wamp.exception import ApplicationError
+
+from crossbar.common import profiler
+from crossbar.common.profiler import SamplingProfiler
+from crossbar.worker.controller import WorkerController
+
+
+class SamplingProfilerProcedureTests(TestCase):
+    """
+    Tests for the worker procedures of the continuous sampling profiler.
+    """
+
+    if not profiler._HAS_ITIMER:
+        skip = "interval timers not available on this platform"
+
+    def setUp(self):
+        self.controller = mock.Mock()
+        self.controller._uri_prefix = u'crossbar.worker.worker1'
+        self.controller._sampling_profiler = SamplingProfiler()
+        self.addCleanup(self._stop)
+
+    def _stop(self):
+        if self.controller._sampling_profiler.is_running:
+            self.controller._sampling_profiler.stop()
+
+    def _error(self, func, *args, **kwargs):
+        with self.assertRaises(ApplicationError) as ctx:
+            func(self.controller, *args, **kwargs)
+        return ctx.exception.error
+
+    def test_start_stop(self):
+        status = WorkerController.start_sampling_profiler(self.controller, period=1000, window=60)
+        self.assertTrue(status[u'running'])
+        self.assertEqual(status[u'window'], 60)
+        self.controller.publish.assert_called_once_with(u'crossbar.worker.worker1.on_sampling_profiler_started', status)
+
+        self.assertEqual(self._error(WorkerController.start_sampling_profiler), u'crossbar.error.already_running')
+
+        WorkerController.stop_sampling_profiler(self.controller)
+        self.assertFalse(WorkerController.get_sampling_profiler(self.controller)[u'running'])
+        self.assertEqual(self._error(WorkerController.stop_sampling_profiler), u'crossbar.error.not_running')
+        self.assertEqual(self._error(WorkerController.get_sampled_profile), u'crossbar.error.not_running')
+
+    def test_exclusive_with_profiler(self):
+        """
+        The sampling profiler and other profilers share the profiling timer,
+        so neither starts while the other runs.
+        """
+        other = mock.Mock()
+        other.is_running = True
+        with mock.patch.dict(profiler.PROFILERS, {u'other': other}):
+            self.assertEqual(self._error(WorkerController.start_sampling_profiler), u'crossbar.error.already_running')
+            self.assertFalse(self.controller._sampling_profiler.is_running)
+
+            other.is_running = False
+            WorkerController.start_sampling_profiler(self.controller, period=1000)
+            error = self._error(WorkerController.start_profiler, profiler=u'other')
+            self.assertEqual(error, u'crossbar.error.already_running')
+            other.start.assert_not_called()
+
+    def test_invalid(self):
+        error = self._error(WorkerController.start_sampling_profiler, clock=u'sundial')
+        self.assertEqual(error, u'crossbar.error.invalid_configuration')
+
+    def test_get_sampled_profile(self):
+        WorkerController.start_sampling_profiler(self.controller, period=1000)
+        self.controller._sampling_profiler._sample(None, sys._getframe())
+
+        profile = WorkerController.get_sampled_profile(self.controller)
+        self.assertEqual(profile[u'samples'], 1)
+        self.assertIn(u';test_get_sampled_profile (', profile[u'stacks'])
+        self.assertTrue(profile[u'stacks'].endswith(u' 1\n'))
+
+    def test_diff_sampled_profile(self):
+        WorkerController.start_sampling_profiler(self.controller, period=1000)
+        self.controller._sampling_profiler._sample(None, sys._getframe())
+
+        diff = WorkerController.diff_sampled_profile(self.controller, 60)
+        self.assertEqual(diff[u'baseline'][u'samples'], 0)
+        self.assertEqual(diff[u'window'][u'samples'], 1)
+        self.assertTrue(diff[u'stacks'].endswith(u' 0 1\n'))
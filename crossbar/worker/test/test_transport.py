@@ -0,0 +1,98 @@
+#####################################################################################
+#
+#  Copyright (c) Crossbar.io Technologies GmbH
+#
+#  Unless a separate license agreement exists between you and Crossbar.io GmbH (e.g.
+#  you have purchased a commercial license), the license terms below apply.
+#
+#  Should you enter into a separate license agreement after having received a copy of
+#  this software, then the terms of such license agreement replace the terms below at
+#  the time at which such license agreement becomes effective.
+#
+#  In case a separate license agreement ends, and such agreement ends without being
+#  replaced by another separate license agreement, the license terms below apply
+#  from the time at which said agreement ends.
+#
+#  LICENSE TERMS
+#
+#  This program is free software: you can redistribute it and/or modify it under the
+#  terms of the GNU Affero General Public License, version 3, as published by the
+#  Free Software Foundation. This program is distributed in the hope that it will be
+#  useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+#
+#  See the GNU Affero General Public License Version 3 for more details.
+#
+#  You should have received a copy of the GNU Affero General Public license along
+#  with this program. If not, see <http://www.gnu.org/licenses/agpl-3.0.en.html>.
+#
+#####################################################################################
+
+from __future__ import absolute_import
+
+import mock
+
+import txaio
+txaio.use_twisted()  # noqa
+
+from twisted.internet.defer import inlineCallbacks
+from twisted.trial.unittest import TestCase
+from twisted.web.resource import Resource
+
+from crossbar.common.twisted.web import _StreamingRequest
+from crossbar.worker.transport import RouterWebTransport
+
+
+class WebFactoryTests(TestCase):
+    """
+    Tests for the Web site of Web and Universal transports.
+    """
+
+    def _create_web_factory(self, config):
+        root_webservice = mock.Mock()
+        root_webservice._resource = Resource()
+
+        worker = mock.Mock()
+        worker.personality.WEB_SERVICE_FACTORIES = {'path': mock.Mock()}
+        worker.personality.WEB_SERVICE_FACTORIES['path'].create.return_value = root_webservice
+
+        transport = RouterWebTransport(worker, u'transport1', config)
+        return transport._create_web_factory()
+
+    @inlineCallbacks
+    def test_universal_web_options(self):
+        """
+        Universal transports take the Web options from their Web sub-service.
+        """
+        site, _ = yield self._create_web_factory({
+            'type': 'universal',
+            'endpoint': {'type': 'tcp', 'port': 8080},
+            'web': {
+                'paths': {
+                    'api': {'type': 'publisher', 'realm': u'realm1'},
+                    'nested': {'type': 'path', 'paths': {
+                        '/': {'type': 'publisher', 'realm': u'realm1'},
+                        'pub': {'type': 'publisher', 'realm': u'realm1'},
+                        'static': {'type': 'static', 'directory': '..'},
+                    }},
+                },
+                'options': {'http2': {'enable': False}, 'display_tracebacks': True},
+            },
+        })
+
+        self.assertEqual(site.acceptableProtocols(), [b'http/1.1'])
+        self.assertTrue(site.displayTracebacks)
+        self.assertIs(site.requestFactory, _StreamingRequest)
+        self.assertEqual(sorted(site._stream_request_paths), [b'/api', b'/nested', b'/nested/pub'])
+
+    @inlineCallbacks
+    def test_web_options(self):
+        site, _ = yield self._create_web_factory({
+            'type': 'web',
+            'endpoint': {'type': 'tcp', 'port': 8080},
+            'paths': {'static': {'type': 'static', 'directory': '..'}},
+            'options': {'display_tracebacks': True},
+        })
+
+        self.assertTrue(site.displayTracebacks)
+        self.assertIsNot(site.requestFactory, _StreamingRequest)
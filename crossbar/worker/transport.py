@@ -279,7 +279,8 @@ class RouterTransport(object):
         #
         elif self._config['type'] == 'mqtt':
             transport_factory = WampMQTTServerFactory(
-                self._worker.router_session_factory, self._config, self._worker._reactor)
+                self._worker.router_session_factory, self._config, self._worker._reactor,
+                timers=self._worker.router_factory._timers)
             transport_factory.noisy = False
 
         # Twisted Web based transport
@@ -305,7 +306,8 @@ class RouterTransport(object):
 
             if 'mqtt' in self._config:
                 mqtt_factory = WampMQTTServerFactory(
-                    self._worker.router_session_factory, self._config['mqtt'], self._worker._reactor)
+                    self._worker.router_session_factory, self._config['mqtt'], self._worker._reactor,
+                    timers=self._worker.router_factory._timers)
                 mqtt_factory.noisy = False
             else:
                 mqtt_factory = None
@@ -355,6 +357,8 @@ class RouterTransport(object):
         def ok(_):
             self._state = RouterTransport.STATE_STOPPED
             self._port = None
+            if self._root_webservice is not None:
+                self._root_webservice.stop()
 
         def fail(err):
             self._state = RouterTransport.STATE_FAILED
@@ -378,8 +382,13 @@ class RouterWebTransport(RouterTransport):
     @inlineCallbacks
     def _create_web_factory(self, create_paths=False, ignore=[]):
 
-        # web transport options
-        options = self._config.get('options', {})
+        # web transport options: for universal transports, these are the
+        # options of the Web sub-service
+        if self._config['type'] == 'universal':
+            web_config = self._config.get('web', {})
+        else:
+            web_config = self._config
+        options = web_config.get('options', {})
 
         # create root web service
         if '/' in self._config.get('paths', []):
@@ -392,6 +401,9 @@ class RouterWebTransport(RouterTransport):
 
         root_webservice = yield maybeDeferred(root_factory.create, self, '/', root_config)
 
+        # the REST publisher consumes request bodies while they arrive
+        stream_request_paths = [path.encode('utf8') for path in _web_service_paths(web_config.get('paths', {}), 'publisher')]
+
         # create the actual transport factory
         transport_factory = Site(
             root_webservice._resource,
@@ -399,12 +411,28 @@ class RouterWebTransport(RouterTransport):
             access_log=options.get('access_log', False),
             display_tracebacks=options.get('display_tracebacks', False),
             hsts=options.get('hsts', False),
-            hsts_max_age=int(options.get('hsts_max_age', 31536000))
+            hsts_max_age=int(options.get('hsts_max_age', 31536000)),
+            http2=options.get('http2', None),
+            stream_request_paths=stream_request_paths,
         )
 
         returnValue((transport_factory, root_webservice))
 
 
+def _web_service_paths(paths, service_type, prefix=u''):
+    """
+    Get the URL paths of the Web services of the given type configured on
+    the (nested) paths.
+    """
+    found = []
+    for path, config in paths.items():
+        url = prefix if path == u'/' else u'{}/{}'.format(prefix, path)
+        if config.get('type', None) == service_type:
+            found.append(url or u'/')
+        found.extend(_web_service_paths(config.get('paths', {}), service_type, url))
+    return found
+
+
 def create_router_transport(worker, transport_id, config):
     """
     Factory for creating router (listening) transports.